@@ -0,0 +1,182 @@
+import datetime
+import re
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Literal
+
+from agent.echarts_agent import (
+    generate_bar_chart,
+    generate_line_chart,
+    generate_pie_chart,
+    generate_scatter_chart,
+    generate_radar_chart,
+    generate_funnel_chart,
+    generate_heatmap_chart,
+    generate_wordcloud_chart,
+    generate_boxplot_chart,
+)
+from utils.logger import logger
+from utils.sql_executor import QueryResult
+
+ColumnRole = Literal["time", "category", "measure"]
+
+# 图表最多展示的数据点，超出部分截断
+MAX_CHART_POINTS = 500
+
+# 图表类型关键字，按顺序匹配模型给出的图表类型描述
+CHART_TYPE_KEYWORDS = [
+    ("boxplot", ("箱线", "箱型", "boxplot")),
+    ("heatmap", ("热力", "heatmap")),
+    ("wordcloud", ("词云", "wordcloud")),
+    ("funnel", ("漏斗", "funnel")),
+    ("radar", ("雷达", "radar")),
+    ("scatter", ("散点", "scatter")),
+    ("pie", ("饼", "环形", "玫瑰", "pie")),
+    ("line", ("折线", "趋势", "曲线", "面积", "line")),
+    ("bar", ("柱", "条形", "直方", "bar")),
+]
+
+_DATE_PATTERN = re.compile(r'^\d{4}[-/]\d{1,2}([-/]\d{1,2})?([ T]\d{1,2}:\d{2}(:\d{2})?)?$')
+_ID_PATTERN = re.compile(r'(^|_)id$', re.IGNORECASE)
+
+
+def resolve_chart_kind(chart_type: str | None) -> str | None:
+    """
+    将模型给出的图表类型描述映射为图表种类
+    :param chart_type: 图表类型描述，如“柱状图”
+    :return: 图表种类，无法识别时返回 None
+    """
+    text = (chart_type or "").lower()
+    for kind, keywords in CHART_TYPE_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return kind
+    return None
+
+
+def infer_column_roles(result: QueryResult) -> dict[str, ColumnRole]:
+    """
+    根据列名和取值推断各列在图表中的角色：时间、分类或度量
+    :param result: 查询结果
+    :return: {列名: 角色}
+    """
+    roles: dict[str, ColumnRole] = {}
+    for column in result.columns:
+        values = [row[column] for row in result.rows[:MAX_CHART_POINTS] if row.get(column) is not None]
+        if not values:
+            roles[column] = "category"
+        elif all(isinstance(value, (datetime.date, datetime.datetime)) for value in values):
+            roles[column] = "time"
+        elif all(isinstance(value, str) and _DATE_PATTERN.match(value) for value in values):
+            roles[column] = "time"
+        elif all(isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) for value in values):
+            # 数值型的 ID 列按分类处理
+            roles[column] = "category" if _ID_PATTERN.search(column) else "measure"
+        else:
+            roles[column] = "category"
+    return roles
+
+
+def _label(value: Any) -> str:
+    if value is None:
+        return "空"
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    return str(value)
+
+
+def _number(value: Any) -> float | int:
+    if value is None:
+        return 0
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+async def build_chart(chart_type: str | None, result: QueryResult | None, title: str | None = None) -> str | None:
+    """
+    不调用模型，直接根据查询结果和图表类型生成图表
+    :param chart_type: 模型给出的图表类型描述
+    :param result: 查询结果
+    :param title: 模型给出的图表标题，未给出时使用中文的图表类型描述
+    :return: 图表 html，无法确定图表类型或数据不适合时返回 None
+    """
+    try:
+        chart = await _build_chart(chart_type, result, title)
+    except Exception as e:
+        logger.warning(f"根据查询结果生成图表失败: {e}")
+        return None
+    if chart is None:
+        logger.info(f"查询结果不适合直接生成{chart_type or '图表'}，交由图表智能体处理")
+    return chart
+
+
+async def _build_chart(chart_type: str | None, result: QueryResult | None, title: str | None) -> str | None:
+    if result is None or not result.rows:
+        return None
+
+    roles = infer_column_roles(result)
+    times = [column for column, role in roles.items() if role == "time"]
+    categories = [column for column, role in roles.items() if role == "category"]
+    measures = [column for column, role in roles.items() if role == "measure"]
+    dimensions = times + categories
+
+    kind = resolve_chart_kind(chart_type)
+    if kind is None and not (chart_type or "").strip() and measures and dimensions:
+        # 未指定图表类型时按列角色选择：有时间维度用折线图，否则用柱状图
+        kind = "line" if times else "bar"
+    if kind is None:
+        return None
+
+    rows = result.rows[:MAX_CHART_POINTS]
+    if not title:
+        # 图表类型描述可能是 bar、line 等英文关键字，不适合作为标题
+        title = chart_type if chart_type and not chart_type.isascii() else ""
+
+    if kind in ("bar", "line") and dimensions and measures:
+        # 时间维度优先作为横轴
+        x_column, y_column = dimensions[0], measures[0]
+        x_data = [_label(row[x_column]) for row in rows]
+        y_data = [_number(row[y_column]) for row in rows]
+        if kind == "bar":
+            return await generate_bar_chart(title, x_data, y_data, series_name=y_column)
+        return await generate_line_chart(title, x_data, y_data, series_name=y_column)
+
+    if kind in ("pie", "funnel", "wordcloud") and dimensions and measures:
+        data = [(_label(row[dimensions[0]]), _number(row[measures[0]])) for row in rows]
+        if kind == "pie":
+            return await generate_pie_chart(title, data)
+        if kind == "funnel":
+            return await generate_funnel_chart(title, data)
+        return await generate_wordcloud_chart(title, data)
+
+    if kind == "scatter" and len(measures) >= 2:
+        x_data = [_number(row[measures[0]]) for row in rows]
+        y_data = [_number(row[measures[1]]) for row in rows]
+        return await generate_scatter_chart(title, x_data, y_data)
+
+    if kind == "radar" and dimensions and measures:
+        values = [_number(row[measures[0]]) for row in rows]
+        upper = max(values, default=0) * 1.2 or 1
+        indicators = [{"name": _label(row[dimensions[0]]), "max": upper} for row in rows]
+        return await generate_radar_chart(title, indicators, values, series_name=measures[0])
+
+    if kind == "heatmap" and len(dimensions) >= 2 and measures:
+        x_labels = list(dict.fromkeys(_label(row[dimensions[0]]) for row in rows))
+        y_labels = list(dict.fromkeys(_label(row[dimensions[1]]) for row in rows))
+        x_index = {label: i for i, label in enumerate(x_labels)}
+        y_index = {label: i for i, label in enumerate(y_labels)}
+        value_data = [
+            [x_index[_label(row[dimensions[0]])], y_index[_label(row[dimensions[1]])], _number(row[measures[0]])]
+            for row in rows
+        ]
+        return await generate_heatmap_chart(title, x_labels, y_labels, value_data)
+
+    if kind == "boxplot" and measures:
+        # 箱线图按分类分组，每组至少需要 5 个值才能计算四分位数
+        groups: dict[str, list] = defaultdict(list)
+        for row in rows:
+            groups[_label(row[categories[0]]) if categories else measures[0]].append(_number(row[measures[0]]))
+        if all(len(values) >= 5 for values in groups.values()):
+            return await generate_boxplot_chart(title, list(groups), list(groups.values()))
+
+    return None
@@ -0,0 +1,368 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import CONVERSATION_MAX_COUNT, CONVERSATION_MAX_TOKENS, CONVERSATION_TTL
+from utils.logger import logger
+from utils.shared_store import SharedStore, register_type, shared_store
+from utils.token_counter import estimate_json_tokens, estimate_tokens
+
+# 共享存储中对话的命名空间
+_STORE_NAMESPACE = "conversation"
+# 返回表结构的工具，返回的表结构合并到对话的表结构中，历史消息里只保留表名
+SCHEMA_TOOLS = ("get_db_tables_description", "search_relevant_tables")
+SQL_TOOL = "execute_sql"
+# 较早轮次的SQL执行结果只保留这些字段，结果行和列统计信息不再保留
+_RESULT_KEYS = ("columns", "row_count", "truncated")
+# 摘要中每轮答案保留的字数、最多保留的摘要轮数
+_SUMMARY_ANSWER_CHARS = 120
+_MAX_SUMMARY_TURNS = 20
+
+
+@dataclass
+class Turn:
+    """对话中的一轮问答"""
+    question: str
+    sql_text: str | None  # 本轮最后执行的SQL
+    answer: str  # 模型输出的答案，不含服务端渲染的表格
+    messages: list[ModelMessage]  # 本轮的消息，已压缩且不含系统提示
+    tokens: int = 0  # 本轮消息的估算 token 数
+
+    def summary(self) -> str:
+        """本轮的一行摘要：问题、SQL和答案开头"""
+        answer = " ".join(self.answer.split())
+        if len(answer) > _SUMMARY_ANSWER_CHARS:
+            answer = answer[:_SUMMARY_ANSWER_CHARS] + "…"
+        return f"问：{self.question}；SQL：{self.sql_text or '无'}；答：{answer or '无'}"
+
+
+@dataclass
+class Conversation:
+    """多轮对话，保存各轮的消息、已获取的表结构和早期轮次的摘要"""
+    conversation_id: str
+    session_id: str
+    conn_key: str  # 对话所用数据库的连接标识，会话切换数据库后对话重新开始
+    schema_version: str | None = None  # 已获取的表结构对应的表结构版本
+    tables: dict[str, Any] = field(default_factory=dict)  # 已获取的表结构，表名 -> 表结构
+    summary: list[str] = field(default_factory=list)  # 压缩为摘要的早期轮次，每轮一行
+    turns: list[Turn] = field(default_factory=list)  # 保留完整消息的近期轮次
+    folded: int = 0  # 压缩为摘要的轮次总数（包括摘要过多被丢弃的）
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def turn_count(self) -> int:
+        return self.folded + len(self.turns)
+
+    def context(self) -> str | None:
+        """对话背景：早期轮次的摘要和已获取的表结构，作为系统提示随历史消息传给模型"""
+        sections = []
+        if self.summary:
+            sections.append("之前的问答摘要：\n" + "\n".join(
+                f"{index}. {line}" for index, line in enumerate(self.summary, start=self.folded - len(self.summary) + 1)
+            ))
+        if self.tables:
+            sections.append(
+                "已获取的表结构（可以直接使用，无需再次调用工具获取）：\n"
+                + json.dumps(self.tables, ensure_ascii=False, default=str, separators=(",", ":"))
+            )
+        return "对话背景：\n" + "\n\n".join(sections) if sections else None
+
+    def tokens(self) -> int:
+        """历史消息和对话背景的估算 token 数"""
+        context = self.context()
+        return sum(turn.tokens for turn in self.turns) + (estimate_tokens(context) if context else 0)
+
+
+def _message_tokens(messages: list[ModelMessage]) -> int:
+    return estimate_json_tokens(ModelMessagesTypeAdapter.dump_python(messages, mode="json"))
+
+
+def _compact_part(part: Any, tables: dict[str, Any], keep_results: bool) -> Any:
+    if not isinstance(part, ToolReturnPart) or not isinstance(part.content, dict):
+        return part
+    if part.tool_name in SCHEMA_TOOLS:
+        # 表结构合并到对话背景中，各轮重复获取的表只保留一份
+        for name, info in part.content.items():
+            if isinstance(info, dict):
+                tables[name] = info
+        return replace(part, content={"tables": list(part.content), "note": "表结构见对话背景"})
+    if part.tool_name == SQL_TOOL and not keep_results and "rows" in part.content:
+        content = {key: part.content[key] for key in _RESULT_KEYS if key in part.content}
+        return replace(part, content={**content, "note": "结果行已省略，需要时重新执行SQL"})
+    return part
+
+
+def compact_messages(messages: list[ModelMessage], tables: dict[str, Any], keep_results: bool) -> list[ModelMessage]:
+    """
+    压缩一轮的消息：去掉系统提示，表结构工具的结果移入对话的表结构，较早轮次的SQL结果只保留列名和行数
+    :param messages: 本轮的消息
+    :param tables: 对话已获取的表结构，本轮获取的表结构合并到其中
+    :param keep_results: 是否保留SQL执行结果的预览行，最近一轮保留以便追问时直接引用
+    :return: 压缩后的消息
+    """
+    compacted: list[ModelMessage] = []
+    for message in messages:
+        if isinstance(message, ModelRequest):
+            parts = [
+                _compact_part(part, tables, keep_results)
+                for part in message.parts if not isinstance(part, SystemPromptPart)
+            ]
+            if parts:
+                compacted.append(replace(message, parts=parts))
+        else:
+            compacted.append(message)
+
+    # 流式运行结束时最后的输出工具调用可能没有对应的返回，补齐后才能作为历史消息再次发送
+    last = compacted[-1] if compacted else None
+    if isinstance(last, ModelResponse):
+        calls = [part for part in last.parts if isinstance(part, ToolCallPart)]
+        if calls:
+            compacted.append(ModelRequest(parts=[
+                ToolReturnPart(call.tool_name, "Final result processed.", call.tool_call_id) for call in calls
+            ]))
+    return compacted
+
+
+def synthetic_turn_messages(question: str, answer: str) -> list[ModelMessage]:
+    """
+    未经过数据智能体的一轮问答（如直接执行SQL）对应的消息，使后续问题能引用这一轮
+    :param question: 用户输入
+    :param answer: 答案概要
+    """
+    return [ModelRequest(parts=[UserPromptPart(question)]), ModelResponse(parts=[TextPart(answer)])]
+
+
+def _encode_conversation(conversation: Conversation) -> dict[str, Any]:
+    return {
+        **{name: getattr(conversation, name) for name in (
+            "conversation_id", "session_id", "conn_key", "schema_version", "tables", "summary", "folded", "updated_at",
+        )},
+        "turns": [
+            {
+                "question": turn.question,
+                "sql_text": turn.sql_text,
+                "answer": turn.answer,
+                "messages": ModelMessagesTypeAdapter.dump_python(turn.messages, mode="json"),
+                "tokens": turn.tokens,
+            }
+            for turn in conversation.turns
+        ],
+    }
+
+
+def _decode_conversation(data: dict[str, Any]) -> Conversation:
+    turns = [
+        Turn(**{**turn, "messages": ModelMessagesTypeAdapter.validate_python(turn["messages"])})
+        for turn in data["turns"]
+    ]
+    return Conversation(**{**data, "turns": turns})
+
+
+# 对话按字段写入共享存储，消息使用 pydantic-ai 的消息格式序列化
+register_type("conversation", Conversation, _encode_conversation, _decode_conversation)
+
+
+class ConversationRegistry:
+    """
+    多轮对话注册表
+    对话属于创建它的会话，每轮问答把数据智能体的消息追加到对话中，后续问题连同历史消息一起发给模型，
+    已获取的表结构和最近一轮的SQL结果可以直接引用，不必重新调用工具；
+    历史按 token 预算压缩：表结构工具的结果合并为一份，较早轮次的结果行省略，仍超出预算时最早的轮次压缩为一行摘要
+    配置了共享存储时对话同时写入共享存储，同一对话的后续问题可以落到任一工作进程
+    """
+
+    def __init__(
+            self,
+            max_tokens: int = CONVERSATION_MAX_TOKENS,
+            ttl: int = CONVERSATION_TTL,
+            max_conversations: int = CONVERSATION_MAX_COUNT,
+            store: SharedStore | None = shared_store,
+    ):
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.store = store
+        self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def create(self, session_id: str, conn_config: DatabaseConnectionConfig) -> Conversation:
+        """
+        为会话创建新对话
+        :param session_id: 会话 ID
+        :param conn_config: 会话当前的数据库连接配置
+        :return: 对话
+        """
+        conversation = Conversation(uuid.uuid4().hex, session_id, conn_config.conn_key)
+        await self._save(conversation)
+        return conversation
+
+    async def get(self, conversation_id: str, session_id: str) -> Conversation | None:
+        """
+        获取对话
+        :param conversation_id: 对话 ID
+        :param session_id: 会话 ID，只能获取本会话创建的对话
+        :return: 对话，不存在、已过期或不属于该会话时返回 None
+        """
+        conversation = self._conversations.get(conversation_id)
+        if self.store is not None:
+            stored = await self.store.get(_STORE_NAMESPACE, conversation_id)
+            # 以共享存储为准：已被其他进程删除则失效，其他进程追加了新的轮次则使用存储中的版本
+            if stored is None:
+                conversation = None
+            elif conversation is None or stored.value.updated_at > conversation.updated_at:
+                conversation = stored.value
+        if conversation is None or time.time() - conversation.updated_at > self.ttl:
+            self._conversations.pop(conversation_id, None)
+            return None
+        if conversation.session_id != session_id:
+            return None
+        self._conversations[conversation_id] = conversation
+        self._conversations.move_to_end(conversation_id)
+        return conversation
+
+    async def delete(self, conversation_id: str, session_id: str) -> bool:
+        """
+        删除对话
+        :return: 对话是否存在
+        """
+        if await self.get(conversation_id, session_id) is None:
+            return False
+        self._conversations.pop(conversation_id, None)
+        self._locks.pop(conversation_id, None)
+        if self.store is not None:
+            await self.store.delete(_STORE_NAMESPACE, conversation_id)
+        return True
+
+    @asynccontextmanager
+    async def hold(self, conversation: Conversation | None) -> AsyncIterator[None]:
+        """
+        同一对话的各轮问答依次执行，后一轮需要基于前一轮的结果
+        :param conversation: 对话，None 表示不属于任何对话
+        """
+        if conversation is None:
+            yield
+            return
+        lock = self._locks.setdefault(conversation.conversation_id, asyncio.Lock())
+        async with lock:
+            yield
+
+    def history(
+            self,
+            conversation: Conversation,
+            conn_config: DatabaseConnectionConfig,
+            schema_version: str,
+            system_prompt: str,
+    ) -> list[ModelMessage] | None:
+        """
+        本轮问答传给模型的历史消息：系统提示和对话背景，加上近期各轮的消息
+        :param conversation: 对话
+        :param conn_config: 本轮使用的数据库连接配置
+        :param schema_version: 当前的表结构版本
+        :param system_prompt: 数据智能体的系统提示，传入历史消息时模型不会再自动添加
+        :return: 历史消息，对话还没有任何轮次时返回 None
+        """
+        if conversation.conn_key != conn_config.conn_key:
+            # 会话已切换到其他数据库，之前的表结构和SQL都不再适用
+            logger.info(f"对话所属会话已切换数据库，重新开始对话：{conversation.conversation_id}")
+            conversation.conn_key = conn_config.conn_key
+            conversation.tables, conversation.summary, conversation.turns = {}, [], []
+            conversation.folded, conversation.schema_version = 0, None
+        elif conversation.schema_version != schema_version and conversation.tables:
+            # 表结构已变化，之前获取的表结构不再可信，由模型重新获取
+            conversation.tables = {}
+        if not conversation.turn_count:
+            return None
+
+        parts = [SystemPromptPart(system_prompt)]
+        context = conversation.context()
+        if context:
+            parts.append(SystemPromptPart(context))
+        return [ModelRequest(parts=parts), *(message for turn in conversation.turns for message in turn.messages)]
+
+    async def record(
+            self,
+            conversation: Conversation,
+            question: str,
+            messages: list[ModelMessage],
+            sql_text: str | None,
+            answer: str,
+            schema_version: str | None,
+    ) -> None:
+        """
+        追加一轮问答并按 token 预算压缩历史
+        :param conversation: 对话
+        :param question: 用户问题
+        :param messages: 本轮新增的消息
+        :param sql_text: 本轮最后执行的SQL
+        :param answer: 模型输出的答案
+        :param schema_version: 本轮使用的表结构版本
+        """
+        tables = conversation.tables
+        if conversation.turns:
+            # 上一轮不再是最近一轮，只保留结果的列名和行数
+            previous = conversation.turns[-1]
+            previous.messages = compact_messages(previous.messages, tables, keep_results=False)
+            previous.tokens = _message_tokens(previous.messages)
+        compacted = compact_messages(messages, tables, keep_results=True)
+        conversation.turns.append(Turn(question, sql_text, answer, compacted, _message_tokens(compacted)))
+        if schema_version is not None:
+            conversation.schema_version = schema_version
+        self._fit(conversation)
+        conversation.updated_at = time.time()
+        await self._save(conversation)
+
+    def stats(self) -> dict[str, Any]:
+        """对话统计信息"""
+        return {
+            "conversations": len(self._conversations),
+            "turns": sum(conversation.turn_count for conversation in self._conversations.values()),
+            "max_tokens": self.max_tokens,
+        }
+
+    def _fit(self, conversation: Conversation) -> None:
+        # 超出预算时从最早的轮次开始压缩为摘要，最近一轮始终保留完整消息
+        before = conversation.tokens()
+        while conversation.turns[:-1] and conversation.tokens() > self.max_tokens:
+            conversation.summary.append(conversation.turns.pop(0).summary())
+            conversation.folded += 1
+        del conversation.summary[:-_MAX_SUMMARY_TURNS]
+        if conversation.tokens() > self.max_tokens and conversation.tables:
+            # 仍然超出时只保留保留的SQL中用到的表
+            sqls = [turn.sql_text for turn in conversation.turns if turn.sql_text]
+            conversation.tables = {
+                name: info for name, info in conversation.tables.items() if any(name in sql for sql in sqls)
+            }
+        after = conversation.tokens()
+        if after < before:
+            logger.info(f"压缩对话历史：{before} -> {after} tokens，摘要 {len(conversation.summary)} 轮，"
+                        f"完整保留 {len(conversation.turns)} 轮")
+
+    async def _save(self, conversation: Conversation) -> None:
+        self._conversations[conversation.conversation_id] = conversation
+        self._conversations.move_to_end(conversation.conversation_id)
+        while len(self._conversations) > self.max_conversations:
+            oldest_id, _ = self._conversations.popitem(last=False)
+            self._locks.pop(oldest_id, None)
+        if self.store is not None:
+            await self.store.set(_STORE_NAMESPACE, conversation.conversation_id, conversation, ttl=self.ttl)
+
+
+conversation_registry = ConversationRegistry()
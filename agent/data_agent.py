@@ -1,150 +1,198 @@
-import re
+import asyncio
 from typing import Any
 
-import aiomysql
 from pydantic_ai import Agent, settings, RunContext, ModelRetry
 
 from schemas.agent_output import DataDetails
-from schemas.db_conn_config import DatabaseConnectionConfig
+from schemas.agent_deps import DataAgentDeps
+from utils.config import SCHEMA_TOP_K, SQL_PREVIEW_ROWS
+from utils.cost_gate import QueryCostExceededError
 from utils.logger import logger
+from utils.model_router import data_model
+from utils.query_governor import QueryQueueFullError
+from utils.replica_router import ReplicaUnavailableError
+from utils.schema_cache import schema_cache
+from utils.schema_index import get_schema_index, prune_schema
+from utils.sql_executor import execute_query
+from utils.sql_guard import validate_sql
+from utils.tracing import traced
+from utils.value_index import value_indexer
+
+# 取值解析工具最多返回的匹配数
+RESOLVE_VALUE_LIMIT = 10
+# 多轮对话中已提供过的表，表结构工具只返回该提示
+KNOWN_TABLE_NOTE = "表结构已在之前的对话中提供"
 
 model_settings = settings.ModelSettings(
     temperature=0.0
 )
 
+# 多轮对话中由服务端拼接历史消息，系统提示需要随历史一起传入
+DATA_AGENT_SYSTEM_PROMPT = (
+    "你是一个数据库查询专家，你精通根据用户的问题来结合数据库表和字段信息生成对应的SQL，然后调用对应工具执行SQL，"
+    "最后你将SQL查询的结果结合用户的问题以简单易懂的语言输出，并根据用户的问题判断要不要生成统计图表。"
+    "与问题相关的表的描述信息优先通过检索相关表的工具来获取，只有检索结果不足以回答问题时才获取数据库中所有表的描述信息，"
+    "如果获取到的结果是空或空字典等，直接输出“无法读取数据库信息。”。"
+    "SQL执行结果可以通过工具来获取，如果查询结果为空，直接输出“未能查询到相关结果。”"
+    "若用户直接提供了SQL，直接调用SQL查询工具来执行提供的SQL。"
+    "问题中提到具体的取值（如地名、人名、商品名、状态）时，先调用取值解析工具确定其所在的表、列和库中的精确取值，"
+    "再用等值条件查询，不要用 LIKE '%...%' 模糊匹配猜测列和取值；解析不到时再按表结构判断。"
+    "要注意你输出的信息尽量便于阅读，例如永远用名称代替id输出。"
+    "查询结果表格由系统根据SQL执行结果自动渲染，你不要自己输出表格，也不要逐行复述查询结果，只需用一到三句话总结结果；"
+    "多行数据需要展示时将是否附上表格设为True，并可在答案中用 {{table}} 标记表格的位置，不标记时表格附在答案末尾。"
+    "为了输出的美观性和易读性，你总是以MarkDown格式输出答案，以Bool类型来输出是否需要生成统计图表，并尽量说明图表类型。"
+    "注意：除非用户的问题中明确表示需要生成统计图表，否则一律认为不需要生成统计图表（False），图表类型用中文输出，并给出概括图表内容的中文图表标题。"
+    "注意：不要在答案中包含和问题及答案无关的内容，尤其是自己的思考和执行过程。类似【我将生成图表】这类描述绝对不可以出现在答案中。"
+    "注意：一旦你遇到无法确定或无法解决的问题，或者遇到用户随意问了和数据查询不相干的问题，不要自我猜测，直接输出“抱歉，我不能帮你解决这个问题。”。"
+    "多轮对话中，之前获取的表结构、执行过的SQL及其结果仍然有效：后续问题能基于已有的表结构和SQL回答时直接改写并执行新的SQL，"
+    "不要重复检索或获取表结构；工具对某张表返回“表结构已在之前的对话中提供”时，该表结构见对话背景。"
+)
+
 data_agent = Agent(
-    'deepseek:deepseek-chat',
-    deps_type=DatabaseConnectionConfig,
+    data_model,
+    deps_type=DataAgentDeps,
     output_type=DataDetails,
-    system_prompt=(
-        "你是一个数据库查询专家，你精通根据用户的问题来结合数据库表和字段信息生成对应的SQL，然后调用对应工具执行SQL，"
-        "最后你将SQL查询的结果结合用户的问题以简单易懂的语言输出，并根据用户的问题判断要不要生成统计图表。"
-        "数据库中所有表的描述信息可以通过工具来获取，如果获取到的结果是空或空字典等，直接输出“无法读取数据库信息。”。"
-        "SQL执行结果可以通过工具来获取，如果查询结果为空，直接输出“未能查询到相关结果。”"
-        "若用户直接提供了SQL，直接调用SQL查询工具来执行提供的SQL。"
-        "要注意你输出的信息尽量便于阅读，例如永远用名称代替id输出，另外多行数据需要输出时你要用表格形式输出。"
-        "为了输出的美观性和易读性，你总是以MarkDown格式输出答案，以Bool类型来输出是否需要生成统计图表，并尽量说明图表类型。"
-        "注意：除非用户的问题中明确表示需要生成统计图表，否则一律认为不需要生成统计图表（False），图表名称用中文输出。"
-        "注意：不要在答案中包含和问题及答案无关的内容，尤其是自己的思考和执行过程。类似【我将生成图表】这类描述绝对不可以出现在答案中。"
-        "注意：一旦你遇到无法确定或无法解决的问题，或者遇到用户随意问了和数据查询不相干的问题，不要自我猜测，直接输出“抱歉，我不能帮你解决这个问题。”。"
-    ),
+    system_prompt=DATA_AGENT_SYSTEM_PROMPT,
     model_settings=model_settings
 )
 
 
-sql_dict = {}
+def _omit_known_tables(deps: DataAgentDeps, schema: dict[str, Any]) -> dict[str, Any]:
+    # 对话中已提供过表结构的表不再重复返回，模型从对话背景中读取
+    if not deps.known_tables:
+        return schema
+    return {name: KNOWN_TABLE_NOTE if name in deps.known_tables else info for name, info in schema.items()}
+
 
 @data_agent.tool
-async def get_db_tables_description(ctx: RunContext[DatabaseConnectionConfig]) -> dict[str, str | dict[str, str]]:
+@traced("tool.get_db_tables_description")
+async def get_db_tables_description(ctx: RunContext[DataAgentDeps]) -> dict[str, str | dict[str, str]]:
     """
     获取数据库中所有表和列信息（表名、列名、数据类型、列描述和表描述）
     :return:
         dict: {
             表名: {
                 "description": 表描述(仅MySQL),
-                "columns": [{"name": 列名, "type": 类型, "comment": 列描述}, ...]
+                "columns": [{"name": 列名, "type": 类型, "comment": 列描述}, ...],
+                "foreign_keys": [{"column": 列名, "ref_table": 关联表名, "ref_column": 关联列名}, ...](仅存在外键时)
             }
         }
     """
     schema = {}
 
     try:
-        async with aiomysql.connect(
-                host=ctx.deps.host,
-                port=ctx.deps.port,
-                user=ctx.deps.username,
-                password=ctx.deps.password.get_secret_value(),
-                db=ctx.deps.database_name,
-                charset='utf8mb4',
-                cursorclass=aiomysql.DictCursor
-        ) as conn:
-            async with conn.cursor() as cursor:
-                # 获取所有表名和表注释
-                await cursor.execute("""
-                                     SELECT TABLE_NAME, TABLE_COMMENT
-                                     FROM INFORMATION_SCHEMA.TABLES
-                                     WHERE TABLE_SCHEMA = DATABASE()
-                                     """)
-                tables = await cursor.fetchall()
-
-                for table in tables:
-                    table_name = table['TABLE_NAME']
-
-                    # 获取列详细信息
-                    await cursor.execute(f"""
-                                    SELECT 
-                                        COLUMN_NAME,
-                                        COLUMN_TYPE,
-                                        COLUMN_COMMENT
-                                    FROM INFORMATION_SCHEMA.COLUMNS 
-                                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
-                                    ORDER BY ORDINAL_POSITION
-                                """, (table_name,))
-
-                    columns = await cursor.fetchall()
-
-                    schema[table_name] = {
-                        "description": table['TABLE_COMMENT'] or None,
-                        "columns": [
-                            {
-                                "name": col['COLUMN_NAME'],
-                                "type": col['COLUMN_TYPE'],
-                                "comment": col['COLUMN_COMMENT'] or None,
-                            }
-                            for col in columns
-                        ]
-                    }
+        # 表结构按数据库缓存，仅在表结构版本变化时重新加载
+        snapshot = await schema_cache.get_schema(ctx.deps.conn_config)
+        schema = _omit_known_tables(ctx.deps, snapshot.tables)
+        await ctx.deps.send("schema", {"table_count": len(schema)})
+    except Exception as e:
+        logger.error(e)
+
+    return schema
+
+
+@data_agent.tool
+@traced("tool.search_relevant_tables")
+async def search_relevant_tables(ctx: RunContext[DataAgentDeps], question: str) -> dict[str, str | dict[str, str]]:
+    """
+    根据用户问题检索最相关的表及与其存在外键关联的表的信息，结构与获取所有表信息的工具相同
+    :param ctx: agent上下文
+    :param question: 用户问题
+    :return:
+        dict: {表名: {"description": 表描述, "columns": [...], "foreign_keys": [...]}}
+    """
+    schema = {}
+
+    try:
+        snapshot = await schema_cache.get_schema(ctx.deps.conn_config)
+        if snapshot.index is None:
+            # 大库首次构建索引耗时较长，放到线程中执行避免阻塞事件循环
+            await asyncio.to_thread(get_schema_index, snapshot)
+        schema = _omit_known_tables(ctx.deps, prune_schema(snapshot, question, SCHEMA_TOP_K))
+        logger.info(f"检索相关表：{list(schema)}")
+        await ctx.deps.send("schema", {"table_count": len(schema), "tables": list(schema)})
     except Exception as e:
         logger.error(e)
 
     return schema
 
 
+@data_agent.tool
+@traced("tool.resolve_value")
+async def resolve_value(ctx: RunContext[DataAgentDeps], mention: str) -> dict[str, Any]:
+    """
+    根据问题中提到的具体取值（如“北京”、商品名称、状态）查找它所在的表、列以及库中的精确取值，用于编写等值查询条件
+    :param ctx: agent上下文
+    :param mention: 问题中提到的取值
+    :return:
+        dict: {
+            "matches": [{"table": 表名, "column": 列名, "value": 库中的精确取值, "match": exact(完全一致)/partial(包含该取值)}],
+            "indexed": 取值索引是否已构建完成，未完成时 matches 为空
+        }
+    """
+    index = value_indexer.get(ctx.deps.conn_config)
+    if index is None:
+        value_indexer.schedule(ctx.deps.conn_config)
+        return {"matches": [], "indexed": False}
+
+    matches = index.lookup(mention, RESOLVE_VALUE_LIMIT)
+    logger.info(f"解析取值 {mention}：{[(m['table'], m['column'], m['value']) for m in matches]}")
+    return {"matches": matches, "indexed": True}
+
+
 @data_agent.tool(retries=2)
-async def execute_sql(ctx: RunContext[DatabaseConnectionConfig], sql: str) -> list[dict[str, Any]] | None:
+@traced("tool.execute_sql")
+async def execute_sql(ctx: RunContext[DataAgentDeps], sql: str) -> dict[str, Any]:
     """
-    执行SQL查询并返回结果
+    执行SQL查询并返回结果，行数较多时只返回部分预览行及各列统计信息
     :param ctx: agent上下文
     :param sql: SQL查询语句
     :return:
-        list: 查询结果列表
+        dict: {
+            "columns": 列名列表,
+            "row_count": 查询结果行数,
+            "truncated": 结果是否因超出上限被截断,
+            "rows": 预览行列表,
+            "column_stats": {列名: {"min": 最小值, "max": 最大值, "distinct": 去重计数估算, "nulls": 空值数}}(仅行数多于预览行数时)
+        }
     """
     logger.info(f"执行SQL查询：{sql}")
-    sql_dict.clear()
-    sql_dict["sql_text"] = sql
+
+    # 只允许执行单条只读语句，能识别注释、字符串和带引号的标识符，校验结果按SQL缓存
+    verdict = validate_sql(sql)
+    if not verdict.allowed:
+        # 把拒绝原因告诉模型，由模型改写SQL；被拒绝的SQL不作为本次查询的SQL
+        logger.warning(f"拒绝执行SQL：{verdict.reason}")
+        raise ModelRetry(f"SQL未通过只读校验：{verdict.reason}。请只生成单条只读查询语句。")
+
+    ctx.deps.sql_text = sql
+    ctx.deps.result = None
 
     result = None
 
-    #  检查SQL中是否包含危险操作，但是字段中可能包含update，如update_time
-    danger_sql = [
-        'update', 'delete', 'insert', 'drop', 'truncate', 'create', 'alter', 'rename', 'grant', 'revoke', 'set', 'optimize',
-        'call', 'begin', 'commit', 'rollback', 'lock', 'unlock', 'savepoint', 'execute', 'deallocate', 'kill', 'reset',
-    ]
-    # 构造正则：匹配单词边界或特定前缀（避免误判字段名）
-    pattern = re.compile(
-        r'\b(' + '|'.join(danger_sql) + r')\b',
-        flags=re.IGNORECASE  # 忽略大小写
-    )
+    await ctx.deps.send("sql", {"sql": sql})
 
-    if bool(pattern.search(sql)):
-        return None
+    async def send_rows(rows: list[dict[str, Any]]) -> None:
+        await ctx.deps.send("rows", {"rows": rows})
 
     try:
-        async with aiomysql.connect(
-                host=ctx.deps.host,
-                port=ctx.deps.port,
-                user=ctx.deps.username,
-                password=ctx.deps.password.get_secret_value(),
-                db=ctx.deps.database_name,
-                charset='utf8mb4',
-                cursorclass=aiomysql.DictCursor
-        ) as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(sql)
-                result = await cursor.fetchall()
-
+        result = await execute_query(
+            ctx.deps.conn_config,
+            sql,
+            ctx.deps.cache_mode,
+            on_batch=send_rows if ctx.deps.emit else None,
+            # 未命中结果缓存时先检查执行计划，预估成本过高时让模型改写SQL
+            check_cost=True,
+        )
+    except QueryCostExceededError as e:
+        raise ModelRetry(e.decision.retry_message())
+    except (QueryQueueFullError, ReplicaUnavailableError):
+        # 数据库繁忙或没有可用的只读副本时让模型重试没有意义，直接结束本次查询
+        raise
     except Exception as e:
         logger.error(e)
         raise ModelRetry(f"SQL执行错误，错误信息：{e}。")
 
-    return result
+    ctx.deps.result = result
+    await ctx.deps.send("result", result.overview())
+    return result.summary(SQL_PREVIEW_ROWS)
@@ -2,25 +2,18 @@ from pydantic_ai import Agent, settings, RunContext
 from pyecharts import options as opts
 from pyecharts.charts import Bar, Line, Pie, Scatter, Radar, Funnel, Boxplot, HeatMap, WordCloud
 
+from utils.chart_renderer import render_chart
+from utils.model_router import chart_model
 
-async def generate_bar_chart(
+
+def _bar_chart(
         title: str,
         x_data: list,
         y_data: list,
         series_name: str = "系列1",
         width: str = "800px",
         height: str = "500px"
-) -> str:
-    """
-    生成柱状图
-    :param title: 图表标题
-    :param x_data: x轴数据
-    :param y_data: y轴数据
-    :param series_name: 系列名称
-    :param width: 图表宽度
-    :param height: 图表高度
-    :return: 生成的html文件路径
-    """
+) -> Bar:
     bar = (
         Bar(init_opts=opts.InitOpts(width=width, height=height))
         .add_xaxis(x_data)
@@ -31,31 +24,49 @@ async def generate_bar_chart(
             datazoom_opts=opts.DataZoomOpts(),
         )
     )
-    return bar.render_embed()
+    return bar
 
 
-async def generate_line_chart(
+async def generate_bar_chart(
         title: str,
         x_data: list,
         y_data: list,
         series_name: str = "系列1",
         width: str = "800px",
-        height: str = "500px",
-        is_smooth: bool = False,
-        is_area: bool = False
+        height: str = "500px"
 ) -> str:
     """
-    生成折线图
+    生成柱状图
     :param title: 图表标题
     :param x_data: x轴数据
     :param y_data: y轴数据
     :param series_name: 系列名称
     :param width: 图表宽度
     :param height: 图表高度
-    :param is_smooth: 是否平滑曲线
-    :param is_area: 是否显示面积
-    :return: 生成的html文件路径
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
     """
+    return await render_chart(
+        "bar",
+        _bar_chart,
+        title=title,
+        x_data=x_data,
+        y_data=y_data,
+        series_name=series_name,
+        width=width,
+        height=height,
+    )
+
+
+def _line_chart(
+        title: str,
+        x_data: list,
+        y_data: list,
+        series_name: str = "系列1",
+        width: str = "800px",
+        height: str = "500px",
+        is_smooth: bool = False,
+        is_area: bool = False
+) -> Line:
     line = (
         Line(init_opts=opts.InitOpts(width=width, height=height))
         .add_xaxis(x_data)
@@ -71,25 +82,52 @@ async def generate_line_chart(
             datazoom_opts=opts.DataZoomOpts(),
         )
     )
-    return line.render_embed()
+    return line
 
 
-async def generate_pie_chart(
+async def generate_line_chart(
         title: str,
-        data: list,
+        x_data: list,
+        y_data: list,
+        series_name: str = "系列1",
         width: str = "800px",
         height: str = "500px",
-        rose_type: str = None
+        is_smooth: bool = False,
+        is_area: bool = False
 ) -> str:
     """
-    生成饼图
+    生成折线图
     :param title: 图表标题
-    :param data: 数据格式 [(name1, value1), (name2, value2), ...]
+    :param x_data: x轴数据
+    :param y_data: y轴数据
+    :param series_name: 系列名称
     :param width: 图表宽度
     :param height: 图表高度
-    :param rose_type: 玫瑰图类型 (None/'radius'/'area')
-    :return: 生成的html文件路径
+    :param is_smooth: 是否平滑曲线
+    :param is_area: 是否显示面积
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
     """
+    return await render_chart(
+        "line",
+        _line_chart,
+        title=title,
+        x_data=x_data,
+        y_data=y_data,
+        series_name=series_name,
+        width=width,
+        height=height,
+        is_smooth=is_smooth,
+        is_area=is_area,
+    )
+
+
+def _pie_chart(
+        title: str,
+        data: list,
+        width: str = "800px",
+        height: str = "500px",
+        rose_type: str = None
+) -> Pie:
     pie = (
         Pie(init_opts=opts.InitOpts(width=width, height=height))
         .add(
@@ -104,26 +142,43 @@ async def generate_pie_chart(
         )
         .set_series_opts(label_opts=opts.LabelOpts(formatter="{b}: {c} ({d}%)"))
     )
-    return pie.render_embed()
+    return pie
 
 
-async def generate_scatter_chart(
+async def generate_pie_chart(
         title: str,
-        x_data: list,
-        y_data: list,
+        data: list,
         width: str = "800px",
-        height: str = "500px"
+        height: str = "500px",
+        rose_type: str = None
 ) -> str:
     """
-    生成散点图
+    生成饼图
     :param title: 图表标题
-    :param x_data: x轴数据
-    :param y_data: y轴数据 (长度应与x_data相同)
+    :param data: 数据格式 [(name1, value1), (name2, value2), ...]
     :param width: 图表宽度
     :param height: 图表高度
-    :return: 生成的html文件路径
+    :param rose_type: 玫瑰图类型 (None/'radius'/'area')
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
     """
+    return await render_chart(
+        "pie",
+        _pie_chart,
+        title=title,
+        data=data,
+        width=width,
+        height=height,
+        rose_type=rose_type,
+    )
+
 
+def _scatter_chart(
+        title: str,
+        x_data: list,
+        y_data: list,
+        width: str = "800px",
+        height: str = "500px"
+) -> Scatter:
     # 创建图表对象
     scatter = Scatter(init_opts=opts.InitOpts(width=width, height=height))
     scatter.add_xaxis(xaxis_data=x_data)
@@ -149,7 +204,51 @@ async def generate_scatter_chart(
         visualmap_opts=opts.VisualMapOpts(max_=max(y_data)),
     )
 
-    return scatter.render_embed()
+    return scatter
+
+
+async def generate_scatter_chart(
+        title: str,
+        x_data: list,
+        y_data: list,
+        width: str = "800px",
+        height: str = "500px"
+) -> str:
+    """
+    生成散点图
+    :param title: 图表标题
+    :param x_data: x轴数据
+    :param y_data: y轴数据 (长度应与x_data相同)
+    :param width: 图表宽度
+    :param height: 图表高度
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
+    """
+    return await render_chart(
+        "scatter",
+        _scatter_chart,
+        title=title,
+        x_data=x_data,
+        y_data=y_data,
+        width=width,
+        height=height,
+    )
+
+
+def _radar_chart(
+        title: str,
+        indicators: list,
+        values: list,
+        series_name: str = "系列1",
+        width: str = "600px",
+        height: str = "500px"
+) -> Radar:
+    radar = (
+        Radar(init_opts=opts.InitOpts(width=width, height=height))
+        .add_schema(schema=indicators)
+        .add(series_name, [values])
+        .set_global_opts(title_opts=opts.TitleOpts(title=title))
+    )
+    return radar
 
 
 async def generate_radar_chart(
@@ -168,33 +267,27 @@ async def generate_radar_chart(
     :param series_name: 系列名称
     :param width: 图表宽度
     :param height: 图表高度
-    :return: 生成的html文件路径
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
     """
-    radar = (
-        Radar(init_opts=opts.InitOpts(width=width, height=height))
-        .add_schema(schema=indicators)
-        .add(series_name, [values])
-        .set_global_opts(title_opts=opts.TitleOpts(title=title))
+    return await render_chart(
+        "radar",
+        _radar_chart,
+        title=title,
+        indicators=indicators,
+        values=values,
+        series_name=series_name,
+        width=width,
+        height=height,
     )
-    return radar.render_embed()
 
 
-async def generate_funnel_chart(
+def _funnel_chart(
         title: str,
         data: list,
         width: str = "800px",
         height: str = "500px",
         sort_: str = "descending"
-) -> str:
-    """
-    生成漏斗图
-    :param title: 图表标题
-    :param data: 数据格式 [(name1, value1), (name2, value2), ...]
-    :param width: 图表宽度
-    :param height: 图表高度
-    :param sort_: 排序方式 ('ascending'/'descending'/None)
-    :return: 生成的html文件路径
-    """
+) -> Funnel:
     funnel = (
         Funnel(init_opts=opts.InitOpts(width=width, height=height))
         .add(
@@ -205,27 +298,44 @@ async def generate_funnel_chart(
         )
         .set_global_opts(title_opts=opts.TitleOpts(title=title))
     )
-    return funnel.render_embed()
+    return funnel
 
 
-async def generate_heatmap_chart(
+async def generate_funnel_chart(
         title: str,
-        x_data: list,
-        y_data: list,
-        value_data: list,
+        data: list,
         width: str = "800px",
-        height: str = "500px"
+        height: str = "500px",
+        sort_: str = "descending"
 ) -> str:
     """
-    生成热力图
+    生成漏斗图
     :param title: 图表标题
-    :param x_data: x轴数据
-    :param y_data: y轴数据
-    :param value_data: 值数据 [[x_index, y_index, value], ...]
+    :param data: 数据格式 [(name1, value1), (name2, value2), ...]
     :param width: 图表宽度
     :param height: 图表高度
-    :return: 生成的html文件路径
+    :param sort_: 排序方式 ('ascending'/'descending'/None)
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
     """
+    return await render_chart(
+        "funnel",
+        _funnel_chart,
+        title=title,
+        data=data,
+        width=width,
+        height=height,
+        sort_=sort_,
+    )
+
+
+def _heatmap_chart(
+        title: str,
+        x_data: list,
+        y_data: list,
+        value_data: list,
+        width: str = "800px",
+        height: str = "500px"
+) -> HeatMap:
     heatmap = (
         HeatMap(init_opts=opts.InitOpts(width=width, height=height))
         .add_xaxis(x_data)
@@ -240,49 +350,88 @@ async def generate_heatmap_chart(
             visualmap_opts=opts.VisualMapOpts(),
         )
     )
-    return heatmap.render_embed()
+    return heatmap
 
 
-async def generate_wordcloud_chart(
+async def generate_heatmap_chart(
         title: str,
-        data: list,
+        x_data: list,
+        y_data: list,
+        value_data: list,
         width: str = "800px",
-        height: str = "500px",
-        shape: str = "circle"
+        height: str = "500px"
 ) -> str:
     """
-    生成词云图
+    生成热力图
     :param title: 图表标题
-    :param data: 数据格式 [(word1, size1), (word2, size2), ...]
+    :param x_data: x轴数据
+    :param y_data: y轴数据
+    :param value_data: 值数据 [[x_index, y_index, value], ...]
     :param width: 图表宽度
     :param height: 图表高度
-    :param shape: 形状 ('circle'/'cardioid'/'diamond'/'triangle-forward'/'triangle'/'pentagon'/'star')
-    :return: 生成的html文件路径
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
     """
+    return await render_chart(
+        "heatmap",
+        _heatmap_chart,
+        title=title,
+        x_data=x_data,
+        y_data=y_data,
+        value_data=value_data,
+        width=width,
+        height=height,
+    )
+
+
+def _wordcloud_chart(
+        title: str,
+        data: list,
+        width: str = "800px",
+        height: str = "500px",
+        shape: str = "circle"
+) -> WordCloud:
     wordcloud = (
         WordCloud(init_opts=opts.InitOpts(width=width, height=height))
         .add("", data, word_size_range=[12, 60], shape=shape)
         .set_global_opts(title_opts=opts.TitleOpts(title=title))
     )
-    return wordcloud.render_embed()
+    return wordcloud
 
 
-async def generate_boxplot_chart(
+async def generate_wordcloud_chart(
         title: str,
-        x_data: list,
-        y_data: list,
+        data: list,
         width: str = "800px",
-        height: str = "500px"
+        height: str = "500px",
+        shape: str = "circle"
 ) -> str:
     """
-    生成箱线图
+    生成词云图
     :param title: 图表标题
-    :param x_data: x轴数据
-    :param y_data: y轴数据 (二维数组，每个元素代表一个箱线图的数据点集合)
+    :param data: 数据格式 [(word1, size1), (word2, size2), ...]
     :param width: 图表宽度
     :param height: 图表高度
-    :return: 生成的html文件路径
+    :param shape: 形状 ('circle'/'cardioid'/'diamond'/'triangle-forward'/'triangle'/'pentagon'/'star')
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
     """
+    return await render_chart(
+        "wordcloud",
+        _wordcloud_chart,
+        title=title,
+        data=data,
+        width=width,
+        height=height,
+        shape=shape,
+    )
+
+
+def _boxplot_chart(
+        title: str,
+        x_data: list,
+        y_data: list,
+        width: str = "800px",
+        height: str = "500px"
+) -> Boxplot:
     # 确保y_data是二维数组
     if not all(isinstance(item, list) for item in y_data):
         y_data = [y_data]  # 如果是一维数组，转换为二维
@@ -297,7 +446,34 @@ async def generate_boxplot_chart(
         )
     )
 
-    return boxplot.render_embed()
+    return boxplot
+
+
+async def generate_boxplot_chart(
+        title: str,
+        x_data: list,
+        y_data: list,
+        width: str = "800px",
+        height: str = "500px"
+) -> str:
+    """
+    生成箱线图
+    :param title: 图表标题
+    :param x_data: x轴数据
+    :param y_data: y轴数据 (二维数组，每个元素代表一个箱线图的数据点集合)
+    :param width: 图表宽度
+    :param height: 图表高度
+    :return: 生成的图表（HTML 片段或 ECharts 配置项 JSON）
+    """
+    return await render_chart(
+        "boxplot",
+        _boxplot_chart,
+        title=title,
+        x_data=x_data,
+        y_data=y_data,
+        width=width,
+        height=height,
+    )
 
 
 model_settings = settings.ModelSettings(
@@ -305,7 +481,7 @@ model_settings = settings.ModelSettings(
 )
 
 echarts_agent = Agent[None, str](
-    'deepseek:deepseek-chat',
+    chart_model,
     output_type=[
         generate_bar_chart,
         generate_line_chart,
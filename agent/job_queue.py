@@ -0,0 +1,407 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Literal
+
+from agent.query_pipeline import run_query
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.chart_renderer import ChartFormat
+from utils.config import JOB_MAX_QUEUED, JOB_RESULT_TTL, JOB_WORKERS
+from utils.logger import logger
+from utils.query_governor import QueryQueueFullError
+from utils.query_registry import query_registry
+from utils.replica_router import ReplicaUnavailableError
+from utils.result_cache import CacheMode
+from utils.session_registry import Session, session_registry
+from utils.shared_store import SharedStore, shared_store
+from utils.sql_executor import execute_query
+from utils.tracing import new_trace_id, stage_summary, start_trace
+
+# 最多保留的任务数量，超出后淘汰最早结束的任务
+MAX_JOBS = 1000
+# 共享存储中任务的命名空间
+_STORE_NAMESPACE = "job"
+# 共享存储中取消请求的命名空间，其他工作进程上的任务由执行它的进程读取后取消
+_CANCEL_NAMESPACE = "job_cancel"
+# 订阅其他工作进程上的任务时读取共享存储的间隔（秒）
+_STORE_POLL_INTERVAL = 1.0
+
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobQueueFullError(Exception):
+    """排队的任务数量超出上限"""
+
+
+@dataclass
+class Job:
+    """异步查询任务，结束后保留结果和最后执行的SQL的查询结果行，供客户端分页获取"""
+    job_id: str
+    question: str
+    conn_config: DatabaseConnectionConfig
+    cache_mode: CacheMode = "default"
+    chart_format: ChartFormat | None = None
+    narrate: bool = False
+    trace_id: str = field(default_factory=new_trace_id)
+    session_id: str | None = None  # 提交任务的会话，只有该会话可以查看和取消任务
+    status: JobStatus = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: dict[str, Any] | None = None  # 与 /api/query 相同的结果
+    error: str | None = None
+    columns: list[str] = field(default_factory=list)
+    rows: list[dict[str, Any]] = field(default_factory=list)
+    truncated: bool = False
+    stages: dict[str, float] = field(default_factory=dict)
+    expires_at: float | None = None  # 结束后的过期时间（time.monotonic()）
+    events: list[tuple[str, dict[str, Any]]] = field(default_factory=list, repr=False)
+    session: Session | None = field(default=None, repr=False)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    _task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def owned_by(self, session: Session) -> bool:
+        """任务是否由该会话提交，且会话仍连接提交时的数据库"""
+        return self.session_id == session.session_id and self.conn_config.conn_key == session.conn_config.conn_key
+
+    def to_dict(self) -> dict[str, Any]:
+        """任务状态，不包含查询结果行"""
+        ended = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "question": self.question,
+            "trace_id": self.trace_id,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait_ms": round(((self.started_at or ended) - self.created_at) * 1000, 1),
+            "duration_ms": round((ended - self.started_at) * 1000, 1) if self.started_at else None,
+            "result": self.result,
+            "error": self.error,
+            "columns": self.columns,
+            "row_count": len(self.rows),
+            "truncated": self.truncated,
+            "stages": self.stages,
+        }
+
+    def page(self, offset: int, limit: int) -> dict[str, Any]:
+        """
+        获取一页查询结果行
+        :param offset: 起始行
+        :param limit: 行数
+        :return: {"columns": 列名, "rows": 行, "offset": 起始行, "next_offset": 下一页起始行，没有下一页时为 None, "total": 总行数}
+        """
+        rows = self.rows[offset:offset + limit]
+        next_offset = offset + len(rows)
+        return {
+            "columns": self.columns,
+            "rows": rows,
+            "offset": offset,
+            "next_offset": next_offset if next_offset < len(self.rows) else None,
+            "total": len(self.rows),
+            "truncated": self.truncated,
+        }
+
+    def record(self, event: str, data: dict[str, Any]) -> None:
+        """记录任务事件并唤醒订阅者"""
+        self.events.append((event, data))
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def capture(self, event: str, data: dict[str, Any]) -> None:
+        """
+        流水线的事件回调：保存最后执行的SQL的结果行，其余事件原样记录，行数据只以行数通知订阅者
+        :param event: 事件名称
+        :param data: 事件数据
+        """
+        if event == "sql":
+            self.columns, self.rows, self.truncated = [], [], False
+        elif event == "rows":
+            self.rows.extend(data["rows"])
+            data = {"row_count": len(self.rows)}
+        elif event == "result":
+            self.columns, self.truncated = data["columns"], data["truncated"]
+        self.record(event, data)
+
+    def snapshot(self) -> dict[str, Any]:
+        """写入共享存储的任务状态"""
+        return {name: getattr(self, name) for name in _SNAPSHOT_FIELDS}
+
+
+_SNAPSHOT_FIELDS = (
+    "job_id", "question", "conn_config", "trace_id", "session_id", "status", "created_at", "started_at", "finished_at",
+    "result", "error", "columns", "rows", "truncated", "stages",
+)
+
+
+class JobQueue:
+    """
+    异步查询任务队列
+    提交后立即返回任务 ID，由固定数量的后台工作协程依次执行，客户端轮询或订阅任务状态，
+    结束后的结果保留一段时间，查询结果行按页获取
+    """
+
+    def __init__(
+            self,
+            workers: int = JOB_WORKERS,
+            max_queued: int = JOB_MAX_QUEUED,
+            ttl: int = JOB_RESULT_TTL,
+            max_jobs: int = MAX_JOBS,
+            store: SharedStore | None = shared_store,
+    ):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.store = store
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._queue: asyncio.Queue[Job] | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        """启动后台工作协程，在应用生命周期开始时调用"""
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._worker_tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"异步查询任务队列已启动，工作协程 {self.workers} 个")
+
+    async def stop(self) -> None:
+        """停止后台工作协程并取消未完成的任务"""
+        for job in list(self._jobs.values()):
+            if not job.finished:
+                await self._cancel(job)
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def submit(
+            self,
+            session: Session,
+            question: str,
+            cache_mode: CacheMode = "default",
+            chart_format: ChartFormat | None = None,
+            narrate: bool = False,
+    ) -> Job:
+        """
+        提交查询任务
+        :param session: 提交任务的会话，使用提交时的数据库连接配置
+        :param question: 用户问题
+        :param cache_mode: 缓存模式
+        :param chart_format: 图表输出格式
+        :param narrate: 输入为SQL时，是否额外生成结果总结
+        :return: 任务
+        """
+        if self._queue is None:
+            raise RuntimeError("任务队列未启动")
+        self._purge()
+        job = Job(
+            job_id=uuid.uuid4().hex,
+            question=question,
+            conn_config=session.conn_config,
+            cache_mode=cache_mode,
+            chart_format=chart_format,
+            narrate=narrate,
+            session_id=session.session_id,
+            session=session,
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"排队的查询任务已达上限 {self.max_queued} 个，请稍后再试")
+        self._jobs[job.job_id] = job
+        job.record("status", {"status": job.status})
+        await self._save(job)
+        return job
+
+    async def get(self, job_id: str, session: Session) -> Job | None:
+        """
+        获取任务，本进程没有时读取共享存储
+        :param job_id: 任务 ID
+        :param session: 发起请求的会话，不是该会话提交的任务视为不存在
+        :return: 任务，不存在或已过期时返回 None
+        """
+        job = self._jobs.get(job_id)
+        if job is not None and job.expires_at is not None and job.expires_at <= time.monotonic():
+            del self._jobs[job_id]
+            return None
+        if job is None:
+            job = await self._load(job_id)
+        return job if job is not None and job.owned_by(session) else None
+
+    async def cancel(self, job_id: str, session: Session) -> Job | None:
+        """
+        取消排队中或执行中的任务，其他工作进程上的任务通过共享存储通知执行它的进程取消
+        :param job_id: 任务 ID
+        :param session: 发起请求的会话
+        :return: 任务，不存在时返回 None；其他工作进程上的任务返回取消前的状态
+        """
+        job = await self.get(job_id, session)
+        if job is None or job.finished:
+            return job
+        if job_id in self._jobs:
+            await self._cancel(job)
+        elif self.store is not None:
+            await self.store.set(_CANCEL_NAMESPACE, job_id, True, ttl=self.ttl)
+            logger.info(f"查询任务 {job_id} 在其他工作进程上，已写入取消请求")
+        return job
+
+    async def watch(self, job_id: str) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        """
+        订阅任务事件：先补发已有事件，之后逐个返回新事件，任务结束后停止，调用前先用 get 检查任务归属
+        :param job_id: 任务 ID
+        :return: (事件名称, 事件数据)
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            # 其他工作进程上的任务只能读取共享存储，状态变化时返回
+            async for event in self._watch_shared(job_id):
+                yield event
+            return
+
+        sent = 0
+        while True:
+            changed = job._changed
+            while sent < len(job.events):
+                sent += 1
+                yield job.events[sent - 1]
+            if job.finished:
+                return
+            await changed.wait()
+
+    def stats(self) -> dict[str, int]:
+        """任务统计信息"""
+        counts = {status: 0 for status in ("queued", "running", *FINISHED_STATUSES)}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {"jobs": len(self._jobs), "workers": self.workers, **counts}
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == "queued" and await self._cancel_requested(job):
+                    await self._cancel(job)
+                if job.status == "queued":
+                    job._task = asyncio.create_task(self._run(job))
+                    watcher = asyncio.create_task(self._watch_cancel(job)) if self.store is not None else None
+                    try:
+                        await asyncio.wait({job._task})
+                    finally:
+                        if watcher is not None:
+                            watcher.cancel()
+            except Exception as e:
+                logger.error(f"查询任务 {job.job_id} 执行失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        with start_trace(job.trace_id):
+            job.status, job.started_at = "running", time.time()
+            job.record("status", {"status": job.status})
+            await self._save(job)
+            logger.info(f"开始执行查询任务 {job.job_id}: {job.question}")
+            try:
+                async with session_registry.hold(job.session):
+                    job.result = await run_query(
+                        job.question, job.conn_config, job.cache_mode, emit=job.capture,
+                        chart_format=job.chart_format, narrate=job.narrate,
+                    )
+                    await self._load_rows(job)
+                job.status = "succeeded"
+            except asyncio.CancelledError:
+                job.status, job.error = "cancelled", "任务已取消"
+            except (QueryQueueFullError, ReplicaUnavailableError) as e:
+                job.status, job.error = "failed", str(e)
+            except Exception as e:
+                logger.error(f"查询任务 {job.job_id} 发生异常: {e}")
+                job.status, job.error = "failed", "服务器内部出错"
+            finally:
+                job.stages = stage_summary()
+                await self._finish(job)
+                logger.info(f"查询任务 {job.job_id} 结束：{job.status}，各阶段耗时(ms): {job.stages}")
+
+    @staticmethod
+    async def _load_rows(job: Job) -> None:
+        # 命中问答缓存时流水线不会发送结果行，按结果句柄重新读取（通常命中结果缓存）
+        if job.rows or not job.result or not job.result.get("result_id"):
+            return
+        handle = await query_registry.get(job.result["result_id"])
+        if handle is None:
+            return
+        result = await execute_query(handle.conn_config, handle.sql_text, job.cache_mode)
+        job.columns, job.rows, job.truncated = result.columns, result.rows, result.truncated
+
+    async def _cancel(self, job: Job) -> None:
+        if job._task is not None:
+            job._task.cancel()
+        else:
+            # 仍在排队的任务直接结束，工作协程取到后跳过
+            job.status, job.error = "cancelled", "任务已取消"
+            await self._finish(job)
+
+    async def _cancel_requested(self, job: Job) -> bool:
+        return self.store is not None and await self.store.get(_CANCEL_NAMESPACE, job.job_id) is not None
+
+    async def _watch_cancel(self, job: Job) -> None:
+        # 取消请求可能由其他工作进程写入共享存储，执行期间定期检查
+        while not job.finished:
+            await asyncio.sleep(_STORE_POLL_INTERVAL)
+            if not job.finished and await self._cancel_requested(job):
+                logger.info(f"收到其他工作进程的取消请求，取消查询任务 {job.job_id}")
+                await self._cancel(job)
+                return
+
+    async def _finish(self, job: Job) -> None:
+        job.finished_at = time.time()
+        job.expires_at = time.monotonic() + self.ttl
+        job.session = None
+        job._task = None
+        if job.status == "succeeded":
+            job.record("done", job.to_dict())
+        else:
+            job.record("error", {"message": job.error, "status": job.status, "trace_id": job.trace_id})
+        await self._save(job)
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.expires_at is not None and job.expires_at <= now]:
+            del self._jobs[job_id]
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[job_id]
+
+    async def _save(self, job: Job) -> None:
+        # 未结束的任务保留到结束后的有效期为止，避免执行中的进程退出后任务永远停留在执行中
+        if self.store is not None:
+            await self.store.set(_STORE_NAMESPACE, job.job_id, job.snapshot(), ttl=self.ttl)
+
+    async def _load(self, job_id: str) -> Job | None:
+        stored = await self.store.get(_STORE_NAMESPACE, job_id) if self.store is not None else None
+        if stored is None:
+            return None
+        return Job(**stored.value)
+
+    async def _watch_shared(self, job_id: str) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        status = None
+        while (job := await self._load(job_id)) is not None:
+            if job.status != status:
+                status = job.status
+                yield "status", {"status": status}
+            if job.finished:
+                if job.status == "succeeded":
+                    yield "done", job.to_dict()
+                else:
+                    yield "error", {"message": job.error, "status": job.status, "trace_id": job.trace_id}
+                return
+            await asyncio.sleep(_STORE_POLL_INTERVAL)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,18 @@
+from pydantic_ai import Agent, settings
+
+from utils.model_router import narrative_model
+
+model_settings = settings.ModelSettings(
+    temperature=0.0
+)
+
+narrative_agent = Agent[None, str](
+    narrative_model,
+    output_type=str,
+    system_prompt=(
+        "你是一个数据分析专家，你将收到一条SQL及其查询结果的概要（列名、行数、预览行和各列统计信息），"
+        "请用一到三句简单易懂的中文总结查询结果中最值得关注的信息。"
+        "注意：查询结果会以表格形式另行展示给用户，你不要输出表格，也不要逐行复述数据，不要包含自己的思考过程。"
+    ),
+    model_settings=model_settings
+)
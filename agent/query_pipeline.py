@@ -0,0 +1,440 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, AsyncIterator
+
+import aiomysql
+import pydantic_core
+from pydantic_ai.messages import ModelMessage, ToolCallPart
+
+from agent.chart_builder import build_chart
+from agent.conversation import Conversation, conversation_registry, synthetic_turn_messages
+from agent.data_agent import DATA_AGENT_SYSTEM_PROMPT, data_agent
+from agent.echarts_agent import echarts_agent
+from agent.narrative_agent import narrative_agent
+from schemas.agent_deps import DataAgentDeps, EventEmitter
+from schemas.agent_output import DataDetails
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.answer_cache import CachedAnswer, answer_cache, result_fingerprint
+from utils.chart_renderer import ChartFormat, chart_format_var
+from utils.config import ANSWER_CACHE_REVALIDATE, BATCH_CONCURRENCY, SQL_PREVIEW_ROWS
+from utils.cost_gate import QueryCostExceededError
+from utils.logger import logger
+from utils.query_governor import QueryQueueFullError, QueryTimeoutError
+from utils.query_registry import query_registry
+from utils.replica_router import ReplicaUnavailableError
+from utils.result_cache import CacheMode
+from utils.schema_cache import schema_cache
+from utils.schema_index import get_schema_index
+from utils.sql_executor import QueryResult, execute_query
+from utils.sql_guard import is_raw_sql
+from utils.table_renderer import TABLE_PLACEHOLDER, insert_table, render_result_table
+from utils.tracing import Span, record_usage, span, stage_summary, start_trace
+
+# 流式输出答案时的合并间隔（秒），None 表示每个 token 都立即发送
+ANSWER_STREAM_DEBOUNCE = 0.05
+
+_SQL_FENCE_PATTERN = re.compile(r'^```(?:sql|mysql)?\s*\n?(.*?)\n?```$', re.IGNORECASE | re.DOTALL)
+_DIGIT_PATTERN = re.compile(r'\d')
+
+
+async def get_cached_answer(
+        conn_config: DatabaseConnectionConfig,
+        schema_version: str,
+        question: str,
+        chart_format: ChartFormat,
+) -> CachedAnswer | None:
+    """
+    读取问答缓存，开启重新校验时绕过结果缓存重新执行缓存的SQL，
+    查询结果变化时用新的结果重新渲染表格和图表，不调用模型；无法直接渲染（需要图表智能体）时视为未命中
+    :param chart_format: 本次请求的图表格式，缓存的图表格式不同时视为未命中
+    :return: 缓存的答案，未命中时返回 None
+    """
+    cached = await answer_cache.get(conn_config, schema_version, question)
+    if cached is None:
+        return None
+    # 先判断图表格式，需要重新生成的答案不必再校验数据
+    if cached.response.get("chart") and cached.response.get("chart_format") != chart_format:
+        return None
+
+    if ANSWER_CACHE_REVALIDATE:
+        try:
+            result = await execute_query(conn_config, cached.sql_text, cache_mode="refresh")
+        except Exception as e:
+            logger.error(f"重新执行缓存的SQL失败: {e}")
+            await answer_cache.discard(conn_config, schema_version, question)
+            return None
+        fingerprint = result_fingerprint(result.rows)
+        if fingerprint != cached.fingerprint:
+            response = await _rerender_cached_answer(conn_config, cached, result, chart_format)
+            if response is None:
+                await answer_cache.discard(conn_config, schema_version, question)
+                logger.info("缓存答案对应的数据已变化且无法直接重新渲染，重新生成答案")
+                return None
+            logger.info("缓存答案对应的数据已变化，已用新的查询结果重新渲染表格和图表")
+            await answer_cache.set(conn_config, schema_version, question, cached.sql_text, result.rows, response,
+                                   cached.details)
+            return CachedAnswer(cached.sql_text, fingerprint, response, cached.expires_at, cached.details)
+
+    logger.info("问答缓存命中，跳过模型调用")
+    return cached
+
+
+async def _rerender_cached_answer(
+        conn_config: DatabaseConnectionConfig,
+        cached: CachedAnswer,
+        result: QueryResult,
+        chart_format: ChartFormat,
+) -> dict[str, Any] | None:
+    # 模型生成的文字总结沿用缓存，表格和图表按新的查询结果重新渲染
+    if cached.details is None:
+        return None
+    details = DataDetails(**cached.details)
+    deps = DataAgentDeps(conn_config=conn_config, sql_text=cached.sql_text, result=result)
+    rendered = await _render_answer(details, deps, chart_format, use_chart_agent=False)
+    if rendered is None:
+        return None
+    describe, chart = rendered
+    if _DIGIT_PATTERN.search(details.markdown_describe.replace(TABLE_PLACEHOLDER, "")):
+        describe = f"{describe}\n\n> 数据已更新：表格和图表为最新的查询结果，文字总结基于更新前的数据生成。"
+    return {"data": _format_answer(describe, cached.sql_text), "chart": chart, "chart_format": chart_format}
+
+
+def extract_raw_sql(question: str) -> str | None:
+    """
+    判断用户输入是否本身就是一条只读SQL（可以用 ```sql 代码块包裹），
+    以 show、select 等单词开头的英文问题能通过只读校验，还要确认输入确实是SQL而不是自然语言
+    :param question: 用户输入
+    :return: SQL语句，不是只读SQL时返回 None
+    """
+    text = question.strip()
+    match = _SQL_FENCE_PATTERN.match(text)
+    if match:
+        text = match.group(1).strip()
+    return text if is_raw_sql(text) else None
+
+
+def _format_answer(describe: str, sql_text: str | None) -> str:
+    return (
+        f"{describe}"
+        f"\n\n\n"
+        f"---"
+        f"\n\n\n"
+        f"执行的SQL：\n\n{sql_text or '无'}"
+    )
+
+
+async def _run_raw_sql(
+        question: str,
+        sql: str,
+        conn_config: DatabaseConnectionConfig,
+        cache_mode: CacheMode,
+        emit: EventEmitter | None,
+        chart_format: ChartFormat,
+        narrate: bool,
+        conversation: Conversation | None,
+) -> dict[str, Any] | None:
+    """
+    直接执行用户输入的SQL，结果由服务端渲染为表格，不经过数据智能体
+    :param narrate: 是否额外让模型根据结果概要生成一段简短总结
+    :param conversation: 所属的对话，执行成功时作为一轮问答记录，后续问题可以基于这条SQL追问
+    :return: 返回给客户端的结果，SQL执行出错时返回 None，交由数据智能体处理
+    """
+    logger.info(f"用户输入为只读SQL，跳过数据智能体直接执行：{sql}")
+    deps = DataAgentDeps(conn_config=conn_config, cache_mode=cache_mode, emit=emit)
+    # SQL执行成功后才发送 sql 事件，执行出错转交数据智能体时客户端不会先收到一条无效的SQL
+    sql_sent = False
+
+    async def send_sql() -> None:
+        nonlocal sql_sent
+        if not sql_sent:
+            sql_sent = True
+            await deps.send("sql", {"sql": sql})
+
+    async def send_rows(rows: list[dict[str, Any]]) -> None:
+        await send_sql()
+        await deps.send("rows", {"rows": rows})
+
+    try:
+        result = await execute_query(
+            conn_config, sql, cache_mode, on_batch=send_rows if emit else None, check_cost=True
+        )
+    except QueryCostExceededError as e:
+        describe = f"SQL预估扫描约 {int(e.decision.estimated_rows)} 行，超出执行成本上限，未执行：\n\n" + "\n".join(
+            f"- {hint}" for hint in e.decision.hints
+        )
+        await deps.send("answer", {"delta": describe})
+        return {"data": _format_answer(describe, sql), "chart": None, "chart_format": chart_format, "result_id": None}
+    except QueryTimeoutError as e:
+        describe = f"SQL执行超时：{e}"
+        await deps.send("answer", {"delta": describe})
+        return {"data": _format_answer(describe, sql), "chart": None, "chart_format": chart_format, "result_id": None}
+    except aiomysql.Error as e:
+        # 形如SQL的自然语言问题执行会出错，交给数据智能体理解
+        logger.info(f"直接执行SQL失败，交由数据智能体处理: {e}")
+        return None
+
+    await send_sql()
+    await deps.send("result", result.overview())
+
+    describe = await render_result_table(conn_config, sql, result) if result.row_count else "未能查询到相关结果。"
+    overview = f"已直接执行该SQL，查询结果共 {result.row_count} 行，列：{', '.join(result.columns)}。"
+    if narrate and result.row_count:
+        with span("narrative_agent") as agent_span:
+            narrative = await narrative_agent.run(
+                f"SQL：{sql}\n查询结果概要："
+                f"{json.dumps(result.summary(SQL_PREVIEW_ROWS), ensure_ascii=False, default=str)}"
+            )
+            record_usage("narrative_agent", narrative.usage(), agent_span)
+        describe = f"{narrative.output}\n\n{describe}"
+        overview = f"{overview}{narrative.output}"
+    await deps.send("answer", {"delta": describe})
+
+    if conversation is not None:
+        await conversation_registry.record(
+            conversation, question, synthetic_turn_messages(question, overview), sql, overview, None
+        )
+
+    result_id = await query_registry.register(conn_config, sql)
+    return {"data": _format_answer(describe, sql), "chart": None, "chart_format": chart_format, "result_id": result_id}
+
+
+async def _run_data_agent_streaming(
+        question: str,
+        deps: DataAgentDeps,
+        agent_span: Span,
+        history: list[ModelMessage] | None,
+) -> tuple[DataDetails, list[ModelMessage]]:
+    """
+    流式运行数据智能体，答案生成过程中逐段发送 answer 事件
+    :return: 数据智能体的输出和本次运行新增的消息
+    """
+    sent_length = 0
+    async with data_agent.run_stream(question, deps=deps, message_history=history) as result:
+        async for message, is_last in result.stream_structured(debounce_by=ANSWER_STREAM_DEBOUNCE):
+            # 输出工具的参数是逐步补全的 JSON，按部分 JSON 解析出当前已生成的答案
+            for part in message.parts:
+                if not isinstance(part, ToolCallPart) or not isinstance(part.args, str) or not part.args:
+                    continue
+                try:
+                    partial_args = pydantic_core.from_json(part.args, allow_partial='trailing-strings')
+                except ValueError:
+                    continue
+                describe = partial_args.get("markdown_describe") if isinstance(partial_args, dict) else None
+                if isinstance(describe, str) and len(describe) > sent_length:
+                    await deps.send("answer", {"delta": describe[sent_length:]})
+                    sent_length = len(describe)
+
+        output = await result.validate_structured_output(message)
+        record_usage("data_agent", result.usage(), agent_span)
+        return output, result.new_messages()
+
+
+async def _render_answer(
+        details: DataDetails,
+        deps: DataAgentDeps,
+        chart_format: ChartFormat,
+        use_chart_agent: bool = True,
+) -> tuple[str, Any] | None:
+    """
+    根据数据智能体的输出和查询结果渲染最终答案：服务端渲染的表格放入答案，需要图表时生成图表
+    :param details: 数据智能体的输出
+    :param deps: 数据智能体的依赖，包含最后执行的SQL及其结果
+    :param chart_format: 图表输出格式
+    :param use_chart_agent: 无法直接用查询结果生成图表时是否交给图表智能体
+    :return: (答案, 图表)，需要图表智能体但不允许使用时返回 None
+    """
+    # 查询结果表格由服务端渲染，模型只输出总结；图表智能体需要根据表格数据生成图表
+    describe = details.markdown_describe
+    show_table = details.show_table or TABLE_PLACEHOLDER in describe
+    table = None
+    if deps.result is not None and deps.result.row_count and (show_table or details.chart):
+        table = await render_result_table(deps.conn_config, deps.sql_text, deps.result)
+
+    chart = None
+    if details.chart:
+        # 优先直接用查询结果生成图表，无法推断时才交给图表智能体
+        chart = await build_chart(details.chart_type, deps.result, details.chart_title)
+        if chart is None and not use_chart_agent:
+            return None
+
+    if show_table and table:
+        if TABLE_PLACEHOLDER not in describe:
+            await deps.send("answer", {"delta": f"\n\n{table}"})
+        describe = insert_table(describe, table)
+    else:
+        describe = describe.replace(TABLE_PLACEHOLDER, "")
+
+    if details.chart:
+        if chart is None:
+            chart_data = describe if show_table or not table else insert_table(describe, table)
+            with span("echarts_agent") as agent_span:
+                echarts_agent_result = await echarts_agent.run(
+                    f"MarkDown数据描述：{chart_data} \n 生成的图表类型：{details.chart_type}"
+                    + (f" \n 图表标题：{details.chart_title}" if details.chart_title else "")
+                )
+                record_usage("echarts_agent", echarts_agent_result.usage(), agent_span)
+            chart = echarts_agent_result.output
+        await deps.send("chart", {"chart": chart, "format": chart_format})
+    return describe, chart
+
+
+async def run_query(
+        question: str,
+        conn_config: DatabaseConnectionConfig,
+        cache_mode: CacheMode = "default",
+        emit: EventEmitter | None = None,
+        chart_format: ChartFormat | None = None,
+        narrate: bool = False,
+        conversation: Conversation | None = None,
+) -> dict[str, Any]:
+    """
+    执行一次完整的问答：问答缓存 -> 数据智能体 -> 图表生成；输入本身是只读SQL时直接执行并渲染表格
+    :param question: 用户问题
+    :param conn_config: 数据库连接配置
+    :param cache_mode: 缓存模式
+    :param emit: 事件回调，传入时以流式方式运行并在各阶段发送事件
+    :param chart_format: 图表输出格式，默认使用全局配置
+    :param narrate: 输入为SQL时，是否额外生成结果总结
+    :param conversation: 所属的多轮对话，传入时带上之前各轮的历史消息，并把本轮追加到对话中
+    :return: 返回给客户端的结果 {"data": 答案, "chart": 图表, "chart_format": 图表格式, "result_id": 完整结果句柄}，
+             属于对话时附带 "conversation_id"
+    """
+    chart_format = chart_format or chart_format_var.get()
+    token = chart_format_var.set(chart_format)
+    try:
+        async with conversation_registry.hold(conversation):
+            result = None
+            sql = extract_raw_sql(question)
+            if sql is not None:
+                result = await _run_raw_sql(question, sql, conn_config, cache_mode, emit, chart_format, narrate,
+                                            conversation)
+            if result is None:
+                result = await _run_query(question, conn_config, cache_mode, emit, chart_format, conversation)
+        if conversation is not None:
+            result["conversation_id"] = conversation.conversation_id
+        return result
+    finally:
+        chart_format_var.reset(token)
+
+
+async def run_batch(
+        questions: list[str],
+        conn_config: DatabaseConnectionConfig,
+        cache_mode: CacheMode = "default",
+        concurrency: int = BATCH_CONCURRENCY,
+        chart_format: ChartFormat | None = None,
+        batch_id: str | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    批量问答：表结构只加载一次并在整个批次内共用，各问题在并发上限内同时处理，按完成顺序返回
+    :param questions: 用户问题列表
+    :param conn_config: 数据库连接配置
+    :param cache_mode: 缓存模式
+    :param concurrency: 同时处理的问题数
+    :param chart_format: 图表输出格式，默认使用全局配置
+    :param batch_id: 批次 ID，作为各问题追踪 ID 的前缀
+    :return: 各问题的结果 {"index": 序号, "question": 问题, "success": 是否成功, "message": 结果或错误信息,
+             "trace_id": 追踪 ID, "duration_ms": 耗时, "stages": 各阶段耗时}
+    """
+    snapshot = await schema_cache.get_schema(conn_config)
+    # 预先构建检索索引，避免并发的问题各自构建
+    await asyncio.to_thread(get_schema_index, snapshot)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    finished: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+
+    async def run_item(index: int, question: str) -> None:
+        async with semaphore:
+            with start_trace(f"{batch_id}-{index}" if batch_id else None) as trace_id:
+                started = time.perf_counter()
+                try:
+                    item = {"success": True, "message": await run_query(
+                        question, conn_config, cache_mode, chart_format=chart_format
+                    )}
+                except (QueryQueueFullError, ReplicaUnavailableError) as e:
+                    item = {"success": False, "message": str(e)}
+                except Exception as e:
+                    logger.error(f"批量查询第 {index} 个问题发生异常: {e}")
+                    item = {"success": False, "message": "服务器内部出错"}
+                item.update(
+                    index=index,
+                    question=question,
+                    trace_id=trace_id,
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                    stages=stage_summary(),
+                )
+        await finished.put(item)
+
+    # 子任务创建时复制上下文，批次内的所有问题都使用同一份表结构
+    with schema_cache.pin(conn_config, snapshot):
+        tasks = [asyncio.create_task(run_item(index, question)) for index, question in enumerate(questions)]
+    try:
+        for _ in tasks:
+            yield await finished.get()
+    finally:
+        # 客户端断开时取消尚未完成的问题
+        for task in tasks:
+            task.cancel()
+
+
+async def _run_query(
+        question: str,
+        conn_config: DatabaseConnectionConfig,
+        cache_mode: CacheMode,
+        emit: EventEmitter | None,
+        chart_format: ChartFormat,
+        conversation: Conversation | None,
+) -> dict[str, Any]:
+    schema_version = (await schema_cache.get_schema(conn_config)).version
+    history = None
+    if conversation is not None:
+        history = conversation_registry.history(conversation, conn_config, schema_version, DATA_AGENT_SYSTEM_PROMPT)
+
+    # 对话中的问题可能依赖上文（如“按月份再拆分一下”），不读取问答缓存，只有没有上文的问题写入缓存
+    if cache_mode == "default" and conversation is None:
+        cached = await get_cached_answer(conn_config, schema_version, question, chart_format)
+        if cached is not None:
+            result_id = await query_registry.register(conn_config, cached.sql_text)
+            return {**cached.response, "result_id": result_id}
+
+    deps = DataAgentDeps(
+        conn_config=conn_config,
+        cache_mode=cache_mode,
+        emit=emit,
+        known_tables=frozenset(conversation.tables) if conversation is not None else frozenset(),
+    )
+    with span("data_agent", streaming=emit is not None) as agent_span:
+        if history is not None:
+            agent_span.set(history_turns=conversation.turn_count, history_tokens=conversation.tokens())
+        if emit is not None:
+            data_details, messages = await _run_data_agent_streaming(question, deps, agent_span, history)
+        else:
+            agent_result = await data_agent.run(question, deps=deps, message_history=history)
+            record_usage("data_agent", agent_result.usage(), agent_span)
+            data_details, messages = agent_result.output, agent_result.new_messages()
+
+    logger.info(f"数据智能体结果: {data_details}")
+    if conversation is not None:
+        await conversation_registry.record(
+            conversation, question, messages, deps.sql_text,
+            data_details.markdown_describe.replace(TABLE_PLACEHOLDER, ""), schema_version,
+        )
+
+    describe, chart = await _render_answer(data_details, deps, chart_format)
+    data_text = _format_answer(describe, deps.sql_text)
+
+    result = {
+        "data": data_text,
+        "chart": chart,
+        "chart_format": chart_format,
+    }
+
+    # 只缓存基于成功执行的SQL、且不依赖对话上文得到的答案
+    if cache_mode != "bypass" and history is None and deps.sql_text and deps.result is not None:
+        await answer_cache.set(conn_config, schema_version, question, deps.sql_text, deps.result.rows, result,
+                               data_details.model_dump())
+
+    # 模型只看到结果预览，完整结果由客户端凭 result_id 另行获取
+    result_id = await query_registry.register(conn_config, deps.sql_text) if deps.result is not None else None
+    return {**result, "result_id": result_id}
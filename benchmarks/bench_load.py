@@ -0,0 +1,339 @@
+"""
+端到端负载基准测试：用 FunctionModel 按脚本调用工具代替 DeepSeek，用进程内替身数据库代替 MySQL，
+直接通过 ASGI 接口驱动 main.app，统计 /api/query、表结构加载与检索、图表渲染的 p50/p95/p99 延迟、每秒请求数和峰值内存，
+并可与上一次保存的结果对比检测性能回退
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_load --requests 200 --concurrency 16 --model-delay 0.05 --save bench.json
+    python -m benchmarks.bench_load --baseline bench.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+# 模型只在测试中被替换，构造 Agent 时仍需要 API Key
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from agent.chart_builder import build_chart
+from agent.data_agent import data_agent
+from agent.echarts_agent import echarts_agent
+from benchmarks.fixture_db import FixtureDatabase, install
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.chart_renderer import render_cache
+from utils.config import SCHEMA_TOP_K
+from utils.logger import logger
+from utils.schema_cache import schema_cache
+from utils.schema_index import get_schema_index, prune_schema
+from utils.sql_executor import QueryResult
+from utils.value_index import value_indexer
+
+BENCH_SQL = "SELECT u.name, COUNT(*) AS order_count, SUM(o.amount) AS total FROM t_order o JOIN t_user u ON u.id = o.user_id GROUP BY u.name ORDER BY total DESC LIMIT 20"
+CONNECT_BODY = {"host": "fixture", "port": 3306, "username": "bench", "password": "bench", "dbName": "bench"}
+
+# 回退判断：延迟类指标越大越差，吞吐类指标越小越差
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms")
+HIGHER_IS_BETTER = ("rps",)
+
+
+def scripted_data_model(delay: float) -> FunctionModel:
+    """
+    按固定脚本调用工具的数据智能体模型：检索相关表 -> 执行SQL -> 输出总结并附表格和图表
+    :param delay: 每次模型调用的模拟耗时（秒）
+    """
+
+    async def step(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        if delay:
+            await asyncio.sleep(delay)
+        last = messages[-1].parts[-1]
+        if isinstance(last, ToolReturnPart) and last.tool_name == "execute_sql":
+            output = {"markdown_describe": "消费金额最高的用户如下：", "show_table": True, "chart": True, "chart_type": "柱状图"}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+        if isinstance(last, ToolReturnPart):
+            return ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": BENCH_SQL})])
+        return ModelResponse(parts=[ToolCallPart("search_relevant_tables", {"question": "用户订单金额"})])
+
+    return FunctionModel(step)
+
+
+def unexpected_chart_model(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+    raise RuntimeError("图表应由查询结果直接生成，不应调用图表智能体")
+
+
+class AsgiClient:
+    """不经过网络，直接调用 ASGI 应用的最小客户端"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    @asynccontextmanager
+    async def lifespan(self) -> AsyncIterator[None]:
+        """运行应用的启动和关闭流程"""
+        receive_queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        send_queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        await receive_queue.put({"type": "lifespan.startup"})
+        task = asyncio.create_task(self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive_queue.get, send_queue.put))
+        message = await send_queue.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"应用启动失败：{message}")
+        try:
+            yield
+        finally:
+            await receive_queue.put({"type": "lifespan.shutdown"})
+            await send_queue.get()
+            await task
+
+    async def request(
+            self,
+            method: str,
+            path: str,
+            body: Any = None,
+            headers: dict[str, str] | None = None,
+    ) -> tuple[int, dict[str, str], bytes]:
+        """
+        发送一次请求并读取完整响应
+        :return: (状态码, 响应头, 响应体)
+        """
+        path, _, query_string = path.partition("?")
+        payload = json.dumps(body, ensure_ascii=False).encode() if body is not None else b""
+        raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        raw_headers += [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": query_string.encode(), "root_path": "",
+            "headers": raw_headers, "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        }
+        request_sent = False
+        response_done = asyncio.Event()
+
+        async def receive() -> dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            # 请求体已发送完毕，等到响应结束后再报告断开
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        status, response_headers, chunks = 0, {}, []
+
+        async def send(message: dict[str, Any]) -> None:
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = {key.decode(): value.decode() for key, value in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    response_done.set()
+
+        await self.app(scope, receive, send)
+        response_done.set()
+        return status, response_headers, b"".join(chunks)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(name: str, samples: list[float], wall: float | None = None) -> dict[str, float]:
+    """
+    统计延迟分位数和峰值内存
+    :param wall: 并发压测的总耗时，传入时计算每秒请求数
+    """
+    metrics = {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if wall:
+        metrics["rps"] = len(samples) / wall
+    print(
+        f"{name:<24} n={metrics['count']:>5}  p50={metrics['p50_ms']:>8.2f}ms  p95={metrics['p95_ms']:>8.2f}ms  "
+        f"p99={metrics['p99_ms']:>8.2f}ms  peak_rss={metrics['peak_rss_mb']:>7.1f}MB"
+        + (f"  rps={metrics['rps']:.1f}" if wall else "")
+    )
+    return metrics
+
+
+async def bench_query(requests: int, concurrency: int, model_delay: float, db_delay: float) -> dict[str, float]:
+    """并发调用 /api/query，每个问题都不同且跳过缓存，完整经过模型、SQL执行、表格和图表渲染"""
+    import main
+
+    fixture = FixtureDatabase(query_delay=db_delay)
+    client = AsgiClient(main.app)
+    # 合成表结构中的表在替身数据库里没有数据，不构建取值索引，也避免后台采样占用执行名额影响延迟统计
+    value_indexer.enabled = False
+    with install(fixture), data_agent.override(model=scripted_data_model(model_delay)), \
+            echarts_agent.override(model=FunctionModel(unexpected_chart_model)):
+        async with client.lifespan():
+            status, _, body = await client.request("PUT", "/api/connect", CONNECT_BODY)
+            session_id = json.loads(body)["session_id"]
+            headers = {"X-Session-Id": session_id}
+            semaphore = asyncio.Semaphore(concurrency)
+            samples: list[float] = []
+            failures = 0
+
+            async def one(index: int) -> None:
+                nonlocal failures
+                async with semaphore:
+                    start = time.perf_counter()
+                    status, _, body = await client.request("POST", "/api/query?cache=bypass", f"各用户订单金额 #{index}", headers)
+                    samples.append(time.perf_counter() - start)
+                    if status != 200 or not json.loads(body).get("success"):
+                        failures += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(index) for index in range(requests)))
+            wall = time.perf_counter() - start
+            await client.request("DELETE", "/api/connect", headers=headers)
+
+    if failures:
+        print(f"/api/query 失败 {failures} 次")
+    return summarize(f"query c={concurrency}", samples, wall)
+
+
+async def bench_schema(table_count: int, repeat: int) -> dict[str, dict[str, float]]:
+    """在合成表结构上统计表结构完整加载、检索索引构建和按问题裁剪的耗时"""
+    conn_config = DatabaseConnectionConfig(**{**CONNECT_BODY, "dbName": f"bench_{table_count}"})
+    load_samples, index_samples, prune_samples = [], [], []
+    with install(FixtureDatabase(table_count=table_count, user_rows=1, order_rows=1)):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            snapshot = await schema_cache.refresh(conn_config)
+            load_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            get_schema_index(snapshot)
+            index_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            prune_schema(snapshot, "上个月订单金额最高的前10个商品", SCHEMA_TOP_K)
+            prune_samples.append(time.perf_counter() - start)
+        await schema_cache.invalidate(conn_config)
+
+    return {
+        f"schema_load t={table_count}": summarize(f"schema_load t={table_count}", load_samples),
+        f"schema_index t={table_count}": summarize(f"schema_index t={table_count}", index_samples),
+        f"schema_prune t={table_count}": summarize(f"schema_prune t={table_count}", prune_samples),
+    }
+
+
+async def bench_chart(chart_type: str, rows: int, repeat: int) -> dict[str, dict[str, float]]:
+    """统计直接由查询结果生成图表的耗时，cold 每次清空渲染缓存，warm 命中缓存"""
+    result = QueryResult(
+        columns=["city", "amount"],
+        rows=[{"city": f"城市{index}", "amount": index * 10.5} for index in range(rows)],
+    )
+    metrics = {}
+    for mode in ("cold", "warm"):
+        samples = []
+        for _ in range(repeat):
+            if mode == "cold":
+                render_cache.clear()
+            start = time.perf_counter()
+            await build_chart(chart_type, result)
+            samples.append(time.perf_counter() - start)
+        name = f"chart {chart_type} {mode}"
+        metrics[name] = summarize(name, samples)
+    return metrics
+
+
+def compare(
+        results: dict[str, dict[str, float]],
+        baseline: dict[str, dict[str, float]],
+        threshold: float,
+        min_delta_ms: float,
+) -> list[str]:
+    """
+    与基线对比，返回超出阈值的回退项
+    :param threshold: 允许的相对变化，如 0.2 表示变差 20% 以内不算回退
+    :param min_delta_ms: 延迟增加不超过该值时不算回退，避免亚毫秒级场景的抖动被误报
+    """
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not base.get(key) or key not in metrics:
+                continue
+            change = (metrics[key] - base[key]) / base[key]
+            if key in LOWER_IS_BETTER:
+                worse = change > threshold and metrics[key] - base[key] > min_delta_ms
+            else:
+                worse = change < -threshold
+            if worse:
+                regressions.append(f"{name} {key}: {base[key]:.2f} -> {metrics[key]:.2f} ({change:+.0%})")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    results: dict[str, dict[str, float]] = {}
+    results[f"query c={args.concurrency}"] = await bench_query(args.requests, args.concurrency, args.model_delay, args.db_delay)
+    for table_count in args.tables:
+        results.update(await bench_schema(table_count, args.repeat))
+    for chart_type in ("柱状图", "折线图", "饼图"):
+        results.update(await bench_chart(chart_type, args.chart_rows, args.repeat))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="端到端负载基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="/api/query 请求总数")
+    parser.add_argument("--concurrency", type=int, default=16, help="/api/query 并发数")
+    parser.add_argument("--model-delay", type=float, default=0.05, help="每次模型调用的模拟耗时（秒）")
+    parser.add_argument("--db-delay", type=float, default=0.0, help="每条SQL的模拟执行耗时（秒）")
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 1000, 5000], help="合成表结构的表数量")
+    parser.add_argument("--chart-rows", type=int, default=50, help="图表数据行数")
+    parser.add_argument("--repeat", type=int, default=5, help="表结构和图表场景的重复次数")
+    parser.add_argument("--save", help="保存结果的 JSON 文件")
+    parser.add_argument("--baseline", help="作为基线对比的 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定回退的相对变化阈值")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="判定延迟回退的最小绝对增加量（毫秒）")
+    parser.add_argument("--log-level", default="WARNING", help="服务日志级别")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    results = asyncio.run(run(args))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"与基线相比出现 {len(regressions)} 项性能回退：")
+            for regression in regressions:
+                print(f"    {regression}")
+            sys.exit(1)
+        print("与基线相比没有性能回退")
+
+
+if __name__ == "__main__":
+    main()
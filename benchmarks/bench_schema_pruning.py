@@ -0,0 +1,65 @@
+"""
+表结构裁剪基准测试：对比完整表结构与按问题裁剪后的 token 数，并统计索引构建和检索耗时
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_schema_pruning --tables 10 100 1500
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.synthetic_schema import generate_schema
+from utils.config import SCHEMA_TOP_K
+from utils.schema_cache import SchemaSnapshot
+from utils.schema_index import get_schema_index, prune_schema
+from utils.token_counter import estimate_json_tokens
+
+QUESTIONS = [
+    "查询每个城市的用户数",
+    "上个月订单金额最高的前10个商品",
+    "统计各门店的退款金额",
+    "各部门员工的平均月薪",
+    "哪些优惠券即将过期",
+    "营销活动预算排行",
+    "查询库存低于100的商品和供应商",
+]
+
+
+def run(table_count: int, top_k: int, repeat: int) -> None:
+    snapshot = SchemaSnapshot(version="bench", tables=generate_schema(table_count))
+    full_tokens = estimate_json_tokens(snapshot.tables)
+
+    start = time.perf_counter()
+    get_schema_index(snapshot)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    pruned_tokens = []
+    search_us = []
+    for question in QUESTIONS:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pruned = prune_schema(snapshot, question, top_k)
+            search_us.append((time.perf_counter() - start) * 1_000_000)
+        pruned_tokens.append(estimate_json_tokens(pruned))
+
+    avg_pruned = statistics.mean(pruned_tokens)
+    print(
+        f"表数量={table_count:<6} 完整表结构≈{full_tokens:>9} tokens  裁剪后(平均)≈{avg_pruned:>8.0f} tokens  "
+        f"压缩比={full_tokens / avg_pruned:>7.1f}x  索引构建={build_ms:>8.1f}ms  "
+        f"检索p50={statistics.median(search_us):>8.1f}µs  检索max={max(search_us):>8.1f}µs"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="表结构裁剪基准测试")
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 500, 1500, 5000], help="合成表数量")
+    parser.add_argument("--top-k", type=int, default=SCHEMA_TOP_K, help="保留的相关表数量")
+    parser.add_argument("--repeat", type=int, default=20, help="每个问题重复检索次数")
+    args = parser.parse_args()
+
+    for table_count in args.tables:
+        run(table_count, args.top_k, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+只读SQL校验基准测试：在语料上对比旧的关键字正则与词法校验的误判、漏判数量，并统计单次校验耗时
+
+运行方式（在项目根目录）：
+    python -m benchmarks.bench_sql_guard --repeat 2000
+"""
+import argparse
+import re
+import statistics
+import time
+
+from benchmarks.sql_guard_corpus import ALLOWED, REJECTED
+from utils.sql_guard import _validate, validate_sql
+
+LEGACY_DANGER_SQL = [
+    'update', 'delete', 'insert', 'drop', 'truncate', 'create', 'alter', 'rename', 'grant', 'revoke', 'set', 'optimize',
+    'call', 'begin', 'commit', 'rollback', 'lock', 'unlock', 'savepoint', 'execute', 'deallocate', 'kill', 'reset',
+]
+
+
+def legacy_allowed(sql: str) -> bool:
+    """旧的校验方式：每次调用都重新构造正则，在整段文本中匹配关键字"""
+    pattern = re.compile(r'\b(' + '|'.join(LEGACY_DANGER_SQL) + r')\b', flags=re.IGNORECASE)
+    return not pattern.search(sql)
+
+
+def accuracy(name: str, is_allowed) -> None:
+    false_rejects = [note for sql, note in ALLOWED if not is_allowed(sql)]
+    false_allows = [note for sql, note in REJECTED if is_allowed(sql)]
+    print(f"{name:<10} 误拒 {len(false_rejects):>2}/{len(ALLOWED)}  漏放 {len(false_allows):>2}/{len(REJECTED)}")
+    for note in false_rejects:
+        print(f"    误拒：{note}")
+    for note in false_allows:
+        print(f"    漏放：{note}")
+
+
+def timing(name: str, is_allowed, repeat: int) -> None:
+    corpus = [sql for sql, _ in ALLOWED + REJECTED]
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for sql in corpus:
+            is_allowed(sql)
+        samples.append((time.perf_counter() - start) * 1_000_000 / len(corpus))
+    print(f"{name:<10} 单次校验 p50={statistics.median(samples):>7.2f}µs  max={max(samples):>7.2f}µs")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="只读SQL校验基准测试")
+    parser.add_argument("--repeat", type=int, default=2000, help="语料重复校验次数")
+    args = parser.parse_args()
+
+    accuracy("旧正则", legacy_allowed)
+    accuracy("词法校验", lambda sql: validate_sql(sql).allowed)
+
+    timing("旧正则", legacy_allowed, args.repeat)
+    timing("词法(无缓存)", lambda sql: _validate.__wrapped__(sql.strip()).allowed, args.repeat)
+    timing("词法(缓存)", lambda sql: validate_sql(sql).allowed, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
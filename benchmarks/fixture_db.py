@@ -0,0 +1,215 @@
+"""
+基准测试用的进程内数据库替身：替换 aiomysql.create_pool / aiomysql.connect，
+表结构查询按合成表结构返回，其余SQL在内存 SQLite 中执行，不需要真实的 MySQL
+"""
+import asyncio
+import json
+import random
+import sqlite3
+import zlib
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator
+
+import aiomysql
+from aiomysql.cursors import _DictCursorMixin
+
+from benchmarks.synthetic_schema import generate_schema
+from utils.schema_cache import COLUMNS_SQL, FOREIGN_KEYS_SQL, SCHEMA_VERSION_SQL, TABLES_SQL
+
+CITIES = ["北京", "上海", "广州", "深圳", "杭州", "成都", "武汉", "西安"]
+
+
+class FixtureDatabase:
+    """
+    合成数据库：表结构由 generate_schema 生成，另有可查询的 t_user、t_order 两张数据表
+    :param table_count: 合成表结构的表数量
+    :param user_rows: t_user 行数
+    :param order_rows: t_order 行数
+    :param query_delay: 每条SQL的模拟执行耗时（秒）
+    """
+
+    def __init__(self, table_count: int = 50, user_rows: int = 200, order_rows: int = 5000, query_delay: float = 0.0):
+        self.tables = generate_schema(table_count)
+        self.query_delay = query_delay
+        self.executed = 0
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._load_data(user_rows, order_rows)
+
+    def _load_data(self, user_rows: int, order_rows: int) -> None:
+        rng = random.Random(42)
+        self._db.execute("CREATE TABLE t_user (id INTEGER PRIMARY KEY, name TEXT, city TEXT)")
+        self._db.execute("CREATE TABLE t_order (id INTEGER PRIMARY KEY, user_id INTEGER, amount REAL, pay_time TEXT)")
+        self._db.executemany(
+            "INSERT INTO t_user VALUES (?, ?, ?)",
+            [(i, f"用户{i}", rng.choice(CITIES)) for i in range(1, user_rows + 1)],
+        )
+        self._db.executemany(
+            "INSERT INTO t_order VALUES (?, ?, ?, ?)",
+            [
+                (i, rng.randint(1, user_rows), round(rng.uniform(1, 1000), 2),
+                 f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+                for i in range(1, order_rows + 1)
+            ],
+        )
+
+    def execute(self, sql: str, args: Any = None) -> tuple[list[str], list[tuple]]:
+        """
+        执行一条SQL
+        :return: (列名, 行)
+        """
+        self.executed += 1
+        if sql == SCHEMA_VERSION_SQL:
+            column_count = sum(len(table["columns"]) for table in self.tables.values())
+            keys = [f"{name}|{fk['column']}|{fk['ref_table']}|{fk['ref_column']}"
+                    for name, table in self.tables.items() for fk in table.get("foreign_keys", [])]
+            key_checksum = sum(zlib.crc32(key.encode()) for key in keys)
+            return ["table_count", "table_checksum", "column_count", "column_checksum", "key_count", "key_checksum"], [
+                (len(self.tables), 0, column_count, 0, len(keys), key_checksum)
+            ]
+        if sql == TABLES_SQL:
+            return ["TABLE_NAME", "TABLE_COMMENT"], [(name, table["description"]) for name, table in self.tables.items()]
+        if sql == COLUMNS_SQL:
+            return ["TABLE_NAME", "COLUMN_NAME", "COLUMN_TYPE", "COLUMN_COMMENT"], [
+                (name, column["name"], column["type"], column["comment"])
+                for name, table in self.tables.items() for column in table["columns"]
+            ]
+        if sql == FOREIGN_KEYS_SQL:
+            return ["TABLE_NAME", "COLUMN_NAME", "REFERENCED_TABLE_NAME", "REFERENCED_COLUMN_NAME"], [
+                (name, fk["column"], fk["ref_table"], fk["ref_column"])
+                for name, table in self.tables.items() for fk in table.get("foreign_keys", [])
+            ]
+
+        statement = sql.strip()
+        upper = statement.upper()
+        if upper == "SELECT 1":
+            return ["1"], [(1,)]
+        if upper.startswith("KILL QUERY"):
+            return [], []
+        if upper.startswith("EXPLAIN FORMAT=JSON"):
+            plan = {"query_block": {"select_id": 1, "cost_info": {"query_cost": "10.0"}, "table": {
+                "table_name": "t_order", "access_type": "range", "rows_examined_per_scan": 100, "rows_produced_per_join": 100,
+            }}}
+            return ["EXPLAIN"], [(json.dumps(plan),)]
+
+        cursor = self._db.execute(statement.replace("%s", "?"), list(args or []))
+        columns = [column[0] for column in cursor.description or []]
+        return columns, cursor.fetchall()
+
+
+class FixtureCursor:
+    def __init__(self, fixture: FixtureDatabase, dict_rows: bool):
+        self._fixture = fixture
+        self._dict_rows = dict_rows
+        self._rows: list[Any] = []
+        self.description = None
+        self.rowcount = 0
+
+    async def execute(self, sql: str, args: Any = None) -> int:
+        if self._fixture.query_delay:
+            await asyncio.sleep(self._fixture.query_delay)
+        columns, rows = self._fixture.execute(sql, args)
+        self.description = [(column, 253, None, None, None, None, True) for column in columns]
+        self._rows = [dict(zip(columns, row)) for row in rows] if self._dict_rows else list(rows)
+        self.rowcount = len(rows)
+        return self.rowcount
+
+    async def fetchone(self) -> Any:
+        return self._rows.pop(0) if self._rows else None
+
+    async def fetchmany(self, size: int) -> list[Any]:
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    async def fetchall(self) -> list[Any]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    async def close(self) -> None:
+        self._rows = []
+
+
+class _CursorContext:
+    """与 aiomysql 一致，conn.cursor() 既可以 await 也可以 async with"""
+
+    def __init__(self, cursor: FixtureCursor):
+        self._cursor = cursor
+
+    def __await__(self):
+        async def get() -> FixtureCursor:
+            return self._cursor
+        return get().__await__()
+
+    async def __aenter__(self) -> FixtureCursor:
+        return self._cursor
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._cursor.close()
+
+
+class FixtureConnection:
+    _next_thread_id = 0
+
+    def __init__(self, fixture: FixtureDatabase):
+        FixtureConnection._next_thread_id += 1
+        self._fixture = fixture
+        self._thread_id = FixtureConnection._next_thread_id
+        self.last_usage = asyncio.get_running_loop().time()
+        self.closed = False
+
+    def cursor(self, cursor_class: type | None = None) -> _CursorContext:
+        dict_rows = cursor_class is not None and issubclass(cursor_class, _DictCursorMixin)
+        return _CursorContext(FixtureCursor(self._fixture, dict_rows))
+
+    def thread_id(self) -> int:
+        return self._thread_id
+
+    async def ping(self, reconnect: bool = True) -> None:
+        self.last_usage = asyncio.get_running_loop().time()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FixturePool:
+    def __init__(self, fixture: FixtureDatabase, maxsize: int):
+        self._free = [FixtureConnection(fixture) for _ in range(maxsize)]
+        self._available = asyncio.Semaphore(maxsize)
+        self.closed = False
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[FixtureConnection]:
+        async with self._available:
+            conn = self._free.pop()
+            try:
+                yield conn
+            finally:
+                conn.last_usage = asyncio.get_running_loop().time()
+                self._free.append(conn)
+
+    def close(self) -> None:
+        self.closed = True
+
+    async def wait_closed(self) -> None:
+        pass
+
+
+@contextmanager
+def install(fixture: FixtureDatabase) -> Iterator[FixtureDatabase]:
+    """
+    在上下文内让 aiomysql 的连接池和连接都指向替身数据库
+    :param fixture: 替身数据库
+    :return: 替身数据库
+    """
+    original_create_pool, original_connect = aiomysql.create_pool, aiomysql.connect
+
+    async def create_pool(maxsize: int = 10, **kwargs) -> FixturePool:
+        return FixturePool(fixture, maxsize)
+
+    async def connect(**kwargs) -> FixtureConnection:
+        return FixtureConnection(fixture)
+
+    aiomysql.create_pool, aiomysql.connect = create_pool, connect
+    try:
+        yield fixture
+    finally:
+        aiomysql.create_pool, aiomysql.connect = original_create_pool, original_connect
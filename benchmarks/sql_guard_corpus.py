@@ -0,0 +1,71 @@
+"""
+只读SQL校验语料：ALLOWED 为应当放行的查询（包括旧的关键字正则会误判的情况），REJECTED 为应当拒绝的语句（包括旧正则会漏判的情况）
+每条为 (SQL, 说明)
+"""
+
+ALLOWED = [
+    ("SELECT id, name FROM users WHERE id = 1", "普通查询"),
+    ("select update_time, create_time from orders", "字段名包含 update/create"),
+    ("SELECT * FROM logs WHERE message LIKE '%update%'", "字符串中包含 update"),
+    ("SELECT * FROM settings WHERE name = 'set password'", "字符串中包含 set"),
+    ("SELECT `update`, `delete` FROM audit", "反引号标识符为保留字"),
+    ("SELECT \"drop table users\" AS tip", "双引号字符串中包含 drop"),
+    ("SELECT 'it''s ok; drop table t' AS s", "连续两个引号转义，字符串中包含分号"),
+    ("SELECT 'a\\' ; delete from t' AS s", "反斜杠转义，字符串中包含分号和 delete"),
+    ("SELECT 1; ", "末尾分号"),
+    ("SELECT id FROM t -- update later\n", "行尾注释中包含 update"),
+    ("SELECT id /* delete me */ FROM t", "块注释中包含 delete"),
+    ("# grant all\nSELECT 1", "井号注释"),
+    ("SELECT /*+ MAX_EXECUTION_TIME(1000) */ id FROM t", "优化器提示"),
+    ("WITH recent AS (SELECT * FROM orders WHERE created > NOW() - INTERVAL 7 DAY) SELECT COUNT(*) FROM recent", "公共表表达式"),
+    ("WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < 10) SELECT * FROM seq", "递归公共表表达式"),
+    ("(SELECT id FROM a) UNION (SELECT id FROM b)", "括号包裹的联合查询"),
+    ("SHOW TABLES", "SHOW 语句"),
+    ("SHOW CHARACTER SET", "SHOW 语句中的 SET"),
+    ("SHOW CREATE TABLE users", "SHOW CREATE 只读"),
+    ("EXPLAIN SELECT * FROM users", "EXPLAIN"),
+    ("EXPLAIN FORMAT=JSON SELECT * FROM users", "JSON 格式执行计划"),
+    ("DESC users", "DESC 查看表结构"),
+    ("SELECT REPLACE(name, 'a', 'b') FROM users", "REPLACE 字符串函数"),
+    ("SELECT INSERT(name, 1, 2, 'xx') FROM users", "INSERT 字符串函数"),
+    ("SELECT TRUNCATE(amount, 2) FROM orders", "TRUNCATE 数值函数"),
+    ("SELECT CONVERT(name USING utf8mb4), CAST(name AS CHAR CHARACTER SET utf8mb4) FROM users", "CHARACTER SET"),
+    ("SELECT FIND_IN_SET('a', tags) FROM posts", "FIND_IN_SET 函数"),
+    ("SELECT id FROM t ORDER BY created DESC LIMIT 10", "ORDER BY DESC"),
+    ("SELECT 用户名, 金额 FROM 订单", "中文标识符"),
+    ("SELECT COUNT(*) AS cnt FROM t WHERE status IN ('commit', 'rollback')", "字符串中包含事务关键字"),
+    ("SELECT @@version", "读取系统变量"),
+    ("SELECT data->'$.name' FROM docs", "JSON 路径运算符"),
+]
+
+REJECTED = [
+    ("UPDATE users SET name = 'x'", "更新"),
+    ("DELETE FROM users", "删除"),
+    ("INSERT INTO users VALUES (1)", "插入"),
+    ("REPLACE INTO users VALUES (1)", "替换插入"),
+    ("DROP TABLE users", "删除表"),
+    ("TRUNCATE TABLE users", "清空表"),
+    ("SET @a = 1", "设置变量"),
+    ("SELECT 1; DROP TABLE users", "多条语句"),
+    ("SELECT 1;SELECT 2", "多条查询语句"),
+    ("SELECT * FROM t -- comment\n; DELETE FROM t", "注释后接第二条语句"),
+    ("SELECT * FROM users INTO OUTFILE '/tmp/users.csv'", "导出到文件"),
+    ("SELECT name INTO @n FROM users LIMIT 1", "写入变量"),
+    ("SELECT * FROM users FOR UPDATE", "加锁读"),
+    ("SELECT * FROM users LOCK IN SHARE MODE", "共享锁读"),
+    ("SELECT * FROM users FOR SHARE", "共享锁读"),
+    ("WITH x AS (SELECT id FROM t) DELETE FROM t WHERE id IN (SELECT id FROM x)", "公共表表达式后接删除"),
+    ("SELECT SLEEP(100)", "阻塞连接"),
+    ("SELECT BENCHMARK(100000000, MD5('a'))", "消耗CPU"),
+    ("SELECT LOAD_FILE('/etc/passwd')", "读取服务器文件"),
+    ("SELECT @a := 1", "变量赋值"),
+    ("/*!50000 DROP TABLE users */", "可执行注释"),
+    ("SELECT 1 /*!, (DELETE FROM t) */", "查询中的可执行注释"),
+    ("SELECT 'unterminated", "引号未闭合"),
+    ("CALL do_something()", "调用存储过程"),
+    ("GRANT ALL ON *.* TO 'u'", "授权"),
+    ("LOAD DATA INFILE '/tmp/x' INTO TABLE t", "导入数据"),
+    ("HANDLER t OPEN", "HANDLER 语句"),
+    ("DO SLEEP(10)", "DO 语句"),
+    ("", "空语句"),
+]
@@ -0,0 +1,69 @@
+import random
+from typing import Any
+
+# 业务领域：(英文实体名, 中文描述, [(列名, 类型, 列注释), ...])
+ENTITIES = [
+    ("user", "用户", [("name", "varchar(64)", "用户名"), ("phone", "varchar(20)", "手机号"),
+                      ("city", "varchar(32)", "所在城市"), ("register_time", "datetime", "注册时间")]),
+    ("order", "订单", [("order_no", "varchar(32)", "订单编号"), ("amount", "decimal(12,2)", "订单金额"),
+                       ("status", "tinyint", "订单状态"), ("pay_time", "datetime", "支付时间")]),
+    ("product", "商品", [("name", "varchar(128)", "商品名称"), ("price", "decimal(10,2)", "单价"),
+                         ("category", "varchar(32)", "商品类目"), ("stock", "int", "库存")]),
+    ("store", "门店", [("name", "varchar(64)", "门店名称"), ("province", "varchar(32)", "省份"),
+                       ("city", "varchar(32)", "城市"), ("open_date", "date", "开业日期")]),
+    ("employee", "员工", [("name", "varchar(64)", "员工姓名"), ("salary", "decimal(10,2)", "月薪"),
+                          ("department", "varchar(32)", "部门"), ("hire_date", "date", "入职日期")]),
+    ("supplier", "供应商", [("name", "varchar(128)", "供应商名称"), ("contact", "varchar(64)", "联系人"),
+                            ("level", "tinyint", "供应商等级")]),
+    ("coupon", "优惠券", [("code", "varchar(32)", "券码"), ("discount", "decimal(5,2)", "折扣"),
+                          ("expire_time", "datetime", "过期时间")]),
+    ("refund", "退款", [("reason", "varchar(255)", "退款原因"), ("amount", "decimal(12,2)", "退款金额"),
+                        ("refund_time", "datetime", "退款时间")]),
+    ("inventory", "库存流水", [("quantity", "int", "变动数量"), ("change_type", "varchar(16)", "变动类型"),
+                               ("change_time", "datetime", "变动时间")]),
+    ("campaign", "营销活动", [("title", "varchar(128)", "活动标题"), ("budget", "decimal(12,2)", "活动预算"),
+                              ("start_time", "datetime", "开始时间"), ("end_time", "datetime", "结束时间")]),
+]
+
+# 同一实体在不同子系统中的变体表
+SUFFIXES = [("", ""), ("_log", "日志"), ("_snapshot", "快照"), ("_daily", "日汇总"), ("_archive", "归档"),
+            ("_detail", "明细"), ("_stat", "统计"), ("_history", "历史")]
+
+
+def generate_schema(table_count: int, seed: int = 42) -> dict[str, dict[str, Any]]:
+    """
+    生成与 SchemaSnapshot.tables 结构相同的合成表结构，包含中文注释和外键关系
+    :param table_count: 表数量
+    :param seed: 随机种子
+    :return: {表名: {"description": ..., "columns": [...], "foreign_keys": [...]}}
+    """
+    rng = random.Random(seed)
+    tables: dict[str, dict[str, Any]] = {}
+    index = 0
+    while len(tables) < table_count:
+        entity, entity_desc, columns = ENTITIES[index % len(ENTITIES)]
+        suffix, suffix_desc = SUFFIXES[(index // len(ENTITIES)) % len(SUFFIXES)]
+        shard = index // (len(ENTITIES) * len(SUFFIXES))
+        table_name = f"t_{entity}{suffix}" + (f"_{shard:04d}" if shard else "")
+        table: dict[str, Any] = {
+            "description": f"{entity_desc}{suffix_desc}表",
+            "columns": [{"name": "id", "type": "bigint", "comment": "主键"}] + [
+                {"name": name, "type": type_, "comment": comment} for name, type_, comment in columns
+            ] + [
+                {"name": "create_time", "type": "datetime", "comment": "创建时间"},
+                {"name": "update_time", "type": "datetime", "comment": "更新时间"},
+            ],
+        }
+
+        # 随机关联到已生成的基础实体表
+        if tables and entity != "user":
+            ref_entity = rng.choice([e for e, _, _ in ENTITIES if e != entity])
+            ref_table = f"t_{ref_entity}"
+            if ref_table in tables:
+                table["columns"].append({"name": f"{ref_entity}_id", "type": "bigint", "comment": f"关联{ref_entity}"})
+                table["foreign_keys"] = [{"column": f"{ref_entity}_id", "ref_table": ref_table, "ref_column": "id"}]
+
+        tables[table_name] = table
+        index += 1
+
+    return tables
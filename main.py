@@ -1,17 +1,44 @@
-from contextlib import asynccontextmanager
+import asyncio
+import json
+import re
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import Any, Awaitable, TypeVar
 
 import uvicorn
-from fastapi import FastAPI, Request, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, Body, Query, Header, Depends, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from agent.data_agent import data_agent, sql_dict
-from agent.echarts_agent import echarts_agent
+from agent.conversation import conversation_registry
+from agent.job_queue import JobQueueFullError, job_queue
+from agent.query_pipeline import run_batch, run_query
 from schemas.db_conn_config import DatabaseConnectionConfig
-from utils.logger import logger
+from utils.answer_cache import answer_cache
+from utils.chart_renderer import ChartFormat, render_cache, shutdown_renderer
+from utils.config import BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, BATCH_MAX_QUESTIONS, JOB_PAGE_MAX_ROWS, WORKERS
+from utils.db_pool import pool_manager
+from utils.logger import logger, trace_id_var
+from utils.metrics import http_request_duration_seconds, http_requests_total, metrics_registry
+from utils.model_router import chart_model, data_model, narrative_model
+from utils.query_governor import QueryQueueFullError, query_governor
+from utils.query_registry import query_registry
+from utils.replica_router import ReplicaUnavailableError, replica_router
+from utils.result_cache import CacheMode, result_cache
+from utils.result_export import ExportFormat, create_writer, export_rows
+from utils.schema_cache import schema_cache
+from utils.session_registry import Session, session_registry
+from utils.shared_store import shared_store
+from utils.sql_executor import stream_query
 from utils.test_connection import test_connection
+from utils.tracing import stage_summary, start_trace
+from utils.value_index import value_indexer
 
-global_conn_config = None
+# 表结构变化后该数据库的查询结果缓存和问答缓存随之失效
+schema_cache.add_invalidation_listener(result_cache.invalidate)
+schema_cache.add_invalidation_listener(answer_cache.invalidate)
+# 表结构变化后增量刷新取值索引
+schema_cache.add_invalidation_listener(value_indexer.refresh)
 
 
 # 应用生命周期管理
@@ -19,6 +46,10 @@ global_conn_config = None
 async def lifespan(fast_api_app: FastAPI):
     # 启动时执行
     logger.info("Application starting up...")
+    eviction_task = asyncio.create_task(session_registry.run_eviction())
+    job_queue.start()
+    value_index_task = asyncio.create_task(value_indexer.run_refresh())
+    replica_check_task = asyncio.create_task(replica_router.run_checks())
 
     yield  # 应用运行期间
 
@@ -26,6 +57,12 @@ async def lifespan(fast_api_app: FastAPI):
     logger.info("Application shutting down...")
 
     # 在这里可以清理资源
+    eviction_task.cancel()
+    value_index_task.cancel()
+    replica_check_task.cancel()
+    await job_queue.stop()
+    await pool_manager.close_all()
+    shutdown_renderer()
     logger.info("Resources cleaned up")
 
 
@@ -48,6 +85,31 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+TRACE_HEADER = "X-Trace-Id"
+_TRACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """为每个请求分配追踪 ID（沿用合法的上游追踪 ID），写入日志和响应头，并记录请求数和耗时"""
+    upstream_trace_id = request.headers.get(TRACE_HEADER)
+    if upstream_trace_id and not _TRACE_ID_PATTERN.match(upstream_trace_id):
+        upstream_trace_id = None
+
+    with start_trace(upstream_trace_id) as trace_id:
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            http_requests_total.inc(method=request.method, route=route, status=str(status))
+            http_request_duration_seconds.observe(time.perf_counter() - start, method=request.method, route=route)
+        response.headers[TRACE_HEADER] = trace_id
+        return response
+
+
 # 基础健康检查端点
 @app.get("/health")
 async def health_check():
@@ -55,47 +117,444 @@ async def health_check():
     return {"status": "OK"}
 
 
+T = TypeVar("T")
+
+# 检查客户端是否断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# 会话 ID 通过请求头传递，由 /api/connect 返回
+SESSION_HEADER = "X-Session-Id"
+NO_SESSION_RESPONSE = {"success": False, "message": "请先设置数据库连接"}
+
+
+async def get_session(x_session_id: str | None = Header(None)) -> Session | None:
+    """根据请求头中的会话 ID 获取会话"""
+    return await session_registry.get(x_session_id) if x_session_id else None
+
+
 @app.put("/api/connect")
-async def set_connect(config: DatabaseConnectionConfig):
+async def set_connect(
+        config: DatabaseConnectionConfig,
+        response: Response,
+        x_session_id: str | None = Header(None),
+):
     test_result = await test_connection(config)
     if not test_result:
         return {"success": False, "message": "数据库连接测试失败"}
-    global global_conn_config
-    global_conn_config = config
-    return {"success": True, "message": "数据库连接设置成功"}
+
+    # 携带已有会话 ID 时切换该会话的数据库，否则创建新会话
+    session = await session_registry.connect(config, x_session_id)
+    response.headers[SESSION_HEADER] = session.session_id
+    # 在后台为该数据库构建列取值索引，供模型把问题中的取值解析为精确的表、列和值
+    value_indexer.schedule(config)
+    # 配置了只读副本时在后台检查各副本的连通性和复制延迟
+    replica_router.register(config)
+    return {"success": True, "message": "数据库连接设置成功", "session_id": session.session_id}
+
+
+@app.delete("/api/connect")
+async def close_connect(x_session_id: str | None = Header(None)):
+    if not x_session_id or not await session_registry.close(x_session_id):
+        return {"success": False, "message": "会话不存在或已过期"}
+    return {"success": True, "message": "已断开数据库连接"}
+
+
+@app.post("/api/schema/refresh")
+async def refresh_schema(session: Session | None = Depends(get_session)):
+    if session is None:
+        return NO_SESSION_RESPONSE
+
+    snapshot = await schema_cache.refresh(session.conn_config)
+    return {"success": True, "message": {"version": snapshot.version, "table_count": len(snapshot.tables)}}
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {"success": True, "message": {
+        "result_cache": result_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "render_cache": render_cache.stats(),
+        "sessions": session_registry.stats(),
+        "jobs": job_queue.stats(),
+        "conversations": conversation_registry.stats(),
+        "value_index": value_indexer.stats(),
+        "replicas": replica_router.stats(),
+        "models": {model.stage: model.stats() for model in (data_model, chart_model, narrative_model)},
+        **({"shared_store": await shared_store.stats()} if shared_store is not None else {}),
+    }}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的指标：请求数与耗时、各阶段耗时、SQL 行数与数据量、模型请求次数与 token 用量"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/governor/stats")
+async def governor_stats():
+    return {"success": True, "message": query_governor.stats()}
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T | None:
+    """
+    执行请求处理，客户端断开连接时取消处理，正在执行的SQL随之终止
+    :param request: 请求
+    :param awaitable: 请求处理协程
+    :return: 处理结果，客户端已断开时返回 None
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("客户端已断开连接，取消查询")
+                break
+    finally:
+        # 请求处理本身被取消时同样取消查询
+        if not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    return None
+
+
+CONVERSATION_NOT_FOUND_RESPONSE = {"success": False, "message": "对话不存在或已过期"}
+
+
+@app.post("/api/conversations")
+async def create_conversation(session: Session | None = Depends(get_session)):
+    """创建多轮对话，之后的查询携带返回的 conversation_id 即可基于之前的问答继续追问"""
+    if session is None:
+        return NO_SESSION_RESPONSE
+
+    conversation = await conversation_registry.create(session.session_id, session.conn_config)
+    return {"success": True, "message": {"conversation_id": conversation.conversation_id}}
+
+
+@app.get("/api/conversations/{conversation_id}")
+async def get_conversation(conversation_id: str, session: Session | None = Depends(get_session)):
+    if session is None:
+        return NO_SESSION_RESPONSE
+
+    conversation = await conversation_registry.get(conversation_id, session.session_id)
+    if conversation is None:
+        return CONVERSATION_NOT_FOUND_RESPONSE
+    return {"success": True, "message": {
+        "conversation_id": conversation.conversation_id,
+        "turn_count": conversation.turn_count,
+        "summary": conversation.summary,
+        "turns": [
+            {"question": turn.question, "sql": turn.sql_text, "answer": turn.answer} for turn in conversation.turns
+        ],
+        "tables": list(conversation.tables),
+        "history_tokens": conversation.tokens(),
+    }}
+
+
+@app.delete("/api/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str, session: Session | None = Depends(get_session)):
+    if session is None:
+        return NO_SESSION_RESPONSE
+
+    if not await conversation_registry.delete(conversation_id, session.session_id):
+        return CONVERSATION_NOT_FOUND_RESPONSE
+    return {"success": True, "message": "对话已删除"}
+
+
+def resolve_cache_mode(cache: CacheMode, cache_control: str | None) -> CacheMode:
+    """
+    确定本次请求的缓存模式，请求参数优先于 Cache-Control 请求头
+    Cache-Control: no-store 表示不读写缓存，no-cache 表示忽略已有缓存重新查询
+    """
+    if cache != "default" or not cache_control:
+        return cache
+
+    directives = {directive.strip().lower() for directive in cache_control.split(",")}
+    if "no-store" in directives:
+        return "bypass"
+    if "no-cache" in directives:
+        return "refresh"
+    return cache
 
 
 @app.post("/api/query")
-async def query(query_text: str = Body(..., examples=["查询用户数"])):
-    if not global_conn_config:
-        return {"success": False, "message": "请先设置数据库连接"}
+async def query(
+        request: Request,
+        query_text: str = Body(..., examples=["查询用户数"]),
+        cache: CacheMode = Query("default", description="结果缓存模式：default/refresh/bypass"),
+        cache_control: str | None = Header(None),
+        chart_format: ChartFormat | None = Query(None, description="图表输出格式：html/options"),
+        narrate: bool = Query(False, description="输入为SQL时，是否额外生成结果总结"),
+        conversation_id: str | None = Query(None, description="多轮对话 ID，由 /api/conversations 创建"),
+        session: Session | None = Depends(get_session),
+):
+    if session is None:
+        return NO_SESSION_RESPONSE
+    conversation = await conversation_registry.get(conversation_id, session.session_id) if conversation_id else None
+    if conversation_id and conversation is None:
+        return CONVERSATION_NOT_FOUND_RESPONSE
 
     logger.info(f"用户查询内容: {query_text}")
-    data_agent_result = await data_agent.run(query_text, deps=global_conn_config)
-    data_details = data_agent_result.output
-
-    logger.info(f"数据智能体结果: {data_details}")
-
-    echarts_agent_result = None
-    if data_details.chart:
-        echarts_agent_result = await echarts_agent.run(
-            f"MarkDown数据描述：{data_details.markdown_describe} \n 生成的图表类型：{data_details.chart_type}"
-        )
-
-    data_text = (
-        f"{data_details.markdown_describe}"
-        f"\n\n\n"
-        f"---"
-        f"\n\n\n"
-        f"执行的SQL：\n\n{sql_dict.get('sql_text', '无')}"
+    try:
+        async with session_registry.hold(session):
+            result = await cancel_on_disconnect(request, run_query(
+                query_text, session.conn_config, resolve_cache_mode(cache, cache_control), chart_format=chart_format,
+                narrate=narrate, conversation=conversation,
+            ))
+    except (QueryQueueFullError, ReplicaUnavailableError) as e:
+        return {"success": False, "message": str(e), "trace_id": trace_id_var.get()}
+    finally:
+        logger.info(f"查询结束，各阶段耗时(ms): {stage_summary()}")
+    if result is None:
+        return {"success": False, "message": "客户端已断开连接", "trace_id": trace_id_var.get()}
+    return {"success": True, "message": result, "trace_id": trace_id_var.get()}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """按 Server-Sent Events 格式编码一个事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.post("/api/query/stream")
+async def query_stream(
+        query_text: str = Body(..., examples=["查询用户数"]),
+        cache: CacheMode = Query("default", description="结果缓存模式：default/refresh/bypass"),
+        cache_control: str | None = Header(None),
+        chart_format: ChartFormat | None = Query(None, description="图表输出格式：html/options"),
+        narrate: bool = Query(False, description="输入为SQL时，是否额外生成结果总结"),
+        conversation_id: str | None = Query(None, description="多轮对话 ID，由 /api/conversations 创建"),
+        session: Session | None = Depends(get_session),
+):
+    """
+    以 Server-Sent Events 流式返回查询过程：
+    schema（表结构已加载）、sql（生成的SQL）、rows（分批的查询结果）、result（结果概要）、
+    answer（逐段生成的答案）、chart（图表）、done（最终结果，与 /api/query 相同，附带追踪 ID）、error（出错）
+    """
+    if session is None:
+        return NO_SESSION_RESPONSE
+    conversation = await conversation_registry.get(conversation_id, session.session_id) if conversation_id else None
+    if conversation_id and conversation is None:
+        return CONVERSATION_NOT_FOUND_RESPONSE
+
+    logger.info(f"用户流式查询内容: {query_text}")
+    conn_config = session.conn_config
+    cache_mode = resolve_cache_mode(cache, cache_control)
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def emit(event: str, data: dict[str, Any]) -> None:
+        await queue.put(format_sse(event, data))
+
+    async def run() -> None:
+        try:
+            async with session_registry.hold(session):
+                result = await run_query(
+                    query_text, conn_config, cache_mode, emit=emit, chart_format=chart_format, narrate=narrate,
+                    conversation=conversation,
+                )
+            await emit("done", {**result, "trace_id": trace_id_var.get()})
+        except (QueryQueueFullError, ReplicaUnavailableError) as e:
+            await emit("error", {"message": str(e), "trace_id": trace_id_var.get()})
+        except Exception as e:
+            logger.error(f"流式查询发生异常: {e}")
+            await emit("error", {"message": "服务器内部出错", "trace_id": trace_id_var.get()})
+        finally:
+            logger.info(f"流式查询结束，各阶段耗时(ms): {stage_summary()}")
+            await queue.put(None)
+
+    async def generate_events():
+        task = asyncio.create_task(run())
+        try:
+            while (message := await queue.get()) is not None:
+                yield message
+        finally:
+            # 客户端断开时停止后续的模型调用和查询
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/query/batch")
+async def query_batch(
+        questions: list[str] = Body(..., examples=[["查询用户数", "查询本月订单总额"]]),
+        cache: CacheMode = Query("default", description="结果缓存模式：default/refresh/bypass"),
+        cache_control: str | None = Header(None),
+        chart_format: ChartFormat | None = Query(None, description="图表输出格式：html/options"),
+        concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY, description="同时处理的问题数"),
+        session: Session | None = Depends(get_session),
+):
+    """
+    批量查询，以 NDJSON 按完成顺序逐行返回各问题的结果（序号、问题、结果或错误、追踪 ID、耗时及各阶段耗时），
+    最后一行为批次汇总
+    """
+    if session is None:
+        return NO_SESSION_RESPONSE
+    if not questions or len(questions) > BATCH_MAX_QUESTIONS:
+        return {"success": False, "message": f"批量查询的问题数应在 1 到 {BATCH_MAX_QUESTIONS} 之间"}
+
+    logger.info(f"批量查询 {len(questions)} 个问题，并发数 {concurrency}")
+    conn_config = session.conn_config
+    cache_mode = resolve_cache_mode(cache, cache_control)
+    batch_id = trace_id_var.get()
+
+    async def generate_items():
+        started = time.perf_counter()
+        succeeded = failed = 0
+        async with session_registry.hold(session):
+            try:
+                async for item in run_batch(
+                        questions, conn_config, cache_mode, concurrency, chart_format=chart_format, batch_id=batch_id
+                ):
+                    succeeded, failed = succeeded + item["success"], failed + (not item["success"])
+                    yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+            except Exception as e:
+                logger.error(f"批量查询发生异常: {e}")
+                yield json.dumps({"success": False, "message": "服务器内部出错"}, ensure_ascii=False) + "\n"
+        summary = {
+            "total": len(questions),
+            "succeeded": succeeded,
+            "failed": failed,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "trace_id": batch_id,
+        }
+        logger.info(f"批量查询结束: {summary}")
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate_items(), media_type="application/x-ndjson")
+
+
+JOB_NOT_FOUND_RESPONSE = {"success": False, "message": "查询任务不存在或已过期"}
+
+
+@app.post("/api/jobs")
+async def submit_job(
+        query_text: str = Body(..., examples=["查询用户数"]),
+        cache: CacheMode = Query("default", description="结果缓存模式：default/refresh/bypass"),
+        cache_control: str | None = Header(None),
+        chart_format: ChartFormat | None = Query(None, description="图表输出格式：html/options"),
+        narrate: bool = Query(False, description="输入为SQL时，是否额外生成结果总结"),
+        session: Session | None = Depends(get_session),
+):
+    """提交异步查询任务，立即返回任务 ID，之后轮询任务状态或订阅任务事件"""
+    if session is None:
+        return NO_SESSION_RESPONSE
+
+    logger.info(f"提交异步查询任务: {query_text}")
+    try:
+        job = await job_queue.submit(session, query_text, resolve_cache_mode(cache, cache_control), chart_format, narrate)
+    except JobQueueFullError as e:
+        return {"success": False, "message": str(e)}
+    return {"success": True, "message": {"job_id": job.job_id, "status": job.status, "trace_id": job.trace_id}}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, session: Session | None = Depends(get_session)):
+    """任务状态，结束后附带与 /api/query 相同的结果、结果行数和各阶段耗时"""
+    if session is None:
+        return NO_SESSION_RESPONSE
+    job = await job_queue.get(job_id, session)
+    if job is None:
+        return JOB_NOT_FOUND_RESPONSE
+    return {"success": True, "message": job.to_dict()}
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str, session: Session | None = Depends(get_session)):
+    if session is None:
+        return NO_SESSION_RESPONSE
+    job = await job_queue.cancel(job_id, session)
+    if job is None:
+        return JOB_NOT_FOUND_RESPONSE
+    return {"success": True, "message": {"job_id": job.job_id, "status": job.status}}
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def watch_job(job_id: str, session: Session | None = Depends(get_session)):
+    """
+    以 Server-Sent Events 订阅任务：status（状态变化）及与 /api/query/stream 相同的过程事件，
+    rows 事件只包含已读取的行数，任务结束时发送 done（任务状态及结果）或 error
+    """
+    if session is None:
+        return NO_SESSION_RESPONSE
+    if await job_queue.get(job_id, session) is None:
+        return JOB_NOT_FOUND_RESPONSE
+
+    async def generate_events():
+        async for event, data in job_queue.watch(job_id):
+            yield format_sse(event, data)
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    result = {
-        "data": data_text,
-        "chart": echarts_agent_result.output if echarts_agent_result else None,
-    }
 
-    return {"success": True, "message": result}
+@app.get("/api/jobs/{job_id}/rows")
+async def get_job_rows(
+        job_id: str,
+        offset: int = Query(0, ge=0, description="起始行，取上一页返回的 next_offset"),
+        limit: int = Query(100, ge=1, le=JOB_PAGE_MAX_ROWS, description="每页行数"),
+        session: Session | None = Depends(get_session),
+):
+    """分页获取任务最后执行的SQL的查询结果行"""
+    if session is None:
+        return NO_SESSION_RESPONSE
+    job = await job_queue.get(job_id, session)
+    if job is None:
+        return JOB_NOT_FOUND_RESPONSE
+    if job.status != "succeeded":
+        return {"success": False, "message": f"查询任务尚未成功完成，当前状态：{job.status}"}
+    return {"success": True, "message": job.page(offset, limit)}
+
+
+RESULT_NOT_FOUND_RESPONSE = {"success": False, "message": "查询结果不存在或已过期"}
+
+
+@app.get("/api/results/{result_id}/rows")
+async def stream_result_rows(result_id: str, session: Session | None = Depends(get_session)):
+    if session is None:
+        return NO_SESSION_RESPONSE
+    # 其他会话的结果句柄视为不存在
+    handle = await query_registry.get(result_id)
+    if handle is None or not handle.owned_by(session):
+        return RESULT_NOT_FOUND_RESPONSE
+
+    async def generate_rows():
+        async for batch in stream_query(handle.conn_config, handle.sql_text):
+            yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in batch)
+
+    return StreamingResponse(generate_rows(), media_type="application/x-ndjson")
+
+
+@app.get("/api/results/{result_id}/export")
+async def export_result(
+        result_id: str,
+        export_format: ExportFormat = Query("csv", alias="format", description="导出格式：csv/ndjson/arrow/parquet"),
+        cache: CacheMode = Query("default", description="结果缓存模式：default/refresh/bypass"),
+        session: Session | None = Depends(get_session),
+):
+    if session is None:
+        return NO_SESSION_RESPONSE
+    handle = await query_registry.get(result_id)
+    if handle is None or not handle.owned_by(session):
+        return RESULT_NOT_FOUND_RESPONSE
+    try:
+        writer = create_writer(export_format)
+    except RuntimeError as e:
+        return {"success": False, "message": str(e)}
+
+    return StreamingResponse(
+        export_rows(handle.conn_config, handle.sql_text, writer, cache),
+        media_type=writer.media_type,
+        headers={"Content-Disposition": f'attachment; filename="result-{result_id[:8]}.{writer.extension}"'},
+    )
 
 
 # 静态页面
@@ -104,10 +563,12 @@ app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
 if __name__ == "__main__":
     # 启动uvicorn服务器
     logger.info("Starting Uvicorn server...")
+    # 多个工作进程时 uvicorn 需要以导入字符串的方式加载应用，会话和缓存通过共享存储在进程间共享
     uvicorn.run(
-        app,
+        "main:app" if WORKERS > 1 else app,
         host="0.0.0.0",
         port=8000,
+        workers=WORKERS,
         log_config=None,  # 禁用uvicorn的日志配置，使用loguru
         access_log=False  # 禁用uvicorn的访问日志
     )
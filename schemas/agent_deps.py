@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.result_cache import CacheMode
+from utils.sql_executor import QueryResult
+
+# 事件回调：事件名称, 事件数据
+EventEmitter = Callable[[str, dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class DataAgentDeps:
+    """数据智能体单次运行的依赖，同时记录本次运行最后执行的SQL及其结果"""
+    conn_config: DatabaseConnectionConfig  # 数据库连接配置
+    cache_mode: CacheMode = "default"  # SQL 查询结果缓存模式
+    sql_text: str | None = None  # 最后执行的SQL
+    result: QueryResult | None = None  # 最后执行的SQL的查询结果
+    emit: EventEmitter | None = None  # 流式查询时的事件回调
+    known_tables: frozenset[str] = frozenset()  # 多轮对话中已提供过表结构的表，表结构工具对这些表只返回提示
+
+    async def send(self, event: str, data: dict[str, Any]) -> None:
+        """
+        发送运行过程事件，非流式查询时忽略
+        :param event: 事件名称
+        :param data: 事件数据
+        """
+        if self.emit is not None:
+            await self.emit(event, data)
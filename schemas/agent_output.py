@@ -2,6 +2,8 @@ from pydantic import BaseModel
 
 
 class DataDetails(BaseModel):
-    markdown_describe: str # markdown格式的数据描述
+    markdown_describe: str # markdown格式的数据描述，只包含对结果的简要总结，可用 {{table}} 标记查询结果表格的位置
+    show_table: bool = False # 是否附上服务端根据查询结果渲染的表格
     chart:bool # 是否生成图表
     chart_type: str # 图表类型
+    chart_title: str = "" # 图表标题，用中文概括图表内容，如“各城市订单数量”
@@ -1,5 +1,24 @@
+import hashlib
+import hmac
+import secrets
+
 from pydantic import BaseModel, Field, SecretStr
 
+from utils.config import SHARED_STORE_SECRET
+
+# 计算连接标识中密码摘要的密钥：使用共享存储时各工作进程共用 SHARED_STORE_SECRET，否则每个进程随机生成，
+# 连接标识出现在日志和共享存储的键中，不能用于离线猜测密码
+_CONN_KEY_SECRET = (SHARED_STORE_SECRET or secrets.token_urlsafe(32)).encode()
+
+
+class ReplicaConfig(BaseModel):
+    """只读副本连接参数，账号、密码为空时使用主库的账号、密码"""
+    host: str = Field(..., description="副本主机地址")
+    port: int = Field(3306, gt=0, le=65535, description="副本端口")
+    username: str | None = Field(None, description="副本账号")
+    password: SecretStr | None = Field(None, description="副本密码")
+    weight: int = Field(1, ge=0, le=100, description="路由权重，0 表示不接收查询")
+
 
 class DatabaseConnectionConfig(BaseModel):
     """数据库连接请求参数"""
@@ -8,6 +27,31 @@ class DatabaseConnectionConfig(BaseModel):
     username: str = Field(..., description="数据库账号")
     password: SecretStr = Field(..., description="数据库密码")  # 敏感字段特殊处理
     database_name: str = Field(..., alias="dbName", description="目标数据库名")
+    replicas: list[ReplicaConfig] = Field(default_factory=list, description="只读副本，只读查询和表结构加载按权重路由到副本")
+
+    @property
+    def conn_key(self) -> str:
+        """连接标识，相同的连接配置共用同一个连接池，密码和副本配置只参与摘要计算"""
+        digest_source = self.password.get_secret_value()
+        for replica in self.replicas:
+            password = replica.password.get_secret_value() if replica.password else ""
+            digest_source += f"|{replica.username}@{replica.host}:{replica.port}*{replica.weight}:{password}"
+        password_digest = hmac.new(_CONN_KEY_SECRET, digest_source.encode(), hashlib.sha256).hexdigest()[:12]
+        return f"{self.username}@{self.host}:{self.port}/{self.database_name}#{password_digest}"
+
+    def replica_config(self, replica: ReplicaConfig) -> "DatabaseConnectionConfig":
+        """
+        生成连接某个副本的连接配置
+        :param replica: 副本连接参数
+        :return: 指向副本的连接配置，不包含副本列表
+        """
+        return DatabaseConnectionConfig(
+            host=replica.host,
+            port=replica.port,
+            username=replica.username or self.username,
+            password=replica.password or self.password,
+            dbName=self.database_name,
+        )
 
     class Config:
         # 额外配置示例
@@ -18,5 +62,9 @@ class DatabaseConnectionConfig(BaseModel):
                 "username": "admin",
                 "password": "strongpassword123",
                 "dbName": "my_database",
+                "replicas": [
+                    {"host": "mysql-replica-1.prod.example.com", "weight": 2},
+                    {"host": "mysql-replica-2.prod.example.com", "weight": 1},
+                ],
             }
         }
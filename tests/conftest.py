@@ -0,0 +1,76 @@
+"""
+测试公共夹具：用基准测试的进程内替身数据库代替 MySQL，模型由各测试用 FunctionModel 替换
+"""
+import asyncio
+import os
+import uuid
+from typing import Any
+
+# 模型只在测试中被替换，构造 Agent 时仍需要 API Key
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+import pytest
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from agent.data_agent import data_agent
+from benchmarks.bench_load import AsgiClient
+from benchmarks.fixture_db import FixtureDatabase, install
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.db_pool import pool_manager
+
+
+@pytest.fixture
+def conn_config() -> DatabaseConnectionConfig:
+    # 每个测试使用不同的库名，连接池、执行名额和各类缓存互不影响
+    return DatabaseConnectionConfig(
+        host="fixture", port=3306, username="test", password="test", dbName=f"test_{uuid.uuid4().hex[:8]}"
+    )
+
+
+@pytest.fixture
+def fixture_db():
+    fixture = FixtureDatabase(table_count=10, user_rows=20, order_rows=200)
+    with install(fixture):
+        yield fixture
+    # 连接池绑定在创建它的事件循环上，测试结束后关闭，避免被下一个测试复用
+    asyncio.run(pool_manager.close_all())
+
+
+SCRIPTED_SQL = "SELECT city, COUNT(*) AS user_count FROM t_user GROUP BY city ORDER BY city"
+
+
+@pytest.fixture
+def scripted_model():
+    """
+    用按脚本调用工具的 FunctionModel 替换数据智能体的模型：执行 SCRIPTED_SQL 后输出总结并附表格
+    :return: 每次模型调用收到的最后一条消息，用于判断模型是否被调用
+    """
+    calls = []
+
+    def step(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        last = messages[-1].parts[-1]
+        calls.append(last)
+        if isinstance(last, ToolReturnPart) and last.tool_name == "execute_sql":
+            output = {"markdown_describe": "各城市用户数量如下：", "show_table": True, "chart": False, "chart_type": ""}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+        return ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": SCRIPTED_SQL})])
+
+    with data_agent.override(model=FunctionModel(step)):
+        yield calls
+
+
+@pytest.fixture
+def app_client(fixture_db) -> AsgiClient:
+    """不经过网络直接调用 main.app 的客户端，需在 client.lifespan() 内发送请求"""
+    # main 按相对路径挂载前端静态文件，只在需要时导入
+    import main
+
+    return AsgiClient(main.app)
+
+
+@pytest.fixture
+def connect_body(conn_config: DatabaseConnectionConfig) -> dict[str, Any]:
+    """连接 conn_config 对应数据库的 /api/connect 请求体"""
+    return {"host": conn_config.host, "port": conn_config.port, "username": conn_config.username,
+            "password": conn_config.password.get_secret_value(), "dbName": conn_config.database_name}
@@ -0,0 +1,76 @@
+import asyncio
+
+import agent.query_pipeline as query_pipeline
+from agent.query_pipeline import run_query
+from utils.answer_cache import AnswerCache, normalize_question, result_fingerprint
+
+
+def test_normalize_question():
+    assert normalize_question("  各城市的 用户数量？ ") == normalize_question("各城市的 用户数量")
+    assert normalize_question("Top  10 Users?") == "top 10 users"
+
+
+def test_result_fingerprint_is_order_insensitive_for_keys():
+    assert result_fingerprint([{"a": 1, "b": 2}]) == result_fingerprint([{"b": 2, "a": 1}])
+    assert result_fingerprint([{"a": 1}]) != result_fingerprint([{"a": 2}])
+
+
+def test_answers_are_keyed_by_schema_version(conn_config):
+    cache = AnswerCache(store=None)
+
+    async def run():
+        await cache.set(conn_config, "v1", "各城市用户数？", "SELECT 1", [{"n": 1}], {"data": "答案"})
+        return await cache.get(conn_config, "v1", "各城市用户数"), await cache.get(conn_config, "v2", "各城市用户数")
+
+    hit, other_version = asyncio.run(run())
+    assert hit.response == {"data": "答案"} and hit.sql_text == "SELECT 1"
+    assert hit.fingerprint == result_fingerprint([{"n": 1}])
+    assert other_version is None
+
+
+def test_evicts_least_recently_used_and_discards(conn_config):
+    cache = AnswerCache(max_entries=2, store=None)
+
+    async def run():
+        for question in ("q1", "q2", "q3"):
+            await cache.set(conn_config, "v1", question, "SELECT 1", [], {"data": question})
+        await cache.discard(conn_config, "v1", "q3")
+        return [await cache.get(conn_config, "v1", question) for question in ("q1", "q2", "q3")]
+
+    q1, q2, q3 = asyncio.run(run())
+    assert q1 is None and q2.response == {"data": "q2"} and q3 is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_repeated_question_skips_model(fixture_db, conn_config, scripted_model, monkeypatch):
+    monkeypatch.setattr(query_pipeline, "ANSWER_CACHE_REVALIDATE", False)
+
+    async def run():
+        first = await run_query("各城市的用户数量", conn_config)
+        calls = len(scripted_model)
+        second = await run_query("各城市的用户数量？", conn_config)
+        return first, second, calls
+
+    first, second, calls = asyncio.run(run())
+    assert calls == 2
+    assert len(scripted_model) == calls
+    assert second["data"] == first["data"]
+    assert second["result_id"] and second["result_id"] != first["result_id"]
+
+
+def test_revalidation_rerenders_changed_data_without_model(fixture_db, conn_config, scripted_model, monkeypatch):
+    monkeypatch.setattr(query_pipeline, "ANSWER_CACHE_REVALIDATE", True)
+
+    async def run():
+        first = await run_query("各城市的用户数量", conn_config)
+        unchanged = await run_query("各城市的用户数量", conn_config)
+        calls = len(scripted_model)
+        fixture_db._db.execute("UPDATE t_user SET city = '拉萨' WHERE id <= 5")
+        changed = await run_query("各城市的用户数量", conn_config)
+        return first, unchanged, changed, calls
+
+    first, unchanged, changed, calls = asyncio.run(run())
+    assert len(scripted_model) == calls == 2
+    assert unchanged["data"] == first["data"]
+    assert "拉萨" in changed["data"] and "拉萨" not in first["data"]
+    assert changed["data"].startswith("各城市用户数量如下：")
@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import json
+from decimal import Decimal
+
+import pytest
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+import agent.chart_builder as chart_builder
+from agent.chart_builder import build_chart, infer_column_roles, resolve_chart_kind
+from agent.data_agent import data_agent
+from agent.echarts_agent import echarts_agent
+from agent.query_pipeline import run_query
+from utils.chart_renderer import chart_format_var
+from utils.sql_executor import QueryResult
+
+
+def result(*rows: dict) -> QueryResult:
+    return QueryResult(list(rows[0]), list(rows))
+
+
+@pytest.fixture
+def charts(monkeypatch) -> list[tuple[str, tuple]]:
+    """记录 build_chart 调用的图表函数及参数，不实际渲染"""
+    calls = []
+    for kind in ("bar", "line", "pie", "scatter", "radar", "funnel", "heatmap", "wordcloud", "boxplot"):
+        async def generate(*args, kind=kind, **kwargs):
+            calls.append((kind, args))
+            return f"<{kind}>"
+
+        monkeypatch.setattr(chart_builder, f"generate_{kind}_chart", generate)
+    return calls
+
+
+@pytest.mark.parametrize("chart_type, expected", [
+    ("柱状图", "bar"),
+    ("横向条形图", "bar"),
+    ("销售趋势", "line"),
+    ("环形图", "pie"),
+    ("南丁格尔玫瑰图", "pie"),
+    ("箱线图", "boxplot"),
+    ("Scatter", "scatter"),
+    ("桑基图", None),
+    ("", None),
+    (None, None),
+])
+def test_resolve_chart_kind(chart_type, expected):
+    assert resolve_chart_kind(chart_type) == expected
+
+
+def test_infer_column_roles():
+    roles = infer_column_roles(result(
+        {"day": datetime.date(2024, 5, 1), "month": "2024-05", "city": "北京", "user_id": 3, "amount": Decimal("1.5"),
+         "paid": True, "empty": None},
+        {"day": datetime.date(2024, 5, 2), "month": "2024/06", "city": "上海", "user_id": 4, "amount": 2, "paid": False,
+         "empty": None},
+    ))
+    assert roles == {
+        "day": "time", "month": "time", "city": "category", "user_id": "category", "amount": "measure",
+        "paid": "category", "empty": "category",
+    }
+
+
+def test_time_series_defaults_to_line(charts):
+    chart = asyncio.run(build_chart("", result(
+        {"day": datetime.date(2024, 5, 2), "city": "北京", "orders": 3},
+        {"day": datetime.date(2024, 5, 1), "city": "上海", "orders": Decimal("4")},
+    )))
+    assert chart == "<line>"
+    # 时间维度优先作为横轴，Decimal 转换为浮点数
+    assert charts == [("line", ("", ["2024-05-02", "2024-05-01"], [3, 4.0]))]
+
+
+def test_category_and_measure(charts):
+    rows = result({"city": "北京", "users": 3}, {"city": "上海", "users": 5})
+    assert asyncio.run(build_chart(None, rows)) == "<bar>"
+    assert asyncio.run(build_chart("饼图", rows, "各城市用户占比")) == "<pie>"
+    assert charts == [
+        ("bar", ("", ["北京", "上海"], [3, 5])),
+        ("pie", ("各城市用户占比", [("北京", 3), ("上海", 5)])),
+    ]
+
+
+@pytest.mark.parametrize("chart_type, rows", [
+    # 没有度量列
+    ("柱状图", [{"city": "北京", "name": "a"}]),
+    # 无法识别的图表类型
+    ("桑基图", [{"city": "北京", "users": 3}]),
+    # 散点图需要两个度量列
+    ("散点图", [{"city": "北京", "users": 3}]),
+    # 每组不足 5 个值无法计算四分位数
+    ("箱线图", [{"city": "北京", "users": 3}]),
+])
+def test_unchartable_results(charts, chart_type, rows):
+    assert asyncio.run(build_chart(chart_type, result(*rows))) is None
+    assert charts == []
+
+
+def test_no_result_or_rows():
+    assert asyncio.run(build_chart("柱状图", None)) is None
+    assert asyncio.run(build_chart("柱状图", QueryResult(["city"], []))) is None
+
+
+def test_renders_chart_options():
+    async def run():
+        token = chart_format_var.set("options")
+        try:
+            return await build_chart("柱状图", result({"city": "北京", "users": 3}, {"city": "上海", "users": 5}))
+        finally:
+            chart_format_var.reset(token)
+
+    options = json.loads(asyncio.run(run()))
+    assert options["series"][0]["type"] == "bar"
+    assert options["xAxis"][0]["data"] == ["北京", "上海"]
+
+
+def _data_model(chart_type: str) -> FunctionModel:
+    def step(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        last = messages[-1].parts[-1]
+        if isinstance(last, ToolReturnPart) and last.tool_name == "execute_sql":
+            output = {"markdown_describe": "各城市用户数量如下：", "show_table": True, "chart": True, "chart_type": chart_type}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+        sql = "SELECT city, COUNT(*) AS user_count FROM t_user GROUP BY city ORDER BY city"
+        return ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": sql})])
+
+    return FunctionModel(step)
+
+
+@pytest.fixture
+def chart_agent_calls():
+    calls = []
+
+    def step(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        calls.append(messages[-1].parts[-1].content)
+        tool = next(tool for tool in info.output_tools if "bar" in tool.name)
+        return ModelResponse(parts=[ToolCallPart(tool.name, {"title": "图表智能体", "x_data": ["a"], "y_data": [1]})])
+
+    with echarts_agent.override(model=FunctionModel(step)):
+        yield calls
+
+
+@pytest.mark.parametrize("chart_type, agent_called", [("柱状图", False), ("桑基图", True)])
+def test_falls_back_to_chart_agent(fixture_db, conn_config, chart_agent_calls, chart_type, agent_called):
+    with data_agent.override(model=_data_model(chart_type)):
+        answer = asyncio.run(run_query("各城市用户数", conn_config, cache_mode="bypass", chart_format="options"))
+    options = json.loads(answer["chart"])
+    assert bool(chart_agent_calls) is agent_called
+    if agent_called:
+        # 图表智能体收到带表格的数据描述
+        assert "生成的图表类型：桑基图" in chart_agent_calls[0] and "| 北京" in chart_agent_calls[0]
+        assert options["title"][0]["text"] == "图表智能体"
+    else:
+        assert options["series"][0]["type"] == "bar"
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+import agent.query_pipeline as query_pipeline
+from agent.conversation import ConversationRegistry, compact_messages, synthetic_turn_messages
+from agent.data_agent import data_agent
+from agent.query_pipeline import run_query
+
+SCRIPTED_SQL = "SELECT city, COUNT(*) AS user_count FROM t_user GROUP BY city ORDER BY city"
+T_USER = {"columns": [{"name": "id", "type": "int"}, {"name": "city", "type": "varchar(32)"}]}
+T_ORDER = {"columns": [{"name": "id", "type": "int"}, {"name": "user_id", "type": "int"}]}
+
+
+def _turn_messages(question: str, sql: str, rows: int = 3) -> list[ModelMessage]:
+    """一轮数据智能体的消息：获取表结构、执行SQL，最后的输出工具调用没有返回"""
+    return [
+        ModelRequest(parts=[SystemPromptPart("系统提示"), UserPromptPart(question)]),
+        ModelResponse(parts=[ToolCallPart("get_db_tables_description", {}, "c1")]),
+        ModelRequest(parts=[ToolReturnPart("get_db_tables_description", {"t_user": T_USER, "t_order": T_ORDER}, "c1")]),
+        ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": sql}, "c2")]),
+        ModelRequest(parts=[ToolReturnPart("execute_sql", {
+            "columns": ["city"], "rows": [{"city": f"城市{i}"} for i in range(rows)], "row_count": rows,
+            "truncated": False, "stats": {},
+        }, "c2")]),
+        ModelResponse(parts=[ToolCallPart("final_result", {"markdown_describe": "答案"}, "c3")]),
+    ]
+
+
+def assert_calls_answered(messages: list[ModelMessage]) -> None:
+    """每个工具调用都在紧随其后的请求中有对应 tool_call_id 的返回，才能作为历史消息再次发送给模型"""
+    for index, message in enumerate(messages):
+        if not isinstance(message, ModelResponse):
+            continue
+        calls = {part.tool_call_id for part in message.parts if isinstance(part, ToolCallPart)}
+        if not calls:
+            continue
+        following = messages[index + 1] if index + 1 < len(messages) else None
+        assert isinstance(following, ModelRequest), f"工具调用之后没有返回：{calls}"
+        returns = {part.tool_call_id for part in following.parts if isinstance(part, ToolReturnPart)}
+        assert calls <= returns
+
+
+def test_compact_messages_moves_schema_to_context():
+    tables = {}
+    messages = compact_messages(_turn_messages("各城市用户数", SCRIPTED_SQL), tables, keep_results=True)
+
+    assert not any(isinstance(part, SystemPromptPart) for message in messages for part in message.parts)
+    assert tables == {"t_user": T_USER, "t_order": T_ORDER}
+    schema_return = messages[2].parts[0]
+    assert schema_return.content == {"tables": ["t_user", "t_order"], "note": "表结构见对话背景"}
+    assert len(messages[4].parts[0].content["rows"]) == 3
+    # 补齐最后的输出工具调用的返回
+    [final_return] = messages[-1].parts
+    assert (final_return.tool_name, final_return.content, final_return.tool_call_id) == \
+        ("final_result", "Final result processed.", "c3")
+    assert_calls_answered(messages)
+
+
+def test_compact_messages_drops_rows_of_earlier_turns():
+    messages = compact_messages(_turn_messages("q", SCRIPTED_SQL), {}, keep_results=True)
+    again = compact_messages(messages, {}, keep_results=False)
+    assert again[4].parts[0].content == {
+        "columns": ["city"], "row_count": 3, "truncated": False, "note": "结果行已省略，需要时重新执行SQL",
+    }
+    # 已补齐的返回不会重复添加
+    assert len(again) == len(messages)
+    assert_calls_answered(again)
+
+
+def test_synthetic_turn_messages():
+    messages = synthetic_turn_messages("SELECT 1", "查询返回 1 行")
+    assert [type(message) for message in messages] == [ModelRequest, ModelResponse]
+    assert [(type(part), part.content) for message in messages for part in message.parts] == [
+        (UserPromptPart, "SELECT 1"), (TextPart, "查询返回 1 行"),
+    ]
+    assert_calls_answered(messages)
+
+
+def test_history_is_compacted_to_the_token_budget(conn_config):
+    registry = ConversationRegistry(max_tokens=400, store=None)
+
+    async def run():
+        conversation = await registry.create("s1", conn_config)
+        for index in range(4):
+            question = f"问题{index}"
+            sql = f"SELECT city FROM t_user WHERE id > {index}"
+            await registry.record(conversation, question, _turn_messages(question, sql, rows=20), sql, f"答案{index}", "v1")
+        return conversation
+
+    conversation = asyncio.run(run())
+    assert conversation.turn_count == 4
+    assert conversation.folded == len(conversation.summary) > 0
+    assert conversation.summary[0] == "问：问题0；SQL：SELECT city FROM t_user WHERE id > 0；答：答案0"
+    # 最近一轮始终保留完整消息，其余轮次压缩后整体不超出预算
+    assert conversation.turns[-1].question == "问题3"
+    assert len(conversation.turns) == 1 or conversation.tokens() <= registry.max_tokens
+    # 仍超出预算时只保留SQL中用到的表
+    assert set(conversation.tables) == {"t_user"}
+
+    history = registry.history(conversation, conn_config, "v1", "系统提示")
+    system = [part.content for part in history[0].parts]
+    assert system[0] == "系统提示" and "之前的问答摘要：\n1. 问：问题0" in system[1]
+    assert_calls_answered(history)
+
+
+def test_history_resets_after_switching_database(conn_config):
+    registry = ConversationRegistry(store=None)
+    other_db = conn_config.model_copy(update={"database_name": "other"})
+
+    async def run():
+        conversation = await registry.create("s1", conn_config)
+        await registry.record(conversation, "q", _turn_messages("q", SCRIPTED_SQL), SCRIPTED_SQL, "答案", "v1")
+        return conversation
+
+    conversation = asyncio.run(run())
+    assert registry.history(conversation, conn_config, "v1", "系统提示") is not None
+    # 表结构版本变化时只丢弃已获取的表结构
+    assert registry.history(conversation, conn_config, "v2", "系统提示") is not None
+    assert conversation.tables == {} and conversation.turn_count == 1
+
+    assert registry.history(conversation, other_db, "v2", "系统提示") is None
+    assert conversation.conn_key == other_db.conn_key
+    assert conversation.turn_count == 0 and conversation.summary == []
+
+
+@pytest.fixture
+def recording_model():
+    """与 scripted_model 相同的脚本，但记录每次模型调用收到的全部消息"""
+    requests = []
+
+    def step(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        requests.append(list(messages))
+        last = messages[-1].parts[-1]
+        if isinstance(last, ToolReturnPart) and last.tool_name == "execute_sql":
+            output = {"markdown_describe": "各城市用户数量如下：", "show_table": True, "chart": False, "chart_type": ""}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+        return ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": SCRIPTED_SQL})])
+
+    with data_agent.override(model=FunctionModel(step)):
+        yield requests
+
+
+def test_follow_up_question_sends_history(fixture_db, conn_config, recording_model, monkeypatch):
+    registry = ConversationRegistry(store=None)
+    monkeypatch.setattr(query_pipeline, "conversation_registry", registry)
+
+    async def run():
+        conversation = await registry.create("s1", conn_config)
+        for question in ("SELECT id FROM t_user WHERE id = 1", "各城市用户数", "只看北京"):
+            await run_query(question, conn_config, conversation=conversation)
+        return conversation
+
+    conversation = asyncio.run(run())
+    assert conversation.turn_count == 3
+    assert conversation.turns[0].sql_text == "SELECT id FROM t_user WHERE id = 1"
+
+    # 第三个问题的第一次模型调用带上了前两轮：直接执行的SQL和数据智能体的一轮
+    history = recording_model[2]
+    prompts = [part.content for message in history for part in message.parts if isinstance(part, UserPromptPart)]
+    assert prompts == ["SELECT id FROM t_user WHERE id = 1", "各城市用户数", "只看北京"]
+    assert_calls_answered(history)
@@ -0,0 +1,84 @@
+import asyncio
+
+from utils.cost_gate import check_query_cost, evaluate_plan
+
+
+def _table(name, access_type, rows, produced=None, **extra):
+    table = {"table_name": name, "access_type": access_type, "rows_examined_per_scan": rows,
+             "rows_produced_per_join": rows if produced is None else produced}
+    table.update(extra)
+    return table
+
+
+def _plan(*tables, cost="10.0"):
+    block = {"select_id": 1, "cost_info": {"query_cost": cost}}
+    if len(tables) == 1:
+        block["table"] = tables[0]
+    else:
+        block["nested_loop"] = [{"table": table} for table in tables]
+    return {"query_block": block}
+
+
+def test_indexed_access_is_allowed():
+    decision = evaluate_plan("SELECT * FROM t WHERE id = 1", _plan(_table("t", "ref", 5)), max_rows=100, max_full_scan_rows=10)
+    assert decision.allowed and decision.hints == []
+    assert decision.estimated_rows == 5 and decision.query_cost == 10.0
+
+
+def test_full_scan_threshold_is_inclusive():
+    sql = "SELECT * FROM t"
+    assert evaluate_plan(sql, _plan(_table("t", "ALL", 1000)), max_rows=10 ** 6, max_full_scan_rows=1000).allowed
+    assert not evaluate_plan(sql, _plan(_table("t", "ALL", 1001)), max_rows=10 ** 6, max_full_scan_rows=1000).allowed
+
+
+def test_full_scan_hints_depend_on_keys_and_conditions():
+    def hint(**extra):
+        decision = evaluate_plan("SELECT * FROM t", _plan(_table("t", "ALL", 5000, **extra)),
+                                 max_rows=10 ** 6, max_full_scan_rows=1000)
+        assert not decision.allowed
+        return decision.hints[0]
+
+    assert "没有可用的索引" in hint()
+    assert "没有过滤条件" in hint(possible_keys=["idx_city"])
+    assert "未被使用" in hint(possible_keys=["idx_city"], attached_condition="(t.city like '%a%')")
+
+
+def test_full_index_scan_is_reported():
+    decision = evaluate_plan("SELECT id FROM t", _plan(_table("t", "index", 5000, possible_keys=["PRIMARY"])),
+                             max_rows=10 ** 6, max_full_scan_rows=1000)
+    assert not decision.allowed and "全索引扫描" in decision.hints[0]
+
+
+def test_nested_loop_multiplies_driven_table_rows():
+    plan = _plan(_table("u", "ALL", 100, produced=50), _table("o", "ref", 20))
+    decision = evaluate_plan("SELECT * FROM u JOIN o ON o.user_id = u.id", plan, max_rows=500, max_full_scan_rows=1000)
+    assert [table.rows_examined for table in decision.tables] == [100, 1000]
+    assert decision.estimated_rows == 1100
+    assert not decision.allowed
+    assert decision.hints == ["如只需查看部分数据，请添加 LIMIT"]
+
+
+def test_total_rows_hint_without_limit_suggestion_when_limited():
+    plan = _plan(_table("t", "range", 5000))
+    decision = evaluate_plan("SELECT * FROM t WHERE id > 1 LIMIT 10", plan, max_rows=1000, max_full_scan_rows=1000)
+    assert not decision.allowed
+    assert decision.hints == ["请缩小查询的时间或数据范围，或先聚合再关联"]
+    assert "5000" in decision.retry_message()
+
+
+def test_partition_hint():
+    plan = _plan(_table("t", "ALL", 5000, possible_keys=["idx"], attached_condition="x", partitions=["p0", "p1", "p2"]))
+    decision = evaluate_plan("SELECT * FROM t", plan, max_rows=10 ** 6, max_full_scan_rows=1000)
+    assert any("全部 3 个分区" in hint for hint in decision.hints)
+
+
+def test_check_query_cost_skips_non_select(fixture_db, conn_config):
+    decision = asyncio.run(check_query_cost(conn_config, "SHOW TABLES"))
+    assert decision.allowed and decision.tables == []
+    assert fixture_db.executed == 0
+
+
+def test_check_query_cost_explains_select(fixture_db, conn_config):
+    decision = asyncio.run(check_query_cost(conn_config, "SELECT * FROM t_order WHERE id > 10"))
+    assert decision.allowed
+    assert [(table.table_name, table.access_type) for table in decision.tables] == [("t_order", "range")]
@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import pytest
+
+import agent.job_queue as job_queue_module
+from agent.job_queue import JobQueue, JobQueueFullError
+from utils.session_registry import Session
+
+
+async def _events(queue: JobQueue, job_id: str) -> list[tuple[str, dict]]:
+    return [event async for event in queue.watch(job_id)]
+
+
+@pytest.fixture
+def blocked_run_query(monkeypatch):
+    """替换流水线：任务执行到 release 被设置为止"""
+    release = asyncio.Event()
+
+    async def run_query(*args, **kwargs):
+        await release.wait()
+        return {"data": "答案", "chart": None, "chart_format": "html", "result_id": None}
+
+    monkeypatch.setattr(job_queue_module, "run_query", run_query)
+    return release
+
+
+def test_job_succeeds_with_events_and_paged_rows(fixture_db, conn_config):
+    session = Session("s1", conn_config)
+
+    async def run():
+        queue = JobQueue(workers=1, store=None)
+        queue.start()
+        try:
+            job = await queue.submit(session, "SELECT id, name FROM t_user ORDER BY id")
+            return job, await _events(queue, job.job_id)
+        finally:
+            await queue.stop()
+
+    job, events = asyncio.run(run())
+    assert job.status == "succeeded"
+    names = [name for name, _ in events]
+    assert names[:2] == ["status", "status"] and names[-1] == "done"
+    assert [data["status"] for name, data in events if name == "status"] == ["queued", "running"]
+    assert {"sql", "rows", "result", "answer"} <= set(names)
+
+    assert job.columns == ["id", "name"] and len(job.rows) == 20
+    first = job.page(0, 8)
+    assert [row["id"] for row in first["rows"]] == list(range(1, 9))
+    assert first["next_offset"] == 8 and first["total"] == 20
+    last = job.page(16, 8)
+    assert len(last["rows"]) == 4 and last["next_offset"] is None
+    assert job.page(40, 8)["rows"] == []
+
+    status = job.to_dict()
+    assert status["row_count"] == 20 and status["result"]["result_id"]
+    assert status["queue_wait_ms"] >= 0 and status["duration_ms"] >= 0
+
+
+def test_jobs_are_scoped_to_the_submitting_session(fixture_db, conn_config, blocked_run_query):
+    owner, stranger = Session("owner", conn_config), Session("stranger", conn_config)
+    switched = Session("owner", conn_config.model_copy(update={"database_name": "other"}))
+
+    async def run():
+        queue = JobQueue(workers=1, store=None)
+        queue.start()
+        try:
+            job = await queue.submit(owner, "q")
+            return (await queue.get(job.job_id, owner), await queue.get(job.job_id, stranger),
+                    await queue.cancel(job.job_id, stranger), await queue.get(job.job_id, switched), job)
+        finally:
+            await queue.stop()
+
+    found, hidden, not_cancelled, after_switch, job = asyncio.run(run())
+    assert found is job
+    assert hidden is None and not_cancelled is None and after_switch is None
+
+
+def test_cancel_queued_and_running_jobs(fixture_db, conn_config, blocked_run_query):
+    session = Session("s1", conn_config)
+
+    async def run():
+        queue = JobQueue(workers=1, store=None)
+        queue.start()
+        try:
+            running = await queue.submit(session, "q1")
+            queued = await queue.submit(session, "q2")
+            while running.status != "running":
+                await asyncio.sleep(0.01)
+            assert queued.status == "queued"
+            await queue.cancel(queued.job_id, session)
+            await queue.cancel(running.job_id, session)
+            await _events(queue, running.job_id)
+            return running, queued, queue.stats()
+        finally:
+            await queue.stop()
+
+    running, queued, stats = asyncio.run(run())
+    assert running.status == queued.status == "cancelled"
+    assert queued.started_at is None
+    assert stats["cancelled"] == 2
+
+
+def test_queue_full_and_failures(fixture_db, conn_config, monkeypatch):
+    session = Session("s1", conn_config)
+
+    async def failing_run_query(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(job_queue_module, "run_query", failing_run_query)
+
+    async def run():
+        queue = JobQueue(workers=1, max_queued=1, store=None)
+        queue.start()
+        try:
+            job = await queue.submit(session, "q1")
+            with pytest.raises(JobQueueFullError):
+                await queue.submit(session, "q2")
+            events = await _events(queue, job.job_id)
+            return job, events
+        finally:
+            await queue.stop()
+
+    job, events = asyncio.run(run())
+    assert job.status == "failed" and job.error == "服务器内部出错"
+    assert events[-1] == ("error", {"message": "服务器内部出错", "status": "failed", "trace_id": job.trace_id})
+
+
+def test_job_endpoints_poll_and_page(app_client, connect_body):
+    async def run():
+        async with app_client.lifespan():
+            _, _, body = await app_client.request("PUT", "/api/connect", connect_body)
+            headers = {"X-Session-Id": json.loads(body)["session_id"]}
+            _, _, body = await app_client.request("POST", "/api/jobs", "SELECT id FROM t_user ORDER BY id", headers)
+            job_id = json.loads(body)["message"]["job_id"]
+            status = None
+            while status not in ("succeeded", "failed", "cancelled"):
+                await asyncio.sleep(0.01)
+                _, _, body = await app_client.request("GET", f"/api/jobs/{job_id}", headers=headers)
+                status = json.loads(body)["message"]["status"]
+            _, _, page = await app_client.request("GET", f"/api/jobs/{job_id}/rows?offset=15&limit=10", headers=headers)
+            _, _, missing = await app_client.request("GET", "/api/jobs/missing", headers=headers)
+            return status, json.loads(page)["message"], json.loads(missing)
+
+    status, page, missing = asyncio.run(run())
+    assert status == "succeeded"
+    assert [row["id"] for row in page["rows"]] == [16, 17, 18, 19, 20]
+    assert page["next_offset"] is None and page["total"] == 20
+    assert missing == {"success": False, "message": "查询任务不存在或已过期"}
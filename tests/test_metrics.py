@@ -0,0 +1,108 @@
+import asyncio
+import json
+import re
+
+import pytest
+
+from utils.logger import trace_id_var
+from utils.metrics import MetricsRegistry
+from utils.tracing import current_spans, span, stage_summary, start_trace
+
+
+def test_counter_exposition():
+    registry = MetricsRegistry()
+    counter = registry.counter("t_requests_total", "请求数", ("route", "status"))
+    counter.inc(route="/a", status="200")
+    counter.inc(2, route="/a", status="200")
+    counter.inc(route='/b"\n', status="500")
+    assert registry.render() == (
+        "# HELP t_requests_total 请求数\n"
+        "# TYPE t_requests_total counter\n"
+        't_requests_total{route="/a",status="200"} 3\n'
+        't_requests_total{route="/b\\"\\n",status="500"} 1\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("t_seconds", "耗时", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, stage="sql")
+    assert registry.render().splitlines() == [
+        "# HELP t_seconds 耗时",
+        "# TYPE t_seconds histogram",
+        # 等于分桶上限的值计入该分桶
+        't_seconds_bucket{stage="sql",le="0.1"} 2',
+        't_seconds_bucket{stage="sql",le="1"} 3',
+        't_seconds_bucket{stage="sql",le="+Inf"} 4',
+        't_seconds_sum{stage="sql"} 3.65',
+        't_seconds_count{stage="sql"} 4',
+    ]
+
+
+def test_histogram_without_labels():
+    registry = MetricsRegistry()
+    registry.histogram("t_rows", "行数", buckets=(10,)).observe(20)
+    assert registry.render().splitlines()[2:] == ['t_rows_bucket{le="10"} 0', 't_rows_bucket{le="+Inf"} 1',
+                                                   "t_rows_sum 20", "t_rows_count 1"]
+
+
+def test_spans_are_nested_within_a_trace():
+    with start_trace("upstream-1") as trace_id:
+        assert trace_id_var.get() == "upstream-1"
+        with span("data_agent") as outer:
+            with span("sql.execute", rows=3):
+                pass
+            with pytest.raises(ValueError):
+                with span("sql.execute"):
+                    raise ValueError("boom")
+        spans = current_spans()
+        summary = stage_summary()
+
+    assert trace_id == "upstream-1"
+    assert [s.name for s in spans] == ["sql.execute", "sql.execute", "data_agent"]
+    assert all(s.parent_id == outer.span_id for s in spans[:2]) and outer.parent_id is None
+    assert spans[0].attributes == {"rows": 3} and spans[1].error == "ValueError"
+    assert set(summary) == {"sql.execute", "data_agent"}
+    # 追踪结束后恢复外层上下文
+    assert current_spans() == []
+    with start_trace() as generated:
+        assert re.fullmatch(r"[0-9a-f]{16}", generated)
+
+
+def _metric(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_query_updates_metrics_and_returns_trace_id(app_client, connect_body):
+    requests_line = 'dbqa_http_requests_total{method="POST",route="/api/query",status="200"}'
+    duration_line = 'dbqa_http_request_duration_seconds_bucket{method="POST",route="/api/query",le="+Inf"}'
+    sql_line = 'dbqa_stage_duration_seconds_count{stage="sql.execute"}'
+
+    async def run():
+        async with app_client.lifespan():
+            _, _, body = await app_client.request("PUT", "/api/connect", connect_body)
+            headers = {"X-Session-Id": json.loads(body)["session_id"]}
+            _, _, before = await app_client.request("GET", "/metrics")
+            query = await app_client.request("POST", "/api/query?cache=bypass", "SELECT id FROM t_user WHERE id = 1",
+                                             {**headers, "X-Trace-Id": "upstream-42"})
+            invalid = await app_client.request("GET", "/health", headers={"X-Trace-Id": "not a valid id!"})
+            metrics = await app_client.request("GET", "/metrics")
+            return before.decode(), query, invalid, metrics
+
+    before, (_, query_headers, query_body), (_, invalid_headers, _), (_, metrics_headers, after) = asyncio.run(run())
+    assert query_headers["x-trace-id"] == "upstream-42"
+    assert json.loads(query_body)["trace_id"] == "upstream-42"
+    # 不合法的上游追踪 ID 被替换为新生成的 ID
+    assert re.fullmatch(r"[0-9a-f]{16}", invalid_headers["x-trace-id"])
+
+    assert metrics_headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    after = after.decode()
+    assert "# TYPE dbqa_http_requests_total counter" in after
+    assert "# TYPE dbqa_http_request_duration_seconds histogram" in after
+    assert _metric(after, requests_line) == _metric(before, requests_line) + 1
+    assert _metric(after, duration_line) == _metric(before, duration_line) + 1
+    assert _metric(after, sql_line) >= _metric(before, sql_line) + 1
@@ -0,0 +1,121 @@
+import asyncio
+from collections import deque
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from utils.model_router import ModelCallTimeoutError, RoutedModel
+
+
+def answering(name: str, delay: float = 0.0) -> FunctionModel:
+    async def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep(delay)
+        return ModelResponse(parts=[TextPart(f"{name} 的回答")])
+
+    async def stream(messages: list[ModelMessage], info: AgentInfo):
+        yield f"{name} 的"
+        yield "流式回答"
+
+    return FunctionModel(respond, stream_function=stream, model_name=name)
+
+
+def failing(name: str) -> FunctionModel:
+    async def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        raise RuntimeError(f"{name} 不可用")
+
+    async def stream(messages: list[ModelMessage], info: AgentInfo):
+        raise RuntimeError(f"{name} 不可用")
+        yield
+
+    return FunctionModel(respond, stream_function=stream, model_name=name)
+
+
+def run(model: RoutedModel) -> str:
+    return asyncio.run(Agent(model).run("问题")).output
+
+
+def test_primary_answers():
+    assert run(RoutedModel("test", [answering("primary"), answering("backup")])) == "primary 的回答"
+
+
+def test_falls_back_after_error():
+    assert run(RoutedModel("test", [failing("primary"), answering("backup")])) == "backup 的回答"
+
+
+def test_falls_back_after_timeout():
+    model = RoutedModel("test", [answering("primary", delay=1), answering("backup")], timeout=0.05)
+    assert run(model) == "backup 的回答"
+
+
+def test_raises_last_error_when_all_models_fail():
+    with pytest.raises(RuntimeError, match="backup 不可用"):
+        run(RoutedModel("test", [failing("primary"), failing("backup")]))
+    with pytest.raises(ModelCallTimeoutError):
+        run(RoutedModel("test", [answering("primary", delay=1)], timeout=0.05))
+
+
+def test_requires_a_model():
+    with pytest.raises(ValueError):
+        RoutedModel("test", [])
+
+
+def test_hedge_delay_needs_enough_samples():
+    primary = answering("primary")
+    model = RoutedModel("test", [primary], hedge=True, hedge_min_delay=0.01, hedge_min_samples=20)
+    assert model.hedge_delay(primary) is None
+    model._latencies["primary"] = deque([0.02] * 19 + [0.5] * 1)
+    # p95 取第 19 个样本，不受最慢的一次影响，且不低于最短等待
+    assert model.hedge_delay(primary) == 0.02
+    model._latencies["primary"] = deque([0.001] * 20)
+    assert model.hedge_delay(primary) == 0.01
+    assert RoutedModel("test", [primary], hedge=False, hedge_min_samples=0).hedge_delay(primary) is None
+
+
+def test_hedged_request_wins_over_slow_primary():
+    calls: list[str] = []
+    # 首次请求卡住，对冲请求立即返回
+    delays = iter([1.0, 0.0])
+
+    async def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        attempt = len(calls)
+        calls.append("call")
+        await asyncio.sleep(next(delays))
+        return ModelResponse(parts=[TextPart(f"第 {attempt + 1} 次请求的回答")])
+
+    primary = FunctionModel(respond, model_name="primary")
+    model = RoutedModel("test", [primary], hedge=True, hedge_min_delay=0.02, hedge_min_samples=1)
+    model._latencies["primary"] = deque([0.02])
+
+    result, elapsed = asyncio.run(_timed(Agent(model).run("问题")))
+    assert result.output == "第 2 次请求的回答"
+    assert len(calls) == 2
+    assert elapsed < 0.5
+    # 对冲后的耗时不计入样本
+    assert list(model._latencies["primary"]) == [0.02]
+
+
+def test_successful_calls_feed_latency_samples():
+    model = RoutedModel("test", [answering("primary")], hedge=True, hedge_min_samples=2)
+    for _ in range(2):
+        run(model)
+    assert model.stats()["samples"] == {"primary": 2}
+    assert model.stats()["hedge_delay"]["primary"] == 1.0
+
+
+def test_stream_falls_back_before_first_response():
+    model = RoutedModel("test", [failing("primary"), answering("backup")])
+
+    async def stream():
+        async with Agent(model).run_stream("问题") as result:
+            return await result.get_output()
+
+    assert asyncio.run(stream()) == "backup 的流式回答"
+
+
+async def _timed(awaitable):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = await awaitable
+    return result, loop.time() - started
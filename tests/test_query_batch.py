@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+import agent.query_pipeline as query_pipeline
+from agent.query_pipeline import run_batch
+from utils.schema_cache import schema_cache
+
+USER_SQL = "SELECT id, name FROM t_user WHERE id = 1"
+
+
+@pytest.fixture
+def batch_calls(fixture_db, monkeypatch) -> dict:
+    """
+    包装批量查询中的单个问题：记录同时处理的问题数和各问题看到的表结构，问题为“失败”时抛出异常，
+    第一个问题处理时向替身库新增一张表并使表结构缓存失效
+    """
+    calls = {"active": 0, "max_active": 0, "snapshots": []}
+    run_query = query_pipeline.run_query
+
+    async def wrapped(question, conn_config, *args, **kwargs):
+        calls["active"] += 1
+        calls["max_active"] = max(calls["max_active"], calls["active"])
+        try:
+            if "t_new" not in fixture_db.tables:
+                fixture_db.tables["t_new"] = {"description": "新表",
+                                              "columns": [{"name": "id", "type": "bigint", "comment": None}]}
+                await schema_cache.invalidate(conn_config)
+            calls["snapshots"].append(await schema_cache.get_schema(conn_config))
+            await asyncio.sleep(0.01)
+            if question == "失败":
+                raise RuntimeError("boom")
+            return await run_query(question, conn_config, *args, **kwargs)
+        finally:
+            calls["active"] -= 1
+
+    monkeypatch.setattr(query_pipeline, "run_query", wrapped)
+    return calls
+
+
+def test_batch_is_bounded_and_pins_schema(batch_calls, conn_config):
+    questions = [USER_SQL, "失败", USER_SQL, USER_SQL, USER_SQL, USER_SQL]
+
+    async def run():
+        items = [item async for item in run_batch(questions, conn_config, "bypass", concurrency=2, batch_id="b1")]
+        return items, await schema_cache.get_schema(conn_config)
+
+    items, after = asyncio.run(run())
+    assert batch_calls["max_active"] == 2
+    # 批次内的问题都使用批次开始时加载的表结构，批次结束后才看到新表
+    pinned = batch_calls["snapshots"][0]
+    assert all(snapshot is pinned for snapshot in batch_calls["snapshots"])
+    assert "t_new" not in pinned.tables and "t_new" in after.tables
+
+    assert sorted(item["index"] for item in items) == list(range(len(questions)))
+    failed = [item for item in items if not item["success"]]
+    assert [(item["index"], item["message"]) for item in failed] == [(1, "服务器内部出错")]
+    assert all(item["trace_id"] == f"b1-{item['index']}" for item in items)
+    assert all(item["message"]["data"].startswith("| id | name |") for item in items if item["success"])
+
+
+def test_batch_route_streams_ndjson(app_client, connect_body, batch_calls):
+    async def run():
+        async with app_client.lifespan():
+            _, _, body = await app_client.request("PUT", "/api/connect", connect_body)
+            headers = {"X-Session-Id": json.loads(body)["session_id"]}
+            return await app_client.request("POST", "/api/query/batch?concurrency=1&cache=bypass",
+                                            [USER_SQL, "失败", USER_SQL], headers)
+
+    status, headers, body = asyncio.run(run())
+    assert status == 200 and headers["content-type"] == "application/x-ndjson"
+    assert body.endswith(b"\n")
+    # 每行一个完整的 JSON 对象，某个问题失败不影响其余各行，最后一行为批次汇总
+    lines = [json.loads(line) for line in body.decode().splitlines()]
+    items, summary = lines[:-1], lines[-1]["summary"]
+    assert batch_calls["max_active"] == 1
+    assert [item["success"] for item in sorted(items, key=lambda item: item["index"])] == [True, False, True]
+    assert {key: summary[key] for key in ("total", "succeeded", "failed")} == {"total": 3, "succeeded": 2, "failed": 1}
+    assert summary["trace_id"] == headers["x-trace-id"]
+    assert all(item["trace_id"] == f"{summary['trace_id']}-{item['index']}" for item in items)
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+import utils.query_governor as query_governor_module
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.db_pool import pool_manager
+from utils.query_governor import QueryGovernor, QueryQueueFullError, QueryTimeoutError, add_timeout_hint, query_governor
+from utils.sql_executor import execute_query
+
+
+@pytest.fixture
+def killed(monkeypatch) -> list[int]:
+    """记录被终止查询的连接线程 ID，不真正连接数据库执行 KILL QUERY"""
+    thread_ids = []
+
+    async def kill_query(conn_config, thread_id):
+        thread_ids.append(thread_id)
+
+    monkeypatch.setattr(pool_manager, "kill_query", kill_query)
+    # 客户端超时不再额外等待服务端先终止查询
+    monkeypatch.setattr(query_governor_module, "CLIENT_DEADLINE_GRACE", 0)
+    return thread_ids
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t", "SELECT /*+ MAX_EXECUTION_TIME(30000) */ * FROM t"),
+    ("  select id from t", "  select /*+ MAX_EXECUTION_TIME(30000) */ id from t"),
+    ("SELECT /*+ MAX_EXECUTION_TIME(1000) */ * FROM t", "SELECT /*+ MAX_EXECUTION_TIME(1000) */ * FROM t"),
+    ("WITH t AS (SELECT 1) SELECT * FROM t", "WITH t AS (SELECT 1) SELECT * FROM t"),
+    ("SHOW TABLES", "SHOW TABLES"),
+    ("EXPLAIN SELECT * FROM t", "EXPLAIN SELECT * FROM t"),
+    ("(SELECT 1) UNION (SELECT 2)", "(SELECT 1) UNION (SELECT 2)"),
+    ("SELECTED_COLUMNS", "SELECTED_COLUMNS"),
+])
+def test_add_timeout_hint(sql, expected):
+    assert add_timeout_hint(sql, 30) == expected
+
+
+def test_add_timeout_hint_disabled():
+    assert add_timeout_hint("SELECT 1", 0) == "SELECT 1"
+
+
+def test_slow_statement_is_killed(fixture_db, conn_config, killed, monkeypatch):
+    fixture_db.query_delay = 5
+    monkeypatch.setattr(query_governor, "timeout", 0.05)
+
+    with pytest.raises(QueryTimeoutError, match="已被终止"):
+        asyncio.run(execute_query(conn_config, "SELECT id FROM t_user", cache_mode="bypass"))
+    assert len(killed) == 1
+    stats = query_governor.stats()[conn_config.conn_key.split("#")[0]]
+    assert stats["timeouts"] == 1 and stats["running"] == 0 and stats["statements"] == 1
+
+
+def test_cancelled_statement_is_killed(conn_config, killed):
+    governor = QueryGovernor(timeout=0)
+
+    class Conn:
+        def thread_id(self):
+            return 7
+
+    async def run():
+        task = asyncio.create_task(governor.run(conn_config, Conn(), asyncio.sleep(5)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert killed == [7]
+
+
+def test_queue_over_limit_is_rejected(conn_config):
+    governor = QueryGovernor(max_concurrency=1, max_queue=1, queue_timeout=5)
+
+    async def hold(release: asyncio.Event):
+        async with governor.slot(conn_config):
+            await release.wait()
+
+    async def run():
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(release))
+        queued = asyncio.create_task(hold(release))
+        await asyncio.sleep(0.01)
+        with pytest.raises(QueryQueueFullError, match="排队的SQL已达上限 1 条"):
+            async with governor.slot(conn_config):
+                pass
+        stats = governor.stats()[conn_config.conn_key.split("#")[0]]
+        release.set()
+        await asyncio.gather(running, queued)
+        return stats, governor.stats()[conn_config.conn_key.split("#")[0]]
+
+    during, after = asyncio.run(run())
+    assert during["running"] == 1 and during["waiting"] == 1 and during["rejected"] == 1
+    assert after["running"] == after["waiting"] == 0 and after["statements"] == 2
+    assert after["avg_queue_wait_ms"] > 0
+
+
+def test_queue_timeout_is_rejected(conn_config):
+    governor = QueryGovernor(max_concurrency=1, queue_timeout=0.05)
+
+    async def run():
+        async with governor.slot(conn_config):
+            with pytest.raises(QueryQueueFullError, match="排队超过"):
+                async with governor.slot(conn_config):
+                    pass
+
+    asyncio.run(run())
+    assert governor.stats()[conn_config.conn_key.split("#")[0]]["rejected"] == 1
+
+
+def test_stream_slots_are_separate(conn_config):
+    governor = QueryGovernor(max_concurrency=1, max_stream_concurrency=1, queue_timeout=0.05)
+
+    async def run():
+        async with governor.slot(conn_config, stream=True):
+            # 流式读取占用名额时普通查询仍可执行，第二个流式读取排队超时
+            async with governor.slot(conn_config):
+                stats = governor.stats()[conn_config.conn_key.split("#")[0]]
+            with pytest.raises(QueryQueueFullError):
+                async with governor.slot(conn_config, stream=True):
+                    pass
+        return stats, governor.stats()[conn_config.conn_key.split("#")[0]]
+
+    during, after = asyncio.run(run())
+    assert during["running"] == 1 and during["streams_running"] == 1
+    assert after["streams_running"] == 0 and after["streams_rejected"] == 1 and after["rejected"] == 0
+
+
+def test_slots_scale_with_replicas(conn_config):
+    governor = QueryGovernor(max_concurrency=2)
+    replicated = DatabaseConnectionConfig(**conn_config.model_dump(by_alias=True, exclude={"replicas"}), replicas=[
+        {"host": "r1", "weight": 1}, {"host": "r2", "weight": 1}, {"host": "r3", "weight": 0},
+    ])
+    assert governor._get_slots(replicated, False).semaphore._value == 4
+    assert governor._get_slots(conn_config, False).semaphore._value == 2
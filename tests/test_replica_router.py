@@ -0,0 +1,167 @@
+import asyncio
+import random
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import pytest
+
+import utils.schema_cache as schema_cache_module
+import utils.sql_executor as sql_executor_module
+from agent.query_pipeline import run_query
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.query_governor import QueryQueueFullError
+from utils.replica_router import ReplicaHealth, ReplicaRouter, ReplicaUnavailableError
+
+
+class StubPools:
+    """按主机名借出“连接”的连接池替身，down 中的主机连接失败"""
+
+    def __init__(self):
+        self.down: set[str] = set()
+        self.acquired: list[str] = []
+
+    @asynccontextmanager
+    async def acquire(self, conn_config: DatabaseConnectionConfig):
+        if conn_config.host in self.down:
+            raise OSError(f"无法连接 {conn_config.host}")
+        self.acquired.append(conn_config.host)
+        yield conn_config.host
+
+    async def close_pool(self, conn_config: DatabaseConnectionConfig) -> None:
+        pass
+
+
+@pytest.fixture
+def replicated_config(conn_config) -> DatabaseConnectionConfig:
+    return DatabaseConnectionConfig(**conn_config.model_dump(by_alias=True, exclude={"replicas"}), replicas=[
+        {"host": "r1", "port": 3306, "weight": 2},
+        {"host": "r2", "port": 3306, "weight": 1},
+        {"host": "r3", "port": 3306, "weight": 0},
+    ])
+
+
+def _router(pools=None, **kwargs) -> ReplicaRouter:
+    router = ReplicaRouter(pools=pools or StubPools(), enabled=True, max_lag=10, check_interval=60, **kwargs)
+
+    async def lag(replica):
+        return 0.0
+
+    router._replication_lag = lag
+    return router
+
+
+def _key(router: ReplicaRouter, conn_config: DatabaseConnectionConfig, host: str) -> str:
+    return next(replica.conn_key for replica, _ in router.replicas(conn_config) if replica.host == host)
+
+
+def test_choose_by_weight(replicated_config):
+    router = _router()
+    random.seed(0)
+    picks = Counter(router.choose(replicated_config).host for _ in range(3000))
+    # 权重为 0 的副本不接收查询
+    assert set(picks) == {"r1", "r2"}
+    assert 1.7 < picks["r1"] / picks["r2"] < 2.3
+
+
+def test_lagging_replicas_are_excluded(replicated_config):
+    router = _router()
+    router._health[_key(router, replicated_config, "r1")] = ReplicaHealth(lag=30)
+    router._health[_key(router, replicated_config, "r2")] = ReplicaHealth(lag=5)
+    assert {router.choose(replicated_config).host for _ in range(50)} == {"r2"}
+
+    router._health[_key(router, replicated_config, "r2")] = ReplicaHealth(lag=11)
+    assert router.choose(replicated_config) is replicated_config
+    # 不允许回退到主库时直接报错
+    router.primary_fallback = False
+    with pytest.raises(ReplicaUnavailableError, match="没有可用的只读副本"):
+        router.choose(replicated_config)
+
+
+def test_health_check_tracks_lag_and_errors(replicated_config):
+    router = _router()
+    lags = {"r1": 42.0, "r2": 1.0}
+
+    async def lag(replica):
+        if replica.host == "r3":
+            raise OSError("连接超时")
+        return lags[replica.host]
+
+    router._replication_lag = lag
+    asyncio.run(router.check(replicated_config))
+    r1, r2, r3 = (router._health[_key(router, replicated_config, host)] for host in ("r1", "r2", "r3"))
+    assert r1.healthy and r1.lag == 42.0 and not router._available(_key(router, replicated_config, "r1"))
+    assert r2.healthy and router._available(_key(router, replicated_config, "r2"))
+    assert not r3.healthy and r3.error == "连接超时"
+
+    # 延迟恢复后重新接收查询
+    lags["r1"] = 3.0
+    asyncio.run(router.check(replicated_config))
+    assert router._available(_key(router, replicated_config, "r1"))
+
+
+def test_acquire_fails_over_to_other_replica_then_primary(replicated_config):
+    pools = StubPools()
+    router = _router(pools)
+
+    async def acquire_host():
+        async with router.acquire(replicated_config) as conn:
+            return conn
+
+    async def run():
+        pools.down = {"r1"}
+        first = [await acquire_host() for _ in range(5)]
+        pools.down = {"r1", "r2"}
+        # r2 在本次借出时失败，之后回退到主库
+        second = await acquire_host()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert set(first) == {"r2"}
+    assert second == replicated_config.host
+    assert not router._health[_key(router, replicated_config, "r1")].healthy
+    assert not router._health[_key(router, replicated_config, "r2")].healthy
+    stats = router.stats()["databases"]
+    [replicas] = stats.values()
+    assert replicas["r2:3306"]["reads"] == 5 and replicas["r1:3306"]["available"] is False
+
+
+def test_acquire_without_primary_fallback_raises(replicated_config):
+    pools = StubPools()
+    pools.down = {"r1", "r2"}
+    router = _router(pools, primary_fallback=False)
+
+    async def run():
+        async with router.acquire(replicated_config):
+            pass
+
+    with pytest.raises(ReplicaUnavailableError):
+        asyncio.run(run())
+    assert pools.acquired == []
+
+
+def test_disabled_router_uses_primary(replicated_config):
+    pools = StubPools()
+    router = ReplicaRouter(pools=pools, enabled=False)
+
+    async def run():
+        async with router.acquire(replicated_config) as conn:
+            return conn
+
+    assert asyncio.run(run()) == replicated_config.host
+    assert router.stats()["databases"] == {}
+
+
+def test_replica_unavailable_is_not_queue_full():
+    assert not issubclass(ReplicaUnavailableError, QueryQueueFullError)
+
+
+def test_data_agent_does_not_retry_without_replicas(fixture_db, replicated_config, scripted_model, monkeypatch):
+    pools = StubPools()
+    pools.down = {"r1", "r2"}
+    monkeypatch.setattr(sql_executor_module, "replica_router", _router(pools, primary_fallback=False))
+    monkeypatch.setattr(schema_cache_module, "replica_router", ReplicaRouter(enabled=False))
+
+    with pytest.raises(ReplicaUnavailableError):
+        asyncio.run(run_query("各城市用户数", replicated_config, cache_mode="bypass"))
+    # 执行SQL失败后没有让模型重试
+    assert len(scripted_model) == 1
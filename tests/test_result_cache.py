@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.result_cache import ResultCache, normalize_sql
+
+
+def test_normalize_sql_ignores_whitespace_comments_and_semicolons():
+    expected = normalize_sql("SELECT id FROM t_order WHERE amount > 10")
+    assert normalize_sql("  SELECT  id\nFROM t_order -- 注释\nWHERE amount > 10 ;; ") == expected
+    assert normalize_sql("SELECT /* 注释 */ id FROM t_order WHERE amount>10;") == expected
+
+
+def test_normalize_sql_keeps_literals_and_quoted_identifiers():
+    assert normalize_sql("SELECT * FROM t WHERE name = 'a  b'") != normalize_sql("SELECT * FROM t WHERE name = 'a b'")
+    assert normalize_sql("SELECT `a  b` FROM t") == "SELECT `a  b` FROM t"
+
+
+def test_normalize_sql_ignores_keyword_case():
+    assert normalize_sql("select * from t_order where amount between 1 and 10") == \
+        "SELECT * FROM t_order WHERE amount BETWEEN 1 AND 10"
+    # 表名、字符串和带引号的标识符保留原有大小写
+    assert normalize_sql("select `Select`, 'from' from T_Order") == "SELECT `Select` , 'from' FROM T_Order"
+    assert normalize_sql("SELECT * FROM t WHERE name = 'a'") != normalize_sql("SELECT * FROM t WHERE name = 'A'")
+    assert normalize_sql("select day from year") == "SELECT day FROM year"
+
+
+def test_normalize_sql_falls_back_to_strip_on_lex_error():
+    assert normalize_sql("  SELECT 'unterminated  ") == "SELECT 'unterminated"
+
+
+def test_cache_key_includes_database(conn_config):
+    cache = ResultCache(store=None)
+    other = DatabaseConnectionConfig(host="other", port=3306, username="test", password="test", dbName="test")
+
+    async def run():
+        await cache.set(conn_config, "SELECT 1", {"rows": [1]})
+        return await cache.get(conn_config, "SELECT  1 ;"), await cache.get(other, "SELECT 1")
+
+    same, other_db = asyncio.run(run())
+    assert same == {"rows": [1]}
+    assert other_db is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(conn_config, monkeypatch):
+    cache = ResultCache(ttl=10, store=None)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+
+    async def run():
+        await cache.set(conn_config, "SELECT 1", [1])
+        hit = await cache.get(conn_config, "SELECT 1")
+        monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+        return hit, await cache.get(conn_config, "SELECT 1")
+
+    assert asyncio.run(run()) == ([1], None)
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_eviction_by_bytes(conn_config):
+    cache = ResultCache(max_bytes=400, store=None)
+
+    async def run():
+        for i in range(4):
+            await cache.set(conn_config, f"SELECT {i}", i, size=100)
+        # 访问最早的条目后，它不再是最久未使用的
+        await cache.get(conn_config, "SELECT 0")
+        await cache.set(conn_config, "SELECT 4", 4, size=100)
+        return [await cache.get(conn_config, f"SELECT {i}") for i in range(5)]
+
+    assert asyncio.run(run()) == [0, None, 2, 3, 4]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 400
+
+
+def test_oversized_and_zero_ttl_results_are_not_cached(conn_config):
+    cache = ResultCache(max_bytes=400, store=None)
+
+    async def run():
+        await cache.set(conn_config, "SELECT 1", 1, size=101)
+        await cache.set(conn_config, "SELECT 2", 2, ttl=0)
+        return await cache.get(conn_config, "SELECT 1"), await cache.get(conn_config, "SELECT 2")
+
+    assert asyncio.run(run()) == (None, None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_only_clears_one_database(conn_config):
+    cache = ResultCache(store=None)
+    other = DatabaseConnectionConfig(host="other", port=3306, username="test", password="test", dbName="test")
+
+    async def run():
+        await cache.set(conn_config, "SELECT 1", 1)
+        await cache.set(other, "SELECT 1", 2)
+        await cache.invalidate(conn_config)
+        return await cache.get(conn_config, "SELECT 1"), await cache.get(other, "SELECT 1")
+
+    assert asyncio.run(run()) == (None, 2)
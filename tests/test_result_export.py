@@ -0,0 +1,150 @@
+import asyncio
+import datetime
+import io
+import json
+from decimal import Decimal
+
+import pytest
+from pymysql.constants import FIELD_TYPE
+
+from utils.result_export import CsvWriter, NdjsonWriter, create_writer, export_rows
+from utils.sql_executor import ColumnType
+
+pa = pytest.importorskip("pyarrow")
+
+from utils.result_export import ArrowWriter, arrow_type  # noqa: E402
+
+
+def _read_arrow(chunks: list[bytes]):
+    return pa.ipc.open_stream(b"".join(chunks)).read_all()
+
+
+def _write(writer, columns: list[ColumnType], *batches: list[tuple]) -> list[bytes]:
+    return [writer.begin(columns), *[writer.write(rows) for rows in batches], writer.finish()]
+
+
+@pytest.mark.parametrize("column, expected", [
+    (ColumnType("a", FIELD_TYPE.TINY), pa.int8()),
+    (ColumnType("a", FIELD_TYPE.TINY, unsigned=True), pa.uint8()),
+    (ColumnType("a", FIELD_TYPE.INT24), pa.int32()),
+    (ColumnType("a", FIELD_TYPE.LONGLONG, unsigned=True), pa.uint64()),
+    (ColumnType("a", FIELD_TYPE.YEAR), pa.int16()),
+    (ColumnType("a", FIELD_TYPE.FLOAT), pa.float32()),
+    (ColumnType("a", FIELD_TYPE.DOUBLE), pa.float64()),
+    # decimal(12,2)：字段长度 14 = 12 位数字 + 小数点 + 符号位
+    (ColumnType("a", FIELD_TYPE.NEWDECIMAL, length=14, scale=2), pa.decimal128(12, 2)),
+    (ColumnType("a", FIELD_TYPE.NEWDECIMAL, unsigned=True, length=11, scale=0), pa.decimal128(11, 0)),
+    (ColumnType("a", FIELD_TYPE.NEWDECIMAL, length=67, scale=30), pa.decimal256(65, 30)),
+    (ColumnType("a", FIELD_TYPE.DATE), pa.date32()),
+    (ColumnType("a", FIELD_TYPE.DATETIME), pa.timestamp("us")),
+    (ColumnType("a", FIELD_TYPE.TIMESTAMP), pa.timestamp("us")),
+    (ColumnType("a", FIELD_TYPE.TIME), pa.duration("us")),
+    (ColumnType("a", FIELD_TYPE.BIT), pa.binary()),
+    (ColumnType("a", FIELD_TYPE.BLOB, binary=True), pa.binary()),
+    (ColumnType("a", FIELD_TYPE.BLOB), pa.string()),
+    (ColumnType("a", FIELD_TYPE.VAR_STRING), pa.string()),
+    (ColumnType("a", FIELD_TYPE.JSON), pa.string()),
+    (ColumnType("a", None), None),
+])
+def test_arrow_type(column, expected):
+    assert arrow_type(column) == expected
+
+
+def test_arrow_writer_keeps_mysql_types():
+    columns = [
+        ColumnType("id", FIELD_TYPE.LONGLONG, unsigned=True),
+        ColumnType("amount", FIELD_TYPE.NEWDECIMAL, length=14, scale=2),
+        ColumnType("day", FIELD_TYPE.DATE),
+        ColumnType("raw", FIELD_TYPE.BLOB, binary=True),
+    ]
+    writer = ArrowWriter()
+    table = _read_arrow(_write(
+        writer, columns,
+        [(1, Decimal("12.50"), datetime.date(2024, 5, 1), b"\x00\xff")],
+        [(2, None, datetime.date(2024, 5, 2), None)],
+    ))
+    assert table.schema.types == [pa.uint64(), pa.decimal128(12, 2), pa.date32(), pa.binary()]
+    assert table.to_pylist() == [
+        {"id": 1, "amount": Decimal("12.50"), "day": datetime.date(2024, 5, 1), "raw": b"\x00\xff"},
+        {"id": 2, "amount": None, "day": datetime.date(2024, 5, 2), "raw": None},
+    ]
+    assert writer.invalid == 0
+
+
+def test_arrow_writer_nulls_values_that_do_not_fit():
+    # 0000-00-00 这类日期在驱动中返回为字符串
+    writer = ArrowWriter()
+    table = _read_arrow(_write(writer, [ColumnType("day", FIELD_TYPE.DATE)], [(datetime.date(2024, 5, 1),), ("0000-00-00",)]))
+    assert table.column("day").to_pylist() == [datetime.date(2024, 5, 1), None]
+    assert writer.invalid == 1
+
+
+def test_arrow_writer_infers_unknown_types_from_first_batch():
+    columns = [ColumnType("n", None), ColumnType("empty", None)]
+    table = _read_arrow(_write(ArrowWriter(), columns, [(1, None), (2, None)], [(3, None)]))
+    assert table.schema.types == [pa.int64(), pa.string()]
+    assert table.column("n").to_pylist() == [1, 2, 3]
+
+
+def test_arrow_writer_without_rows_still_writes_schema():
+    columns = [ColumnType("id", FIELD_TYPE.LONG), ColumnType("name", None)]
+    table = _read_arrow(_write(ArrowWriter(), columns))
+    assert table.num_rows == 0 and table.schema.types == [pa.int32(), pa.string()]
+
+
+def test_parquet_writer():
+    pq = pytest.importorskip("pyarrow.parquet")
+    writer = create_writer("parquet")
+    assert writer.extension == "parquet"
+    chunks = _write(writer, [ColumnType("id", FIELD_TYPE.LONG)], [(1,), (2,)], [(3,)])
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(chunks)))
+    # 每批行为一个行组
+    assert parquet.metadata.num_row_groups == 2
+    assert parquet.read().column("id").to_pylist() == [1, 2, 3]
+
+
+def test_csv_writer_hexes_binary_values():
+    columns = [ColumnType("name", FIELD_TYPE.VAR_STRING), ColumnType("raw", FIELD_TYPE.BLOB, binary=True)]
+    data = b"".join(_write(CsvWriter(), columns, [("北京, 朝阳", b"\x00\xff")]))
+    assert data.startswith("\ufeff".encode())
+    assert data.decode("utf-8-sig").splitlines() == ["name,raw", '"北京, 朝阳",00ff']
+
+
+def test_ndjson_writer():
+    columns = [ColumnType("amount", FIELD_TYPE.NEWDECIMAL), ColumnType("raw", None)]
+    data = b"".join(_write(NdjsonWriter(), columns, [(Decimal("1.5"), b"\x01")], [(None, "城市")]))
+    assert [json.loads(line) for line in data.decode().splitlines()] == [
+        {"amount": "1.5", "raw": "01"}, {"amount": None, "raw": "城市"},
+    ]
+
+
+def test_export_rows_streams_in_batches(fixture_db, conn_config):
+    async def run():
+        return [chunk async for chunk in export_rows(
+            conn_config, "SELECT id, name FROM t_user ORDER BY id", CsvWriter(), cache_mode="bypass", batch_size=8,
+        )]
+
+    chunks = asyncio.run(run())
+    # 文件头、3 批行、文件尾
+    assert len(chunks) == 5
+    lines = b"".join(chunks).decode("utf-8-sig").splitlines()
+    assert lines[0] == "id,name" and lines[1] == "1,用户1" and len(lines) == 21
+
+
+def test_export_endpoint(app_client, connect_body):
+    async def run():
+        async with app_client.lifespan():
+            _, _, body = await app_client.request("PUT", "/api/connect", connect_body)
+            headers = {"X-Session-Id": json.loads(body)["session_id"]}
+            _, _, body = await app_client.request("POST", "/api/query", "SELECT id, name FROM t_user ORDER BY id", headers)
+            path = f"/api/results/{json.loads(body)['message']['result_id']}/export"
+            return (await app_client.request("GET", f"{path}?format=arrow", headers=headers),
+                    await app_client.request("GET", path))
+
+    (status, response_headers, body), (_, _, anonymous_body) = asyncio.run(run())
+    assert status == 200
+    assert response_headers["content-type"] == "application/vnd.apache.arrow.stream"
+    assert ".arrow" in response_headers["content-disposition"]
+    table = _read_arrow([body])
+    assert table.num_rows == 20 and table.column_names == ["id", "name"]
+    assert json.loads(anonymous_body) == {"success": False, "message": "请先设置数据库连接"}
@@ -0,0 +1,100 @@
+import asyncio
+
+from utils.schema_cache import SchemaCache
+
+
+def test_loads_tables_columns_and_foreign_keys(fixture_db, conn_config):
+    cache = SchemaCache(check_interval=60, store=None)
+    snapshot = asyncio.run(cache.get_schema(conn_config))
+
+    assert set(snapshot.tables) == set(fixture_db.tables)
+    order = snapshot.tables["t_order"]
+    assert order["description"] == "订单表"
+    assert [column["name"] for column in order["columns"]][:3] == ["id", "order_no", "amount"]
+    assert any("foreign_keys" in table for table in snapshot.tables.values())
+
+
+def test_within_check_interval_skips_database(fixture_db, conn_config):
+    cache = SchemaCache(check_interval=60, store=None)
+
+    async def run():
+        first = await cache.get_schema(conn_config)
+        executed = fixture_db.executed
+        second = await cache.get_schema(conn_config)
+        return first, second, fixture_db.executed - executed
+
+    first, second, queries = asyncio.run(run())
+    assert second is first
+    assert queries == 0
+
+
+def test_unchanged_version_only_runs_version_query(fixture_db, conn_config):
+    cache = SchemaCache(check_interval=0, store=None)
+
+    async def run():
+        first = await cache.get_schema(conn_config)
+        executed = fixture_db.executed
+        second = await cache.get_schema(conn_config)
+        return first, second, fixture_db.executed - executed
+
+    first, second, queries = asyncio.run(run())
+    assert second is first
+    assert queries == 1
+
+
+def test_version_change_reloads_and_notifies(fixture_db, conn_config):
+    cache = SchemaCache(check_interval=0, store=None)
+    changed = []
+
+    async def listener(config):
+        changed.append(config.conn_key)
+
+    cache.add_invalidation_listener(listener)
+
+    async def run():
+        first = await cache.get_schema(conn_config)
+        fixture_db.tables["t_new"] = {"description": "新表", "columns": [{"name": "id", "type": "bigint", "comment": None}]}
+        second = await cache.get_schema(conn_config)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.version != second.version
+    assert "t_new" in second.tables and "t_new" not in first.tables
+    assert changed == [conn_config.conn_key]
+
+
+def test_invalidate_drops_snapshot_and_notifies(fixture_db, conn_config):
+    cache = SchemaCache(check_interval=60, store=None)
+    changed = []
+    cache.add_invalidation_listener(lambda config: changed.append(config.conn_key))
+
+    async def run():
+        first = await cache.get_schema(conn_config)
+        await cache.invalidate(conn_config)
+        # 没有缓存时再次失效不重复通知
+        await cache.invalidate(conn_config)
+        return first, await cache.get_schema(conn_config)
+
+    first, second = asyncio.run(run())
+    assert second is not first
+    assert changed == [conn_config.conn_key]
+
+
+def test_foreign_key_change_reloads(fixture_db, conn_config):
+    cache = SchemaCache(check_interval=0, store=None)
+    order = fixture_db.tables["t_order"]
+
+    async def run():
+        first = await cache.get_schema(conn_config)
+        # 只增加外键，表和列都不变
+        order["foreign_keys"] = [*order.get("foreign_keys", []),
+                                 {"column": "id", "ref_table": "t_user", "ref_column": "id"}]
+        second = await cache.get_schema(conn_config)
+        # 外键数量不变但引用的列改变
+        order["foreign_keys"][-1] = {"column": "order_no", "ref_table": "t_user", "ref_column": "id"}
+        third = await cache.get_schema(conn_config)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert len({first.version, second.version, third.version}) == 3
+    assert second.tables["t_order"]["foreign_keys"] != first.tables["t_order"].get("foreign_keys")
@@ -0,0 +1,70 @@
+from benchmarks.synthetic_schema import generate_schema
+from utils.schema_cache import SchemaSnapshot
+from utils.schema_index import SchemaIndex, get_schema_index, prune_schema, tokenize
+
+TABLES = {
+    "t_user": {
+        "description": "用户表",
+        "columns": [{"name": "id", "type": "bigint", "comment": "主键"},
+                    {"name": "city", "type": "varchar(32)", "comment": "所在城市"}],
+    },
+    "t_order": {
+        "description": "订单表",
+        "columns": [{"name": "id", "type": "bigint", "comment": "主键"},
+                    {"name": "user_id", "type": "bigint", "comment": "下单用户"},
+                    {"name": "amount", "type": "decimal(12,2)", "comment": "订单金额"}],
+        "foreign_keys": [{"column": "user_id", "ref_table": "t_user", "ref_column": "id"}],
+    },
+    "t_refund": {
+        "description": "退款表",
+        "columns": [{"name": "id", "type": "bigint", "comment": "主键"},
+                    {"name": "order_id", "type": "bigint", "comment": "退款订单"},
+                    {"name": "reason", "type": "varchar(255)", "comment": "退款原因"}],
+        "foreign_keys": [{"column": "order_id", "ref_table": "t_order", "ref_column": "id"}],
+    },
+    "t_campaign": {
+        "description": "营销活动表",
+        "columns": [{"name": "id", "type": "bigint", "comment": "主键"},
+                    {"name": "budget", "type": "decimal(12,2)", "comment": "活动预算"}],
+    },
+}
+
+
+def test_tokenize_splits_identifiers_and_chinese():
+    tokens = tokenize("orderAmount 订单金额")
+    assert {"w:order", "w:amount", "t:#or", "b:订单", "b:金额", "c:订"} <= set(tokens)
+    assert tokenize(None) == {}
+
+
+def test_search_ranks_matching_table_first():
+    index = SchemaIndex(TABLES)
+    assert index.search("各城市的订单金额", 2)[0][0] == "t_order"
+    assert [name for name, _ in index.search("活动预算", 3)] == ["t_campaign"]
+    assert index.search("xyz", 3) == []
+
+
+def test_related_tables_follow_foreign_keys():
+    index = SchemaIndex(TABLES)
+    # 被引用的表总是带上，引用方只在候选集合中时带上
+    assert index.related_tables(["t_order"]) == ["t_user"]
+    assert index.related_tables(["t_order"], {"t_order", "t_refund"}) == ["t_refund", "t_user"]
+
+
+def test_prune_schema_keeps_top_k_and_referenced_tables():
+    snapshot = SchemaSnapshot(version="v1", tables=TABLES)
+    pruned = prune_schema(snapshot, "退款原因", top_k=1)
+    assert list(pruned) == ["t_refund", "t_order"]
+    assert pruned["t_refund"] is TABLES["t_refund"]
+
+
+def test_prune_schema_returns_all_tables_when_nothing_matches():
+    snapshot = SchemaSnapshot(version="v1", tables=TABLES)
+    assert prune_schema(snapshot, "hello", top_k=1) == TABLES
+
+
+def test_index_is_built_once_per_snapshot():
+    snapshot = SchemaSnapshot(version="v1", tables=generate_schema(200))
+    index = get_schema_index(snapshot)
+    assert get_schema_index(snapshot) is index
+    pruned = prune_schema(snapshot, "门店所在省份", top_k=5)
+    assert "t_store" in pruned and len(pruned) < 200
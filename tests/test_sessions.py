@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import json
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.query_registry import QueryRegistry
+from utils.session_registry import SessionRegistry
+
+
+def test_sessions_are_independent(fixture_db, conn_config):
+    registry = SessionRegistry(store=None)
+
+    async def run():
+        a = await registry.connect(conn_config)
+        b = await registry.connect(conn_config)
+        return a, b, await registry.get(a.session_id), await registry.get("missing")
+
+    a, b, got, missing = asyncio.run(run())
+    assert a.session_id != b.session_id
+    assert got is a and missing is None
+    assert registry.stats() == {"sessions": 2, "databases": 1, "active": 0}
+
+
+def test_reconnect_switches_database_and_keeps_id(fixture_db, conn_config):
+    registry = SessionRegistry(store=None)
+    other = conn_config.model_copy(update={"database_name": "other"})
+
+    async def run():
+        session = await registry.connect(conn_config)
+        return session, await registry.connect(other, session.session_id)
+
+    session, switched = asyncio.run(run())
+    assert switched is session
+    assert session.conn_config.conn_key == other.conn_key
+
+
+def test_conn_key_does_not_expose_password_hash(conn_config):
+    other_password = DatabaseConnectionConfig(**{**conn_config.model_dump(by_alias=True), "password": "other"})
+    digest = conn_config.conn_key.split("#")[1]
+    assert conn_config.conn_key.split("#")[0] == other_password.conn_key.split("#")[0]
+    assert digest != other_password.conn_key.split("#")[1]
+    # 摘要使用密钥计算，不能由未加盐的密码哈希离线比对
+    assert digest != hashlib.sha256(b"test").hexdigest()[:12]
+
+
+def test_idle_sessions_expire_unless_held(fixture_db, conn_config):
+    registry = SessionRegistry(idle_timeout=0, store=None)
+
+    async def run():
+        idle = await registry.connect(conn_config)
+        held = await registry.connect(conn_config)
+        async with registry.hold(held):
+            visible = await registry.get(idle.session_id), await registry.get(held.session_id)
+            evicted = await registry.evict_idle()
+        return visible, evicted
+
+    (idle, held), evicted = asyncio.run(run())
+    assert idle is None and held is not None
+    assert evicted == 1
+    assert registry.stats()["sessions"] == 1
+
+
+def test_oldest_session_evicted_beyond_limit(fixture_db, conn_config):
+    registry = SessionRegistry(max_sessions=2, store=None)
+
+    async def run():
+        sessions = [await registry.connect(conn_config) for _ in range(3)]
+        return sessions, [await registry.get(session.session_id) for session in sessions]
+
+    sessions, found = asyncio.run(run())
+    assert found[0] is None and found[1:] == sessions[1:]
+
+
+def test_handle_belongs_to_registering_session(fixture_db, conn_config):
+    sessions = SessionRegistry(store=None)
+    handles = QueryRegistry(store=None)
+
+    async def run():
+        owner = await sessions.connect(conn_config)
+        stranger = await sessions.connect(conn_config)
+        async with sessions.hold(owner):
+            result_id = await handles.register(conn_config, "SELECT 1")
+        handle = await handles.get(result_id)
+        owned = handle.owned_by(owner), handle.owned_by(stranger)
+        # 会话切换到其他数据库后不再能获取之前的结果
+        await sessions.connect(conn_config.model_copy(update={"database_name": "other"}), owner.session_id)
+        return owned, handle.owned_by(owner), await handles.get("missing")
+
+    (by_owner, by_stranger), after_switch, missing = asyncio.run(run())
+    assert by_owner and not by_stranger
+    assert not after_switch
+    assert missing is None
+
+
+def test_result_rows_only_for_owning_session(app_client, connect_body):
+    async def run():
+        async with app_client.lifespan():
+            sessions = []
+            for _ in range(2):
+                _, _, body = await app_client.request("PUT", "/api/connect", connect_body)
+                sessions.append({"X-Session-Id": json.loads(body)["session_id"]})
+            _, _, body = await app_client.request("POST", "/api/query", "SELECT id, name FROM t_user ORDER BY id", sessions[0])
+            result_id = json.loads(body)["message"]["result_id"]
+            path = f"/api/results/{result_id}/rows"
+            return [await app_client.request("GET", path, headers=headers) for headers in (*sessions, None)]
+
+    (owner_status, _, owner_body), (_, _, other_body), (_, _, anonymous_body) = asyncio.run(run())
+    assert owner_status == 200
+    rows = [json.loads(line) for line in owner_body.decode().splitlines()]
+    assert len(rows) == 20 and rows[0] == {"id": 1, "name": "用户1"}
+    assert json.loads(other_body) == {"success": False, "message": "查询结果不存在或已过期"}
+    assert json.loads(anonymous_body) == {"success": False, "message": "请先设置数据库连接"}
@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import pickle
+import time
+from decimal import Decimal
+
+import pytest
+
+import utils.shared_store as shared_store_module
+from agent.conversation import ConversationRegistry
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.session_registry import SessionRegistry
+from utils.shared_store import SharedStore, SqliteStore, dumps, loads
+from utils.sql_executor import ColumnStats, QueryResult
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    pytest.importorskip("cryptography")
+    monkeypatch.setattr(shared_store_module, "SHARED_STORE_SECRET", "test-secret")
+    monkeypatch.setattr(shared_store_module, "_fernet", None)
+
+
+@pytest.fixture
+def stores(tmp_path, secret):
+    # 同一文件上的两个存储模拟两个工作进程
+    path = str(tmp_path / "store.sqlite3")
+    return SqliteStore(path), SqliteStore(path)
+
+
+def test_round_trips_tagged_scalars():
+    value = {
+        "amount": Decimal("12.50"), "at": datetime.datetime(2024, 5, 1, 8, 30), "day": datetime.date(2024, 5, 1),
+        "clock": datetime.time(8, 30), "span": datetime.timedelta(hours=1, microseconds=5), "raw": b"\x00\xff",
+        "tags": {"a"}, "pair": ("x", 1),
+    }
+    decoded = loads(dumps(value))
+    assert decoded == {**value, "pair": ["x", 1]}
+
+
+def test_rejects_unknown_tags_and_pickle():
+    with pytest.raises(ValueError, match="未知的类型"):
+        loads(b'{"$type": "os.system", "value": "id"}')
+    with pytest.raises(ValueError):
+        loads(pickle.dumps({"a": 1}))
+    with pytest.raises(TypeError):
+        dumps(object())
+
+
+def test_shared_store_is_abstract():
+    with pytest.raises(TypeError):
+        SharedStore()
+
+
+def test_conn_config_passwords_are_encrypted(secret):
+    config = DatabaseConnectionConfig(host="h", port=3306, username="u", password="db-password", dbName="d",
+                                      replicas=[{"host": "r", "port": 3306, "password": "replica-password"}])
+    data = dumps(config)
+    assert b"db-password" not in data and b"replica-password" not in data
+    decoded = loads(data)
+    assert decoded == config
+    assert decoded.replicas[0].password.get_secret_value() == "replica-password"
+
+
+def test_wrong_secret_cannot_decrypt(secret, monkeypatch):
+    data = dumps(DatabaseConnectionConfig(host="h", port=3306, username="u", password="p", dbName="d"))
+    monkeypatch.setattr(shared_store_module, "SHARED_STORE_SECRET", "other-secret")
+    monkeypatch.setattr(shared_store_module, "_fernet", None)
+    with pytest.raises(ValueError, match="无法解密"):
+        loads(data)
+
+
+def test_missing_secret_is_rejected(monkeypatch):
+    monkeypatch.setattr(shared_store_module, "SHARED_STORE_SECRET", "")
+    monkeypatch.setattr(shared_store_module, "_fernet", None)
+    with pytest.raises(RuntimeError, match="SHARED_STORE_SECRET"):
+        shared_store_module.create_store("sqlite")
+
+
+def test_sqlite_store_ttl_prefix_delete_and_stats(stores, monkeypatch):
+    a, b = stores
+
+    async def run():
+        await a.set("result", "db1\x00SELECT 1", [1])
+        await a.set("result", "db1%\x00SELECT 1", [2])
+        await a.set("result", "db2\x00SELECT 1", [3], ttl=60)
+        await a.set("answer", "db1\x00q", "x", ttl=1)
+        shared = (await b.get("result", "db2\x00SELECT 1")).value
+        # 前缀中的 % 不作为通配符
+        await b.delete_prefix("result", "db1\x00")
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 2)
+        return shared, await a.get("result", "db1\x00SELECT 1"), await a.get("result", "db1%\x00SELECT 1"), \
+            await a.get("answer", "db1\x00q"), await a.stats()
+
+    shared, deleted, kept, expired, stats = asyncio.run(run())
+    assert shared == [3]
+    assert deleted is None and kept.value == [2] and kept.remaining() is None
+    assert expired is None
+    assert stats["result"] == 2 and "answer" not in stats
+
+
+def test_undecodable_entries_are_treated_as_missing(stores):
+    a, _ = stores
+    a._execute("INSERT INTO kv VALUES (?, ?, ?, ?)", ("session", "legacy", pickle.dumps({"a": 1}), None))
+    assert asyncio.run(a.get("session", "legacy")) is None
+
+
+def test_query_result_round_trip(secret):
+    stats = ColumnStats()
+    for value in range(300):
+        stats.add(Decimal(value))
+    result = QueryResult(["amount", "day"], [{"amount": Decimal("1.5"), "day": datetime.date(2024, 1, 1)}],
+                         truncated=True, nbytes=12, stats={"amount": stats})
+    decoded = loads(dumps(result))
+    assert decoded.rows == result.rows and decoded.truncated and decoded.nbytes == 12
+    assert decoded.stats["amount"].to_dict() == stats.to_dict()
+
+
+def test_sessions_and_conversations_shared_between_workers(stores, fixture_db, conn_config):
+    a, b = stores
+
+    async def run():
+        sessions_a, sessions_b = SessionRegistry(store=a), SessionRegistry(store=b)
+        session = await sessions_a.connect(conn_config)
+        seen = await sessions_b.get(session.session_id)
+        conversations_a, conversations_b = ConversationRegistry(store=a), ConversationRegistry(store=b)
+        conversation = await conversations_a.create(session.session_id, conn_config)
+        await conversations_a.record(conversation, "各城市用户数", [], "SELECT 1", "答案", "v1")
+        other = await conversations_b.get(conversation.conversation_id, session.session_id)
+        stranger = await conversations_b.get(conversation.conversation_id, "other-session")
+        closed = await sessions_b.close(session.session_id)
+        return seen, other, stranger, closed, await sessions_a.get(session.session_id)
+
+    seen, other, stranger, closed, after_close = asyncio.run(run())
+    assert seen.conn_config == conn_config
+    assert other.turn_count == 1 and stranger is None
+    assert closed and after_close is None
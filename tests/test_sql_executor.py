@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from utils.sql_executor import ColumnStats, DistinctSketch, QueryResult, execute_query
+
+
+def test_distinct_sketch_is_exact_below_k():
+    sketch = DistinctSketch(k=64)
+    for value in list(range(50)) * 3:
+        sketch.add(value)
+    assert sketch.estimate() == 50
+
+
+@pytest.mark.parametrize("distinct", [1_000, 20_000])
+def test_distinct_sketch_estimate_within_error(distinct):
+    sketch = DistinctSketch(k=256)
+    # 重复值不影响估算
+    for _ in range(2):
+        for value in range(distinct):
+            sketch.add(f"value-{value}")
+    assert abs(sketch.estimate() - distinct) / distinct < 0.2
+    assert len(sketch._hashes) == 256
+
+
+def test_column_stats_tracks_nulls_min_max():
+    stats = ColumnStats()
+    for value in [3, None, 1, 7, None, 3]:
+        stats.add(value)
+    assert stats.to_dict() == {"min": 1, "max": 7, "distinct": 3, "nulls": 2}
+
+
+def test_column_stats_ignores_incomparable_values():
+    stats = ColumnStats()
+    for value in [1, "a", 2]:
+        stats.add(value)
+    assert (stats.min, stats.max) == (1, 2)
+    assert stats.distinct.estimate() == 3
+
+
+def test_summary_includes_stats_only_beyond_preview():
+    rows = [{"n": i} for i in range(5)]
+    stats = {"n": ColumnStats()}
+    for row in rows:
+        stats["n"].add(row["n"])
+    result = QueryResult(columns=["n"], rows=rows, stats=stats)
+    assert "column_stats" not in result.summary(preview_rows=5)
+    summary = result.summary(preview_rows=2)
+    assert summary["rows"] == rows[:2]
+    assert summary["column_stats"]["n"]["distinct"] == 5
+
+
+def test_execute_query_streams_batches(fixture_db, conn_config):
+    batches = []
+
+    async def on_batch(rows):
+        batches.append(len(rows))
+
+    result = asyncio.run(execute_query(conn_config, "SELECT id, city FROM t_user ORDER BY id", cache_mode="bypass",
+                                       batch_size=8, on_batch=on_batch))
+    assert result.row_count == 20 and not result.truncated
+    assert batches == [8, 8, 4]
+    assert result.stats["id"].to_dict() == {"min": 1, "max": 20, "distinct": 20, "nulls": 0}
+
+
+def test_execute_query_truncates_at_row_cap(fixture_db, conn_config):
+    result = asyncio.run(execute_query(conn_config, "SELECT id FROM t_order", cache_mode="bypass",
+                                       max_rows=30, batch_size=25))
+    assert result.row_count == 30 and result.truncated
+
+
+def test_execute_query_truncates_at_byte_cap(fixture_db, conn_config):
+    result = asyncio.run(execute_query(conn_config, "SELECT id, pay_time FROM t_order", cache_mode="bypass",
+                                       max_bytes=200, batch_size=50))
+    assert result.truncated
+    assert 200 <= result.nbytes < 250
+    assert result.row_count < 50
+
+
+def test_execute_query_reads_result_cache(fixture_db, conn_config):
+    async def run():
+        first = await execute_query(conn_config, "SELECT COUNT(*) AS n FROM t_user")
+        executed = fixture_db.executed
+        second = await execute_query(conn_config, "SELECT COUNT(*) AS n FROM t_user;")
+        return first, second, fixture_db.executed - executed
+
+    first, second, queries = asyncio.run(run())
+    assert second is first
+    assert queries == 0
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import ModelMessage, ModelResponse, RetryPromptPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from agent.data_agent import data_agent
+from agent.query_pipeline import extract_raw_sql, run_query
+from utils.sql_guard import SqlLexError, is_raw_sql, tokenize, validate_sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT update_time, `delete` FROM t WHERE note = 'drop table t; update t set x = 1'",
+    "select replace(name, 'a', 'b'), insert(name, 1, 2, 'x'), truncate(amount, 2) from t",
+    "(SELECT 1) UNION (SELECT 2)",
+    "WITH t AS (SELECT 1 AS x) SELECT x FROM t",
+    "SELECT CONVERT(name USING utf8mb4) COLLATE utf8mb4_bin, CAST(x AS CHAR CHARACTER SET utf8mb4) FROM t",
+    "SELECT 1; -- 末尾注释",
+    "SHOW CREATE TABLE t",
+    "EXPLAIN FORMAT=JSON SELECT * FROM t",
+    "SELECT \"a;b\", 'it''s', `x``y` FROM t /* ; drop */",
+])
+def test_allows_readonly_statements(sql):
+    verdict = validate_sql(sql)
+    assert verdict.allowed, verdict.reason
+
+
+@pytest.mark.parametrize("sql, reason", [
+    ("UPDATE t SET x = 1", "不允许 UPDATE"),
+    ("SELECT 1; DROP TABLE t", "只允许执行单条SQL"),
+    ("WITH t AS (SELECT 1) DELETE FROM t", "不允许使用 DELETE"),
+    ("SELECT * FROM t INTO OUTFILE '/tmp/x'", "不允许使用 INTO"),
+    ("SELECT * FROM t FOR UPDATE", "不允许使用 UPDATE"),
+    ("SELECT * FROM t FOR SHARE", "不允许加锁"),
+    ("SELECT SLEEP(10)", "不允许调用 SLEEP()"),
+    ("SELECT @a := 1", "不允许在查询中给变量赋值"),
+    ("SELECT 1 FROM t SET x = 1", "不允许使用 SET"),
+    ("EXPLAIN ANALYZE SELECT * FROM t", "不允许使用 EXPLAIN ANALYZE"),
+    ("explain analyze format=tree select * from t", "不允许使用 EXPLAIN ANALYZE"),
+    ("DESCRIBE ANALYZE SELECT * FROM t", "不允许使用 DESCRIBE ANALYZE"),
+    ("", "SQL为空"),
+    ("SELECT 'unterminated", None),
+])
+def test_rejects_writes_and_unsafe_reads(sql, reason):
+    verdict = validate_sql(sql)
+    assert not verdict.allowed
+    if reason:
+        assert reason in verdict.reason
+
+
+def test_statement_type():
+    assert validate_sql("  with t as (select 1) select * from t ").statement_type == "WITH"
+    assert validate_sql("describe t").statement_type == "DESCRIBE"
+
+
+def test_tokenize_skips_comments_and_keeps_quoted_text():
+    assert tokenize("SELECT /* c */ 'a b' -- x\n FROM `t t`") == [
+        ("word", "SELECT"), ("string", "'a b'"), ("word", "FROM"), ("quoted", "`t t`"),
+    ]
+    with pytest.raises(SqlLexError):
+        tokenize("SELECT /* unterminated")
+
+
+@pytest.mark.parametrize("text", [
+    "select 1",
+    "SELECT id, name FROM users u WHERE status = 'a' ORDER BY id DESC LIMIT 10",
+    "select count(*) from orders o join users u on o.uid = u.id group by u.city with rollup",
+    "select date_sub(now(), interval 7 day)",
+    "select `用户名` from t where name = '张三'",
+    "show full columns from users",
+    "desc users",
+    "describe db.users name",
+    "explain select * from t",
+])
+def test_is_raw_sql_accepts_sql(text):
+    assert is_raw_sql(text)
+
+
+@pytest.mark.parametrize("text", [
+    "show me the top customers",
+    "select the best customers",
+    "explain why sales dropped",
+    "describe the sales trend",
+    "explain sales by region please",
+    "select 一下 销售额",
+    "show tables，谢谢",
+    "delete from users",
+])
+def test_is_raw_sql_rejects_questions(text):
+    assert not is_raw_sql(text)
+
+
+def test_extract_raw_sql_unwraps_code_fence():
+    assert extract_raw_sql("```sql\nSELECT 1\n```") == "SELECT 1"
+    assert extract_raw_sql("  SELECT 1  ") == "SELECT 1"
+    assert extract_raw_sql("各城市的用户数量") is None
+
+
+def test_raw_sql_bypasses_data_agent(fixture_db, conn_config, scripted_model):
+    result = asyncio.run(run_query("SELECT name, city FROM t_user WHERE id = 1", conn_config))
+    assert scripted_model == []
+    assert "用户1" in result["data"]
+    assert result["data"].endswith("执行的SQL：\n\nSELECT name, city FROM t_user WHERE id = 1")
+    assert result["result_id"]
+
+
+def test_rejected_sql_is_returned_to_the_model(fixture_db, conn_config):
+    prompts = []
+
+    def step(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        last = messages[-1].parts[-1]
+        if isinstance(last, RetryPromptPart):
+            prompts.append(last.model_response())
+            return ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": "SELECT id FROM t_user WHERE id = 1"})])
+        if isinstance(last, ToolReturnPart):
+            output = {"markdown_describe": "查询结果如下：", "show_table": True, "chart": False, "chart_type": ""}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+        return ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": "DELETE FROM t_user"})])
+
+    with data_agent.override(model=FunctionModel(step)):
+        result = asyncio.run(run_query("删除所有用户", conn_config, cache_mode="bypass"))
+    assert len(prompts) == 1 and "不允许 DELETE" in prompts[0]
+    # 被拒绝的SQL不会作为本次查询的SQL返回
+    assert "DELETE" not in result["data"]
+    assert result["data"].endswith("SELECT id FROM t_user WHERE id = 1")
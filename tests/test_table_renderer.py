@@ -0,0 +1,119 @@
+import asyncio
+import datetime
+from decimal import Decimal
+
+import pytest
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from agent.data_agent import data_agent
+from agent.query_pipeline import run_query
+from utils.sql_executor import QueryResult, execute_query
+from utils.table_renderer import (
+    TABLE_PLACEHOLDER,
+    format_value,
+    insert_table,
+    render_html_table,
+    render_markdown_table,
+    render_result_table,
+    resolve_id_labels,
+)
+
+ORDERS_BY_USER = "SELECT user_id, COUNT(*) AS orders FROM t_order WHERE user_id <= 3 GROUP BY user_id ORDER BY user_id"
+
+
+@pytest.fixture
+def order_user_fk(fixture_db):
+    """在替身库的表结构中登记 t_order.user_id -> t_user.id 外键"""
+    order = fixture_db.tables["t_order"]
+    order["columns"].append({"name": "user_id", "type": "bigint", "comment": "用户ID"})
+    order["foreign_keys"] = [{"column": "user_id", "ref_table": "t_user", "ref_column": "id"}]
+    return fixture_db
+
+
+@pytest.mark.parametrize("column, value, expected", [
+    ("amount", 1234567, "1,234,567"),
+    ("user_id", 1234567, "1234567"),
+    ("order_no", 20240501, "20240501"),
+    ("year", 2024, "2024"),
+    ("amount", Decimal("1234.50"), "1,234.50"),
+    ("ratio", 1234.5678, "1,234.57"),
+    ("ratio", 0.012345, "0.01235"),
+    ("paid", True, "是"),
+    ("day", datetime.datetime(2024, 5, 1), "2024-05-01"),
+    ("pay_time", datetime.datetime(2024, 5, 1, 8, 30), "2024-05-01 08:30:00"),
+    ("day", datetime.date(2024, 5, 1), "2024-05-01"),
+    ("raw", b"\x00\x01", "<二进制 2 字节>"),
+    ("note", None, ""),
+])
+def test_format_value(column, value, expected):
+    assert format_value(column, value) == expected
+
+
+def test_markdown_escapes_pipes_and_newlines():
+    result = QueryResult(["name|alias", "note"], [{"name|alias": "a|b", "note": "第一行\n第二行"}])
+    assert render_markdown_table(result) == "| name\\|alias | note |\n|---|---|\n| a\\|b | 第一行 第二行 |"
+
+
+def test_html_escapes_markup():
+    result = QueryResult(["<b>"], [{"<b>": "<script>alert('x')</script> & co"}])
+    table = render_html_table(result)
+    assert "<script>" not in table
+    assert "<th>&lt;b&gt;</th>" in table
+    assert "<td>&lt;script&gt;alert(&#x27;x&#x27;)&lt;/script&gt; &amp; co</td>" in table
+
+
+def test_footnote_for_truncated_results():
+    result = QueryResult(["id"], [{"id": i} for i in range(5)], truncated=True)
+    markdown = render_markdown_table(result, max_rows=2)
+    assert markdown.count("\n| ") == 2
+    assert markdown.endswith("*仅展示前 2 行，共 5+ 行*")
+    assert render_html_table(result, max_rows=2).endswith("<p><em>仅展示前 2 行，共 5+ 行</em></p>")
+
+
+def test_ids_are_replaced_by_names(order_user_fk, conn_config):
+    async def run():
+        result = await execute_query(conn_config, ORDERS_BY_USER, cache_mode="bypass")
+        return result, await resolve_id_labels(conn_config, ORDERS_BY_USER, result), \
+            await render_result_table(conn_config, ORDERS_BY_USER, result)
+
+    result, labels, table = asyncio.run(run())
+    assert labels == {"user_id": {1: "用户1", 2: "用户2", 3: "用户3"}}
+    assert [line.split(" | ")[0] for line in table.splitlines()[2:]] == ["| 用户1", "| 用户2", "| 用户3"]
+
+
+def test_ids_are_kept_without_a_matching_foreign_key(order_user_fk, conn_config):
+    with_name = "SELECT o.user_id, u.name FROM t_order o JOIN t_user u ON u.id = o.user_id WHERE o.id = 1"
+
+    async def run():
+        # 结果中已有名称列、或外键所在的表不在SQL中时都不替换
+        labels = []
+        for sql in (with_name, "SELECT id AS user_id FROM t_user WHERE id = 1"):
+            result = await execute_query(conn_config, sql, cache_mode="bypass")
+            labels.append(await resolve_id_labels(conn_config, sql, result))
+        return labels
+
+    assert asyncio.run(run()) == [{}, {}]
+
+
+def test_insert_table():
+    assert insert_table(f"结果如下：\n\n{TABLE_PLACEHOLDER}\n\n共 3 行", "<表格>") == "结果如下：\n\n<表格>\n\n共 3 行"
+    assert insert_table("结果如下：", "<表格>") == "结果如下：\n\n<表格>"
+    assert insert_table("", "<表格>") == "<表格>"
+
+
+def test_table_is_inserted_into_the_model_summary(order_user_fk, conn_config):
+    def step(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        last = messages[-1].parts[-1]
+        if isinstance(last, ToolReturnPart):
+            output = {"markdown_describe": f"各用户的订单数：\n\n{TABLE_PLACEHOLDER}\n\n用户1订单最多。",
+                      "show_table": False, "chart": False, "chart_type": ""}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+        return ModelResponse(parts=[ToolCallPart("execute_sql", {"sql": ORDERS_BY_USER})])
+
+    with data_agent.override(model=FunctionModel(step)):
+        answer = asyncio.run(run_query("前三个用户的订单数", conn_config, cache_mode="bypass"))["data"]
+    before, table_and_after = answer.split("\n\n", 1)
+    assert before == "各用户的订单数："
+    assert table_and_after.startswith("| user_id | orders |\n|---|---|\n| 用户1 | ")
+    assert "\n\n用户1订单最多。" in table_and_after and TABLE_PLACEHOLDER not in answer
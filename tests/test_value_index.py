@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from utils.value_index import ColumnValues, ValueIndex, ValueIndexer, is_indexable
+
+
+@pytest.fixture
+def index() -> ValueIndex:
+    return ValueIndex({
+        ("t_store", "city"): ColumnValues("t_store", "city", "varchar(32)", ["北京市", "北京", "上海市", "Shanghai"], 0),
+        ("t_user", "city"): ColumnValues("t_user", "city", "varchar(32)", ["北京"], 0),
+        ("t_shop", "name"): ColumnValues("t_shop", "name", "varchar(64)", ["北京烤鸭店", "京味小馆"], 0),
+    }, "v1")
+
+
+def test_exact_matches_come_first(index):
+    assert index.lookup("北京") == [
+        {"table": "t_store", "column": "city", "value": "北京", "match": "exact"},
+        {"table": "t_user", "column": "city", "value": "北京", "match": "exact"},
+        {"table": "t_store", "column": "city", "value": "北京市", "match": "partial"},
+        {"table": "t_shop", "column": "name", "value": "北京烤鸭店", "match": "partial"},
+    ]
+
+
+def test_match_ignores_case_and_surrounding_spaces(index):
+    assert index.lookup("  SHANGHAI ") == [{"table": "t_store", "column": "city", "value": "Shanghai", "match": "exact"}]
+
+
+def test_partial_matches_require_containment(index):
+    # 二元组都出现但不连续的取值不算匹配
+    assert index.lookup("烤鸭") == [{"table": "t_shop", "column": "name", "value": "北京烤鸭店", "match": "partial"}]
+    assert index.lookup("京烤店") == []
+
+
+def test_single_character_only_matches_exactly(index):
+    assert index.lookup("京") == []
+    assert index.lookup("") == []
+
+
+def test_limit(index):
+    assert len(index.lookup("北京", limit=1)) == 1
+    assert [match["match"] for match in index.lookup("北京", limit=3)] == ["exact", "exact", "partial"]
+
+
+def test_stats(index):
+    stats = index.stats()
+    assert stats["columns"] == 3 and stats["values"] == 7 and stats["version"] == "v1"
+    assert stats["bytes"] == index.nbytes > 0
+
+
+@pytest.mark.parametrize("column, expected", [
+    ({"name": "city", "type": "varchar(32)"}, True),
+    ({"name": "status", "type": "enum('paid','refunded')"}, True),
+    ({"name": "remark", "type": "text"}, False),
+    ({"name": "title", "type": "varchar(1000)"}, False),
+    ({"name": "password", "type": "varchar(64)"}, False),
+    ({"name": "mobile", "type": "char(11)"}, False),
+    ({"name": "api_key", "type": "varchar(32)"}, False),
+    ({"name": "amount", "type": "decimal(12,2)"}, False),
+])
+def test_is_indexable(column, expected):
+    assert is_indexable(column) is expected
+
+
+def test_indexer_samples_low_cardinality_columns(fixture_db, conn_config):
+    indexer = ValueIndexer(enabled=True, max_distinct=10)
+
+    async def run():
+        indexer.schedule(conn_config)
+        await indexer._tasks[conn_config.conn_key]
+        return indexer.get(conn_config)
+
+    index = asyncio.run(run())
+    # t_user.city 只有 8 个城市，t_user.name 有 20 个取值，超过上限不建索引
+    assert ("t_user", "city") in index.columns and ("t_user", "name") not in index.columns
+    assert index.lookup("杭州") == [{"table": "t_user", "column": "city", "value": "杭州", "match": "exact"}]
+    indexer.drop(conn_config)
+    assert indexer.get(conn_config) is None
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL
+from utils.shared_store import SharedStore, shared_store
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = '?？。.!！;；'
+
+# 共享存储中答案的命名空间
+_STORE_NAMESPACE = "answer"
+
+
+def normalize_question(question: str) -> str:
+    """
+    规范化用户问题作为缓存键：合并空白、统一小写、去除末尾标点
+    :param question: 用户问题
+    :return: 规范化后的问题
+    """
+    return _WHITESPACE_PATTERN.sub(' ', question).strip().rstrip(_TRAILING_PUNCTUATION).strip().lower()
+
+
+def result_fingerprint(result: Any) -> str:
+    """
+    计算查询结果的指纹，用于判断缓存的答案对应的数据是否发生变化
+    :param result: 查询结果
+    :return: 指纹
+    """
+    return hashlib.sha256(json.dumps(result, ensure_ascii=False, default=str, sort_keys=True).encode()).hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    """缓存的答案"""
+    sql_text: str  # 生成答案时最后执行的SQL
+    fingerprint: str  # 最后执行的SQL的查询结果指纹
+    response: dict[str, Any]  # 返回给客户端的结果
+    expires_at: float
+    details: dict[str, Any] | None = None  # 数据智能体的结构化输出，数据变化时据此用新的查询结果重新渲染答案
+
+
+class AnswerCache:
+    """
+    问答缓存
+    以（数据库标识, 表结构版本, 规范化问题）为键，缓存生成的SQL和最终答案，命中时不再调用模型
+    配置了共享存储时本地未命中再读共享存储，各进程共用已生成的答案
+    """
+
+    def __init__(
+            self,
+            max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+            ttl: int = ANSWER_CACHE_TTL,
+            store: SharedStore | None = shared_store,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries: OrderedDict[tuple[str, str, str], CachedAnswer] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+
+    async def get(self, conn_config: DatabaseConnectionConfig, schema_version: str, question: str) -> CachedAnswer | None:
+        """
+        读取缓存的答案
+        :param conn_config: 数据库连接配置
+        :param schema_version: 表结构版本
+        :param question: 用户问题
+        :return: 缓存的答案，未命中或已过期时返回 None
+        """
+        key = (conn_config.conn_key, schema_version, normalize_question(question))
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            entry = await self._get_shared(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    async def set(
+            self,
+            conn_config: DatabaseConnectionConfig,
+            schema_version: str,
+            question: str,
+            sql_text: str,
+            result: Any,
+            response: dict[str, Any],
+            details: dict[str, Any] | None = None,
+    ) -> None:
+        """
+        缓存答案
+        :param conn_config: 数据库连接配置
+        :param schema_version: 表结构版本
+        :param question: 用户问题
+        :param sql_text: 生成答案时最后执行的SQL
+        :param result: 最后执行的SQL的查询结果
+        :param response: 返回给客户端的结果
+        :param details: 数据智能体的结构化输出
+        """
+        if self.ttl <= 0:
+            return
+
+        key = (conn_config.conn_key, schema_version, normalize_question(question))
+        fingerprint = result_fingerprint(result)
+        self._put(key, sql_text, fingerprint, response, details, self.ttl)
+        if self.store is not None:
+            await self.store.set(_STORE_NAMESPACE, _store_key(key), (sql_text, fingerprint, response, details), ttl=self.ttl)
+
+    async def discard(self, conn_config: DatabaseConnectionConfig, schema_version: str, question: str) -> None:
+        """
+        删除某个问题的缓存答案
+        :param conn_config: 数据库连接配置
+        :param schema_version: 表结构版本
+        :param question: 用户问题
+        """
+        key = (conn_config.conn_key, schema_version, normalize_question(question))
+        self._entries.pop(key, None)
+        if self.store is not None:
+            await self.store.delete(_STORE_NAMESPACE, _store_key(key))
+
+    async def invalidate(self, conn_config: DatabaseConnectionConfig | None = None) -> None:
+        """
+        清除缓存，表结构变化时调用
+        :param conn_config: 只清除该数据库的缓存，为 None 时清除全部
+        """
+        if self.store is not None:
+            await self.store.delete_prefix(_STORE_NAMESPACE, f"{conn_config.conn_key}\x00" if conn_config else "")
+        if conn_config is None:
+            self._entries.clear()
+            return
+
+        for key in [key for key in self._entries if key[0] == conn_config.conn_key]:
+            del self._entries[key]
+
+    def stats(self) -> dict[str, int]:
+        """缓存统计信息"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "shared_hits": self.shared_hits,
+        }
+
+    async def _get_shared(self, key: tuple[str, str, str]) -> CachedAnswer | None:
+        stored = await self.store.get(_STORE_NAMESPACE, _store_key(key)) if self.store is not None else None
+        if stored is None:
+            return None
+        sql_text, fingerprint, response, details = stored.value
+        remaining = stored.remaining()
+        self.shared_hits += 1
+        return self._put(key, sql_text, fingerprint, response, details, self.ttl if remaining is None else remaining)
+
+    def _put(
+            self,
+            key: tuple[str, str, str],
+            sql_text: str,
+            fingerprint: str,
+            response: dict[str, Any],
+            details: dict[str, Any] | None,
+            ttl: float,
+    ) -> CachedAnswer:
+        entry = CachedAnswer(sql_text=sql_text, fingerprint=fingerprint, response=response,
+                             expires_at=time.monotonic() + ttl, details=details)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+
+def _store_key(key: tuple[str, str, str]) -> str:
+    return "\x00".join(key)
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Literal
+
+from pyecharts.charts.chart import Base
+
+from utils.config import CHART_FORMAT, CHART_RENDER_WORKERS, CHART_RENDER_CACHE_MAX_ENTRIES
+from utils.tracing import span
+
+# html：完整的 HTML 片段；options：只返回 ECharts 配置项 JSON，由前端加载 ECharts 后渲染
+ChartFormat = Literal["html", "options"]
+
+# 当前请求需要的图表输出格式，图表函数由模型以工具方式调用，无法直接传参
+chart_format_var: ContextVar[ChartFormat] = ContextVar("chart_format", default=CHART_FORMAT)
+
+_executor: ThreadPoolExecutor | None = None
+
+
+class RenderCache:
+    """图表渲染缓存，以（图表类型, 数据, 参数, 输出格式）的内容哈希为键，按 LRU 淘汰"""
+
+    def __init__(self, max_entries: int = CHART_RENDER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        chart = self._entries.get(key)
+        if chart is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return chart
+
+    def set(self, key: str, chart: str) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = chart
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """缓存统计信息"""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+render_cache = RenderCache()
+
+
+def _render(builder: Callable[..., Base], params: dict[str, Any], chart_format: ChartFormat) -> str:
+    chart = builder(**params)
+    if chart_format == "options":
+        # 保留 JsCode 的引号，保证输出是合法的 JSON，并去掉缩进以减小传输量
+        options = json.loads(chart.dump_options_with_quotes())
+        return json.dumps(options, ensure_ascii=False, separators=(",", ":"))
+    return chart.render_embed()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CHART_RENDER_WORKERS, thread_name_prefix="chart-render")
+    return _executor
+
+
+async def render_chart(kind: str, builder: Callable[..., Base], **params: Any) -> str:
+    """
+    在线程池中构建并渲染图表，相同内容的图表直接返回缓存
+    :param kind: 图表类型
+    :param builder: 构建 pyecharts 图表对象的函数
+    :param params: 传给构建函数的参数
+    :return: 按当前输出格式渲染的图表
+    """
+    chart_format = chart_format_var.get()
+    content = json.dumps([kind, params, chart_format], ensure_ascii=False, default=str, sort_keys=True)
+    key = hashlib.sha256(content.encode()).hexdigest()
+
+    with span("chart.render", kind=kind, format=chart_format) as render_span:
+        chart = render_cache.get(key)
+        render_span.set(cached=chart is not None)
+        if chart is None:
+            loop = asyncio.get_running_loop()
+            chart = await loop.run_in_executor(_get_executor(), _render, builder, params, chart_format)
+            render_cache.set(key, chart)
+        render_span.set(size=len(chart))
+    return chart
+
+
+def shutdown_renderer() -> None:
+    """关闭图表渲染线程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
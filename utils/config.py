@@ -0,0 +1,124 @@
+import os
+import secrets
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# 数据库连接池配置（均可通过同名环境变量覆盖）
+DB_POOL_MIN_SIZE = _env_int("DB_POOL_MIN_SIZE", 1)  # 连接池最小连接数，创建连接池时即完成预热
+DB_POOL_MAX_SIZE = _env_int("DB_POOL_MAX_SIZE", 10)  # 连接池最大连接数
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 3600)  # 连接空闲回收时间（秒），-1 表示不回收
+DB_POOL_CONNECT_TIMEOUT = _env_int("DB_POOL_CONNECT_TIMEOUT", 5)  # 建立连接超时时间（秒）
+DB_POOL_PING_INTERVAL = _env_int("DB_POOL_PING_INTERVAL", 30)  # 连接空闲超过该秒数，借出前先 ping 做健康检查，-1 表示不检查
+
+# 数据库表结构缓存配置
+SCHEMA_CHECK_INTERVAL = _env_int("SCHEMA_CHECK_INTERVAL", 60)  # 表结构版本检查间隔（秒），间隔内直接使用缓存
+SCHEMA_TOP_K = _env_int("SCHEMA_TOP_K", 8)  # 按问题检索相关表时默认返回的表数量（不含外键关联表）
+
+# SQL 查询结果缓存配置
+RESULT_CACHE_MAX_BYTES = _env_int("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)  # 结果缓存总字节数上限，超出后按 LRU 淘汰
+RESULT_CACHE_TTL = _env_int("RESULT_CACHE_TTL", 300)  # 结果缓存有效期（秒），0 表示不缓存
+
+# 问答缓存配置
+ANSWER_CACHE_MAX_ENTRIES = _env_int("ANSWER_CACHE_MAX_ENTRIES", 1000)  # 问答缓存最大条目数，超出后按 LRU 淘汰
+ANSWER_CACHE_TTL = _env_int("ANSWER_CACHE_TTL", 3600)  # 问答缓存有效期（秒），0 表示不缓存
+ANSWER_CACHE_REVALIDATE = _env_bool("ANSWER_CACHE_REVALIDATE", True)  # 命中时是否重新执行缓存的SQL，数据变化则用新的结果重新渲染表格和图表
+
+# SQL 执行配置
+SQL_MAX_ROWS = _env_int("SQL_MAX_ROWS", 10000)  # 单次查询最多读取的行数，超出后截断
+SQL_MAX_BYTES = _env_int("SQL_MAX_BYTES", 16 * 1024 * 1024)  # 单次查询最多读取的数据量（字节），超出后截断
+SQL_FETCH_BATCH_SIZE = _env_int("SQL_FETCH_BATCH_SIZE", 500)  # 流式读取时每批读取的行数
+SQL_PREVIEW_ROWS = _env_int("SQL_PREVIEW_ROWS", 50)  # 交给模型的预览行数，其余行只提供统计信息
+QUERY_HANDLE_TTL = _env_int("QUERY_HANDLE_TTL", 1800)  # 查询结果句柄有效期（秒），有效期内可通过接口流式获取完整结果
+
+# 图表渲染配置
+CHART_FORMAT = os.getenv("CHART_FORMAT") or "html"  # 默认图表输出格式：html 返回完整 HTML 片段，options 只返回 ECharts 配置项 JSON
+CHART_RENDER_WORKERS = _env_int("CHART_RENDER_WORKERS", 4)  # 图表渲染线程数，渲染在线程池中进行，不阻塞事件循环
+CHART_RENDER_CACHE_MAX_ENTRIES = _env_int("CHART_RENDER_CACHE_MAX_ENTRIES", 256)  # 图表渲染缓存最大条目数，0 表示不缓存
+
+# 会话配置
+SESSION_IDLE_TIMEOUT = _env_int("SESSION_IDLE_TIMEOUT", 1800)  # 会话空闲超时时间（秒），超时后会话失效
+SESSION_MAX_COUNT = _env_int("SESSION_MAX_COUNT", 1000)  # 最多保留的会话数量，超出后淘汰最久未使用的会话
+SESSION_EVICT_INTERVAL = _env_int("SESSION_EVICT_INTERVAL", 60)  # 清理空闲会话的间隔（秒）
+
+# SQL 执行管控配置
+SQL_TIMEOUT = _env_int("SQL_TIMEOUT", 30)  # 单条SQL执行超时时间（秒），超时后终止查询，0 表示不限制
+SQL_MAX_CONCURRENCY = _env_int("SQL_MAX_CONCURRENCY", 4)  # 每个数据库同时执行的SQL数量上限，超出的SQL排队等待
+SQL_MAX_QUEUE = _env_int("SQL_MAX_QUEUE", 32)  # 每个数据库排队等待的SQL数量上限，超出后直接拒绝
+SQL_QUEUE_TIMEOUT = _env_int("SQL_QUEUE_TIMEOUT", 30)  # SQL排队等待的最长时间（秒）
+SQL_STREAM_MAX_CONCURRENCY = _env_int("SQL_STREAM_MAX_CONCURRENCY", 2)  # 每个数据库同时进行的流式读取和导出数量上限，与普通查询分开计数
+
+# 只读副本配置（连接配置中包含 replicas 时生效）
+REPLICA_READS = _env_bool("REPLICA_READS", True)  # 是否把只读查询和表结构加载按权重路由到只读副本
+REPLICA_MAX_LAG = _env_int("REPLICA_MAX_LAG", 30)  # 复制延迟超过该秒数的副本暂停接收查询，直到延迟恢复
+REPLICA_CHECK_INTERVAL = _env_int("REPLICA_CHECK_INTERVAL", 10)  # 副本健康检查和复制延迟检查的间隔（秒）
+REPLICA_PRIMARY_FALLBACK = _env_bool("REPLICA_PRIMARY_FALLBACK", True)  # 没有可用副本时是否回退到主库执行，关闭时直接报错以保护主库
+
+# SQL 执行成本检查配置（执行模型生成的SQL前先 EXPLAIN）
+SQL_COST_GATE = _env_bool("SQL_COST_GATE", True)  # 是否在执行前检查SQL的预估成本
+SQL_COST_MAX_ROWS = _env_int("SQL_COST_MAX_ROWS", 5_000_000)  # 预估扫描总行数上限，超出后要求模型改写SQL
+SQL_COST_MAX_FULL_SCAN_ROWS = _env_int("SQL_COST_MAX_FULL_SCAN_ROWS", 500_000)  # 单表全表扫描或全索引扫描的预估行数上限
+
+# SQL 只读校验配置
+SQL_GUARD_CACHE_SIZE = _env_int("SQL_GUARD_CACHE_SIZE", 4096)  # SQL 校验结果缓存的条目数
+
+# 结果表格渲染配置
+TABLE_RENDER_MAX_ROWS = _env_int("TABLE_RENDER_MAX_ROWS", 200)  # 服务端渲染的表格最多展示的行数，完整结果通过结果句柄获取
+TABLE_RENDER_FORMAT = os.getenv("TABLE_RENDER_FORMAT") or "markdown"  # 服务端渲染的表格格式：markdown/html
+TABLE_RESOLVE_NAMES = _env_bool("TABLE_RESOLVE_NAMES", True)  # 渲染表格时按外键以被引用表的名称代替 id 展示
+
+# 批量查询配置
+BATCH_MAX_QUESTIONS = _env_int("BATCH_MAX_QUESTIONS", 200)  # 单次批量查询最多包含的问题数
+BATCH_CONCURRENCY = _env_int("BATCH_CONCURRENCY", 4)  # 批量查询默认同时处理的问题数，受模型接口限流约束
+BATCH_MAX_CONCURRENCY = _env_int("BATCH_MAX_CONCURRENCY", 16)  # 批量查询请求可指定的最大并发数
+
+# 异步查询任务配置
+JOB_WORKERS = _env_int("JOB_WORKERS", 2)  # 执行异步查询任务的后台工作协程数
+JOB_MAX_QUEUED = _env_int("JOB_MAX_QUEUED", 100)  # 排队的异步查询任务数量上限，超出后拒绝提交
+JOB_RESULT_TTL = _env_int("JOB_RESULT_TTL", 3600)  # 异步查询任务结束后结果的保留时间（秒）
+JOB_PAGE_MAX_ROWS = _env_int("JOB_PAGE_MAX_ROWS", 1000)  # 分页获取任务结果时每页最多的行数
+
+# 列取值索引配置
+VALUE_INDEX_ENABLED = _env_bool("VALUE_INDEX_ENABLED", True)  # 连接数据库后是否在后台为较短的文本列构建取值索引
+VALUE_INDEX_MAX_DISTINCT = _env_int("VALUE_INDEX_MAX_DISTINCT", 1000)  # 单列去重取值超过该数量时视为高基数列，不建索引
+VALUE_INDEX_SAMPLE_ROWS = _env_int("VALUE_INDEX_SAMPLE_ROWS", 100000)  # 每列最多扫描的行数
+VALUE_INDEX_MAX_BYTES = _env_int("VALUE_INDEX_MAX_BYTES", 16 * 1024 * 1024)  # 每个数据库取值索引的内存预算（字节）
+VALUE_INDEX_REFRESH_INTERVAL = _env_int("VALUE_INDEX_REFRESH_INTERVAL", 3600)  # 取值索引的刷新间隔（秒），超过间隔的列重新采样
+
+# 查询结果导出配置
+EXPORT_BATCH_ROWS = _env_int("EXPORT_BATCH_ROWS", 10000)  # 导出查询结果时每批读取和编码的行数，Arrow/Parquet 中每批对应一个 RecordBatch/行组
+
+# 模型调用配置（模型名称逗号分隔时第一个为主模型，其余依次作为出错或超时后的备用模型）
+MODEL_DATA = os.getenv("MODEL_DATA") or "deepseek:deepseek-chat"  # 数据智能体使用的模型
+MODEL_CHART = os.getenv("MODEL_CHART") or MODEL_DATA  # 图表智能体使用的模型，可配置更小更快的模型
+MODEL_NARRATIVE = os.getenv("MODEL_NARRATIVE") or MODEL_CHART  # 结果总结智能体使用的模型
+MODEL_TIMEOUT = _env_int("MODEL_TIMEOUT", 60)  # 数据智能体单次模型调用的超时（秒），超时后切换备用模型，0 表示不限制
+MODEL_CHART_TIMEOUT = _env_int("MODEL_CHART_TIMEOUT", 30)  # 图表和结果总结智能体单次模型调用的超时（秒），0 表示不限制
+MODEL_HEDGE = _env_bool("MODEL_HEDGE", False)  # 模型调用超过近期耗时的 p95 仍未返回时，是否再发起一次相同请求并取先返回的结果
+MODEL_HEDGE_MIN_DELAY_MS = _env_int("MODEL_HEDGE_MIN_DELAY_MS", 1000)  # 发起对冲请求前的最短等待（毫秒）
+MODEL_HEDGE_MIN_SAMPLES = _env_int("MODEL_HEDGE_MIN_SAMPLES", 20)  # 模型近期成功调用少于该次数时不发起对冲
+
+# 多轮对话配置
+CONVERSATION_MAX_TOKENS = _env_int("CONVERSATION_MAX_TOKENS", 6000)  # 对话历史（含已获取的表结构和早期轮次摘要）的估算 token 预算，超出后最早的轮次压缩为摘要
+CONVERSATION_TTL = _env_int("CONVERSATION_TTL", 3600)  # 对话空闲多久后失效（秒）
+CONVERSATION_MAX_COUNT = _env_int("CONVERSATION_MAX_COUNT", 1000)  # 每个工作进程最多保留的对话数量，超出后淘汰最久未使用的对话
+
+# 多进程部署配置
+WORKERS = _env_int("WORKERS", 1)  # uvicorn 工作进程数，大于 1 时会话和缓存通过共享存储在进程间共享
+SHARED_STORE = os.getenv("SHARED_STORE") or ("sqlite" if WORKERS > 1 else "")  # 共享存储：空表示不共享，sqlite 或 redis
+SHARED_STORE_PATH = os.getenv("SHARED_STORE_PATH") or os.path.join(os.getcwd(), ".shared_store.sqlite3")  # sqlite 共享存储的文件路径
+SHARED_STORE_REDIS_URL = os.getenv("SHARED_STORE_REDIS_URL") or "redis://localhost:6379/0"  # redis 共享存储的地址，需要安装 redis 可选依赖
+SHARED_STORE_SECRET = os.getenv("SHARED_STORE_SECRET") or ""  # 加密共享存储中数据库密码、计算连接标识中密码摘要的密钥，各工作进程须使用相同的值
+if SHARED_STORE and not SHARED_STORE_SECRET and WORKERS > 1:
+    # 由本进程启动工作进程时随机生成密钥，写入环境变量由工作进程继承
+    SHARED_STORE_SECRET = os.environ["SHARED_STORE_SECRET"] = secrets.token_urlsafe(32)
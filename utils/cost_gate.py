@@ -0,0 +1,183 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+import aiomysql
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import SQL_COST_GATE, SQL_COST_MAX_ROWS, SQL_COST_MAX_FULL_SCAN_ROWS
+from utils.logger import logger
+from utils.query_governor import QueryTimeoutError, query_governor
+from utils.replica_router import replica_router
+from utils.sql_guard import validate_sql
+from utils.tracing import span
+
+# 全表扫描和全索引扫描
+_SCAN_ACCESS_TYPES = {"ALL", "index"}
+_LIMIT_PATTERN = re.compile(r'\blimit\s+\d+', re.IGNORECASE)
+
+
+class QueryCostExceededError(Exception):
+    """SQL预估执行成本超出上限，未执行"""
+
+    def __init__(self, decision: "CostDecision"):
+        super().__init__(decision.retry_message())
+        self.decision = decision
+
+
+@dataclass
+class TableAccess:
+    """执行计划中的单表访问"""
+    table_name: str
+    access_type: str
+    rows_examined: float  # 预估扫描行数（已乘以驱动表的行数）
+    possible_keys: list[str] | None = None
+    key: str | None = None
+    has_condition: bool = False
+    partitions: list[str] | None = None
+
+
+@dataclass
+class CostDecision:
+    """执行成本检查结果"""
+    allowed: bool
+    estimated_rows: float = 0
+    query_cost: float | None = None
+    tables: list[TableAccess] = field(default_factory=list)
+    hints: list[str] = field(default_factory=list)
+
+    def retry_message(self) -> str:
+        """交给模型改写SQL的提示"""
+        return f"SQL预估扫描约 {int(self.estimated_rows)} 行，超出执行成本上限，请改写SQL后重试：{'；'.join(self.hints)}。"
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _collect_tables(node: Any, tables: list[TableAccess]) -> None:
+    """遍历 EXPLAIN FORMAT=JSON 的执行计划，收集各表的访问方式和预估扫描行数"""
+    if isinstance(node, list):
+        for item in node:
+            _collect_tables(item, tables)
+        return
+    if not isinstance(node, dict):
+        return
+
+    for key, value in node.items():
+        if key == "nested_loop" and isinstance(value, list):
+            # 嵌套循环连接中，被驱动表每次扫描的行数要乘以前面各表产生的行数
+            prefix_rows = 1.0
+            for item in value:
+                table = item.get("table") if isinstance(item, dict) else None
+                if not isinstance(table, dict):
+                    _collect_tables(item, tables)
+                    continue
+                _add_table(table, prefix_rows, tables)
+                prefix_rows = max(_to_float(table.get("rows_produced_per_join")), 1.0)
+                _collect_tables(table, tables)
+        elif key == "table" and isinstance(value, dict):
+            _add_table(value, 1.0, tables)
+            _collect_tables(value, tables)
+        else:
+            _collect_tables(value, tables)
+
+
+def _add_table(table: dict[str, Any], prefix_rows: float, tables: list[TableAccess]) -> None:
+    tables.append(TableAccess(
+        table_name=table.get("table_name", ""),
+        access_type=table.get("access_type", ""),
+        rows_examined=prefix_rows * _to_float(table.get("rows_examined_per_scan")),
+        possible_keys=table.get("possible_keys"),
+        key=table.get("key"),
+        has_condition="attached_condition" in table,
+        partitions=table.get("partitions"),
+    ))
+
+
+def evaluate_plan(
+        sql: str,
+        plan: dict[str, Any],
+        max_rows: int = SQL_COST_MAX_ROWS,
+        max_full_scan_rows: int = SQL_COST_MAX_FULL_SCAN_ROWS,
+) -> CostDecision:
+    """
+    根据执行计划判断SQL是否超出执行成本上限，超出时给出改写建议
+    :param sql: SQL语句
+    :param plan: EXPLAIN FORMAT=JSON 的结果
+    :param max_rows: 预估扫描总行数上限
+    :param max_full_scan_rows: 单表全表扫描或全索引扫描的预估行数上限
+    :return: 检查结果
+    """
+    tables: list[TableAccess] = []
+    _collect_tables(plan, tables)
+    cost_info = plan.get("query_block", {}).get("cost_info", {})
+    decision = CostDecision(
+        allowed=True,
+        estimated_rows=sum(table.rows_examined for table in tables),
+        query_cost=_to_float(cost_info.get("query_cost")) if cost_info else None,
+        tables=tables,
+    )
+
+    for table in tables:
+        if table.access_type not in _SCAN_ACCESS_TYPES or table.rows_examined <= max_full_scan_rows:
+            continue
+        decision.allowed = False
+        scan_type = "全表扫描" if table.access_type == "ALL" else "全索引扫描"
+        scan = f"表 {table.table_name} {scan_type}约 {int(table.rows_examined)} 行"
+        if not table.possible_keys:
+            decision.hints.append(f"{scan}且没有可用的索引，请在有索引的列上增加过滤或关联条件")
+        elif not table.has_condition:
+            decision.hints.append(f"{scan}且没有过滤条件，请增加 WHERE 条件")
+        else:
+            decision.hints.append(f"{scan}，可用索引 {table.possible_keys} 未被使用，请调整过滤条件使其能使用索引")
+        if table.partitions and len(table.partitions) > 1:
+            decision.hints.append(f"表 {table.table_name} 扫描了全部 {len(table.partitions)} 个分区，请在分区键上增加过滤条件")
+
+    if decision.estimated_rows > max_rows:
+        decision.allowed = False
+        if not _LIMIT_PATTERN.search(sql):
+            decision.hints.append("如只需查看部分数据，请添加 LIMIT")
+        if not decision.hints:
+            decision.hints.append("请缩小查询的时间或数据范围，或先聚合再关联")
+
+    return decision
+
+
+async def check_query_cost(conn_config: DatabaseConnectionConfig, sql: str) -> CostDecision:
+    """
+    执行SQL前先 EXPLAIN FORMAT=JSON，检查预估扫描行数和访问方式是否超出上限
+    数据库不支持 JSON 格式的执行计划或 EXPLAIN 失败时放行，由执行超时兜底
+    :param conn_config: 数据库连接配置
+    :param sql: SQL语句
+    :return: 检查结果
+    """
+    if not SQL_COST_GATE:
+        return CostDecision(allowed=True)
+    # SHOW、DESCRIBE 等语句不能 EXPLAIN，也不会扫描业务表
+    if validate_sql(sql).statement_type not in ("SELECT", "WITH"):
+        return CostDecision(allowed=True)
+
+    try:
+        with span("sql.explain"):
+            async with query_governor.slot(conn_config), replica_router.acquire(conn_config) as conn:
+                async with conn.cursor() as cur:
+                    await query_governor.run(conn_config, conn, cur.execute(f"EXPLAIN FORMAT=JSON {sql}"))
+                    row = await cur.fetchone()
+        plan = json.loads(row[0])
+    except (aiomysql.Error, QueryTimeoutError, ValueError, TypeError, IndexError) as e:
+        logger.warning(f"获取执行计划失败，跳过成本检查: {e}")
+        return CostDecision(allowed=True)
+
+    decision = evaluate_plan(sql, plan)
+    logger.info(
+        f"SQL成本检查{'通过' if decision.allowed else '未通过'}："
+        f"预估扫描 {int(decision.estimated_rows)} 行，成本 {decision.query_cost}，"
+        f"访问方式 {[(table.table_name, table.access_type, int(table.rows_examined)) for table in decision.tables]}"
+        + (f"，建议 {decision.hints}" if decision.hints else "")
+    )
+    return decision
@@ -0,0 +1,149 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import aiomysql
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import (
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_RECYCLE,
+    DB_POOL_CONNECT_TIMEOUT,
+    DB_POOL_PING_INTERVAL,
+)
+from utils.logger import logger
+
+
+class DatabasePoolManager:
+    """按连接配置维护 aiomysql 连接池，相同配置的请求共用同一个连接池"""
+
+    def __init__(
+            self,
+            min_size: int = DB_POOL_MIN_SIZE,
+            max_size: int = DB_POOL_MAX_SIZE,
+            pool_recycle: int = DB_POOL_RECYCLE,
+            connect_timeout: int = DB_POOL_CONNECT_TIMEOUT,
+            ping_interval: int = DB_POOL_PING_INTERVAL,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool_recycle = pool_recycle
+        self.connect_timeout = connect_timeout
+        self.ping_interval = ping_interval
+        self._pools: dict[str, aiomysql.Pool] = {}
+        self._lock = asyncio.Lock()
+        # 借出的连接 -> 所属的连接配置，配置了只读副本时用于在执行查询的服务器上终止查询
+        self._endpoints: weakref.WeakKeyDictionary[aiomysql.Connection, DatabaseConnectionConfig] = \
+            weakref.WeakKeyDictionary()
+
+    async def get_pool(self, conn_config: DatabaseConnectionConfig) -> aiomysql.Pool:
+        """
+        获取连接配置对应的连接池，不存在时创建
+        :param conn_config: 数据库连接配置
+        :return: 连接池
+        """
+        key = conn_config.conn_key
+        pool = self._pools.get(key)
+        if pool is not None and not pool.closed:
+            return pool
+
+        async with self._lock:
+            pool = self._pools.get(key)
+            if pool is None or pool.closed:
+                # 创建时即建立 minsize 个连接，完成预热
+                pool = await aiomysql.create_pool(
+                    minsize=self.min_size,
+                    maxsize=self.max_size,
+                    pool_recycle=self.pool_recycle,
+                    **self._connect_kwargs(conn_config),
+                )
+                self._pools[key] = pool
+                logger.info(f"创建数据库连接池：{conn_config.host}:{conn_config.port}/{conn_config.database_name}")
+
+        return pool
+
+    def _connect_kwargs(self, conn_config: DatabaseConnectionConfig) -> dict[str, Any]:
+        return {
+            "host": conn_config.host,
+            "port": conn_config.port,
+            "user": conn_config.username,
+            "password": conn_config.password.get_secret_value(),
+            "db": conn_config.database_name,
+            "charset": 'utf8mb4',
+            "connect_timeout": self.connect_timeout,
+            # 只读查询不需要事务，开启自动提交避免归还连接时因事务未结束被关闭
+            "autocommit": True,
+        }
+
+    async def kill_query(self, conn_config: DatabaseConnectionConfig, thread_id: int) -> None:
+        """
+        通过独立的连接终止正在执行的查询，不占用连接池，连接池耗尽时也能执行
+        :param conn_config: 数据库连接配置
+        :param thread_id: 执行查询的连接的线程 ID
+        """
+        conn = await aiomysql.connect(**self._connect_kwargs(conn_config))
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(f"KILL QUERY {int(thread_id)}")
+        finally:
+            conn.close()
+
+    async def warm_up(self, conn_config: DatabaseConnectionConfig) -> bool:
+        """
+        创建并预热连接池，借出一个连接执行 SELECT 1 验证连通性
+        :param conn_config: 数据库连接配置
+        :return: 是否可用
+        """
+        async with self.acquire(conn_config) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT 1")
+                result = await cur.fetchone()
+
+        return result == (1,)
+
+    @asynccontextmanager
+    async def acquire(self, conn_config: DatabaseConnectionConfig) -> AsyncIterator[aiomysql.Connection]:
+        """
+        从连接池借出一个连接，使用完毕后自动归还
+        :param conn_config: 数据库连接配置
+        :return: 数据库连接
+        """
+        pool = await self.get_pool(conn_config)
+        async with pool.acquire() as conn:
+            # 空闲过久的连接可能已被服务端断开，借出前做一次健康检查
+            if self.ping_interval > -1 and asyncio.get_running_loop().time() - conn.last_usage > self.ping_interval:
+                await conn.ping(reconnect=True)
+            self._endpoints[conn] = conn_config
+            yield conn
+
+    def endpoint_of(self, conn: aiomysql.Connection, default: DatabaseConnectionConfig) -> DatabaseConnectionConfig:
+        """
+        获取连接所属的连接配置（主库或某个只读副本）
+        :param conn: 借出的连接
+        :param default: 未记录时返回的连接配置
+        """
+        return self._endpoints.get(conn, default)
+
+    async def close_pool(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        关闭连接配置对应的连接池
+        :param conn_config: 数据库连接配置
+        """
+        pool = self._pools.pop(conn_config.conn_key, None)
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+    async def close_all(self) -> None:
+        """关闭所有连接池"""
+        pools = list(self._pools.values())
+        self._pools.clear()
+        for pool in pools:
+            pool.close()
+            await pool.wait_closed()
+        logger.info(f"已关闭 {len(pools)} 个数据库连接池")
+
+
+pool_manager = DatabasePoolManager()
@@ -1,11 +1,17 @@
 import sys
+from contextvars import ContextVar
+
 from loguru import logger
 
+# 当前请求的追踪 ID，写入每一行日志
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default="-")
+
 # 配置 loguru 日志
 logger.remove()  # 移除默认的 handler
+logger.configure(patcher=lambda record: record["extra"].setdefault("trace_id", trace_id_var.get()))
 logger.add(
     sys.stdout,
     colorize=True,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+    format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <magenta>{extra[trace_id]}</magenta> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
     level="INFO"
 )
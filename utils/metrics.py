@@ -0,0 +1,156 @@
+import bisect
+import threading
+from typing import Iterable
+
+# 耗时直方图的默认分桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 行数、字节数、token 数等计数类直方图的分桶
+SIZE_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """只增不减的计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+                    for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """分桶累计的直方图，同时记录总和与次数"""
+    type_name = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Iterable[str] = (),
+            buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数..., 超出最大分桶的计数], 总和
+        self._values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def collect(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(total[0])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Iterable[str] = (),
+            buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """按 Prometheus 文本格式（0.0.4）输出所有指标"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+http_requests_total = metrics_registry.counter(
+    "dbqa_http_requests_total", "HTTP 请求数", ("method", "route", "status"))
+http_request_duration_seconds = metrics_registry.histogram(
+    "dbqa_http_request_duration_seconds", "HTTP 请求耗时（流式响应为返回响应头的耗时）", ("method", "route"))
+stage_duration_seconds = metrics_registry.histogram(
+    "dbqa_stage_duration_seconds", "各处理阶段耗时：智能体运行、工具调用、SQL执行、图表渲染等", ("stage",))
+stage_errors_total = metrics_registry.counter(
+    "dbqa_stage_errors_total", "各处理阶段抛出异常的次数", ("stage",))
+sql_rows = metrics_registry.histogram(
+    "dbqa_sql_rows", "每次SQL查询读取的行数", (), SIZE_BUCKETS)
+sql_bytes = metrics_registry.histogram(
+    "dbqa_sql_bytes", "每次SQL查询读取的数据量（字节）", (), SIZE_BUCKETS)
+model_requests_total = metrics_registry.counter(
+    "dbqa_model_requests_total", "模型请求次数", ("agent",))
+model_tokens_total = metrics_registry.counter(
+    "dbqa_model_tokens_total", "模型 token 用量", ("agent", "kind"))
+model_run_tokens = metrics_registry.histogram(
+    "dbqa_model_run_tokens", "每次智能体运行的 token 用量", ("agent", "kind"), SIZE_BUCKETS)
+replica_reads_total = metrics_registry.counter(
+    "dbqa_replica_reads_total", "路由到各服务器（只读副本，或回退时的主库）的只读查询次数", ("endpoint",))
+replica_failovers_total = metrics_registry.counter(
+    "dbqa_replica_failovers_total", "只读副本故障切换次数：connect_error 为连接副本失败后改用其他服务器，no_replica 为没有可用副本回退到主库",
+    ("reason",))
+model_calls_total = metrics_registry.counter(
+    "dbqa_model_calls_total", "各阶段单次模型调用的结果：ok、hedge_won（对冲请求先返回）、primary_won（发起对冲后主请求先返回）、timeout、error",
+    ("stage", "model", "outcome"))
+model_call_duration_seconds = metrics_registry.histogram(
+    "dbqa_model_call_duration_seconds", "各阶段单次模型调用的耗时（流式调用为收到首个响应的耗时）", ("stage", "outcome"))
+model_fallbacks_total = metrics_registry.counter(
+    "dbqa_model_fallbacks_total", "模型出错或超时后切换到备用模型的次数", ("stage", "model", "reason"))
@@ -0,0 +1,236 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any
+
+from pydantic_ai.messages import ModelMessage, ModelResponse
+from pydantic_ai.models import KnownModelName, Model, ModelRequestParameters, StreamedResponse, infer_model
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.settings import ModelSettings
+
+from utils.config import (
+    MODEL_CHART,
+    MODEL_CHART_TIMEOUT,
+    MODEL_DATA,
+    MODEL_HEDGE,
+    MODEL_HEDGE_MIN_DELAY_MS,
+    MODEL_HEDGE_MIN_SAMPLES,
+    MODEL_NARRATIVE,
+    MODEL_TIMEOUT,
+)
+from utils.logger import logger
+from utils.metrics import model_call_duration_seconds, model_calls_total, model_fallbacks_total
+from utils.tracing import span
+
+# 每个模型保留最近多少次成功调用的耗时，用于计算对冲等待时间
+_LATENCY_WINDOW = 200
+
+
+class ModelCallTimeoutError(TimeoutError):
+    """模型调用超过单次调用的超时时间"""
+
+
+class RoutedModel(WrapperModel):
+    """
+    按处理阶段路由的模型：主模型出错或超时后依次切换到备用模型，
+    开启对冲时，调用超过该模型近期耗时的 p95 仍未返回则再发起一次相同请求，取先返回的结果并取消另一个；
+    流式调用只对建立流（收到首个响应）设置超时和切换备用模型，不做对冲
+    """
+
+    def __init__(
+            self,
+            stage: str,
+            models: list[Model | KnownModelName | str],
+            timeout: float = 0,
+            hedge: bool = False,
+            hedge_min_delay: float = 1.0,
+            hedge_min_samples: int = 20,
+    ):
+        """
+        :param stage: 处理阶段名称，用于指标和日志，如 data、chart、narrative
+        :param models: 模型名称或模型实例，第一个为主模型，其余为备用模型
+        :param timeout: 单次模型调用的超时（秒），0 表示不限制
+        :param hedge: 是否发起对冲请求
+        :param hedge_min_delay: 发起对冲请求前的最短等待（秒）
+        :param hedge_min_samples: 近期成功调用少于该次数时不发起对冲
+        """
+        if not models:
+            raise ValueError(f"阶段 {stage} 没有配置模型")
+        super().__init__(models[0])
+        self.models = [self.wrapped, *(infer_model(model) for model in models[1:])]
+        self.stage = stage
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies: dict[str, deque[float]] = {}
+        self._profile = self.wrapped.profile
+
+    def customize_request_parameters(self, model_request_parameters: ModelRequestParameters) -> ModelRequestParameters:
+        # 各模型的工具 JSON Schema 转换规则可能不同，在实际调用时按所用模型转换
+        return model_request_parameters
+
+    def hedge_delay(self, model: Model) -> float | None:
+        """
+        发起对冲请求前的等待时间：该模型近期成功调用耗时的 p95，不低于最短等待
+        :param model: 模型
+        :return: 等待秒数，未开启对冲或样本不足时返回 None
+        """
+        samples = self._latencies.get(model.model_name)
+        if not self.hedge or samples is None or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return max(ordered[int(len(ordered) * 0.95) - 1], self.hedge_min_delay)
+
+    def stats(self) -> dict[str, Any]:
+        """各模型近期成功调用的次数和对冲等待时间"""
+        return {
+            "models": [model.model_name for model in self.models],
+            "timeout": self.timeout,
+            "hedge": self.hedge,
+            "samples": {name: len(samples) for name, samples in self._latencies.items()},
+            "hedge_delay": {model.model_name: self.hedge_delay(model) for model in self.models},
+        }
+
+    async def request(
+            self,
+            messages: list[ModelMessage],
+            model_settings: ModelSettings | None,
+            model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        errors: list[Exception] = []
+        for index, model in enumerate(self.models):
+            parameters = model.customize_request_parameters(model_request_parameters)
+            try:
+                with span(f"model.{self.stage}", model=model.model_name, attempt=index) as current:
+                    return await self._hedged_request(model, current, messages, model_settings, parameters)
+            except Exception as e:
+                errors.append(e)
+                self._fallback(index, model, e)
+        raise errors[-1]
+
+    @asynccontextmanager
+    async def request_stream(
+            self,
+            messages: list[ModelMessage],
+            model_settings: ModelSettings | None,
+            model_request_parameters: ModelRequestParameters,
+    ) -> AsyncIterator[StreamedResponse]:
+        errors: list[Exception] = []
+        for index, model in enumerate(self.models):
+            parameters = model.customize_request_parameters(model_request_parameters)
+            async with AsyncExitStack() as stack:
+                started = time.perf_counter()
+                try:
+                    with span(f"model.{self.stage}", model=model.model_name, attempt=index, stream=True):
+                        async with asyncio.timeout(self.timeout or None):
+                            response = await stack.enter_async_context(
+                                model.request_stream(messages, model_settings, parameters)
+                            )
+                except Exception as e:
+                    error = e
+                    if isinstance(e, TimeoutError) and not isinstance(e, ModelCallTimeoutError):
+                        error = ModelCallTimeoutError(f"模型 {model.model_name} 超过 {self.timeout} 秒未返回")
+                    outcome = "timeout" if isinstance(error, ModelCallTimeoutError) else "error"
+                    self._observe(model, outcome, time.perf_counter() - started, record=False)
+                    errors.append(error)
+                    self._fallback(index, model, error)
+                    continue
+                self._observe(model, "ok", time.perf_counter() - started, record=False)
+                yield response
+                return
+        raise errors[-1]
+
+    async def _hedged_request(
+            self,
+            model: Model,
+            current: Any,
+            messages: list[ModelMessage],
+            model_settings: ModelSettings | None,
+            parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        started = time.perf_counter()
+        deadline = started + self.timeout if self.timeout else None
+        delay = self.hedge_delay(model)
+        primary = asyncio.create_task(model.request(messages, model_settings, parameters))
+        hedge: asyncio.Task | None = None
+        pending = {primary}
+        error: BaseException | None = None
+        try:
+            if delay is not None and (deadline is None or started + delay < deadline):
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    hedge = asyncio.create_task(model.request(messages, model_settings, parameters))
+                    pending.add(hedge)
+                    current.set(hedge_delay_ms=round(delay * 1000, 1))
+                    logger.info(f"模型 {model.model_name} 超过 {delay * 1000:.0f} ms 未返回，发起对冲请求")
+                else:
+                    pending = done
+            while pending:
+                remaining = deadline - time.perf_counter() if deadline is not None else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(remaining, 0) if remaining is not None else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    raise ModelCallTimeoutError(f"模型 {model.model_name} 超过 {self.timeout} 秒未返回")
+                for task in done:
+                    if task.exception() is None:
+                        outcome = "ok" if hedge is None else ("hedge_won" if task is hedge else "primary_won")
+                        current.set(outcome=outcome)
+                        self._observe(model, outcome, time.perf_counter() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        except ModelCallTimeoutError:
+            self._observe(model, "timeout", time.perf_counter() - started, record=False)
+            raise
+        except Exception:
+            self._observe(model, "error", time.perf_counter() - started, record=False)
+            raise
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+            await asyncio.gather(*(task for task in (primary, hedge) if task is not None), return_exceptions=True)
+
+    def _observe(self, model: Model, outcome: str, duration: float, record: bool = True) -> None:
+        model_calls_total.inc(stage=self.stage, model=model.model_name, outcome=outcome)
+        model_call_duration_seconds.observe(duration, stage=self.stage, outcome=outcome)
+        # 对冲请求的耗时从主请求发出时算起，反映的是对冲后的实际延迟，不计入样本，避免 p95 被对冲拉低
+        if record and outcome == "ok":
+            self._latencies.setdefault(model.model_name, deque(maxlen=_LATENCY_WINDOW)).append(duration)
+
+    def _fallback(self, index: int, model: Model, error: Exception) -> None:
+        if index + 1 < len(self.models):
+            reason = "timeout" if isinstance(error, ModelCallTimeoutError) else "error"
+            model_fallbacks_total.inc(stage=self.stage, model=model.model_name, reason=reason)
+            logger.warning(f"模型 {model.model_name} 调用失败（{error}），切换到备用模型 {self.models[index + 1].model_name}")
+
+
+def _model_names(value: str) -> list[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def routed_model(stage: str, models: str, timeout: float) -> RoutedModel:
+    """
+    按配置创建处理阶段使用的模型
+    :param stage: 处理阶段名称
+    :param models: 逗号分隔的模型名称，如 deepseek:deepseek-chat,openai:gpt-4o-mini
+    :param timeout: 单次模型调用的超时（秒）
+    """
+    return RoutedModel(
+        stage,
+        _model_names(models),
+        timeout=timeout,
+        hedge=MODEL_HEDGE,
+        hedge_min_delay=MODEL_HEDGE_MIN_DELAY_MS / 1000,
+        hedge_min_samples=MODEL_HEDGE_MIN_SAMPLES,
+    )
+
+
+data_model = routed_model("data", MODEL_DATA, MODEL_TIMEOUT)
+chart_model = routed_model("chart", MODEL_CHART, MODEL_CHART_TIMEOUT)
+narrative_model = routed_model("narrative", MODEL_NARRATIVE, MODEL_CHART_TIMEOUT)
@@ -0,0 +1,211 @@
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, TypeVar
+
+import aiomysql
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import (
+    REPLICA_READS, SQL_TIMEOUT, SQL_MAX_CONCURRENCY, SQL_MAX_QUEUE, SQL_QUEUE_TIMEOUT, SQL_STREAM_MAX_CONCURRENCY,
+)
+from utils.db_pool import pool_manager
+from utils.logger import logger
+
+T = TypeVar("T")
+
+# 客户端超时比服务端超时稍长，优先由服务端终止查询并返回明确的错误
+CLIENT_DEADLINE_GRACE = 1.0
+
+_SELECT_PATTERN = re.compile(r'^(\s*)(select)\b', re.IGNORECASE)
+
+
+class QueryTimeoutError(Exception):
+    """SQL执行超时"""
+
+
+class QueryQueueFullError(Exception):
+    """SQL排队数量或排队时间超出上限"""
+
+
+@dataclass
+class StatementTiming:
+    """单条SQL的排队和执行耗时（秒）"""
+    queue_wait: float = 0.0
+    elapsed: float = 0.0
+
+
+class _DatabaseSlots:
+    """单个数据库的并发控制状态"""
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.running = 0
+        self.statements = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_queue_wait = 0.0
+        self.total_elapsed = 0.0
+
+
+def add_timeout_hint(sql: str, timeout: int) -> str:
+    """
+    为 SELECT 语句加上 MAX_EXECUTION_TIME 优化器提示，由服务端在超时后终止查询（MySQL 5.7.8+，其他数据库视为注释）
+    :param sql: SQL语句
+    :param timeout: 超时时间（秒）
+    :return: 加上提示后的SQL，非 SELECT 语句或已有提示时原样返回
+    """
+    if timeout <= 0 or 'MAX_EXECUTION_TIME' in sql.upper():
+        return sql
+    return _SELECT_PATTERN.sub(rf'\1\2 /*+ MAX_EXECUTION_TIME({timeout * 1000}) */', sql, count=1)
+
+
+class QueryGovernor:
+    """
+    SQL执行管控
+    每个数据库同时执行的SQL数量受信号量限制，超出的排队等待；每条SQL有执行超时，超时或请求取消时通过独立连接终止查询
+    完整结果的流式读取和导出会在整个响应期间占用连接，使用单独的、更小的名额，不挤占普通查询
+    """
+
+    def __init__(
+            self,
+            timeout: int = SQL_TIMEOUT,
+            max_concurrency: int = SQL_MAX_CONCURRENCY,
+            max_queue: int = SQL_MAX_QUEUE,
+            queue_timeout: int = SQL_QUEUE_TIMEOUT,
+            max_stream_concurrency: int = SQL_STREAM_MAX_CONCURRENCY,
+    ):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_stream_concurrency = max_stream_concurrency
+        self._slots: dict[str, _DatabaseSlots] = {}
+        self._stream_slots: dict[str, _DatabaseSlots] = {}
+
+    def _get_slots(self, conn_config: DatabaseConnectionConfig, stream: bool) -> _DatabaseSlots:
+        registry = self._stream_slots if stream else self._slots
+        slots = registry.get(conn_config.conn_key)
+        if slots is None:
+            # 只读查询按权重分散到各副本时，名额按接收查询的副本数放大
+            readers = sum(1 for replica in conn_config.replicas if replica.weight > 0) if REPLICA_READS else 0
+            max_concurrency = self.max_stream_concurrency if stream else self.max_concurrency
+            slots = registry[conn_config.conn_key] = _DatabaseSlots(max_concurrency * max(readers, 1))
+        return slots
+
+    @asynccontextmanager
+    async def slot(self, conn_config: DatabaseConnectionConfig, stream: bool = False) -> AsyncIterator[StatementTiming]:
+        """
+        占用数据库的一个执行名额，名额不足时排队等待
+        :param conn_config: 数据库连接配置
+        :param stream: 是否为完整结果的流式读取或导出，使用单独的名额
+        :return: 本条SQL的耗时统计，退出时填充执行耗时
+        """
+        slots = self._get_slots(conn_config, stream)
+        timing = StatementTiming()
+        queued_at = time.monotonic()
+
+        if not slots.semaphore.locked():
+            # 有空闲名额时立即占用，不计入排队，避免同时到达的SQL被误判为排队已满
+            await slots.semaphore.acquire()
+        else:
+            if slots.waiting >= self.max_queue:
+                slots.rejected += 1
+                raise QueryQueueFullError(f"数据库繁忙，排队的SQL已达上限 {self.max_queue} 条，请稍后再试")
+            slots.waiting += 1
+            try:
+                await asyncio.wait_for(slots.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                slots.rejected += 1
+                raise QueryQueueFullError(f"数据库繁忙，SQL排队超过 {self.queue_timeout} 秒，请稍后再试")
+            finally:
+                slots.waiting -= 1
+
+        started_at = time.monotonic()
+        timing.queue_wait = started_at - queued_at
+        slots.running += 1
+        try:
+            yield timing
+        finally:
+            timing.elapsed = time.monotonic() - started_at
+            slots.running -= 1
+            slots.semaphore.release()
+            slots.statements += 1
+            slots.total_queue_wait += timing.queue_wait
+            slots.total_elapsed += timing.elapsed
+            logger.info(f"SQL排队 {timing.queue_wait * 1000:.1f} ms，执行 {timing.elapsed * 1000:.1f} ms")
+
+    async def run(
+            self,
+            conn_config: DatabaseConnectionConfig,
+            conn: aiomysql.Connection,
+            statement: Awaitable[T],
+            timeout: int | None = None,
+    ) -> T:
+        """
+        在客户端超时限制下执行SQL，超时或被取消时终止服务端正在执行的查询
+        :param conn_config: 数据库连接配置
+        :param conn: 执行SQL的连接
+        :param statement: 在该连接上执行SQL并读取结果的协程
+        :param timeout: 超时时间（秒），默认使用全局配置，0 表示不限制
+        :return: 协程的返回值
+        """
+        timeout = self.timeout if timeout is None else timeout
+        thread_id = conn.thread_id()
+        endpoint = pool_manager.endpoint_of(conn, conn_config)
+        try:
+            if timeout <= 0:
+                return await statement
+            return await asyncio.wait_for(statement, timeout + CLIENT_DEADLINE_GRACE)
+        except asyncio.TimeoutError:
+            self._get_slots(conn_config, False).timeouts += 1
+            await self._kill(endpoint, thread_id)
+            raise QueryTimeoutError(f"SQL执行超过 {timeout} 秒已被终止，请缩小查询范围或增加过滤条件")
+        except asyncio.CancelledError:
+            # 请求已取消（如客户端断开），终止查询后继续向上传递取消
+            logger.info("请求已取消，终止正在执行的SQL")
+            await asyncio.shield(self._kill(endpoint, thread_id))
+            raise
+
+    async def kill(self, conn_config: DatabaseConnectionConfig, conn: aiomysql.Connection) -> None:
+        """
+        终止连接上正在执行的查询，用于流式读取被中途取消的情况
+        :param conn_config: 数据库连接配置
+        :param conn: 执行SQL的连接
+        """
+        await asyncio.shield(self._kill(pool_manager.endpoint_of(conn, conn_config), conn.thread_id()))
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """各数据库的排队、执行和超时统计，以及流式读取名额的占用情况"""
+        stats = {}
+        for key in self._slots.keys() | self._stream_slots.keys():
+            slots = self._slots.get(key) or _DatabaseSlots(self.max_concurrency)
+            stream_slots = self._stream_slots.get(key) or _DatabaseSlots(self.max_stream_concurrency)
+            # 统计按数据库展示，不包含密码摘要
+            stats[key.split('#')[0]] = {
+                "running": slots.running,
+                "waiting": slots.waiting,
+                "statements": slots.statements,
+                "timeouts": slots.timeouts,
+                "rejected": slots.rejected,
+                "avg_queue_wait_ms": round(slots.total_queue_wait / slots.statements * 1000, 2) if slots.statements else 0,
+                "avg_elapsed_ms": round(slots.total_elapsed / slots.statements * 1000, 2) if slots.statements else 0,
+                "streams_running": stream_slots.running,
+                "streams_waiting": stream_slots.waiting,
+                "streams_rejected": stream_slots.rejected,
+            }
+        return stats
+
+    @staticmethod
+    async def _kill(conn_config: DatabaseConnectionConfig, thread_id: int) -> None:
+        try:
+            await pool_manager.kill_query(conn_config, thread_id)
+            logger.warning(f"已终止数据库线程 {thread_id} 上的查询")
+        except Exception as e:
+            logger.error(f"终止查询失败: {e}")
+
+
+query_governor = QueryGovernor()
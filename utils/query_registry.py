@@ -0,0 +1,83 @@
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import QUERY_HANDLE_TTL
+from utils.session_registry import Session, session_id_var
+from utils.shared_store import SharedStore, shared_store
+
+# 最多保留的查询句柄数量
+MAX_QUERY_HANDLES = 10000
+# 共享存储中查询句柄的命名空间
+_STORE_NAMESPACE = "handle"
+
+
+@dataclass
+class QueryHandle:
+    """已执行查询的句柄，客户端凭句柄获取完整查询结果"""
+    conn_config: DatabaseConnectionConfig
+    sql_text: str
+    expires_at: float
+    session_id: str | None = None  # 执行查询的会话，只有该会话可以获取完整结果
+
+    def owned_by(self, session: Session) -> bool:
+        """句柄是否属于该会话，且会话仍连接执行查询时的数据库"""
+        return self.session_id == session.session_id and self.conn_config.conn_key == session.conn_config.conn_key
+
+
+class QueryRegistry:
+    """
+    记录已执行的查询，交给模型的只是结果预览，完整结果由客户端通过句柄另行流式获取
+    配置了共享存储时句柄同时写入共享存储，获取完整结果的请求可以落到任一工作进程
+    """
+
+    def __init__(self, ttl: int = QUERY_HANDLE_TTL, max_handles: int = MAX_QUERY_HANDLES,
+                 store: SharedStore | None = shared_store):
+        self.ttl = ttl
+        self.max_handles = max_handles
+        self.store = store
+        self._handles: OrderedDict[str, QueryHandle] = OrderedDict()
+
+    async def register(self, conn_config: DatabaseConnectionConfig, sql_text: str) -> str:
+        """
+        登记一次查询，句柄归属于当前请求的会话
+        :param conn_config: 数据库连接配置
+        :param sql_text: SQL语句
+        :return: 结果句柄 ID
+        """
+        result_id = uuid.uuid4().hex
+        session_id = session_id_var.get()
+        self._handles[result_id] = QueryHandle(conn_config, sql_text, time.monotonic() + self.ttl, session_id)
+        if self.store is not None:
+            await self.store.set(_STORE_NAMESPACE, result_id, (conn_config, sql_text, session_id), ttl=self.ttl)
+        while len(self._handles) > self.max_handles:
+            self._handles.popitem(last=False)
+        return result_id
+
+    async def get(self, result_id: str) -> QueryHandle | None:
+        """
+        获取查询句柄
+        :param result_id: 结果句柄 ID
+        :return: 查询句柄，不存在或已过期时返回 None
+        """
+        handle = self._handles.get(result_id)
+        if handle is None:
+            return await self._get_shared(result_id)
+        if handle.expires_at <= time.monotonic():
+            del self._handles[result_id]
+            return None
+        return handle
+
+    async def _get_shared(self, result_id: str) -> QueryHandle | None:
+        stored = await self.store.get(_STORE_NAMESPACE, result_id) if self.store is not None else None
+        if stored is None:
+            return None
+        conn_config, sql_text, session_id = stored.value
+        handle = QueryHandle(conn_config, sql_text, time.monotonic() + (stored.remaining() or self.ttl), session_id)
+        self._handles[result_id] = handle
+        return handle
+
+
+query_registry = QueryRegistry()
@@ -0,0 +1,238 @@
+import asyncio
+import random
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+import aiomysql
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import REPLICA_CHECK_INTERVAL, REPLICA_MAX_LAG, REPLICA_PRIMARY_FALLBACK, REPLICA_READS
+from utils.db_pool import DatabasePoolManager, pool_manager
+from utils.logger import logger
+from utils.metrics import replica_failovers_total, replica_reads_total
+
+# 单个副本健康检查的超时（秒）
+_CHECK_TIMEOUT = 5
+# 没有权限查看复制状态（缺少 REPLICATION CLIENT 权限）的错误码
+_ER_SPECIFIC_ACCESS_DENIED = 1227
+
+
+class ReplicaUnavailableError(Exception):
+    """没有可用的只读副本且不允许回退到主库，让模型重试没有意义，直接结束本次查询"""
+
+
+class ReplicationStoppedError(Exception):
+    """副本的复制线程未运行"""
+
+
+@dataclass
+class ReplicaHealth:
+    """单个只读副本的健康状态"""
+    healthy: bool = True  # 首次检查前视为可用，连接失败后立即排除
+    lag: float | None = None  # 复制延迟（秒），None 表示未知
+    checked_at: float = 0.0  # 最近一次检查的时间（time.time()）
+    error: str | None = None
+    reads: int = 0
+
+
+def _endpoint_name(conn_config: DatabaseConnectionConfig) -> str:
+    return f"{conn_config.host}:{conn_config.port}"
+
+
+class ReplicaRouter:
+    """
+    只读副本路由：连接配置包含只读副本时，只读查询和表结构加载按权重随机分配到可用的副本，
+    定期检查副本的连通性和复制延迟，连接失败或延迟超过上限的副本暂停接收查询，没有可用副本时回退到主库
+    """
+
+    def __init__(
+            self,
+            pools: DatabasePoolManager = pool_manager,
+            enabled: bool = REPLICA_READS,
+            max_lag: int = REPLICA_MAX_LAG,
+            check_interval: int = REPLICA_CHECK_INTERVAL,
+            primary_fallback: bool = REPLICA_PRIMARY_FALLBACK,
+    ):
+        self.pools = pools
+        self.enabled = enabled
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.primary_fallback = primary_fallback
+        # 连接标识 -> 包含副本的连接配置
+        self._configs: dict[str, DatabaseConnectionConfig] = {}
+        # 副本连接标识 -> 健康状态
+        self._health: dict[str, ReplicaHealth] = {}
+        self._checks: dict[str, asyncio.Task] = {}
+
+    def replicas(self, conn_config: DatabaseConnectionConfig) -> list[tuple[DatabaseConnectionConfig, int]]:
+        """
+        连接配置中各副本的连接配置和权重
+        :param conn_config: 数据库连接配置
+        """
+        return [(conn_config.replica_config(replica), replica.weight) for replica in conn_config.replicas]
+
+    def register(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        登记包含副本的连接配置，首次登记时在后台检查一次各副本，之后由定期检查更新
+        :param conn_config: 数据库连接配置
+        """
+        key = conn_config.conn_key
+        if not self.enabled or not conn_config.replicas or key in self._configs:
+            return
+        self._configs[key] = conn_config
+        self._checks[key] = asyncio.create_task(self.check(conn_config))
+
+    def choose(self, conn_config: DatabaseConnectionConfig, exclude: set[str] | None = None) -> DatabaseConnectionConfig:
+        """
+        选择执行只读查询的服务器：在可用副本中按权重随机选择，没有可用副本时回退到主库
+        :param conn_config: 数据库连接配置
+        :param exclude: 本次已尝试失败的副本连接标识
+        :return: 副本或主库的连接配置
+        """
+        candidates = [
+            (replica, weight) for replica, weight in self.replicas(conn_config)
+            if weight > 0 and replica.conn_key not in (exclude or set()) and self._available(replica.conn_key)
+        ]
+        if candidates:
+            replicas, weights = zip(*candidates)
+            return random.choices(replicas, weights=weights)[0]
+        if not self.primary_fallback:
+            raise ReplicaUnavailableError("没有可用的只读副本，请稍后再试")
+        return conn_config
+
+    @asynccontextmanager
+    async def acquire(self, conn_config: DatabaseConnectionConfig) -> AsyncIterator[aiomysql.Connection]:
+        """
+        为只读查询借出连接，从副本借出连接失败时标记该副本不可用并尝试其他副本或主库
+        :param conn_config: 数据库连接配置
+        :return: 副本或主库的连接
+        """
+        if not self.enabled or not conn_config.replicas:
+            async with self.pools.acquire(conn_config) as conn:
+                yield conn
+            return
+
+        self.register(conn_config)
+        tried: set[str] = set()
+        async with AsyncExitStack() as stack:
+            while True:
+                endpoint = self.choose(conn_config, tried)
+                if endpoint is conn_config:
+                    replica_failovers_total.inc(reason="no_replica")
+                    logger.warning(f"没有可用的只读副本，回退到主库执行：{_endpoint_name(conn_config)}")
+                    conn = await stack.enter_async_context(self.pools.acquire(conn_config))
+                    break
+                try:
+                    conn = await stack.enter_async_context(self.pools.acquire(endpoint))
+                except (aiomysql.Error, OSError, asyncio.TimeoutError) as e:
+                    tried.add(endpoint.conn_key)
+                    self._mark_down(endpoint, e)
+                    replica_failovers_total.inc(reason="connect_error")
+                    continue
+                self._health.setdefault(endpoint.conn_key, ReplicaHealth()).reads += 1
+                break
+            replica_reads_total.inc(endpoint=_endpoint_name(endpoint))
+            yield conn
+
+    async def check(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        检查各副本的连通性和复制延迟
+        :param conn_config: 数据库连接配置
+        """
+        await asyncio.gather(*(self._check_replica(replica) for replica, _ in self.replicas(conn_config)))
+
+    async def run_checks(self) -> None:
+        """定期检查所有已登记的副本，在应用生命周期内以后台任务运行"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for conn_config in list(self._configs.values()):
+                try:
+                    await self.check(conn_config)
+                except Exception as e:
+                    logger.error(f"检查只读副本失败：{e}")
+
+    async def release(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        关闭各副本的连接池并停止检查，释放数据库资源时调用
+        :param conn_config: 数据库连接配置
+        """
+        task = self._checks.pop(conn_config.conn_key, None)
+        if task is not None and not task.done():
+            task.cancel()
+        self._configs.pop(conn_config.conn_key, None)
+        for replica, _ in self.replicas(conn_config):
+            self._health.pop(replica.conn_key, None)
+            await self.pools.close_pool(replica)
+
+    def stats(self) -> dict[str, Any]:
+        """各副本的可用状态、复制延迟和分配到的查询数"""
+        databases = {}
+        for conn_config in self._configs.values():
+            replicas = {}
+            for replica, weight in self.replicas(conn_config):
+                health = self._health.get(replica.conn_key, ReplicaHealth())
+                replicas[_endpoint_name(replica)] = {
+                    "weight": weight,
+                    "available": self._available(replica.conn_key),
+                    "healthy": health.healthy,
+                    "lag": health.lag,
+                    "reads": health.reads,
+                    **({"error": health.error} if health.error else {}),
+                }
+            databases[f"{_endpoint_name(conn_config)}/{conn_config.database_name}"] = replicas
+        return {"databases": databases, "max_lag": self.max_lag}
+
+    def _available(self, key: str) -> bool:
+        health = self._health.get(key)
+        if health is None:
+            return True
+        return health.healthy and (health.lag is None or health.lag <= self.max_lag)
+
+    def _mark_down(self, endpoint: DatabaseConnectionConfig, error: BaseException) -> None:
+        health = self._health.setdefault(endpoint.conn_key, ReplicaHealth())
+        if health.healthy:
+            logger.warning(f"只读副本不可用，暂停接收查询：{_endpoint_name(endpoint)}，{error}")
+        health.healthy, health.error = False, str(error) or type(error).__name__
+
+    async def _check_replica(self, replica: DatabaseConnectionConfig) -> None:
+        health = self._health.setdefault(replica.conn_key, ReplicaHealth())
+        try:
+            lag = await asyncio.wait_for(self._replication_lag(replica), _CHECK_TIMEOUT)
+        except Exception as e:
+            self._mark_down(replica, e)
+            health.checked_at = time.time()
+            return
+        if not health.healthy:
+            logger.info(f"只读副本恢复可用：{_endpoint_name(replica)}")
+        if lag is not None and lag > self.max_lag and (health.lag is None or health.lag <= self.max_lag):
+            logger.warning(f"只读副本复制延迟 {lag:.0f} 秒，超过上限 {self.max_lag} 秒，暂停接收查询：{_endpoint_name(replica)}")
+        health.healthy, health.lag, health.error, health.checked_at = True, lag, None, time.time()
+
+    async def _replication_lag(self, replica: DatabaseConnectionConfig) -> float | None:
+        # MySQL 8.0.22 起使用 SHOW REPLICA STATUS，旧版本使用 SHOW SLAVE STATUS
+        async with self.pools.acquire(replica) as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                                          ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+                    try:
+                        await cursor.execute(statement)
+                    except aiomysql.ProgrammingError:
+                        continue
+                    except aiomysql.OperationalError as e:
+                        if e.args and e.args[0] == _ER_SPECIFIC_ACCESS_DENIED:
+                            # 没有权限查看复制状态时只检查连通性，延迟视为未知
+                            return None
+                        raise
+                    row = await cursor.fetchone()
+                    if row is None:
+                        # 不是复制副本（如代理后的只读节点），没有复制延迟
+                        return 0.0
+                    if row.get(column) is None:
+                        raise ReplicationStoppedError("复制线程未运行")
+                    return float(row[column])
+                return None
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,191 @@
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Literal
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, SQL_GUARD_CACHE_SIZE
+from utils.shared_store import SharedStore, shared_store
+from utils.sql_guard import SQL_KEYWORDS, SqlLexError, tokenize
+
+# default：读写缓存；refresh：忽略已有缓存重新执行并写入；bypass：不读也不写缓存
+CacheMode = Literal["default", "refresh", "bypass"]
+
+# 共享存储中查询结果的命名空间
+_STORE_NAMESPACE = "result"
+
+# 规范化时统一转为大写的关键字；类型名和时间单位可能被用作表名，而表名在部分系统上区分大小写，不做转换
+_CASE_INSENSITIVE_KEYWORDS = SQL_KEYWORDS - {
+    "CHAR", "DATE", "DATETIME", "TIME", "YEAR", "MONTH", "DAY", "HOUR", "MINUTE", "SECOND", "WEEK", "QUARTER",
+    "MICROSECOND",
+}
+
+
+@lru_cache(maxsize=SQL_GUARD_CACHE_SIZE)
+def normalize_sql(sql: str) -> str:
+    """
+    规范化SQL文本作为缓存键：按词法单元切分后以单个空格连接，忽略注释、多余空白和末尾分号，关键字转为大写，
+    字符串和带引号的标识符原样保留；无法切分（如引号未闭合）时只去除首尾空白
+    :param sql: SQL语句
+    :return: 规范化后的SQL
+    """
+    try:
+        tokens = tokenize(sql)
+    except SqlLexError:
+        return sql.strip()
+    while tokens and tokens[-1] == ("punct", ";"):
+        tokens.pop()
+    return " ".join(
+        value.upper() if kind == "word" and value.upper() in _CASE_INSENSITIVE_KEYWORDS else value
+        for kind, value in tokens
+    )
+
+
+@dataclass
+class _CacheEntry:
+    value: Any
+    size: int
+    expires_at: float
+
+
+class ResultCache:
+    """
+    SQL 查询结果缓存
+    以（数据库标识, 规范化SQL）为键，每个条目有独立的有效期，总占用按字节数限制并按 LRU 淘汰
+    配置了共享存储时作为二级缓存：本地未命中再读共享存储，一个进程写入的结果其他进程也能命中，
+    写入共享存储的值须是可 JSON 序列化或已登记到共享存储的类型
+    """
+
+    def __init__(
+            self,
+            max_bytes: int = RESULT_CACHE_MAX_BYTES,
+            ttl: int = RESULT_CACHE_TTL,
+            store: SharedStore | None = shared_store,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = store
+        self._entries: OrderedDict[tuple[str, str], _CacheEntry] = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+
+    async def get(self, conn_config: DatabaseConnectionConfig, sql: str) -> Any | None:
+        """
+        读取缓存的查询结果
+        :param conn_config: 数据库连接配置
+        :param sql: SQL语句
+        :return: 查询结果，未命中或已过期时返回 None
+        """
+        key = (conn_config.conn_key, normalize_sql(sql))
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            entry = await self._get_shared(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    async def set(
+            self,
+            conn_config: DatabaseConnectionConfig,
+            sql: str,
+            value: Any,
+            ttl: int | None = None,
+            size: int | None = None,
+    ) -> None:
+        """
+        写入查询结果，超出字节上限时淘汰最久未使用的条目
+        :param conn_config: 数据库连接配置
+        :param sql: SQL语句
+        :param value: 查询结果
+        :param ttl: 有效期（秒），默认使用全局配置
+        :param size: 查询结果占用的字节数，默认按 JSON 序列化后的长度估算
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        if size is None:
+            size = len(json.dumps(value, ensure_ascii=False, default=str).encode())
+        # 单个结果超过总上限的四分之一时不缓存，避免一次写入清空整个缓存
+        if size > self.max_bytes // 4:
+            return
+
+        key = (conn_config.conn_key, normalize_sql(sql))
+        self._put(key, value, size, ttl)
+        if self.store is not None:
+            await self.store.set(_STORE_NAMESPACE, _store_key(key), (value, size), ttl=ttl)
+
+    async def invalidate(self, conn_config: DatabaseConnectionConfig | None = None) -> None:
+        """
+        清除缓存
+        :param conn_config: 只清除该数据库的缓存，为 None 时清除全部
+        """
+        if self.store is not None:
+            await self.store.delete_prefix(_STORE_NAMESPACE, _store_key((conn_config.conn_key, "")) if conn_config else "")
+        if conn_config is None:
+            self._entries.clear()
+            self._total_bytes = 0
+            return
+
+        for key in [key for key in self._entries if key[0] == conn_config.conn_key]:
+            self._remove(key)
+
+    def stats(self) -> dict[str, int]:
+        """缓存统计信息"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared_hits": self.shared_hits,
+        }
+
+    async def _get_shared(self, key: tuple[str, str]) -> _CacheEntry | None:
+        # 共享存储命中后写入本地，本地有效期取共享条目的剩余有效期
+        stored = await self.store.get(_STORE_NAMESPACE, _store_key(key)) if self.store is not None else None
+        if stored is None:
+            return None
+        value, size = stored.value
+        remaining = stored.remaining()
+        self._put(key, value, size, self.ttl if remaining is None else remaining)
+        self.shared_hits += 1
+        return self._entries.get(key)
+
+    def _put(self, key: tuple[str, str], value: Any, size: int, ttl: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CacheEntry(value=value, size=size, expires_at=time.monotonic() + ttl)
+        self._total_bytes += size
+
+        while self._total_bytes > self.max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: tuple[str, str]) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+
+
+def _store_key(key: tuple[str, str]) -> str:
+    return f"{key[0]}\x00{key[1]}"
+
+
+result_cache = ResultCache()
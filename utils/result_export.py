@@ -0,0 +1,320 @@
+import asyncio
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Literal
+
+from pymysql.constants import FIELD_TYPE
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import EXPORT_BATCH_ROWS
+from utils.logger import logger
+from utils.result_cache import CacheMode, result_cache
+from utils.sql_executor import ColumnType, open_row_stream
+from utils.tracing import span
+
+ExportFormat = Literal["csv", "ndjson", "arrow", "parquet"]
+
+# 整数类型 -> 位数
+_INTEGER_BITS = {
+    FIELD_TYPE.TINY: 8,
+    FIELD_TYPE.SHORT: 16,
+    FIELD_TYPE.INT24: 32,
+    FIELD_TYPE.LONG: 32,
+    FIELD_TYPE.LONGLONG: 64,
+}
+# 取值为字符串，字符集为 binary 时取值为 bytes 的类型
+_TEXT_TYPES = {
+    FIELD_TYPE.VARCHAR, FIELD_TYPE.VAR_STRING, FIELD_TYPE.STRING, FIELD_TYPE.ENUM, FIELD_TYPE.SET,
+    FIELD_TYPE.TINY_BLOB, FIELD_TYPE.MEDIUM_BLOB, FIELD_TYPE.LONG_BLOB, FIELD_TYPE.BLOB,
+}
+
+
+def _import_pyarrow() -> Any:
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise RuntimeError("导出 Arrow/Parquet 格式需要先安装 pyarrow 包：pip install pyarrow") from e
+    return pyarrow
+
+
+def arrow_type(column: ColumnType) -> Any:
+    """
+    将 MySQL 列类型映射为 Arrow 类型
+    :param column: 结果列类型
+    :return: Arrow 类型，类型未知时返回 None，由第一批取值推断
+    """
+    pa = _import_pyarrow()
+    code = column.type_code
+    if code is None:
+        return None
+    if code in _INTEGER_BITS:
+        return getattr(pa, f"{'u' if column.unsigned else ''}int{_INTEGER_BITS[code]}")()
+    if code == FIELD_TYPE.YEAR:
+        return pa.int16()
+    if code == FIELD_TYPE.FLOAT:
+        return pa.float32()
+    if code == FIELD_TYPE.DOUBLE:
+        return pa.float64()
+    if code in (FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+        # 字段长度包含小数点和符号位
+        precision = column.length - (1 if column.scale else 0) - (0 if column.unsigned else 1)
+        precision = min(max(precision, column.scale, 1), 76)
+        return pa.decimal128(precision, column.scale) if precision <= 38 else pa.decimal256(precision, column.scale)
+    if code in (FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE):
+        return pa.date32()
+    if code in (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+        return pa.timestamp("us")
+    if code == FIELD_TYPE.TIME:
+        return pa.duration("us")
+    if code in (FIELD_TYPE.BIT, FIELD_TYPE.GEOMETRY):
+        return pa.binary()
+    if code in _TEXT_TYPES and column.binary:
+        return pa.binary()
+    return pa.string()
+
+
+def _text_value(value: Any) -> Any:
+    return value.hex() if isinstance(value, (bytes, bytearray)) else value
+
+
+def _json_default(value: Any) -> str:
+    return value.hex() if isinstance(value, (bytes, bytearray)) else str(value)
+
+
+def _binary_columns(columns: list[ColumnType]) -> list[int]:
+    # 可能返回 bytes 的列，只对这些列逐个转换取值；类型未知的列都需要检查
+    return [
+        index for index, column in enumerate(columns)
+        if column.type_code is None or column.binary or column.type_code in (FIELD_TYPE.BIT, FIELD_TYPE.GEOMETRY)
+    ]
+
+
+def _hex_binary(rows: list[tuple], indexes: list[int]) -> list[Any]:
+    if not indexes:
+        return rows
+    converted = []
+    for row in rows:
+        row = list(row)
+        for index in indexes:
+            row[index] = _text_value(row[index])
+        converted.append(row)
+    return converted
+
+
+class ExportWriter:
+    """把逐批读取的结果行编码为导出格式，每次调用返回可以直接发送给客户端的字节"""
+    media_type = "application/octet-stream"
+    extension = "bin"
+
+    def begin(self, columns: list[ColumnType]) -> bytes:
+        """开始导出，返回文件头"""
+        raise NotImplementedError
+
+    def write(self, rows: list[tuple]) -> bytes:
+        """编码一批行"""
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        """结束导出，返回文件尾"""
+        return b""
+
+
+class CsvWriter(ExportWriter):
+    """CSV，带 UTF-8 BOM 以便 Excel 正确识别中文，二进制取值导出为十六进制"""
+    media_type = "text/csv; charset=utf-8"
+    extension = "csv"
+
+    def __init__(self):
+        self._binary: list[int] = []
+
+    def begin(self, columns: list[ColumnType]) -> bytes:
+        self._binary = _binary_columns(columns)
+        return "\ufeff".encode() + self._encode([[column.name for column in columns]])
+
+    def write(self, rows: list[tuple]) -> bytes:
+        return self._encode(_hex_binary(rows, self._binary))
+
+    @staticmethod
+    def _encode(rows: Any) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+
+class NdjsonWriter(ExportWriter):
+    """每行一个 JSON 对象，与 /api/results/{result_id}/rows 的格式相同"""
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def __init__(self):
+        self._names: list[str] = []
+        self._encoder = json.JSONEncoder(ensure_ascii=False, default=_json_default)
+
+    def begin(self, columns: list[ColumnType]) -> bytes:
+        self._names = [column.name for column in columns]
+        return b""
+
+    def write(self, rows: list[tuple]) -> bytes:
+        encode, names = self._encoder.encode, self._names
+        return "".join([encode(dict(zip(names, row))) + "\n" for row in rows]).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加的输出，Arrow/Parquet 写入的字节在每批之后取出发送"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ArrowWriter(ExportWriter):
+    """
+    Arrow IPC 流或 Parquet，每批行转换为一个 RecordBatch（Parquet 中为一个行组）
+    列类型由 MySQL 列类型映射，无法转换为该类型的取值导出为空值
+    """
+
+    def __init__(self, parquet: bool = False):
+        self.pa = _import_pyarrow()
+        self.parquet = parquet
+        self.media_type = "application/vnd.apache.parquet" if parquet else "application/vnd.apache.arrow.stream"
+        self.extension = "parquet" if parquet else "arrow"
+        self.invalid = 0
+        self._columns: list[ColumnType] = []
+        self._schema = None
+        self._sink = _ChunkSink()
+        self._writer = None
+
+    def begin(self, columns: list[ColumnType]) -> bytes:
+        self._columns = columns
+        types = [arrow_type(column) for column in columns]
+        if all(type_ is not None for type_ in types):
+            self._open(types)
+        return self._sink.drain()
+
+    def write(self, rows: list[tuple]) -> bytes:
+        values = list(zip(*rows)) if rows else [[] for _ in self._columns]
+        if self._schema is None:
+            # 类型未知的列按第一批取值推断，全为空值时按字符串处理
+            types = []
+            for column, column_values in zip(self._columns, values):
+                type_ = arrow_type(column)
+                if type_ is None:
+                    type_ = self._array(column_values, None).type
+                    type_ = self.pa.string() if self.pa.types.is_null(type_) else type_
+                types.append(type_)
+            self._open(types)
+        arrays = [self._array(column_values, field.type) for column_values, field in zip(values, self._schema)]
+        self._writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        if self._schema is None:
+            self._open([arrow_type(column) or self.pa.string() for column in self._columns])
+        self._writer.close()
+        if self.invalid:
+            logger.warning(f"导出时有 {self.invalid} 个取值无法转换为对应的列类型，已导出为空值")
+        return self._sink.drain()
+
+    def _open(self, types: list[Any]) -> None:
+        self._schema = self.pa.schema([self.pa.field(column.name, type_) for column, type_ in zip(self._columns, types)])
+        output = self.pa.PythonFile(self._sink, mode="w")
+        if self.parquet:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(output, self._schema)
+        else:
+            self._writer = self.pa.ipc.new_stream(output, self._schema)
+
+    def _array(self, values: Any, type_: Any) -> Any:
+        try:
+            return self.pa.array(values, type=type_)
+        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError, OverflowError):
+            # 个别取值不合法（如 0000-00-00 日期）时逐个转换，失败的取值置为空值
+            converted = []
+            for value in values:
+                try:
+                    self.pa.scalar(value, type=type_)
+                except (self.pa.ArrowInvalid, self.pa.ArrowTypeError, OverflowError):
+                    self.invalid += 1
+                    value = None
+                converted.append(value)
+            return self.pa.array(converted, type=type_)
+
+
+def create_writer(export_format: ExportFormat) -> ExportWriter:
+    """
+    创建导出格式对应的编码器
+    :param export_format: csv、ndjson、arrow、parquet
+    :return: 编码器，Arrow/Parquet 格式未安装 pyarrow 时抛出 RuntimeError
+    """
+    if export_format == "csv":
+        return CsvWriter()
+    if export_format == "ndjson":
+        return NdjsonWriter()
+    return ArrowWriter(parquet=export_format == "parquet")
+
+
+async def export_rows(
+        conn_config: DatabaseConnectionConfig,
+        sql: str,
+        writer: ExportWriter,
+        cache_mode: CacheMode = "default",
+        batch_size: int = EXPORT_BATCH_ROWS,
+) -> AsyncIterator[bytes]:
+    """
+    导出SQL查询的完整结果：结果缓存中有未截断的完整结果时直接导出，否则重新执行，
+    使用服务端游标逐批读取并编码，内存占用只与每批行数有关
+    :param conn_config: 数据库连接配置
+    :param sql: SQL查询语句
+    :param writer: 导出格式的编码器
+    :param cache_mode: 结果缓存模式，refresh/bypass 时总是重新执行
+    :param batch_size: 每批读取和编码的行数
+    :return: 逐批返回的导出内容
+    """
+    with span("result.export", format=writer.extension) as export_span:
+        row_count = byte_count = 0
+        cached = await result_cache.get(conn_config, sql) if cache_mode == "default" else None
+        if cached is not None and not cached.truncated:
+            export_span.set(cached=True)
+            chunk = writer.begin([ColumnType(name, None) for name in cached.columns])
+            byte_count += len(chunk)
+            yield chunk
+            for start in range(0, cached.row_count, batch_size):
+                rows = [tuple(row[name] for name in cached.columns) for row in cached.rows[start:start + batch_size]]
+                chunk = await asyncio.to_thread(writer.write, rows)
+                row_count += len(rows)
+                byte_count += len(chunk)
+                yield chunk
+        else:
+            async with open_row_stream(conn_config, sql, batch_size) as stream:
+                chunk = writer.begin(stream.columns)
+                byte_count += len(chunk)
+                yield chunk
+                async for rows in stream:
+                    # 编码在线程中进行，不阻塞事件循环
+                    chunk = await asyncio.to_thread(writer.write, rows)
+                    row_count += len(rows)
+                    byte_count += len(chunk)
+                    if chunk:
+                        yield chunk
+        chunk = writer.finish()
+        export_span.set(rows=row_count, bytes=byte_count + len(chunk))
+        yield chunk
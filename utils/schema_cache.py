@@ -0,0 +1,265 @@
+import asyncio
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator
+
+import aiomysql
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import SCHEMA_CHECK_INTERVAL
+from utils.logger import logger
+from utils.replica_router import replica_router
+from utils.shared_store import SharedStore, shared_store
+from utils.tracing import span
+
+# 共享存储中表结构的命名空间
+_STORE_NAMESPACE = "schema"
+
+# 表结构版本：表、列和外键的数量以及各自定义的校验和，任一表、列或外键的增删改都会改变版本
+SCHEMA_VERSION_SQL = """
+                     SELECT (SELECT COUNT(*)
+                             FROM INFORMATION_SCHEMA.TABLES
+                             WHERE TABLE_SCHEMA = DATABASE()) AS table_count,
+                            (SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', TABLE_NAME, TABLE_COMMENT, CREATE_TIME))), 0)
+                             FROM INFORMATION_SCHEMA.TABLES
+                             WHERE TABLE_SCHEMA = DATABASE()) AS table_checksum,
+                            (SELECT COUNT(*)
+                             FROM INFORMATION_SCHEMA.COLUMNS
+                             WHERE TABLE_SCHEMA = DATABASE()) AS column_count,
+                            (SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, ORDINAL_POSITION,
+                                                                 COLUMN_TYPE, COLUMN_COMMENT))), 0)
+                             FROM INFORMATION_SCHEMA.COLUMNS
+                             WHERE TABLE_SCHEMA = DATABASE()) AS column_checksum,
+                            (SELECT COUNT(*)
+                             FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+                             WHERE TABLE_SCHEMA = DATABASE()
+                               AND REFERENCED_TABLE_NAME IS NOT NULL) AS key_count,
+                            (SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME,
+                                                                 REFERENCED_COLUMN_NAME))), 0)
+                             FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+                             WHERE TABLE_SCHEMA = DATABASE()
+                               AND REFERENCED_TABLE_NAME IS NOT NULL) AS key_checksum
+                     """
+
+TABLES_SQL = """
+             SELECT TABLE_NAME, TABLE_COMMENT
+             FROM INFORMATION_SCHEMA.TABLES
+             WHERE TABLE_SCHEMA = DATABASE()
+             ORDER BY TABLE_NAME
+             """
+
+COLUMNS_SQL = """
+              SELECT TABLE_NAME,
+                     COLUMN_NAME,
+                     COLUMN_TYPE,
+                     COLUMN_COMMENT
+              FROM INFORMATION_SCHEMA.COLUMNS
+              WHERE TABLE_SCHEMA = DATABASE()
+              ORDER BY TABLE_NAME, ORDINAL_POSITION
+              """
+
+FOREIGN_KEYS_SQL = """
+                   SELECT TABLE_NAME,
+                          COLUMN_NAME,
+                          REFERENCED_TABLE_NAME,
+                          REFERENCED_COLUMN_NAME
+                   FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+                   WHERE TABLE_SCHEMA = DATABASE()
+                     AND REFERENCED_TABLE_SCHEMA = DATABASE()
+                     AND REFERENCED_TABLE_NAME IS NOT NULL
+                   ORDER BY TABLE_NAME, ORDINAL_POSITION
+                   """
+
+
+@dataclass
+class SchemaSnapshot:
+    """某个数据库在某一版本下的表结构"""
+    version: str
+    tables: dict[str, dict[str, Any]]
+    loaded_at: float = field(default_factory=time.time)
+    checked_at: float = field(default_factory=time.monotonic)
+    index: Any = field(default=None, repr=False)  # 基于该版本表结构构建的检索索引，首次检索时构建
+
+
+# 当前上下文固定使用的表结构快照（数据库标识 -> 快照），批量查询期间不再重复检查版本
+_pinned_var: ContextVar[dict[str, SchemaSnapshot] | None] = ContextVar("pinned_schema", default=None)
+
+
+class SchemaCache:
+    """
+    按数据库缓存表结构
+    在检查间隔内直接返回缓存，超过间隔后只执行一次轻量的版本查询，版本变化时才重新加载表结构
+    多进程部署时加载的表结构写入共享存储，其他进程只需执行版本查询即可复用
+    """
+
+    def __init__(self, check_interval: int = SCHEMA_CHECK_INTERVAL, store: SharedStore | None = shared_store):
+        self.check_interval = check_interval
+        self.store = store
+        self._snapshots: dict[str, SchemaSnapshot] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._listeners: list[Callable[[DatabaseConnectionConfig], Awaitable[None] | None]] = []
+
+    def add_invalidation_listener(
+            self, listener: Callable[[DatabaseConnectionConfig], Awaitable[None] | None]
+    ) -> None:
+        """
+        注册表结构变化回调，表结构版本变化或被手动失效时调用
+        :param listener: 回调函数（可以是协程函数），参数为发生变化的数据库连接配置
+        """
+        self._listeners.append(listener)
+
+    async def get_schema(self, conn_config: DatabaseConnectionConfig, force_refresh: bool = False) -> SchemaSnapshot:
+        """
+        获取数据库表结构
+        :param conn_config: 数据库连接配置
+        :param force_refresh: 是否忽略缓存强制重新加载
+        :return: 表结构快照
+        """
+        key = conn_config.conn_key
+        pinned = (_pinned_var.get() or {}).get(key)
+        if not force_refresh and pinned is not None:
+            return pinned
+        snapshot = self._snapshots.get(key)
+        if not force_refresh and snapshot and time.monotonic() - snapshot.checked_at < self.check_interval:
+            return snapshot
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # 等待锁期间其他请求可能已经完成了加载
+            snapshot = self._snapshots.get(key)
+            if not force_refresh and snapshot and time.monotonic() - snapshot.checked_at < self.check_interval:
+                return snapshot
+            if snapshot is None:
+                snapshot = await self._load_shared(key)
+
+            async with replica_router.acquire(conn_config) as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    version = await self._fetch_version(cursor)
+                    if not force_refresh and snapshot and snapshot.version == version:
+                        snapshot.checked_at = time.monotonic()
+                        self._snapshots[key] = snapshot
+                        return snapshot
+
+                    with span("schema.load") as load_span:
+                        tables = await self._load_tables(cursor)
+                        load_span.set(tables=len(tables))
+
+            new_snapshot = SchemaSnapshot(version=version, tables=tables)
+            self._snapshots[key] = new_snapshot
+            if self.store is not None:
+                await self.store.set(_STORE_NAMESPACE, key, (version, tables, new_snapshot.loaded_at))
+            logger.info(f"加载数据库表结构：{conn_config.database_name}，共 {len(tables)} 张表，版本 {version}")
+
+        # 版本变化或手动刷新时通知依赖表结构的缓存失效
+        if snapshot and (force_refresh or snapshot.version != version):
+            await self._notify(conn_config)
+
+        return new_snapshot
+
+    async def refresh(self, conn_config: DatabaseConnectionConfig) -> SchemaSnapshot:
+        """
+        强制重新加载数据库表结构
+        :param conn_config: 数据库连接配置
+        :return: 表结构快照
+        """
+        return await self.get_schema(conn_config, force_refresh=True)
+
+    @contextmanager
+    def pin(self, conn_config: DatabaseConnectionConfig, snapshot: SchemaSnapshot) -> Iterator[SchemaSnapshot]:
+        """
+        在上下文内（包括其中创建的子任务）固定使用同一份表结构快照
+        :param conn_config: 数据库连接配置
+        :param snapshot: 表结构快照
+        :return: 表结构快照
+        """
+        token = _pinned_var.set({**(_pinned_var.get() or {}), conn_config.conn_key: snapshot})
+        try:
+            yield snapshot
+        finally:
+            _pinned_var.reset(token)
+
+    async def invalidate(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        丢弃数据库的表结构缓存
+        :param conn_config: 数据库连接配置
+        """
+        if self.store is not None:
+            await self.store.delete(_STORE_NAMESPACE, conn_config.conn_key)
+        if self._snapshots.pop(conn_config.conn_key, None) is not None:
+            await self._notify(conn_config)
+
+    def forget(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        只丢弃本进程的表结构副本，共享存储中的表结构和依赖表结构的缓存不受影响
+        :param conn_config: 数据库连接配置
+        """
+        self._snapshots.pop(conn_config.conn_key, None)
+
+    async def _load_shared(self, key: str) -> SchemaSnapshot | None:
+        # 共享存储中的表结构可能已过时，checked_at 置 0 使其先经过一次版本查询才被使用
+        stored = await self.store.get(_STORE_NAMESPACE, key) if self.store is not None else None
+        if stored is None:
+            return None
+        version, tables, loaded_at = stored.value
+        return SchemaSnapshot(version=version, tables=tables, loaded_at=loaded_at, checked_at=0.0)
+
+    async def _notify(self, conn_config: DatabaseConnectionConfig) -> None:
+        for listener in self._listeners:
+            try:
+                result = listener(conn_config)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"表结构变化回调执行失败: {e}")
+
+    @staticmethod
+    async def _fetch_version(cursor: aiomysql.DictCursor) -> str:
+        await cursor.execute(SCHEMA_VERSION_SQL)
+        row = await cursor.fetchone()
+        return (f"{row['table_count']}-{row['table_checksum']}-{row['column_count']}-{row['column_checksum']}"
+                f"-{row['key_count']}-{row['key_checksum']}")
+
+    @staticmethod
+    async def _load_tables(cursor: aiomysql.DictCursor) -> dict[str, dict[str, Any]]:
+        # 表、列和外键各用一次批量查询获取，在内存中按表分组
+        await cursor.execute(TABLES_SQL)
+        tables = await cursor.fetchall()
+
+        schema = {
+            table['TABLE_NAME']: {
+                "description": table['TABLE_COMMENT'] or None,
+                "columns": [],
+            }
+            for table in tables
+        }
+
+        await cursor.execute(COLUMNS_SQL)
+        for col in await cursor.fetchall():
+            table = schema.get(col['TABLE_NAME'])
+            if table is None:
+                continue
+            table["columns"].append({
+                "name": col['COLUMN_NAME'],
+                "type": col['COLUMN_TYPE'],
+                "comment": col['COLUMN_COMMENT'] or None,
+            })
+
+        # 外键关系只在存在时写入，便于模型生成关联查询
+        await cursor.execute(FOREIGN_KEYS_SQL)
+        for fk in await cursor.fetchall():
+            table = schema.get(fk['TABLE_NAME'])
+            if table is None:
+                continue
+            table.setdefault("foreign_keys", []).append({
+                "column": fk['COLUMN_NAME'],
+                "ref_table": fk['REFERENCED_TABLE_NAME'],
+                "ref_column": fk['REFERENCED_COLUMN_NAME'],
+            })
+
+        return schema
+
+
+schema_cache = SchemaCache()
@@ -0,0 +1,211 @@
+import math
+import re
+from collections import defaultdict
+from typing import Any, Callable
+
+from utils.logger import logger
+from utils.schema_cache import SchemaSnapshot
+
+# 可插拔的向量模型：输入一批文本，返回等长的向量列表
+Embedder = Callable[[list[str]], list[list[float]]]
+
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+_CAMEL_PATTERN = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+_CJK_PATTERN = re.compile(r'[一-鿿]+')
+
+# 不同来源文本的权重，表名最能代表表的含义
+TABLE_NAME_WEIGHT = 3.0
+TABLE_COMMENT_WEIGHT = 2.0
+COLUMN_NAME_WEIGHT = 1.0
+COLUMN_COMMENT_WEIGHT = 1.0
+
+# 完整单词命中比三元组（用于模糊匹配单复数、缩写等）命中更可信
+WORD_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.3
+CJK_BIGRAM_WEIGHT = 1.0
+CJK_UNIGRAM_WEIGHT = 0.3
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.5
+
+_embedder: Embedder | None = None
+_embedding_weight = 0.5
+
+
+def set_embedder(embedder: Embedder | None, weight: float = 0.5) -> None:
+    """
+    设置向量模型，设置后新构建的索引会将向量相似度与词法得分按权重融合
+    :param embedder: 向量模型，None 表示只使用词法检索
+    :param weight: 向量相似度所占权重（0~1）
+    """
+    global _embedder, _embedding_weight
+    _embedder = embedder
+    _embedding_weight = weight
+
+
+def tokenize(text: str | None) -> dict[str, float]:
+    """
+    将表名、列名、注释或用户问题切分为检索词
+    英文标识符按下划线和驼峰拆成单词并生成三元组，中文生成单字和二元组
+    :param text: 文本
+    :return: {检索词: 权重}
+    """
+    tokens: dict[str, float] = defaultdict(float)
+    if not text:
+        return tokens
+
+    for raw_word in _WORD_PATTERN.findall(text):
+        for word in _CAMEL_PATTERN.split(raw_word):
+            word = word.lower()
+            tokens[f"w:{word}"] += WORD_WEIGHT
+            if len(word) >= 3:
+                padded = f"#{word}#"
+                for i in range(len(padded) - 2):
+                    tokens[f"t:{padded[i:i + 3]}"] += TRIGRAM_WEIGHT
+
+    for run in _CJK_PATTERN.findall(text):
+        for i, ch in enumerate(run):
+            tokens[f"c:{ch}"] += CJK_UNIGRAM_WEIGHT
+            if i + 1 < len(run):
+                tokens[f"b:{run[i:i + 2]}"] += CJK_BIGRAM_WEIGHT
+
+    return tokens
+
+
+def _table_text(table_name: str, table: dict[str, Any]) -> str:
+    columns = " ".join(f"{col['name']} {col.get('comment') or ''}" for col in table["columns"])
+    return f"{table_name} {table.get('description') or ''} {columns}"
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SchemaIndex:
+    """基于表名、列名和注释的倒排索引，按 BM25 对表进行相关性排序"""
+
+    def __init__(self, tables: dict[str, dict[str, Any]], embedder: Embedder | None = None,
+                 embedding_weight: float = 0.5):
+        self.tables = tables
+        self.table_names = list(tables)
+        self.embedder = embedder
+        self.embedding_weight = embedding_weight
+
+        postings: dict[str, list[tuple[int, float]]] = defaultdict(list)
+        doc_lengths: list[float] = []
+        self._referenced_by: dict[str, set[str]] = defaultdict(set)
+
+        for doc_id, table_name in enumerate(self.table_names):
+            table = tables[table_name]
+            term_freqs: dict[str, float] = defaultdict(float)
+            for text, weight in self._table_fields(table_name, table):
+                for token, token_weight in tokenize(text).items():
+                    term_freqs[token] += token_weight * weight
+            for token, freq in term_freqs.items():
+                postings[token].append((doc_id, freq))
+            doc_lengths.append(sum(term_freqs.values()))
+
+            for fk in table.get("foreign_keys", []):
+                self._referenced_by[fk["ref_table"]].add(table_name)
+
+        doc_count = len(self.table_names)
+        avg_length = (sum(doc_lengths) / doc_count) if doc_count else 0.0
+        length_norms = [1 - BM25_B + BM25_B * length / avg_length for length in doc_lengths]
+
+        # 构建时即算好每个检索词对每张表的 BM25 得分，检索时只需按问题中的检索词累加
+        self._scores: dict[str, list[tuple[int, float]]] = {}
+        for token, token_postings in postings.items():
+            idf = math.log(1 + (doc_count - len(token_postings) + 0.5) / (len(token_postings) + 0.5))
+            self._scores[token] = [
+                (doc_id, idf * freq * (BM25_K1 + 1) / (freq + BM25_K1 * length_norms[doc_id]))
+                for doc_id, freq in token_postings
+            ]
+
+        self._embeddings: list[list[float]] | None = None
+        if embedder is not None and doc_count:
+            self._embeddings = embedder([_table_text(name, tables[name]) for name in self.table_names])
+
+    @staticmethod
+    def _table_fields(table_name: str, table: dict[str, Any]):
+        yield table_name, TABLE_NAME_WEIGHT
+        yield table.get("description"), TABLE_COMMENT_WEIGHT
+        for col in table["columns"]:
+            yield col["name"], COLUMN_NAME_WEIGHT
+            yield col.get("comment"), COLUMN_COMMENT_WEIGHT
+
+    def search(self, question: str, top_k: int) -> list[tuple[str, float]]:
+        """
+        按问题检索最相关的表
+        :param question: 用户问题
+        :param top_k: 返回的表数量
+        :return: [(表名, 得分), ...]，按得分从高到低排列，不包含得分为 0 的表
+        """
+        scores: dict[int, float] = defaultdict(float)
+        for token, query_weight in tokenize(question).items():
+            for doc_id, score in self._scores.get(token, ()):
+                scores[doc_id] += query_weight * score
+
+        if self._embeddings is not None:
+            # 向量相似度与归一化后的词法得分按权重融合
+            max_score = max(scores.values(), default=0.0) or 1.0
+            query_embedding = self.embedder([question])[0]
+            for doc_id, embedding in enumerate(self._embeddings):
+                similarity = _cosine(query_embedding, embedding)
+                scores[doc_id] = ((1 - self.embedding_weight) * scores.get(doc_id, 0.0) / max_score
+                                  + self.embedding_weight * similarity)
+
+        ranked = sorted(((score, doc_id) for doc_id, score in scores.items() if score > 0), reverse=True)
+        return [(self.table_names[doc_id], score) for score, doc_id in ranked[:top_k]]
+
+    def related_tables(self, table_names: list[str], candidates: set[str] | None = None) -> list[str]:
+        """
+        获取与给定表通过外键直接关联的表
+        被引用的表总是返回；引用给定表的表可能非常多（如用户表），只返回同样出现在候选集合中的
+        :param table_names: 表名列表
+        :param candidates: 候选表集合，为 None 时不返回引用给定表的表
+        :return: 关联表名列表（不含给定的表）
+        """
+        selected = set(table_names)
+        related = []
+        for table_name in table_names:
+            neighbours = {fk["ref_table"] for fk in self.tables[table_name].get("foreign_keys", [])}
+            if candidates:
+                neighbours |= self._referenced_by.get(table_name, set()) & candidates
+            for neighbour in sorted(neighbours):
+                if neighbour not in selected and neighbour in self.tables:
+                    selected.add(neighbour)
+                    related.append(neighbour)
+        return related
+
+
+def get_schema_index(snapshot: SchemaSnapshot) -> SchemaIndex:
+    """
+    获取表结构快照对应的检索索引，每个表结构版本只构建一次
+    :param snapshot: 表结构快照
+    :return: 检索索引
+    """
+    if snapshot.index is None:
+        snapshot.index = SchemaIndex(snapshot.tables, embedder=_embedder, embedding_weight=_embedding_weight)
+    return snapshot.index
+
+
+def prune_schema(snapshot: SchemaSnapshot, question: str, top_k: int) -> dict[str, dict[str, Any]]:
+    """
+    只保留与问题最相关的 top_k 张表以及通过外键与其关联的表，
+    问题与任何表都不匹配时（如问题用词与表名、注释完全不同）返回全部表结构，不能让模型误以为读取不到表结构
+    :param snapshot: 表结构快照
+    :param question: 用户问题
+    :param top_k: 保留的相关表数量
+    :return: 与 SchemaSnapshot.tables 结构相同的裁剪后表结构
+    """
+    index = get_schema_index(snapshot)
+    candidates = [table_name for table_name, _ in index.search(question, top_k * 3)]
+    if not candidates:
+        logger.info("问题与所有表都不匹配，返回全部表结构")
+        return dict(snapshot.tables)
+    matched = candidates[:top_k]
+    related = index.related_tables(matched, set(candidates))
+    return {table_name: snapshot.tables[table_name] for table_name in matched + related}
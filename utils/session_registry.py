@@ -0,0 +1,214 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import SESSION_IDLE_TIMEOUT, SESSION_MAX_COUNT, SESSION_EVICT_INTERVAL
+from utils.db_pool import pool_manager
+from utils.logger import logger
+from utils.replica_router import replica_router
+from utils.schema_cache import schema_cache
+from utils.shared_store import SharedStore, shared_store
+from utils.value_index import value_indexer
+
+# 共享存储中会话的命名空间
+_STORE_NAMESPACE = "session"
+
+# 当前请求所属的会话 ID，在 hold 期间有效，结果句柄据此归属到会话
+session_id_var: ContextVar[str | None] = ContextVar("session_id", default=None)
+
+
+@dataclass
+class Session:
+    """客户端会话，记录该会话使用的数据库连接配置"""
+    session_id: str
+    conn_config: DatabaseConnectionConfig
+    last_used: float = field(default_factory=time.monotonic)
+    active: int = 0  # 正在执行的请求数，大于 0 时不会因空闲被清理
+
+
+class SessionRegistry:
+    """
+    会话注册表
+    每个客户端通过 /api/connect 获得独立的会话，请求之间互不影响；
+    连接相同数据库的会话共用同一个连接池，最后一个使用该数据库的会话失效后关闭连接池并清除缓存
+    多进程部署时以共享存储中的会话为准，本地只保留副本，任一工作进程都能处理同一会话的请求
+    """
+
+    def __init__(
+            self,
+            idle_timeout: int = SESSION_IDLE_TIMEOUT,
+            max_sessions: int = SESSION_MAX_COUNT,
+            store: SharedStore | None = shared_store,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.store = store
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        # 其他工作进程切换了会话的数据库后，本进程待释放的旧连接配置
+        self._stale_configs: list[DatabaseConnectionConfig] = []
+
+    async def connect(self, conn_config: DatabaseConnectionConfig, session_id: str | None = None) -> Session:
+        """
+        为连接配置创建会话，传入已有的会话 ID 时切换该会话的数据库
+        :param conn_config: 数据库连接配置
+        :param session_id: 已有的会话 ID
+        :return: 会话
+        """
+        session = await self.get(session_id) if session_id else None
+        if session is not None:
+            old_config = session.conn_config
+            session.conn_config = conn_config
+            await self._save(session)
+            if old_config.conn_key != conn_config.conn_key:
+                await self._release(old_config)
+            return session
+
+        session = Session(session_id=uuid.uuid4().hex, conn_config=conn_config)
+        self._sessions[session.session_id] = session
+        await self._save(session)
+        while len(self._sessions) > self.max_sessions:
+            oldest_id = next(iter(self._sessions))
+            await self._evict(oldest_id)
+        return session
+
+    async def get(self, session_id: str) -> Session | None:
+        """
+        获取会话并刷新最近使用时间
+        :param session_id: 会话 ID
+        :return: 会话，不存在或已超时返回 None
+        """
+        session = self._sessions.get(session_id)
+        if self.store is not None:
+            session = await self._sync(session_id, session)
+        if session is None:
+            return None
+        if session.active == 0 and time.monotonic() - session.last_used > self.idle_timeout:
+            return None
+
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        await self._save(session)
+        return session
+
+    @asynccontextmanager
+    async def hold(self, session: Session) -> AsyncIterator[Session]:
+        """
+        标记会话正在使用，使用期间不会因空闲被清理
+        :param session: 会话
+        """
+        session.active += 1
+        token = session_id_var.set(session.session_id)
+        try:
+            yield session
+        finally:
+            session_id_var.reset(token)
+            session.active -= 1
+            session.last_used = time.monotonic()
+
+    async def close(self, session_id: str) -> bool:
+        """
+        关闭会话
+        :param session_id: 会话 ID
+        :return: 会话是否存在
+        """
+        if self.store is not None:
+            stored = await self.store.get(_STORE_NAMESPACE, session_id)
+            await self.store.delete(_STORE_NAMESPACE, session_id)
+        else:
+            stored = None
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return stored is not None
+        await self._release(session.conn_config)
+        return True
+
+    async def evict_idle(self) -> int:
+        """
+        清理空闲超时的会话
+        :return: 清理的会话数量
+        """
+        now = time.monotonic()
+        expired = [
+            session_id for session_id, session in self._sessions.items()
+            if session.active == 0 and now - session.last_used > self.idle_timeout
+        ]
+        for session_id in expired:
+            await self._evict(session_id)
+        while self._stale_configs:
+            await self._release(self._stale_configs.pop())
+        if expired:
+            logger.info(f"清理空闲会话 {len(expired)} 个，剩余 {len(self._sessions)} 个")
+        return len(expired)
+
+    async def run_eviction(self, interval: int = SESSION_EVICT_INTERVAL) -> None:
+        """定期清理空闲会话，在应用生命周期内以后台任务运行"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.error(f"清理空闲会话失败: {e}")
+
+    def stats(self) -> dict[str, int]:
+        """会话统计信息"""
+        return {
+            "sessions": len(self._sessions),
+            "databases": len({session.conn_config.conn_key for session in self._sessions.values()}),
+            "active": sum(1 for session in self._sessions.values() if session.active),
+        }
+
+    async def _save(self, session: Session) -> None:
+        # 每次使用都写回共享存储，以空闲超时时间作为有效期，其他进程据此判断会话是否仍然有效
+        if self.store is not None:
+            await self.store.set(_STORE_NAMESPACE, session.session_id, session.conn_config, ttl=self.idle_timeout)
+
+    async def _sync(self, session_id: str, session: Session | None) -> Session | None:
+        # 以共享存储为准：会话已被其他进程关闭或超时则丢弃本地副本，由其他进程创建的会话在本地补建
+        stored = await self.store.get(_STORE_NAMESPACE, session_id)
+        if stored is None:
+            # 正在执行请求的副本留待空闲后由定期清理释放
+            if session is not None and session.active == 0:
+                self._sessions.pop(session_id, None)
+                self._stale_configs.append(session.conn_config)
+            return None
+
+        conn_config: DatabaseConnectionConfig = stored.value
+        if session is None:
+            session = Session(session_id=session_id, conn_config=conn_config)
+            self._sessions[session_id] = session
+        elif session.conn_config.conn_key != conn_config.conn_key:
+            self._stale_configs.append(session.conn_config)
+            session.conn_config = conn_config
+        return session
+
+    async def _evict(self, session_id: str) -> None:
+        # 使用共享存储时本地淘汰只丢弃副本，会话本身仍可由其他进程继续使用，由存储的有效期决定何时失效
+        if self.store is None:
+            await self.close(session_id)
+            return
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            await self._release(session.conn_config)
+
+    async def _release(self, conn_config: DatabaseConnectionConfig) -> None:
+        # 仍有会话使用该数据库时保留连接池和缓存
+        if any(session.conn_config.conn_key == conn_config.conn_key for session in self._sessions.values()):
+            return
+        value_indexer.drop(conn_config)
+        await replica_router.release(conn_config)
+        await pool_manager.close_pool(conn_config)
+        # 使用共享存储时其他进程可能仍在使用该数据库，只丢弃本进程的表结构副本，不清除共享的缓存
+        if self.store is None:
+            await schema_cache.invalidate(conn_config)
+        else:
+            schema_cache.forget(conn_config)
+        logger.info(f"已释放数据库资源：{conn_config.host}:{conn_config.port}/{conn_config.database_name}")
+
+
+session_registry = SessionRegistry()
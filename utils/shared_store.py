@@ -0,0 +1,366 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Callable
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import SHARED_STORE, SHARED_STORE_PATH, SHARED_STORE_REDIS_URL, SHARED_STORE_SECRET
+from utils.logger import logger
+
+# sqlite 存储每写入多少次清理一次过期条目
+_PURGE_EVERY = 500
+# 带类型标记的值，如 {"$type": "decimal", "value": "1.50"}
+_TYPE_KEY = "$type"
+
+# 登记过的类型：类型 -> (标记, 编码函数)，标记 -> 解码函数
+_ENCODERS: dict[type, tuple[str, Callable[[Any], Any]]] = {}
+_DECODERS: dict[str, Callable[[Any], Any]] = {}
+
+_fernet = None
+
+
+@dataclass
+class StoredValue:
+    """共享存储中的值及其过期时间"""
+    value: Any
+    expires_at: float | None  # 过期的时间戳（time.time()），None 表示不过期
+
+    def remaining(self) -> float | None:
+        """剩余有效期（秒）"""
+        return None if self.expires_at is None else max(self.expires_at - time.time(), 0.0)
+
+
+def register_type(tag: str, cls: type, encode: Callable[[Any], Any], decode: Callable[[Any], Any]) -> None:
+    """
+    登记可以写入共享存储的类型，读取时只会还原登记过的类型，存储中的内容不能构造任意对象
+    :param tag: 类型标记
+    :param cls: 类型
+    :param encode: 把对象转换为可 JSON 序列化的值，其中可以包含其他登记过的类型
+    :param decode: 由 encode 的结果还原对象
+    """
+    _ENCODERS[cls] = (tag, encode)
+    _DECODERS[tag] = decode
+
+
+def _cipher():
+    global _fernet
+    if _fernet is None:
+        if not SHARED_STORE_SECRET:
+            raise RuntimeError("使用共享存储需要配置 SHARED_STORE_SECRET，用于加密保存数据库密码")
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError as e:
+            raise RuntimeError("共享存储中的数据库密码需要加密保存，请先安装 cryptography 包：pip install cryptography") from e
+        # 任意长度的密钥经 SHA-256 转换为 Fernet 需要的 32 字节密钥
+        _fernet = Fernet(base64.urlsafe_b64encode(hashlib.sha256(SHARED_STORE_SECRET.encode()).digest()))
+    return _fernet
+
+
+def seal_secret(secret: str) -> str:
+    """加密写入共享存储的密码"""
+    return _cipher().encrypt(secret.encode()).decode()
+
+
+def open_secret(token: str) -> str:
+    """
+    解密共享存储中的密码
+    :raise ValueError: 密钥不一致或内容被篡改
+    """
+    from cryptography.fernet import InvalidToken
+    try:
+        return _cipher().decrypt(token.encode()).decode()
+    except InvalidToken as e:
+        raise ValueError("共享存储中的密码无法解密") from e
+
+
+def _encode_default(value: Any) -> Any:
+    encoder = _ENCODERS.get(type(value))
+    if encoder is not None:
+        tag, encode = encoder
+        return {_TYPE_KEY: tag, "value": encode(value)}
+    if isinstance(value, Decimal):
+        return {_TYPE_KEY: "decimal", "value": str(value)}
+    if isinstance(value, datetime.datetime):
+        return {_TYPE_KEY: "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {_TYPE_KEY: "date", "value": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {_TYPE_KEY: "time", "value": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {_TYPE_KEY: "timedelta", "value": value // datetime.timedelta(microseconds=1)}
+    if isinstance(value, (bytes, bytearray)):
+        return {_TYPE_KEY: "bytes", "value": base64.b64encode(value).decode()}
+    if isinstance(value, (set, frozenset)):
+        return {_TYPE_KEY: "set", "value": list(value)}
+    raise TypeError(f"无法写入共享存储的类型：{type(value).__name__}")
+
+
+_SCALAR_DECODERS: dict[str, Callable[[Any], Any]] = {
+    "decimal": Decimal,
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "timedelta": lambda value: datetime.timedelta(microseconds=value),
+    "bytes": base64.b64decode,
+    "set": set,
+}
+
+
+def _decode_hook(obj: dict[str, Any]) -> Any:
+    tag = obj.get(_TYPE_KEY)
+    if tag is None or len(obj) != 2 or "value" not in obj:
+        return obj
+    decode = _SCALAR_DECODERS.get(tag) or _DECODERS.get(tag)
+    if decode is None:
+        raise ValueError(f"共享存储中有未知的类型：{tag}")
+    return decode(obj["value"])
+
+
+def dumps(value: Any) -> bytes:
+    """
+    把值序列化为 JSON，Decimal、日期时间、bytes 和登记过的类型带类型标记
+    :param value: 值
+    :return: JSON 字节串
+    """
+    return json.dumps(value, default=_encode_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data: bytes | str) -> Any:
+    """
+    反序列化 dumps 的结果，元组还原为列表
+    :param data: JSON 字节串
+    :return: 值
+    """
+    return json.loads(data, object_hook=_decode_hook)
+
+
+def _encode_conn_config(conn_config: DatabaseConnectionConfig) -> dict[str, Any]:
+    # 密码加密后写入，存储泄露时不会暴露数据库密码
+    data = conn_config.model_dump(by_alias=True, exclude={"password", "replicas"})
+    data["password"] = seal_secret(conn_config.password.get_secret_value())
+    data["replicas"] = [
+        {
+            **replica.model_dump(exclude={"password"}),
+            "password": seal_secret(replica.password.get_secret_value()) if replica.password else None,
+        }
+        for replica in conn_config.replicas
+    ]
+    return data
+
+
+def _decode_conn_config(data: dict[str, Any]) -> DatabaseConnectionConfig:
+    replicas = [
+        {**replica, "password": open_secret(replica["password"]) if replica["password"] else None}
+        for replica in data["replicas"]
+    ]
+    return DatabaseConnectionConfig(**{**data, "password": open_secret(data["password"]), "replicas": replicas})
+
+
+register_type("conn_config", DatabaseConnectionConfig, _encode_conn_config, _decode_conn_config)
+
+
+class SharedStore(ABC):
+    """
+    多个工作进程共享的键值存储，按命名空间区分会话、结果句柄、表结构和各类缓存
+    值以带类型标记的 JSON 序列化，只还原登记过的类型；读写和序列化都不在事件循环中执行
+    """
+    name = "base"
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> StoredValue | None:
+        """
+        读取值
+        :param namespace: 命名空间
+        :param key: 键
+        :return: 值，不存在、已过期或无法解析时返回 None
+        """
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> None:
+        """
+        写入值
+        :param namespace: 命名空间
+        :param key: 键
+        :param value: 值
+        :param ttl: 有效期（秒），None 表示不过期
+        """
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str) -> None:
+        """删除值"""
+
+    @abstractmethod
+    async def delete_prefix(self, namespace: str, prefix: str) -> None:
+        """删除命名空间下以 prefix 开头的所有键，用于按数据库清除缓存"""
+
+    @abstractmethod
+    async def stats(self) -> dict[str, Any]:
+        """各命名空间的条目数"""
+
+    @staticmethod
+    def _decode(namespace: str, key: str, data: bytes) -> Any:
+        try:
+            return loads(data)
+        except (ValueError, TypeError, KeyError) as e:
+            # 格式不兼容（如升级前写入的条目）或密码无法解密时当作不存在
+            logger.warning(f"共享存储中的值无法解析，已忽略：{namespace}/{key}，{e}")
+            return None
+
+
+class SqliteStore(SharedStore):
+    """
+    基于本机 SQLite 文件的共享存储，同一台机器上的多个工作进程开箱即用
+    每个进程使用自己的连接（fork 之后重新建立），开启 WAL 以支持并发读写；读写在线程中执行
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = SHARED_STORE_PATH):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    async def get(self, namespace: str, key: str) -> StoredValue | None:
+        return await asyncio.to_thread(self._get, namespace, key)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> None:
+        await asyncio.to_thread(self._set, namespace, key, value, ttl)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def delete_prefix(self, namespace: str, prefix: str) -> None:
+        # 用区间而不是 LIKE，避免前缀中的 % 和 _ 被当作通配符
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM kv WHERE namespace = ? AND key >= ? AND key < ?",
+            (namespace, prefix, prefix + "￿"),
+        )
+
+    async def stats(self) -> dict[str, Any]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT namespace, COUNT(*) FROM kv WHERE expires_at IS NULL OR expires_at > ? GROUP BY namespace",
+            (time.time(),),
+        )
+        return {"backend": self.name, "path": self.path, **{namespace: count for namespace, count in rows}}
+
+    def _get(self, namespace: str, key: str) -> StoredValue | None:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        value = self._decode(namespace, key, row[0])
+        return None if value is None else StoredValue(value, row[1])
+
+    def _set(self, namespace: str, key: str, value: Any, ttl: float | None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        data = dumps(value)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)", (namespace, key, data, expires_at))
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def _execute(self, sql: str, params: tuple) -> list[tuple]:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+
+class RedisStore(SharedStore):
+    """基于 Redis（或兼容协议的服务）的共享存储，适用于多台机器部署，需要安装 redis 包"""
+    name = "redis"
+
+    def __init__(self, url: str = SHARED_STORE_REDIS_URL, key_prefix: str = "dbqa"):
+        try:
+            import redis.asyncio
+        except ImportError as e:
+            raise RuntimeError("使用 redis 共享存储需要先安装 redis 包：pip install redis") from e
+        self._client = redis.asyncio.Redis.from_url(url)
+        self.key_prefix = key_prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.key_prefix}:{namespace}:{key}"
+
+    async def get(self, namespace: str, key: str) -> StoredValue | None:
+        full_key = self._key(namespace, key)
+        async with self._client.pipeline(transaction=False) as pipeline:
+            pipeline.get(full_key)
+            pipeline.pttl(full_key)
+            data, pttl = await pipeline.execute()
+        if data is None:
+            return None
+        # 较大的值（如查询结果）解析耗时较长，放到线程中执行
+        value = await asyncio.to_thread(self._decode, namespace, key, data)
+        return None if value is None else StoredValue(value, time.time() + pttl / 1000 if pttl > 0 else None)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> None:
+        data = await asyncio.to_thread(dumps, value)
+        await self._client.set(self._key(namespace, key), data, px=int(ttl * 1000) if ttl is not None else None)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self._client.delete(self._key(namespace, key))
+
+    async def delete_prefix(self, namespace: str, prefix: str) -> None:
+        keys = [key async for key in self._client.scan_iter(
+            match=self._escape(self._key(namespace, prefix)) + "*", count=500
+        )]
+        for start in range(0, len(keys), 500):
+            await self._client.delete(*keys[start:start + 500])
+
+    async def stats(self) -> dict[str, Any]:
+        return {"backend": self.name}
+
+    @staticmethod
+    def _escape(pattern: str) -> str:
+        for ch in "\\*?[]":
+            pattern = pattern.replace(ch, "\\" + ch)
+        return pattern
+
+
+def create_store(kind: str = SHARED_STORE) -> SharedStore | None:
+    """
+    按配置创建共享存储
+    :param kind: sqlite、redis，空表示不使用共享存储
+    :return: 共享存储，不使用时返回 None
+    """
+    if not kind:
+        return None
+    # 启动时即检查密码加密的配置，避免第一次写入会话时才报错
+    _cipher()
+    if kind == "sqlite":
+        store: SharedStore = SqliteStore()
+    elif kind == "redis":
+        store = RedisStore()
+    else:
+        raise ValueError(f"不支持的共享存储：{kind}")
+    logger.info(f"使用共享存储：{kind}")
+    return store
+
+
+shared_store = create_store()
@@ -0,0 +1,384 @@
+import hashlib
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import aiomysql
+from pymysql.constants import FLAG
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import SQL_MAX_ROWS, SQL_MAX_BYTES, SQL_FETCH_BATCH_SIZE
+from utils.cost_gate import QueryCostExceededError, check_query_cost
+from utils.logger import logger
+from utils.metrics import sql_bytes, sql_rows
+from utils.query_governor import add_timeout_hint, query_governor
+from utils.replica_router import replica_router
+from utils.result_cache import CacheMode, result_cache
+from utils.shared_store import register_type
+from utils.tracing import span
+
+# 每读取一批行时的回调，用于流式推送查询结果
+BatchCallback = Callable[[list[dict[str, Any]]], Awaitable[None]]
+
+# 去重计数估算使用的最小哈希值个数，越大越精确
+DISTINCT_SKETCH_SIZE = 256
+# MySQL 二进制字符集（binary）的编号
+_BINARY_CHARSET = 63
+# 客户端错误码范围（如 2013 连接中断），其余错误码由服务端返回
+_CLIENT_ERROR_CODES = range(2000, 3000)
+
+
+class DistinctSketch:
+    """基于 K 最小值（KMV）的去重计数估算，内存占用固定"""
+
+    def __init__(self, k: int = DISTINCT_SKETCH_SIZE):
+        self.k = k
+        self._hashes: set[int] = set()
+        self._max_hash = 0
+
+    def add(self, value: Any) -> None:
+        digest = hashlib.blake2b(repr(value).encode(), digest_size=8).digest()
+        hash_value = int.from_bytes(digest, 'big')
+        if len(self._hashes) < self.k:
+            self._hashes.add(hash_value)
+            self._max_hash = max(self._max_hash, hash_value)
+        elif hash_value < self._max_hash and hash_value not in self._hashes:
+            self._hashes.remove(self._max_hash)
+            self._hashes.add(hash_value)
+            self._max_hash = max(self._hashes)
+
+    def estimate(self) -> int:
+        if len(self._hashes) < self.k:
+            return len(self._hashes)
+        return int((self.k - 1) * (2 ** 64) / self._max_hash)
+
+
+class ColumnStats:
+    """单列统计：空值数、最小值、最大值和去重计数估算"""
+
+    def __init__(self):
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.distinct = DistinctSketch()
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            self.nulls += 1
+            return
+        self.distinct.add(value)
+        try:
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+        except TypeError:
+            # 同一列出现无法比较的类型时不再统计最值
+            pass
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"min": self.min, "max": self.max, "distinct": self.distinct.estimate(), "nulls": self.nulls}
+
+
+@dataclass
+class QueryResult:
+    """SQL 查询结果，行数和数据量受上限约束"""
+    columns: list[str]
+    rows: list[dict[str, Any]]
+    truncated: bool = False  # 是否因超出行数或数据量上限被截断
+    nbytes: int = 0  # 已读取行的估算数据量
+    stats: dict[str, ColumnStats] = field(default_factory=dict)
+    queue_wait: float = 0.0  # 排队等待执行名额的耗时（秒）
+    elapsed: float = 0.0  # 执行并读取结果的耗时（秒）
+
+    @property
+    def row_count(self) -> int:
+        return len(self.rows)
+
+    def overview(self) -> dict[str, Any]:
+        """结果概要：列名、行数、是否截断及排队和执行耗时"""
+        return {
+            "columns": self.columns,
+            "row_count": self.row_count,
+            "truncated": self.truncated,
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+        }
+
+    def summary(self, preview_rows: int) -> dict[str, Any]:
+        """
+        生成交给模型的结果摘要：少量预览行，行数较多时附带各列统计信息
+        :param preview_rows: 预览行数
+        :return: 结果摘要
+        """
+        summary: dict[str, Any] = {
+            "columns": self.columns,
+            "row_count": self.row_count,
+            "truncated": self.truncated,
+            "rows": self.rows[:preview_rows],
+        }
+        if self.row_count > preview_rows:
+            summary["column_stats"] = {name: stats.to_dict() for name, stats in self.stats.items()}
+        return summary
+
+
+def _encode_result(result: QueryResult) -> dict[str, Any]:
+    return {
+        "columns": result.columns,
+        "rows": result.rows,
+        "truncated": result.truncated,
+        "nbytes": result.nbytes,
+        "stats": {
+            name: {"nulls": stats.nulls, "min": stats.min, "max": stats.max, "sketch": sorted(stats.distinct._hashes)}
+            for name, stats in result.stats.items()
+        },
+    }
+
+
+def _decode_result(data: dict[str, Any]) -> QueryResult:
+    column_stats = {}
+    for name, item in data["stats"].items():
+        stats = column_stats[name] = ColumnStats()
+        stats.nulls, stats.min, stats.max = item["nulls"], item["min"], item["max"]
+        stats.distinct._hashes = set(item["sketch"])
+        stats.distinct._max_hash = max(stats.distinct._hashes, default=0)
+    return QueryResult(data["columns"], data["rows"], data["truncated"], data["nbytes"], column_stats)
+
+
+# 查询结果写入共享存储的结果缓存，排队和执行耗时只对本次执行有意义，不保存
+register_type("query_result", QueryResult, _encode_result, _decode_result)
+
+
+def is_server_error(error: BaseException) -> bool:
+    """
+    判断是否为服务端返回的错误（语法错误、列不存在、执行超时等），此时连接本身仍然可用
+    :param error: 执行SQL时抛出的异常
+    """
+    code = error.args[0] if isinstance(error, aiomysql.Error) and error.args else None
+    return isinstance(code, int) and code not in _CLIENT_ERROR_CODES
+
+
+def _row_size(row: dict[str, Any]) -> int:
+    return sum(len(str(value)) for value in row.values()) + len(row)
+
+
+async def _execute_streaming(
+        conn_config: DatabaseConnectionConfig,
+        sql: str,
+        max_rows: int,
+        max_bytes: int,
+        batch_size: int,
+        on_batch: BatchCallback | None,
+) -> QueryResult:
+    # 先排队获取该数据库的执行名额，再从连接池借用连接，执行受超时限制
+    with span("sql.execute") as sql_span:
+        async with query_governor.slot(conn_config) as timing:
+            async with replica_router.acquire(conn_config) as conn:
+                sql = add_timeout_hint(sql, query_governor.timeout)
+                statement = _fetch_rows(conn, sql, max_rows, max_bytes, batch_size, on_batch)
+                result = await query_governor.run(conn_config, conn, statement)
+        sql_span.set(rows=result.row_count, bytes=result.nbytes, truncated=result.truncated,
+                     queue_wait_ms=round(timing.queue_wait * 1000, 1))
+
+    sql_rows.observe(result.row_count)
+    sql_bytes.observe(result.nbytes)
+    result.queue_wait, result.elapsed = timing.queue_wait, timing.elapsed
+    if result.truncated:
+        logger.warning(f"SQL查询结果超出上限已截断，保留 {result.row_count} 行")
+    return result
+
+
+async def _fetch_rows(
+        conn: aiomysql.Connection,
+        sql: str,
+        max_rows: int,
+        max_bytes: int,
+        batch_size: int,
+        on_batch: BatchCallback | None,
+) -> QueryResult:
+    # 使用服务端游标分批读取，避免一次性把完整结果加载到内存
+    cursor = await conn.cursor(aiomysql.SSDictCursor)
+    reusable = False
+    try:
+        try:
+            await cursor.execute(sql)
+        except aiomysql.Error as e:
+            # 执行即失败时没有待读取的结果，服务端错误不影响连接，可以归还连接池继续使用
+            reusable = is_server_error(e)
+            raise
+        columns = [column[0] for column in cursor.description or []]
+        result = QueryResult(columns=columns, rows=[], stats={name: ColumnStats() for name in columns})
+
+        while not result.truncated:
+            batch = await cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            accepted = 0
+            for row in batch:
+                if len(result.rows) >= max_rows or result.nbytes >= max_bytes:
+                    result.truncated = True
+                    break
+                result.rows.append(row)
+                result.nbytes += _row_size(row)
+                accepted += 1
+                for name, value in row.items():
+                    result.stats[name].add(value)
+            if on_batch is not None and accepted:
+                await on_batch(batch[:accepted])
+
+        reusable = not result.truncated
+    finally:
+        if reusable:
+            await cursor.close()
+        else:
+            # 截断、读取中途出错或执行被取消时剩余结果仍在传输，直接关闭连接而不是读完，连接归还时会被连接池丢弃
+            conn.close()
+
+    return result
+
+
+async def execute_query(
+        conn_config: DatabaseConnectionConfig,
+        sql: str,
+        cache_mode: CacheMode = "default",
+        max_rows: int = SQL_MAX_ROWS,
+        max_bytes: int = SQL_MAX_BYTES,
+        batch_size: int = SQL_FETCH_BATCH_SIZE,
+        on_batch: BatchCallback | None = None,
+        check_cost: bool = False,
+) -> QueryResult:
+    """
+    从连接池借用连接流式执行SQL查询，按缓存模式读写查询结果缓存
+    :param conn_config: 数据库连接配置
+    :param sql: SQL查询语句
+    :param cache_mode: 结果缓存模式
+    :param max_rows: 最多读取的行数
+    :param max_bytes: 最多读取的数据量（字节）
+    :param batch_size: 每批读取的行数
+    :param on_batch: 每读取一批行时的回调
+    :param check_cost: 是否在实际执行前检查执行计划，预估成本超出上限时抛出 QueryCostExceededError；命中缓存时不检查
+    :return: 查询结果
+    """
+    if cache_mode == "default":
+        # 命中缓存时直接返回，不占用连接池
+        result = await result_cache.get(conn_config, sql)
+        if result is not None:
+            logger.info("SQL查询结果命中缓存")
+            if on_batch is not None:
+                for start in range(0, result.row_count, batch_size):
+                    await on_batch(result.rows[start:start + batch_size])
+            return result
+
+    if check_cost:
+        decision = await check_query_cost(conn_config, sql)
+        if not decision.allowed:
+            raise QueryCostExceededError(decision)
+
+    result = await _execute_streaming(conn_config, sql, max_rows, max_bytes, batch_size, on_batch)
+
+    if cache_mode != "bypass":
+        await result_cache.set(conn_config, sql, result, size=result.nbytes)
+
+    return result
+
+
+@dataclass
+class ColumnType:
+    """查询结果列的 MySQL 类型信息，用于导出时映射为列式存储的类型"""
+    name: str
+    type_code: int | None  # pymysql.constants.FIELD_TYPE，None 表示未知（如来自结果缓存）
+    unsigned: bool = False
+    binary: bool = False  # 二进制字符集，取值为 bytes
+    length: int = 0
+    scale: int = 0
+
+
+def _column_types(cursor: aiomysql.Cursor) -> list[ColumnType]:
+    # description 中没有无符号标记和字符集，从结果集的字段描述中读取
+    fields = getattr(getattr(cursor, "_result", None), "fields", None) or []
+    if len(fields) != len(cursor.description or []):
+        return [ColumnType(column[0], column[1]) for column in cursor.description or []]
+    return [
+        ColumnType(
+            name=field.name,
+            type_code=field.type_code,
+            unsigned=bool(field.flags & FLAG.UNSIGNED),
+            binary=field.charsetnr == _BINARY_CHARSET,
+            length=field.length,
+            scale=field.scale,
+        )
+        for field in fields
+    ]
+
+
+class RowStream:
+    """流式查询结果，执行后即可获取各列类型，再逐批迭代读取行"""
+
+    def __init__(self, cursor: aiomysql.Cursor, batch_size: int):
+        self.columns = _column_types(cursor)
+        self.exhausted = False
+        self._cursor = cursor
+        self._batch_size = batch_size
+
+    async def __aiter__(self) -> AsyncIterator[list[Any]]:
+        while True:
+            batch = await self._cursor.fetchmany(self._batch_size)
+            if not batch:
+                self.exhausted = True
+                return
+            yield batch
+
+
+@asynccontextmanager
+async def open_row_stream(
+        conn_config: DatabaseConnectionConfig,
+        sql: str,
+        batch_size: int = SQL_FETCH_BATCH_SIZE,
+        cursor_class: type[aiomysql.Cursor] = aiomysql.SSCursor,
+) -> AsyncIterator[RowStream]:
+    """
+    使用服务端游标执行SQL查询，不受行数上限约束，内存占用只与每批行数有关
+    :param conn_config: 数据库连接配置
+    :param sql: SQL查询语句
+    :param batch_size: 每批读取的行数
+    :param cursor_class: 游标类型，SSCursor 按元组返回行，SSDictCursor 按字典返回行
+    :return: 流式查询结果
+    """
+    # 流式读取在整个响应期间占用连接，使用单独的流式名额，不占用普通查询的名额
+    async with query_governor.slot(conn_config, stream=True), replica_router.acquire(conn_config) as conn:
+        cursor = await conn.cursor(cursor_class)
+        stream = None
+        reusable = False
+        try:
+            try:
+                await cursor.execute(sql)
+            except aiomysql.Error as e:
+                # 服务端报错时查询已结束，连接可以继续使用
+                reusable = is_server_error(e)
+                raise
+            stream = RowStream(cursor, batch_size)
+            yield stream
+        finally:
+            if reusable or (stream is not None and stream.exhausted):
+                await cursor.close()
+            else:
+                # 客户端中途断开时不再读取剩余结果，并终止服务端仍在执行的查询
+                conn.close()
+                await query_governor.kill(conn_config, conn)
+
+
+async def stream_query(
+        conn_config: DatabaseConnectionConfig,
+        sql: str,
+        batch_size: int = SQL_FETCH_BATCH_SIZE,
+) -> AsyncIterator[list[dict[str, Any]]]:
+    """
+    流式执行SQL查询，逐批返回完整结果，不受行数上限约束
+    :param conn_config: 数据库连接配置
+    :param sql: SQL查询语句
+    :param batch_size: 每批读取的行数
+    :return: 按批返回的查询结果
+    """
+    async with open_row_stream(conn_config, sql, batch_size, aiomysql.SSDictCursor) as stream:
+        async for batch in stream:
+            yield batch
@@ -0,0 +1,264 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Literal
+
+from utils.config import SQL_GUARD_CACHE_SIZE
+
+TokenKind = Literal["word", "quoted", "string", "number", "variable", "punct"]
+
+# 允许执行的只读语句，DESC/DESCRIBE 与 EXPLAIN 等价
+READONLY_STATEMENTS = {"SELECT", "WITH", "SHOW", "EXPLAIN", "DESC", "DESCRIBE"}
+
+# 出现在语句任意位置都不允许的保留字：数据修改（如 WITH ... DELETE）、导出到文件或变量（INTO）、加锁读（FOR UPDATE）
+FORBIDDEN_KEYWORDS = {"UPDATE", "DELETE", "INTO", "LOCK", "UNLOCK", "CREATE", "ALTER", "DROP", "RENAME", "GRANT", "REVOKE", "CALL"}
+
+# 作为语句不允许，但同名的函数可以使用，如 REPLACE(name, 'a', 'b')、INSERT(str, pos, len, newstr)、TRUNCATE(x, 2)
+FUNCTION_KEYWORDS = {"INSERT", "REPLACE", "TRUNCATE"}
+
+# 会阻塞连接、读取服务器文件或占用锁的函数
+FORBIDDEN_FUNCTIONS = {
+    "SLEEP", "BENCHMARK", "LOAD_FILE", "GET_LOCK", "RELEASE_LOCK", "RELEASE_ALL_LOCKS", "IS_FREE_LOCK", "IS_USED_LOCK",
+    "MASTER_POS_WAIT", "SOURCE_POS_WAIT", "WAIT_FOR_EXECUTED_GTID_SET",
+}
+
+# SHOW 之后允许出现的对象，用于区分 "show me the top customers" 这类英文问题
+SHOW_TARGETS = {
+    "TABLES", "FULL", "COLUMNS", "FIELDS", "INDEX", "INDEXES", "KEYS", "CREATE", "DATABASES", "SCHEMAS", "TABLE",
+    "STATUS", "VARIABLES", "GLOBAL", "SESSION", "PROCESSLIST", "GRANTS", "WARNINGS", "ERRORS", "ENGINES", "ENGINE",
+    "TRIGGERS", "EVENTS", "PLUGINS", "PRIVILEGES", "CHARACTER", "CHARSET", "COLLATION", "FUNCTION", "PROCEDURE",
+    "OPEN", "EXTENDED", "COUNT", "BINARY", "MASTER", "REPLICA", "REPLICAS", "SLAVE", "PROFILE", "PROFILES",
+}
+
+# EXPLAIN/DESCRIBE 之后是查询语句而不是表名时出现的词
+EXPLAIN_TARGETS = {"SELECT", "WITH", "TABLE", "FORMAT", "ANALYZE", "EXTENDED", "PARTITIONS", "FOR"}
+
+# 可以出现在标识符之间的关键字，连续多个不属于其中的裸词视为自然语言
+SQL_KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "IS", "NULL", "AS", "ON", "JOIN", "LEFT", "RIGHT", "INNER",
+    "OUTER", "CROSS", "NATURAL", "STRAIGHT_JOIN", "USING", "GROUP", "BY", "ORDER", "HAVING", "LIMIT", "OFFSET",
+    "UNION", "INTERSECT", "EXCEPT", "ALL", "DISTINCT", "CASE", "WHEN", "THEN", "ELSE", "END", "ASC", "DESC",
+    "BETWEEN", "LIKE", "REGEXP", "RLIKE", "ESCAPE", "EXISTS", "WITH", "RECURSIVE", "ROLLUP", "OVER", "PARTITION",
+    "WINDOW", "ROWS", "RANGE", "PRECEDING", "FOLLOWING", "CURRENT", "ROW", "UNBOUNDED", "INTERVAL", "DIV", "MOD",
+    "XOR", "COLLATE", "CHARACTER", "SET", "BINARY", "TRUE", "FALSE", "UNKNOWN", "ANY", "SOME", "LATERAL",
+    "SIGNED", "UNSIGNED", "INTEGER", "CHAR", "DATE", "DATETIME", "TIME", "DECIMAL", "FORCE", "USE", "IGNORE",
+    "KEY", "INDEX", "FOR", "SQL_NO_CACHE", "SQL_CALC_FOUND_ROWS", "HIGH_PRIORITY", "SOUNDS",
+    "YEAR", "MONTH", "DAY", "HOUR", "MINUTE", "SECOND", "WEEK", "QUARTER", "MICROSECOND",
+}
+
+# 几乎不会作为未加引号的标识符出现的英文虚词
+PROSE_WORDS = {"THE", "ME", "MY", "OUR", "YOUR", "PLEASE", "WHAT", "WHICH", "WHY", "HOW", "WHO", "WHOSE", "ABOUT"}
+
+_WORD_PATTERN = re.compile(r'[^\W\d][\w$]*|\d+[^\W\d$][\w$]*')
+_NUMBER_PATTERN = re.compile(r'0x[0-9a-fA-F]+|\d+(\.\d*)?([eE][+-]?\d+)?|\.\d+([eE][+-]?\d+)?')
+_VARIABLE_PATTERN = re.compile(r'@@?[\w$.]+')
+_TWO_CHAR_OPERATORS = {":=", "<=", ">=", "<>", "!=", "||", "&&", "<<", ">>", "->"}
+
+
+class SqlLexError(ValueError):
+    """SQL 无法完整切分为词法单元，如引号或注释未闭合"""
+
+
+@dataclass(frozen=True)
+class SqlVerdict:
+    """SQL 只读校验结果"""
+    allowed: bool
+    statement_type: str | None = None
+    reason: str | None = None
+
+
+def _scan_quoted(sql: str, start: int) -> int:
+    """返回从 start 处引号开始的字符串或标识符结束后的位置，支持反斜杠转义和连续两个引号的转义"""
+    quote = sql[start]
+    i = start + 1
+    while i < len(sql):
+        ch = sql[i]
+        if ch == '\\' and quote != '`':
+            i += 2
+            continue
+        if ch == quote:
+            if i + 1 < len(sql) and sql[i + 1] == quote:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    raise SqlLexError("引号未闭合")
+
+
+def tokenize(sql: str) -> list[tuple[TokenKind, str]]:
+    """
+    将 SQL 切分为词法单元，跳过注释，字符串和反引号标识符作为整体
+    :param sql: SQL语句
+    :return: [(类型, 文本), ...]
+    """
+    tokens: list[tuple[TokenKind, str]] = []
+    i = 0
+    length = len(sql)
+    while i < length:
+        ch = sql[i]
+        if ch.isspace():
+            i += 1
+        elif ch == '#' or (sql.startswith('--', i) and (i + 2 >= length or sql[i + 2].isspace())):
+            # 单行注释，MySQL 要求 -- 后跟空白字符
+            end = sql.find('\n', i)
+            i = length if end < 0 else end + 1
+        elif sql.startswith('/*', i):
+            # /*! ... */ 是可执行注释，内容会被 MySQL 执行，不能当作普通注释跳过
+            if sql.startswith('/*!', i):
+                raise SqlLexError("不允许使用可执行注释 /*! */")
+            end = sql.find('*/', i + 2)
+            if end < 0:
+                raise SqlLexError("注释未闭合")
+            i = end + 2
+        elif ch in ("'", '"', '`'):
+            end = _scan_quoted(sql, i)
+            tokens.append(("quoted" if ch == '`' else "string", sql[i:end]))
+            i = end
+        elif ch == '@':
+            match = _VARIABLE_PATTERN.match(sql, i)
+            end = match.end() if match else i + 1
+            tokens.append(("variable", sql[i:end]))
+            i = end
+        elif ch.isdigit() or (ch == '.' and i + 1 < length and sql[i + 1].isdigit()):
+            # 数字开头的标识符（如 1day）优先按标识符处理
+            word_match = _WORD_PATTERN.match(sql, i)
+            match = word_match or _NUMBER_PATTERN.match(sql, i)
+            tokens.append(("word" if word_match else "number", match.group()))
+            i = match.end()
+        elif (match := _WORD_PATTERN.match(sql, i)) is not None:
+            tokens.append(("word", match.group()))
+            i = match.end()
+        elif sql[i:i + 2] in _TWO_CHAR_OPERATORS:
+            tokens.append(("punct", sql[i:i + 2]))
+            i += 2
+        else:
+            tokens.append(("punct", ch))
+            i += 1
+    return tokens
+
+
+def _split_statements(tokens: list[tuple[TokenKind, str]]) -> list[list[tuple[TokenKind, str]]]:
+    statements: list[list[tuple[TokenKind, str]]] = [[]]
+    for token in tokens:
+        if token == ("punct", ";"):
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    return [statement for statement in statements if statement]
+
+
+def _classify(tokens: list[tuple[TokenKind, str]]) -> SqlVerdict:
+    # 跳过括号包裹的查询开头，如 (SELECT ...) UNION (SELECT ...)
+    first = next((value.upper() for kind, value in tokens if kind != "punct" or value != "("), None)
+    if first not in READONLY_STATEMENTS:
+        return SqlVerdict(False, first, f"只允许执行查询语句，不允许 {first or '空语句'}")
+    # SHOW 语句都是只读的，其中的 CREATE、GRANTS 等只是查看对象
+    if first == "SHOW":
+        return SqlVerdict(True, first)
+    # EXPLAIN ANALYZE 会实际执行查询，且不经过执行成本检查和超时提示
+    words = [value.upper() for kind, value in tokens if kind == "word"]
+    if first in ("EXPLAIN", "DESC", "DESCRIBE") and words[1:2] == ["ANALYZE"]:
+        return SqlVerdict(False, first, f"不允许使用 {first} ANALYZE，它会实际执行查询")
+
+    for index, (kind, value) in enumerate(tokens):
+        if kind == "punct" and value == ":=":
+            return SqlVerdict(False, first, "不允许在查询中给变量赋值")
+        if kind != "word":
+            continue
+
+        word = value.upper()
+        is_call = index + 1 < len(tokens) and tokens[index + 1] == ("punct", "(")
+        if word in FORBIDDEN_KEYWORDS:
+            return SqlVerdict(False, first, f"查询中不允许使用 {word}")
+        if word in FUNCTION_KEYWORDS and not is_call:
+            return SqlVerdict(False, first, f"查询中不允许使用 {word}")
+        if word in FORBIDDEN_FUNCTIONS and is_call:
+            return SqlVerdict(False, first, f"查询中不允许调用 {word}()")
+        # FOR SHARE 是加锁读
+        if word == "SHARE" and index > 0 and tokens[index - 1][1].upper() == "FOR":
+            return SqlVerdict(False, first, "查询中不允许加锁")
+        # SET 只允许出现在 CHARACTER SET 中
+        if word == "SET" and (index == 0 or tokens[index - 1][1].upper() != "CHARACTER"):
+            return SqlVerdict(False, first, "查询中不允许使用 SET")
+
+    return SqlVerdict(True, first)
+
+
+@lru_cache(maxsize=SQL_GUARD_CACHE_SIZE)
+def _validate(sql: str) -> SqlVerdict:
+    try:
+        tokens = tokenize(sql)
+    except SqlLexError as e:
+        return SqlVerdict(False, None, str(e))
+
+    statements = _split_statements(tokens)
+    if not statements:
+        return SqlVerdict(False, None, "SQL为空")
+    if len(statements) > 1:
+        return SqlVerdict(False, None, "只允许执行单条SQL")
+    return _classify(statements[0])
+
+
+def validate_sql(sql: str) -> SqlVerdict:
+    """
+    校验SQL是否为单条只读语句（SELECT/WITH/SHOW/EXPLAIN），能识别注释、字符串和带引号的标识符，
+    字段名或字符串中出现的 update、set 等不会被误判；校验结果按SQL缓存
+    :param sql: SQL语句
+    :return: 校验结果
+    """
+    # 只去除首尾空白作为缓存键：单行注释以换行结束，合并内部空白会改变语义
+    return _validate(sql.strip())
+
+
+def _looks_like_sql(tokens: list[tuple[TokenKind, str]]) -> bool:
+    words = [value.upper() for kind, value in tokens if kind == "word"]
+    if not words:
+        return False
+    for kind, value in tokens:
+        # 未加引号的中文或全角标点只会出现在自然语言中
+        if kind in ("word", "punct") and not value.isascii():
+            return False
+        if kind == "word" and value.upper() in PROSE_WORDS:
+            return False
+
+    first = words[0]
+    if first == "SHOW":
+        return len(words) > 1 and words[1] in SHOW_TARGETS
+    if first in ("EXPLAIN", "DESC", "DESCRIBE") and len(words) > 1 and words[1] not in EXPLAIN_TARGETS:
+        # DESCRIBE [库名.]表名 [列名]
+        names = [token for token in tokens[1:] if token != ("punct", ".")]
+        max_names = 3 if len(names) < len(tokens) - 1 else 2
+        return len(names) <= max_names and all(kind != "punct" for kind, _ in names)
+
+    run = 0
+    for index, (kind, value) in enumerate(tokens):
+        is_call = index + 1 < len(tokens) and tokens[index + 1] == ("punct", "(")
+        if kind == "word" and value.upper() not in SQL_KEYWORDS and not is_call:
+            run += 1
+            # 标识符之后最多跟一个别名，连续三个以上的裸词是英文句子
+            if run >= 3:
+                return False
+        else:
+            run = 0
+    return True
+
+
+@lru_cache(maxsize=SQL_GUARD_CACHE_SIZE)
+def is_raw_sql(sql: str) -> bool:
+    """
+    判断文本是否确实是一条只读SQL，而不是以 show、select、explain 等单词开头的自然语言问题：
+    除了通过只读校验外，不能含有未加引号的中文，SHOW/DESCRIBE 之后须是合法的对象，也不能出现连续的英文单词
+    :param sql: 文本
+    :return: 是否按SQL直接执行
+    """
+    sql = sql.strip()
+    if not validate_sql(sql).allowed:
+        return False
+    statement = _split_statements(tokenize(sql))[0]
+    return _looks_like_sql(statement)
+
+
+def cache_stats() -> dict[str, int]:
+    """校验结果缓存统计信息"""
+    info = _validate.cache_info()
+    return {"entries": info.currsize, "max_entries": info.maxsize, "hits": info.hits, "misses": info.misses}
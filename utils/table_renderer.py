@@ -0,0 +1,267 @@
+import datetime
+import html
+from decimal import Decimal
+from typing import Any, Literal
+
+import aiomysql
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import TABLE_RENDER_MAX_ROWS, TABLE_RENDER_FORMAT, TABLE_RESOLVE_NAMES
+from utils.logger import logger
+from utils.query_governor import QueryTimeoutError, query_governor
+from utils.replica_router import replica_router
+from utils.schema_cache import schema_cache
+from utils.sql_executor import QueryResult
+from utils.sql_guard import SqlLexError, tokenize
+
+TableFormat = Literal["markdown", "html"]
+
+# 模型在答案中用该标记指代服务端渲染的查询结果表格
+TABLE_PLACEHOLDER = "{{table}}"
+
+# 可作为名称展示的列，按优先级排列
+_LABEL_COLUMN_NAMES = ("name", "title", "label", "nickname", "username", "real_name", "full_name")
+_LABEL_COLUMN_COMMENTS = ("名称", "名字", "姓名", "标题")
+
+# 表名出现在这些关键字之后
+_TABLE_KEYWORDS = {"FROM", "JOIN"}
+
+# id -> 名称，按结果列名分组
+IdLabels = dict[str, dict[Any, str]]
+
+
+def _is_identifier_column(column: str) -> bool:
+    """id、编号、年份等数字列不加千分位"""
+    name = column.lower()
+    return name == "id" or name.endswith(("_id", "_no", "_code")) or "year" in name or column.endswith(("编号", "年份", "年"))
+
+
+def format_value(column: str, value: Any) -> str:
+    """
+    按类型格式化单元格：数值加千分位，浮点数保留两位小数，日期时间去掉多余的零点时间
+    :param column: 列名
+    :param value: 原始值
+    :return: 展示文本
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "是" if value else "否"
+    if isinstance(value, int):
+        return str(value) if _is_identifier_column(column) else f"{value:,}"
+    if isinstance(value, Decimal):
+        # Decimal 保持数据库中的小数位数
+        return str(value) if _is_identifier_column(column) else f"{value:,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}" if abs(value) >= 1 else f"{value:.4g}"
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d" if value.time() == datetime.time() else "%Y-%m-%d %H:%M:%S")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return f"<二进制 {len(value)} 字节>"
+    return str(value)
+
+
+def _display_rows(result: QueryResult, max_rows: int, labels: IdLabels | None) -> list[list[str]]:
+    labels = labels or {}
+    rows = []
+    for row in result.rows[:max_rows]:
+        cells = []
+        for column in result.columns:
+            value = row.get(column)
+            label = labels.get(column, {}).get(value)
+            cells.append(label if label is not None else format_value(column, value))
+        rows.append(cells)
+    return rows
+
+
+def _footnote(result: QueryResult, max_rows: int) -> str | None:
+    if result.row_count > max_rows or result.truncated:
+        return f"仅展示前 {min(max_rows, result.row_count)} 行，共 {result.row_count}{'+' if result.truncated else ''} 行"
+    return None
+
+
+def _md_cell(text: str) -> str:
+    # 单元格中的竖线和换行会破坏 markdown 表格结构
+    return text.replace("|", "\\|").replace("\r", " ").replace("\n", " ")
+
+
+def render_markdown_table(
+        result: QueryResult,
+        max_rows: int = TABLE_RENDER_MAX_ROWS,
+        labels: IdLabels | None = None,
+) -> str:
+    """
+    将查询结果渲染为 markdown 表格，不经过模型，数据与查询结果完全一致
+    :param result: 查询结果
+    :param max_rows: 最多展示的行数
+    :param labels: id 列对应的名称，存在时用名称代替 id 展示
+    :return: markdown 表格
+    """
+    if not result.columns:
+        return ""
+
+    lines = [
+        "| " + " | ".join(_md_cell(column) for column in result.columns) + " |",
+        "|" + "|".join("---" for _ in result.columns) + "|",
+    ]
+    for cells in _display_rows(result, max_rows, labels):
+        lines.append("| " + " | ".join(_md_cell(cell) for cell in cells) + " |")
+
+    footnote = _footnote(result, max_rows)
+    if footnote:
+        lines.append("")
+        lines.append(f"*{footnote}*")
+    return "\n".join(lines)
+
+
+def render_html_table(
+        result: QueryResult,
+        max_rows: int = TABLE_RENDER_MAX_ROWS,
+        labels: IdLabels | None = None,
+) -> str:
+    """
+    将查询结果渲染为 HTML 表格，参数与 render_markdown_table 相同
+    :return: HTML 表格
+    """
+    if not result.columns:
+        return ""
+
+    parts = ["<table>", "<thead><tr>"]
+    parts.extend(f"<th>{html.escape(column)}</th>" for column in result.columns)
+    parts.append("</tr></thead>")
+    parts.append("<tbody>")
+    for cells in _display_rows(result, max_rows, labels):
+        parts.append("<tr>" + "".join(f"<td>{html.escape(cell)}</td>" for cell in cells) + "</tr>")
+    parts.append("</tbody></table>")
+
+    footnote = _footnote(result, max_rows)
+    if footnote:
+        parts.append(f"<p><em>{footnote}</em></p>")
+    return "".join(parts)
+
+
+def _referenced_tables(sql: str, tables: dict[str, dict[str, Any]]) -> list[str]:
+    """SQL 中 FROM/JOIN 之后出现的表名"""
+    try:
+        tokens = tokenize(sql)
+    except SqlLexError:
+        return []
+
+    referenced = []
+    for index, (kind, value) in enumerate(tokens[1:], start=1):
+        previous_kind, previous = tokens[index - 1]
+        if previous_kind != "word" or previous.upper() not in _TABLE_KEYWORDS:
+            continue
+        name = value.strip("`") if kind in ("word", "quoted") else None
+        if name in tables and name not in referenced:
+            referenced.append(name)
+    return referenced
+
+
+def _label_column(table: dict[str, Any], ref_column: str) -> str | None:
+    """在被引用表中挑选可以代替 id 展示的名称列"""
+    columns = [column for column in table.get("columns", []) if column["name"] != ref_column]
+    by_name = {column["name"].lower(): column["name"] for column in columns}
+    for name in _LABEL_COLUMN_NAMES:
+        if name in by_name:
+            return by_name[name]
+    for column in columns:
+        if column["name"].lower().endswith("_name"):
+            return column["name"]
+    for column in columns:
+        if column.get("comment") and any(word in column["comment"] for word in _LABEL_COLUMN_COMMENTS):
+            return column["name"]
+    return None
+
+
+async def resolve_id_labels(
+        conn_config: DatabaseConnectionConfig,
+        sql: str,
+        result: QueryResult,
+        max_rows: int = TABLE_RENDER_MAX_ROWS,
+) -> IdLabels:
+    """
+    根据表结构中的外键，为结果中的外键列查询被引用表的名称列，用于以名称代替 id 展示
+    只处理 SQL 中 FROM/JOIN 的表上、列名与结果列相同的外键，且只查询需要展示的行中出现的 id
+    :param conn_config: 数据库连接配置
+    :param sql: 产生结果的SQL
+    :param result: 查询结果
+    :param max_rows: 需要展示的行数
+    :return: {结果列名: {id: 名称}}
+    """
+    if not TABLE_RESOLVE_NAMES or not result.rows:
+        return {}
+
+    try:
+        tables = (await schema_cache.get_schema(conn_config)).tables
+    except Exception as e:
+        logger.warning(f"读取表结构失败，跳过名称替换: {e}")
+        return {}
+
+    # 结果列名 -> (被引用表, 被引用列, 名称列)
+    lookups: dict[str, tuple[str, str, str]] = {}
+    for table_name in _referenced_tables(sql, tables):
+        for fk in tables[table_name].get("foreign_keys", []):
+            column = fk["column"]
+            if column not in result.columns or column in lookups:
+                continue
+            label_column = _label_column(tables.get(fk["ref_table"], {}), fk["ref_column"])
+            # 结果中已经包含名称列时无需替换
+            if label_column and label_column not in result.columns:
+                lookups[column] = (fk["ref_table"], fk["ref_column"], label_column)
+
+    labels: IdLabels = {}
+    for column, (ref_table, ref_column, label_column) in lookups.items():
+        ids = list({row[column] for row in result.rows[:max_rows] if row.get(column) is not None})
+        if not ids:
+            continue
+        placeholders = ", ".join(["%s"] * len(ids))
+        lookup_sql = (
+            f"SELECT `{ref_column}`, `{label_column}` FROM `{ref_table}` WHERE `{ref_column}` IN ({placeholders})"
+        )
+        try:
+            async with query_governor.slot(conn_config), replica_router.acquire(conn_config) as conn:
+                async with conn.cursor() as cur:
+                    await query_governor.run(conn_config, conn, cur.execute(lookup_sql, ids))
+                    rows = await cur.fetchall()
+        except (aiomysql.Error, QueryTimeoutError) as e:
+            logger.warning(f"查询 {ref_table}.{label_column} 失败，{column} 保持以 id 展示: {e}")
+            continue
+        labels[column] = {row[0]: str(row[1]) for row in rows if row[1] is not None}
+        logger.info(f"结果列 {column} 以 {ref_table}.{label_column} 代替 id 展示，匹配 {len(labels[column])}/{len(ids)} 个")
+    return labels
+
+
+async def render_result_table(
+        conn_config: DatabaseConnectionConfig,
+        sql: str,
+        result: QueryResult,
+        table_format: TableFormat = TABLE_RENDER_FORMAT,
+        max_rows: int = TABLE_RENDER_MAX_ROWS,
+) -> str:
+    """
+    格式化查询结果并渲染为表格，外键列以被引用表的名称代替 id 展示
+    :param conn_config: 数据库连接配置
+    :param sql: 产生结果的SQL
+    :param result: 查询结果
+    :param table_format: 表格格式 markdown/html
+    :param max_rows: 最多展示的行数
+    :return: 表格文本
+    """
+    labels = await resolve_id_labels(conn_config, sql, result, max_rows)
+    render = render_html_table if table_format == "html" else render_markdown_table
+    return render(result, max_rows, labels)
+
+
+def insert_table(describe: str, table: str) -> str:
+    """
+    将渲染好的表格放到答案中：答案中有表格标记时替换标记，否则附在答案末尾
+    :param describe: 模型生成的答案
+    :param table: 表格文本
+    :return: 完整答案
+    """
+    if TABLE_PLACEHOLDER in describe:
+        return describe.replace(TABLE_PLACEHOLDER, table)
+    return f"{describe}\n\n{table}" if describe else table
@@ -0,0 +1,22 @@
+import json
+from typing import Any
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数，不依赖具体模型的分词器
+    中日韩字符按每字 1 个 token 计算，其余字符按每 4 个字符 1 个 token 计算
+    :param text: 文本
+    :return: 估算的 token 数
+    """
+    cjk = sum(1 for ch in text if '⺀' <= ch <= '鿿' or '豈' <= ch <= '﫿')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_json_tokens(data: Any) -> int:
+    """
+    估算数据序列化为 JSON 后的 token 数
+    :param data: 可序列化为 JSON 的数据
+    :return: 估算的 token 数
+    """
+    return estimate_tokens(json.dumps(data, ensure_ascii=False, default=str))
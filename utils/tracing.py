@@ -0,0 +1,151 @@
+import functools
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterator, ParamSpec, TypeVar
+
+from utils.logger import logger, trace_id_var
+from utils.metrics import (
+    model_requests_total,
+    model_run_tokens,
+    model_tokens_total,
+    stage_duration_seconds,
+    stage_errors_total,
+)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+@dataclass
+class Span:
+    """一个处理阶段的耗时记录"""
+    name: str
+    span_id: str
+    parent_id: str | None
+    start: float
+    duration: float | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+    def set(self, **attributes: Any) -> None:
+        """补充阶段属性，如行数、字节数"""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_ms": round((self.duration or 0) * 1000, 1),
+            **({"error": self.error} if self.error else {}),
+            **self.attributes,
+        }
+
+
+# 当前请求已结束的阶段和正在执行的阶段，子任务复制上下文后共享同一个列表
+_spans_var: ContextVar[list[Span] | None] = ContextVar("trace_spans", default=None)
+_current_span_var: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def start_trace(trace_id: str | None = None) -> Iterator[str]:
+    """
+    开始一次请求追踪，上下文内的日志和阶段都带上该追踪 ID
+    :param trace_id: 上游传入的追踪 ID，为空时生成新的
+    :return: 追踪 ID
+    """
+    trace_id = trace_id or new_trace_id()
+    tokens = (trace_id_var.set(trace_id), _spans_var.set([]), _current_span_var.set(None))
+    try:
+        yield trace_id
+    finally:
+        trace_id_var.reset(tokens[0])
+        _spans_var.reset(tokens[1])
+        _current_span_var.reset(tokens[2])
+
+
+def current_spans() -> list[Span]:
+    """当前请求已结束的阶段"""
+    return list(_spans_var.get() or [])
+
+
+def stage_summary() -> dict[str, float]:
+    """当前请求各阶段的累计耗时（毫秒）"""
+    summary: dict[str, float] = {}
+    for span in current_spans():
+        summary[span.name] = round(summary.get(span.name, 0) + (span.duration or 0) * 1000, 1)
+    return summary
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    记录一个处理阶段：结束时写入结构化日志并计入阶段耗时直方图
+    :param name: 阶段名称，如 data_agent、tool.execute_sql、sql.execute、chart.render
+    :param attributes: 阶段属性
+    :return: 阶段记录，可在阶段内补充属性
+    """
+    parent = _current_span_var.get()
+    current = Span(
+        name=name,
+        span_id=uuid.uuid4().hex[:8],
+        parent_id=parent.span_id if parent else None,
+        start=time.perf_counter(),
+        attributes=attributes,
+    )
+    token = _current_span_var.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        stage_errors_total.inc(stage=name)
+        raise
+    finally:
+        _current_span_var.reset(token)
+        current.duration = time.perf_counter() - current.start
+        stage_duration_seconds.observe(current.duration, stage=name)
+        spans = _spans_var.get()
+        if spans is not None:
+            spans.append(current)
+        logger.bind(span=current.to_dict()).info(f"阶段 {name} 耗时 {current.duration * 1000:.1f} ms {current.attributes}")
+
+
+def traced(name: str) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    """
+    将异步函数的每次调用记录为一个阶段，保留原函数签名，可用于智能体工具
+    :param name: 阶段名称
+    """
+
+    def decorator(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_usage(agent: str, usage: Any, current: Span | None = None) -> None:
+    """
+    记录智能体一次运行的模型请求次数和 token 用量
+    :param agent: 智能体名称
+    :param usage: 运行结果的 usage()
+    :param current: 写入 token 用量属性的阶段
+    """
+    request_tokens = usage.request_tokens or 0
+    response_tokens = usage.response_tokens or 0
+    model_requests_total.inc(usage.requests, agent=agent)
+    for kind, tokens in (("request", request_tokens), ("response", response_tokens)):
+        model_tokens_total.inc(tokens, agent=agent, kind=kind)
+        model_run_tokens.observe(tokens, agent=agent, kind=kind)
+    if current is not None:
+        current.set(model_requests=usage.requests, request_tokens=request_tokens, response_tokens=response_tokens)
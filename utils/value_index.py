@@ -0,0 +1,290 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from schemas.db_conn_config import DatabaseConnectionConfig
+from utils.config import (
+    VALUE_INDEX_ENABLED,
+    VALUE_INDEX_MAX_BYTES,
+    VALUE_INDEX_MAX_DISTINCT,
+    VALUE_INDEX_REFRESH_INTERVAL,
+    VALUE_INDEX_SAMPLE_ROWS,
+)
+from utils.logger import logger
+from utils.schema_cache import schema_cache
+from utils.sql_executor import execute_query
+from utils.tracing import span, start_trace
+
+# 只为较短的文本列建立索引，长文本通常是描述、备注，不适合等值匹配
+_TEXT_TYPE_PATTERN = re.compile(r'^(?:var)?char\((\d+)\)|^(?:enum|set)\(', re.IGNORECASE)
+_MAX_COLUMN_LENGTH = 255
+# 超过该长度的取值不进入索引
+_MAX_VALUE_LENGTH = 64
+# 可能保存敏感信息的列不采样
+_SENSITIVE_COLUMN_PATTERN = re.compile(r'pass|pwd|secret|token|salt|phone|mobile|email|id_?card|(?:^|_)key$', re.IGNORECASE)
+# 每个取值在精确索引和二元组倒排索引中的估算额外开销（字节）
+_VALUE_OVERHEAD = 96
+
+
+def normalize_value(value: str) -> str:
+    """规范化取值用于匹配：去除首尾空白、统一大小写"""
+    return value.strip().casefold()
+
+
+def _bigrams(text: str) -> set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _quote(identifier: str) -> str:
+    return "`" + identifier.replace("`", "``") + "`"
+
+
+def is_indexable(column: dict[str, Any]) -> bool:
+    """
+    判断列是否适合建立取值索引：较短的文本列或枚举列，且列名不像敏感信息
+    :param column: 表结构中的列信息
+    """
+    match = _TEXT_TYPE_PATTERN.match(column["type"] or "")
+    if match is None or _SENSITIVE_COLUMN_PATTERN.search(column["name"]):
+        return False
+    return match.group(1) is None or int(match.group(1)) <= _MAX_COLUMN_LENGTH
+
+
+@dataclass
+class ColumnValues:
+    """一列的去重取值采样"""
+    table: str
+    column: str
+    column_type: str
+    values: list[str]
+    sampled_at: float  # 采样时间（time.monotonic()）
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(value.encode()) * 2 + _VALUE_OVERHEAD for value in self.values)
+
+
+class ValueIndex:
+    """
+    某个数据库的列取值索引
+    规范化取值 -> (表, 列, 原始取值) 的精确索引，加上按二元组的倒排索引用于查找包含提及内容的取值
+    """
+
+    def __init__(self, columns: dict[tuple[str, str], ColumnValues], version: str):
+        self.columns = columns
+        self.version = version
+        self.built_at = time.time()
+        self._exact: dict[str, list[tuple[str, str, str]]] = {}
+        self._grams: dict[str, set[str]] = {}
+        for entry in columns.values():
+            for value in entry.values:
+                key = normalize_value(value)
+                self._exact.setdefault(key, []).append((entry.table, entry.column, value))
+                for gram in _bigrams(key):
+                    self._grams.setdefault(gram, set()).add(key)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry.nbytes for entry in self.columns.values())
+
+    def lookup(self, mention: str, limit: int = 10) -> list[dict[str, str]]:
+        """
+        查找提及内容对应的取值：先精确匹配，不足时再查找包含提及内容的取值，较短的取值优先
+        :param mention: 问题中提到的取值
+        :param limit: 最多返回的匹配数
+        :return: [{"table": 表名, "column": 列名, "value": 库中的精确取值, "match": exact/partial}]
+        """
+        key = normalize_value(mention)
+        if not key:
+            return []
+        matches = [
+            {"table": table, "column": column, "value": value, "match": "exact"}
+            for table, column, value in self._exact.get(key, [])
+        ]
+        grams = _bigrams(key)
+        if len(matches) >= limit or not grams:
+            return matches[:limit]
+
+        postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*postings) if postings[0] else set()
+        for candidate in sorted(candidates, key=len):
+            if candidate == key or key not in candidate:
+                continue
+            matches.extend(
+                {"table": table, "column": column, "value": value, "match": "partial"}
+                for table, column, value in self._exact[candidate]
+            )
+            if len(matches) >= limit:
+                break
+        return matches[:limit]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "columns": len(self.columns),
+            "values": sum(len(entry.values) for entry in self.columns.values()),
+            "bytes": self.nbytes,
+            "version": self.version,
+        }
+
+
+class ValueIndexer:
+    """
+    在后台为各数据库构建列取值索引
+    连接数据库后开始构建，只采样较短文本列的有限行数，去重取值超过上限的列视为高基数列不建索引，
+    总占用受字节预算约束；表结构变化或超过刷新间隔时增量构建，只重新采样新增、类型变化或过期的列
+    """
+
+    def __init__(
+            self,
+            enabled: bool = VALUE_INDEX_ENABLED,
+            max_distinct: int = VALUE_INDEX_MAX_DISTINCT,
+            sample_rows: int = VALUE_INDEX_SAMPLE_ROWS,
+            max_bytes: int = VALUE_INDEX_MAX_BYTES,
+            refresh_interval: int = VALUE_INDEX_REFRESH_INTERVAL,
+    ):
+        self.enabled = enabled
+        self.max_distinct = max_distinct
+        self.sample_rows = sample_rows
+        self.max_bytes = max_bytes
+        self.refresh_interval = refresh_interval
+        self._indexes: dict[str, ValueIndex] = {}
+        self._configs: dict[str, DatabaseConnectionConfig] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def get(self, conn_config: DatabaseConnectionConfig) -> ValueIndex | None:
+        """
+        获取数据库的取值索引
+        :param conn_config: 数据库连接配置
+        :return: 取值索引，尚未构建完成时返回 None
+        """
+        return self._indexes.get(conn_config.conn_key)
+
+    def schedule(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        在后台构建或增量刷新数据库的取值索引，已有构建任务时不重复构建
+        :param conn_config: 数据库连接配置
+        """
+        key = conn_config.conn_key
+        if not self.enabled or (key in self._tasks and not self._tasks[key].done()):
+            return
+        self._configs[key] = conn_config
+        self._tasks[key] = asyncio.create_task(self._build(conn_config))
+
+    def refresh(self, conn_config: DatabaseConnectionConfig) -> None:
+        """表结构变化时增量刷新已有的取值索引，注册为表结构变化回调"""
+        if conn_config.conn_key in self._indexes:
+            self.schedule(conn_config)
+
+    def drop(self, conn_config: DatabaseConnectionConfig) -> None:
+        """
+        丢弃数据库的取值索引并停止构建，释放数据库资源时调用
+        :param conn_config: 数据库连接配置
+        """
+        key = conn_config.conn_key
+        task = self._tasks.pop(key, None)
+        if task is not None and not task.done():
+            task.cancel()
+        self._indexes.pop(key, None)
+        self._configs.pop(key, None)
+
+    async def run_refresh(self) -> None:
+        """定期增量刷新所有取值索引，在应用生命周期内以后台任务运行"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for conn_config in list(self._configs.values()):
+                self.schedule(conn_config)
+
+    def stats(self) -> dict[str, Any]:
+        """各数据库取值索引的统计信息"""
+        return {
+            "databases": {f"{conn_config.host}:{conn_config.port}/{conn_config.database_name}": self._indexes[key].stats()
+                          for key, conn_config in self._configs.items() if key in self._indexes},
+            "building": sum(1 for task in self._tasks.values() if not task.done()),
+            "max_bytes": self.max_bytes,
+        }
+
+    async def _build(self, conn_config: DatabaseConnectionConfig) -> None:
+        key = conn_config.conn_key
+        previous = self._indexes.get(key)
+        # 后台构建使用独立的追踪 ID，不计入触发构建的请求
+        with start_trace():
+            try:
+                with span("value_index.build") as build_span:
+                    snapshot = await schema_cache.get_schema(conn_config)
+                    columns, counts = await self._collect(conn_config, snapshot.tables, previous)
+                    index = await asyncio.to_thread(ValueIndex, columns, snapshot.version)
+                    build_span.set(**counts, bytes=index.nbytes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"构建取值索引失败：{conn_config.database_name}，{e}")
+                return
+            self._indexes[key] = index
+            logger.info(f"取值索引构建完成：{conn_config.database_name}，{counts}，占用约 {index.nbytes} 字节")
+
+    async def _collect(
+            self,
+            conn_config: DatabaseConnectionConfig,
+            tables: dict[str, dict[str, Any]],
+            previous: ValueIndex | None,
+    ) -> tuple[dict[tuple[str, str], ColumnValues], dict[str, int]]:
+        # 逐列采样，同一时间只占用一个执行名额，避免影响正常查询
+        columns: dict[tuple[str, str], ColumnValues] = {}
+        counts = {"indexed": 0, "reused": 0, "high_cardinality": 0, "over_budget": 0, "failed": 0}
+        budget = self.max_bytes
+        first_error = None
+        for table_name, table in tables.items():
+            for column in table["columns"]:
+                if not is_indexable(column):
+                    continue
+                entry = previous.columns.get((table_name, column["name"])) if previous else None
+                if entry is not None and entry.column_type == column["type"] \
+                        and time.monotonic() - entry.sampled_at < self.refresh_interval:
+                    counts["reused"] += 1
+                else:
+                    try:
+                        entry = await self._sample(conn_config, table_name, column)
+                    except Exception as e:
+                        counts["failed"] += 1
+                        first_error = first_error or e
+                        continue
+                    if entry is None:
+                        counts["high_cardinality"] += 1
+                        continue
+                    counts["indexed"] += 1
+                if entry.nbytes > budget:
+                    counts["over_budget"] += 1
+                    continue
+                budget -= entry.nbytes
+                columns[(table_name, column["name"])] = entry
+        if first_error is not None:
+            logger.warning(f"取值索引有 {counts['failed']} 列采样失败，首个错误：{first_error}")
+        return columns, counts
+
+    async def _sample(
+            self,
+            conn_config: DatabaseConnectionConfig,
+            table: str,
+            column: dict[str, Any],
+    ) -> ColumnValues | None:
+        # 只扫描前 sample_rows 行，避免大表全表扫描；去重取值超过上限说明是高基数列，不建索引
+        name = _quote(column["name"])
+        sql = (
+            f"SELECT DISTINCT {name} AS value FROM "
+            f"(SELECT {name} FROM {_quote(table)} LIMIT {self.sample_rows}) AS sampled "
+            f"WHERE {name} IS NOT NULL LIMIT {self.max_distinct + 1}"
+        )
+        result = await execute_query(conn_config, sql, cache_mode="bypass", max_rows=self.max_distinct + 1)
+        if result.row_count > self.max_distinct:
+            return None
+        values = []
+        for row in result.rows:
+            value = str(row["value"]).strip()
+            if value and len(value) <= _MAX_VALUE_LENGTH:
+                values.append(value)
+        return ColumnValues(table, column["name"], column["type"], values, time.monotonic())
+
+
+value_indexer = ValueIndexer()